@@ -0,0 +1,134 @@
+"""Prompt-cache-aware provider affinity.
+
+Anthropic and Bedrock keep separate prompt caches. When FallbackHandler
+flips a long Claude Code session between them (a cooldown starts or ends),
+the next request on the other provider re-writes the whole prefix instead of
+reading it from cache. ProviderAffinity remembers, per conversation, which
+provider holds a warm cache and puts that provider first for the
+conversation's next request:
+
+  key     conversation_key(): hash of model, system prompt and the first
+          user message, without cache_control markers (clients move them to
+          the newest message every turn) — stable while the conversation grows
+  warm    the last response reported at least `min_cached_tokens` of
+          cache_read + cache_creation input tokens, within the last `ttl`
+          seconds (Anthropic's default cache lifetime is 5 minutes; each
+          hit refreshes it)
+  switch  a conversation leaves its warm provider only when that provider is
+          in cooldown or fails (the usual fallback), or when the cache is
+          too small or too old to be worth keeping
+  account with an Anthropic credential pool the entry also names the
+          credential (account) holding the cache: caches are per account,
+          so AnthropicProvider keeps the conversation on it (see
+          providers/anthropic_pool.py)
+
+Entries live in diskcache (shared by all workers, like cooldowns) and
+expire with the cache they describe.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Optional
+
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+
+def _without_markers(value: Any) -> Any:
+    """`value` with every cache_control key removed (copies; the body is left alone)."""
+    if isinstance(value, list):
+        return [_without_markers(item) for item in value]
+    if isinstance(value, dict):
+        return {k: _without_markers(v) for k, v in value.items() if k != "cache_control"}
+    return value
+
+
+def conversation_key(body: Dict[str, Any]) -> Optional[str]:
+    """Stable key for a conversation, or None if the body has no messages."""
+    messages = body.get("messages") or []
+    if not messages:
+        return None
+    first_user = next((m for m in messages if isinstance(m, dict) and m.get("role") == "user"), messages[0])
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (body.get("model"), _without_markers(body.get("system")), _without_markers(first_user)):
+        digest.update(json.dumps(part, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def usage_from_chunk(chunk: str) -> Optional[Dict[str, Any]]:
+    """`usage` of a message_start SSE event (input / cache token counts), else None."""
+    if '"message_start"' not in chunk:
+        return None
+    for line in chunk.splitlines():
+        if line.startswith("data: "):
+            try:
+                event = json.loads(line[6:])
+            except ValueError:
+                return None
+            if event.get("type") == "message_start":
+                return (event.get("message") or {}).get("usage")
+    return None
+
+
+class ProviderAffinity:
+    """conversation key → provider holding its warm prompt cache."""
+
+    def __init__(self, cache_dir: Optional[str] = None, ttl: float = 300.0, min_cached_tokens: int = 4096):
+        if cache_dir is None:
+            cache_dir = os.path.expanduser("~/.cache/claude-proxy/affinity")
+        self.entries = diskcache.Cache(cache_dir)
+        self.ttl = ttl
+        self.min_cached_tokens = min_cached_tokens
+        # Per worker
+        self.sticky_routes = 0  # requests routed off the default order to a warm provider
+        self.switches = 0       # warm conversations that completed on a different provider
+
+    def warm_provider(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        return entry["provider"] if entry else None
+
+    def warm_credential(self, key: Optional[str]) -> Optional[str]:
+        """Id of the pool credential holding the conversation's warm cache, if one was recorded."""
+        if key is None:
+            return None
+        entry = self.entries.get(key)
+        return entry.get("credential") if entry else None
+
+    def record(self, key: Optional[str], provider: str, usage: Optional[Dict[str, Any]],
+               credential: Optional[str] = None) -> None:
+        """Note where a conversation's request completed (provider, and pool credential if any)
+        and how much of it was cached. Without `credential`, a recorded one is kept while the
+        provider stays the same."""
+        if key is None or not usage:
+            return
+        cached = (usage.get("cache_read_input_tokens") or 0) + (usage.get("cache_creation_input_tokens") or 0)
+        previous = self.entries.get(key)
+        if previous and previous["provider"] != provider:
+            self.switches += 1
+            logger.info(f"⚓ Conversation {key[:8]} moved {previous['provider']} → {provider} "
+                        f"(its {previous['cached_tokens']}-token cache on {previous['provider']} is lost)")
+        elif previous and credential and previous.get("credential") not in (None, credential):
+            logger.info(f"⚓ Conversation {key[:8]} moved credential {previous['credential']} → {credential} "
+                        f"(its {previous['cached_tokens']}-token cache on that account is lost)")
+        if credential is None and previous and previous["provider"] == provider:
+            credential = previous.get("credential")
+        if cached >= self.min_cached_tokens:
+            self.entries.set(key, {"provider": provider, "credential": credential, "cached_tokens": cached,
+                                   "at": time.time()}, expire=self.ttl)
+        elif previous:
+            self.entries.delete(key)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self.entries),
+            "sticky_routes": self.sticky_routes,
+            "switches": self.switches,
+            "ttl_s": self.ttl,
+            "min_cached_tokens": self.min_cached_tokens,
+        }
@@ -1,4 +1,5 @@
 """Authentication module for validating tokens."""
+import hmac
 from typing import Tuple, Optional
 from fastapi import HTTPException, Request
 import config
@@ -48,4 +49,17 @@ def validate_token(token: str) -> Tuple[str, str]:
 def get_auth_from_request(request: Request) -> Tuple[str, str]:
     """Extract and validate authentication from request."""
     token = extract_token(request)
-    return validate_token(token)
\ No newline at end of file
+    return validate_token(token)
+
+
+def require_debug_token(request: Request) -> None:
+    """Guard for /debug/* — 404 unless PROXY_DEBUG_TOKEN is set, 401 on a wrong token.
+
+    Unlike extract_token, never falls back to CLAUDE_CODE_OAUTH_TOKEN.
+    """
+    if not config.DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    auth_header = request.headers.get("Authorization", "")
+    token = auth_header[7:] if auth_header.startswith("Bearer ") else request.headers.get("x-api-key", "")
+    if not hmac.compare_digest(token.encode(), config.DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid debug token")
\ No newline at end of file
@@ -4,8 +4,33 @@ bench.py — Benchmarking CLI for stapler-compactor.
 
 Commands:
   dry-run   Run all benchmark payloads through /v1/messages/dry-run, print table
+            (--local compresses in-process instead; --repeat N --record appends
+            every sample to the history store, keyed by git revision)
+  history   Trend of recorded runs per scenario, and latest-vs-baseline
+            regression check with 95% confidence intervals (--check exits 1)
   compare   Run same payloads against two ports, compare side-by-side
   watch     Poll /metrics every 2s and print live compression stats
+  load      Drive streaming load through a proxy backed by mock_upstream.py,
+            report RPS, TTFT, inter-chunk gaps, event-loop lag, CPU/request
+            (--provider bedrock exercises BedrockProvider against the mock
+            bedrock-runtime endpoint instead of the Anthropic path)
+  chaos     Replay a scripted outage (chaos.SCENARIOS) against both mock
+            upstreams under open-loop load; report requests lost, retry
+            amplification, failover latency and time-to-recover per fault
+  replay    Rebuild anonymized request bodies from ~/.claude/projects transcripts
+            (replay.py) and send them through dry-run (or --local) or, with
+            --target proxy, the full proxy against the mock upstream; report
+            compression and latency per session
+
+Replay timing:
+  --speed 1     original inter-arrival gaps (idle gaps capped at --max-gap)
+  --speed N     N times faster
+  --speed 0     back to back, one request in flight
+
+Load arrival models:
+  closed    --concurrency N clients, each sends its next request when the last ends
+  open      --rate R requests/sec (Poisson); latency measured from the scheduled
+            send time so a slow proxy can't hide queueing (no coordinated omission)
 
 Benchmark scenarios:
   short         2-turn Q&A — below floor, never compresses (baseline)
@@ -18,14 +43,26 @@ Benchmark scenarios:
   code-explorer Agent reads all files in a project (dynamic, uses real files)
 """
 import argparse
+import asyncio
 import json
 import os
+import random
+import secrets
+import statistics
+import subprocess
 import sys
+import tempfile
 import time
+from collections import Counter
 from pathlib import Path
 
 import httpx
 
+from bench_history import BenchHistory, detect_regressions, summarize
+from chaos import SCENARIOS
+from mock_upstream import MOCK_MODELS, add_mock_arguments, estimate_tokens, mock_args_to_argv
+from replay import DEFAULT_PROJECTS_DIR, Anonymizer, ReplayRequest, Session, discover_sessions, load_session, schedule
+
 # ---------------------------------------------------------------------------
 # Benchmark payloads — static synthetic scenarios
 # ---------------------------------------------------------------------------
@@ -765,6 +802,48 @@ def _dry_run_one(port: int, name: str, messages: list[dict]) -> dict:
         return {"_name": name, "_error": str(e)}
 
 
+def _dry_run_local_one(name: str, messages: list[dict]) -> dict:
+    """Compress one payload in-process with the compactor; same shape as _dry_run_one."""
+    import compactor
+    try:
+        t0 = time.monotonic()
+        _, _, stats = asyncio.run(compactor.compress_messages(messages, [], compactor.get_flags()))
+        elapsed_ms = (time.monotonic() - t0) * 1000
+    except Exception as e:
+        return {"_name": name, "_error": str(e)}
+    tokens_before = stats.get("original_tokens", 0)
+    tokens_after = stats.get("compressed_tokens", 0)
+    return {
+        "_name": name,
+        "_elapsed_ms": elapsed_ms,
+        "compression": {
+            "skipped": stats.get("skipped", False),
+            "tokens_before": tokens_before,
+            "tokens_after": tokens_after,
+            "tokens_saved": tokens_before - tokens_after,
+            "reduction_pct": round(stats.get("reduction_pct", 0.0), 2),
+            "timing_ms": round(stats.get("total_timing_ms", 0.0), 2),
+        },
+    }
+
+
+def _init_local_compactor() -> None:
+    """Initialize the in-process compactor; exit if compression is unavailable."""
+    import compactor
+    compactor.init_compactor()
+    if not compactor.get_flags().get("enabled"):
+        print("Compression is disabled (STAPLER_COMPRESS=0 or FusionEngine unavailable) — nothing to measure")
+        sys.exit(1)
+
+
+def _compactor_version() -> str | None:
+    from importlib.metadata import PackageNotFoundError, version
+    try:
+        return version("claw-compactor")
+    except PackageNotFoundError:
+        return None
+
+
 def _fetch_metrics(port: int) -> dict | None:
     try:
         with httpx.Client(timeout=5.0) as client:
@@ -815,13 +894,13 @@ def _row(name: str, before: str, after: str, saved: str, ratio: str, ms: str) ->
     return "║" + "║".join(parts) + "║"
 
 
-def _print_table(results: list[dict], port: int) -> None:
-    metrics = _fetch_metrics(port)
+def _print_table(results: list[dict], port: int | None) -> None:
     floor = "4096B"
 
     # Total title width = sum of inner widths + separators between columns (5) + outer borders (2)
     total_inner = sum(_IW[k] for k in ("name", "tokens", "tokens", "tokens", "ratio", "ms")) + 5
-    title = f" Benchmark — port {port}  (floor: {floor}) "
+    where = f"port {port}" if port is not None else "in-process"
+    title = f" Benchmark — {where}  (floor: {floor}) "
 
     print()
     print("╔" + "═" * total_inner + "╗")
@@ -910,10 +989,19 @@ def _print_compare_table(primary_results: list[dict], secondary_results: list[di
 # Commands
 # ---------------------------------------------------------------------------
 
-def cmd_dry_run(port: int, directory: str | None = None) -> None:
-    """Run all payloads through /v1/messages/dry-run and print results."""
-    print(f"\nRunning benchmarks against port {port}...")
-    results = []
+def cmd_dry_run(port: int, directory: str | None = None, repeat: int = 1, record: bool = False,
+                local: bool = False, db_path: str | None = None) -> None:
+    """Run all payloads through /v1/messages/dry-run (or in-process) and print results.
+
+    With repeat > 1 every scenario is run that many times (interleaved, so drift
+    hits all scenarios alike) and the table shows median times. With record,
+    every sample is stored in the bench history for `bench.py history`.
+    """
+    if local:
+        _init_local_compactor()
+        print(f"\nRunning benchmarks in-process (claw-compactor {_compactor_version()})...")
+    else:
+        print(f"\nRunning benchmarks against port {port}...")
     payloads = dict(PAYLOADS)
 
     # Add dynamic code-explorer scenario if a directory was specified (or default to claude-proxy dir)
@@ -924,18 +1012,59 @@ def cmd_dry_run(port: int, directory: str | None = None) -> None:
     payloads["code-explorer"] = explorer_msgs
     print("done")
 
-    for name, messages in payloads.items():
-        sys.stdout.write(f"  {name}... ")
-        sys.stdout.flush()
-        r = _dry_run_one(port, name, messages)
-        results.append(r)
-        if "_error" in r:
-            print(f"ERROR: {r['_error']}")
-        else:
-            c = r.get("compression", {})
-            print(f"{c.get('reduction_pct', 0):.1f}% saved")
-
-    _print_table(results, port)
+    if local:
+        # Warm-up pass: first-call imports and caches would otherwise land in repeat 0
+        for name, messages in payloads.items():
+            _dry_run_local_one(name, messages)
+
+    runs: list[list[dict]] = []
+    for i in range(repeat):
+        if repeat > 1:
+            print(f"  repeat {i + 1}/{repeat}")
+        results = []
+        for name, messages in payloads.items():
+            sys.stdout.write(f"  {name}... ")
+            sys.stdout.flush()
+            r = _dry_run_local_one(name, messages) if local else _dry_run_one(port, name, messages)
+            results.append(r)
+            if "_error" in r:
+                print(f"ERROR: {r['_error']}")
+            else:
+                c = r.get("compression", {})
+                print(f"{c.get('reduction_pct', 0):.1f}% saved")
+        runs.append(results)
+
+    table = runs[-1]
+    if repeat > 1:
+        table = [dict(r) for r in runs[-1]]
+        for r in table:
+            elapsed = [x["_elapsed_ms"] for run in runs for x in run
+                       if x.get("_name") == r["_name"] and "_elapsed_ms" in x]
+            if elapsed:
+                r["_elapsed_ms"] = statistics.median(elapsed)
+    _print_table(table, None if local else port)
+
+    if record:
+        samples = [
+            {
+                "scenario": r["_name"],
+                "repeat": i,
+                "tokens_before": r["compression"].get("tokens_before", 0),
+                "tokens_after": r["compression"].get("tokens_after", 0),
+                "reduction_pct": r["compression"].get("reduction_pct", 0.0),
+                "timing_ms": r["compression"].get("timing_ms", 0.0),
+                "elapsed_ms": r["_elapsed_ms"],
+            }
+            for i, results in enumerate(runs) for r in results if "_error" not in r
+        ]
+        if not samples:
+            print("Nothing recorded — every scenario failed")
+            return
+        history = BenchHistory(db_path)
+        rev = _git_rev()
+        run_id = history.record_run(rev, "local" if local else f"port:{port}", samples,
+                                    engine_version=_compactor_version() if local else None)
+        print(f"Recorded run #{run_id} ({rev}, {len(samples)} samples) in {history.db_path}\n")
 
 
 def cmd_compare(primary: int, secondary: int, directory: str | None = None) -> None:
@@ -1004,6 +1133,800 @@ def cmd_watch(port: int, interval: float) -> None:
         print("\n\nStopped.")
 
 
+# ---------------------------------------------------------------------------
+# Benchmark history
+# ---------------------------------------------------------------------------
+
+def _fmt_interval(summary: dict, unit: str = "") -> str:
+    half = (summary["ci_high"] - summary["ci_low"]) / 2
+    return f"{summary['mean']:.1f}±{half:.1f}{unit}"
+
+
+def cmd_history(args: argparse.Namespace) -> None:
+    """Show recorded runs per scenario and check the latest run against a baseline."""
+    history = BenchHistory(args.db)
+    runs = history.runs(limit=args.limit, source=args.source)
+    if not runs:
+        print(f"No recorded runs in {history.db_path} — run `bench.py dry-run --local --repeat 5 --record` first")
+        return
+    latest = runs[-1]
+    baseline = history.baseline_for(latest, args.baseline)
+    current_samples = history.samples(latest["id"])
+    findings = []
+    if baseline:
+        findings = detect_regressions(history.samples(baseline["id"]), current_samples,
+                                      timing_tolerance=args.timing_tolerance,
+                                      ratio_tolerance=args.ratio_tolerance)
+    if args.scenario:
+        findings = [f for f in findings if f["scenario"] == args.scenario]
+
+    if args.json:
+        print(json.dumps({"runs": runs, "latest": latest, "baseline": baseline, "findings": findings}, indent=2))
+    else:
+        per_run = {run["id"]: history.samples(run["id"]) for run in runs}
+        scenarios = sorted({name for samples in per_run.values() for name in samples})
+        if args.scenario:
+            scenarios = [name for name in scenarios if name == args.scenario]
+
+        print(f"\nBenchmark history ({history.db_path})")
+        print(f"  {'Run':>4}  {'When':<16}  {'Rev':<16}  {'Source':<12}  {'Engine':<8}  {'Reps':>4}")
+        for run in runs:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["created"]))
+            print(f"  {run['id']:>4}  {when:<16}  {run['git_rev']:<16}  {run['source']:<12}  "
+                  f"{run['engine_version'] or '-':<8}  {run['repeats']:>4}")
+
+        print("\n  Reduction % / engine ms (mean ± 95% CI) per run, oldest → newest")
+        for name in scenarios:
+            cells = []
+            for run in runs:
+                samples = per_run[run["id"]].get(name)
+                if not samples:
+                    cells.append("—".center(19))
+                    continue
+                ratio = summarize([s["reduction_pct"] for s in samples])
+                timing = summarize([s["timing_ms"] for s in samples])
+                cells.append(f"{ratio['mean']:5.1f}% {_fmt_interval(timing, 'ms'):>12}")
+            print(f"  {name:<14}" + " │ ".join(cells))
+
+        print()
+        if not baseline:
+            print("  No baseline run from another revision yet — nothing to compare\n")
+        else:
+            print(f"  Run #{latest['id']} ({latest['git_rev']}) vs baseline #{baseline['id']} ({baseline['git_rev']}):")
+            for f in findings:
+                parts = []
+                for metric, label, unit in (("reduction_pct", "ratio", "pt"), ("timing_ms", "time", "ms")):
+                    m = f["metrics"].get(metric)
+                    if m:
+                        parts.append(f"{label} {m['diff']:+.2f}{unit} [{m['ci_low']:+.2f}, {m['ci_high']:+.2f}]")
+                mark = {"regression": "✗ REGRESSION", "improvement": "✓ improved", "ok": "  ok"}[f["verdict"]]
+                print(f"    {f['scenario']:<14} {'  '.join(parts):<70} {mark}")
+            print()
+
+    if args.check and any(f["verdict"] == "regression" for f in findings):
+        sys.exit(1)
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+_LOAD_AUTH = {"x-api-key": "bench-load", "anthropic-version": "2023-06-01"}
+
+
+def _percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def _wait_ready(url: str, timeout: float = 30.0) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1.0).status_code < 500:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def _git_rev() -> str:
+    """Short git revision of this checkout (+"-dirty" with local changes), or "unknown"."""
+    here = Path(__file__).parent
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=here,
+                             capture_output=True, text=True, timeout=5).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no", "."], cwd=here,
+                               capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+    if not rev:
+        return "unknown"
+    return f"{rev}-dirty" if dirty else rev
+
+
+def _spawn_stack(args: argparse.Namespace, workdir: str,
+                 extra_env: dict[str, str] | None = None) -> list[subprocess.Popen]:
+    """Start mock_upstream.py and a proxy pointed at it; returns the processes.
+
+    args.provider picks the upstream path: "anthropic" (Bedrock disabled),
+    "bedrock" (Anthropic mock rejects everything) or "fallback" (both, in the
+    proxy's normal priority order).
+    """
+    here = Path(__file__).parent
+    mock_log = open(os.path.join(workdir, "mock.log"), "w")
+    mock = subprocess.Popen(
+        [sys.executable, str(here / "mock_upstream.py"), "--port", str(args.mock_port)] + mock_args_to_argv(args),
+        stdout=mock_log, stderr=subprocess.STDOUT,
+    )
+    procs = [mock]
+    if not _wait_ready(f"http://127.0.0.1:{args.mock_port}/mock/stats"):
+        raise RuntimeError(f"mock upstream did not start (see {workdir}/mock.log)")
+
+    env = dict(os.environ)
+    env.update({
+        "PROXY_PORT": str(args.port),
+        "PROXY_ANTHROPIC_URL": f"http://127.0.0.1:{args.mock_port}",
+        "BEDROCK_ENABLED": "0",
+        "WORKERS": str(args.workers),
+        "CLAUDE_CODE_OAUTH_TOKEN": "bench-load",
+        # Isolated HOME and LOG_DIR: fresh cooldowns / metrics / error DB, and
+        # no writes into a real proxy's logs
+        "HOME": workdir,
+        "LOG_DIR": workdir,
+    })
+    if args.provider in ("bedrock", "fallback"):
+        # Static dummy credentials: boto3 signs requests but the mock never checks them,
+        # and no SSO / credential_process is involved
+        for key in ("AWS_PROFILE", "AWS_SESSION_TOKEN"):
+            env.pop(key, None)
+        env.update({
+            "BEDROCK_ENABLED": "1",
+            "BEDROCK_ENDPOINT_URL": f"http://127.0.0.1:{args.mock_port}",
+            "AWS_ACCESS_KEY_ID": "bench-load",
+            "AWS_SECRET_ACCESS_KEY": "bench-load",
+        })
+    env.update(extra_env or {})
+    proxy_log = open(os.path.join(workdir, "proxy.log"), "w")
+    proxy = subprocess.Popen([sys.executable, str(here / "main.py")], cwd=here, env=env,
+                             stdout=proxy_log, stderr=subprocess.STDOUT)
+    procs.append(proxy)
+    if not _wait_ready(f"http://127.0.0.1:{args.port}/health"):
+        raise RuntimeError(f"proxy did not start (see {workdir}/proxy.log)")
+    if args.provider == "bedrock":
+        _prime_bedrock(args)
+    return procs
+
+
+def _prime_bedrock(args: argparse.Namespace) -> None:
+    """Send one request so the proxy puts the (always-429) Anthropic mock in cooldown.
+
+    Every timed request then goes straight to BedrockProvider instead of paying
+    for a fallback hop.
+    """
+    body = {"model": args.model or "claude-sonnet-4-6", "max_tokens": 16, "messages": PAYLOADS["short"]}
+    resp = httpx.post(f"http://127.0.0.1:{args.port}/v1/messages", json=body, headers=_LOAD_AUTH, timeout=60)
+    if resp.status_code != 200:
+        raise RuntimeError(f"bedrock priming request failed: HTTP {resp.status_code} {resp.text[:200]}")
+
+
+async def _stream_one(client: httpx.AsyncClient, url: str, body: dict, start: float) -> dict:
+    """Send one streaming request; timings are relative to `start` (perf_counter)."""
+    result = {"ok": False, "status": None, "ttft_ms": None, "total_ms": None, "gaps_ms": [], "error": None,
+              "input_tokens": None}
+    last_chunk = None
+    try:
+        async with client.stream("POST", url, json=body, headers=_LOAD_AUTH) as resp:
+            result["status"] = resp.status_code
+            if resp.status_code != 200:
+                await resp.aread()
+                result["error"] = f"HTTP {resp.status_code}"
+                return result
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                now = time.perf_counter()
+                if last_chunk is not None:
+                    result["gaps_ms"].append((now - last_chunk) * 1000)
+                last_chunk = now
+                if '"content_block_delta"' in line and result["ttft_ms"] is None:
+                    result["ttft_ms"] = (now - start) * 1000
+                elif '"message_start"' in line:
+                    result["input_tokens"] = json.loads(line[6:])["message"].get("usage", {}).get("input_tokens")
+                elif '"type": "error"' in line or '"type":"error"' in line:
+                    result["error"] = json.loads(line[6:]).get("error", {}).get("type", "error")
+                elif '"message_stop"' in line:
+                    result["ok"] = True
+    except httpx.HTTPError as e:
+        result["error"] = type(e).__name__
+    finally:
+        result["total_ms"] = (time.perf_counter() - start) * 1000
+    if result["error"]:
+        result["ok"] = False
+    return result
+
+
+async def _closed_loop(client: httpx.AsyncClient, url: str, body: dict,
+                       concurrency: int, duration: float) -> list[dict]:
+    results: list[dict] = []
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            results.append(await _stream_one(client, url, body, time.perf_counter()))
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return results
+
+
+async def _open_loop(client: httpx.AsyncClient, url: str, body: dict,
+                     rate: float, duration: float, seed: int | None) -> list[dict]:
+    rng = random.Random(seed)
+    tasks = []
+    begin = time.perf_counter()
+    scheduled = begin
+    offsets = []
+    while scheduled - begin < duration:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Measure from the scheduled time, not the (possibly late) actual send
+        tasks.append(asyncio.create_task(_stream_one(client, url, body, scheduled)))
+        offsets.append(scheduled - begin)
+        scheduled += rng.expovariate(rate)
+    results = list(await asyncio.gather(*tasks))
+    for result, offset in zip(results, offsets):
+        result["sent_s"] = offset
+    return results
+
+
+async def _sample_process(port: int, stop: asyncio.Event, samples: list[dict]) -> None:
+    """Poll the proxy's live process figures and this generator's own loop lag."""
+    async with httpx.AsyncClient(timeout=5.0) as client:
+        while not stop.is_set():
+            t = time.perf_counter()
+            try:
+                data = (await client.get(f"http://127.0.0.1:{port}/metrics")).json()
+                samples.append({"proxy": data.get("process", {}), "t": t})
+            except (httpx.HTTPError, ValueError):
+                pass
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            drift = (time.perf_counter() - t - 1.0) * 1000
+            if not stop.is_set() and samples:
+                samples[-1]["client_lag_ms"] = max(0.0, drift)
+
+
+async def _run_load(args: argparse.Namespace) -> dict:
+    url = f"http://127.0.0.1:{args.port}/v1/messages"
+    body = {
+        "model": args.model,
+        "max_tokens": 1024,
+        "stream": True,
+        "messages": PAYLOADS[args.payload],
+    }
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    stop = asyncio.Event()
+    samples: list[dict] = []
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=300.0), limits=limits) as client:
+        sampler = asyncio.create_task(_sample_process(args.port, stop, samples))
+        await asyncio.sleep(0)
+        wall_start = time.perf_counter()
+        if args.rate:
+            results = await _open_loop(client, url, body, args.rate, args.duration, args.seed)
+        else:
+            results = await _closed_loop(client, url, body, args.concurrency, args.duration)
+        wall = time.perf_counter() - wall_start
+        stop.set()
+        await sampler
+
+    return _summarize_load(args, results, samples, wall)
+
+
+def _summarize_load(args: argparse.Namespace, results: list[dict], samples: list[dict], wall: float) -> dict:
+    ok = [r for r in results if r["ok"]]
+    errors: dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            key = r["error"] or "incomplete"
+            errors[key] = errors.get(key, 0) + 1
+    ttft = [r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]
+    total = [r["total_ms"] for r in ok]
+    gaps = [g for r in ok for g in r["gaps_ms"]]
+    lag = [s["proxy"].get("current_lag_ms", 0.0) for s in samples if s.get("proxy")]
+    client_lag = [s["client_lag_ms"] for s in samples if "client_lag_ms" in s]
+    # /metrics answers from whichever worker accepts the connection and CPU time is per
+    # process: sum each worker's own delta (a worker sampled only once adds nothing)
+    cpu_by_pid: dict[int, list[float]] = {}
+    for s in samples:
+        if "cpu_seconds" in s.get("proxy", {}):
+            cpu_by_pid.setdefault(s["proxy"].get("pid", 0), []).append(s["proxy"]["cpu_seconds"])
+    cpu_used = sum(cpu[-1] - cpu[0] for cpu in cpu_by_pid.values())
+
+    return {
+        "mode": f"open {args.rate}/s" if args.rate else f"closed x{args.concurrency}",
+        "provider": args.provider,
+        "duration_s": round(wall, 2),
+        "requests": len(results),
+        "ok": len(ok),
+        "errors": errors,
+        "rps": round(len(ok) / wall, 2) if wall else 0.0,
+        "ttft_ms": {"p50": round(_percentile(ttft, 50), 1), "p99": round(_percentile(ttft, 99), 1)},
+        "total_ms": {"p50": round(_percentile(total, 50), 1), "p99": round(_percentile(total, 99), 1)},
+        "gap_ms": {"p50": round(_percentile(gaps, 50), 2), "p99": round(_percentile(gaps, 99), 2),
+                   "max": round(max(gaps), 2) if gaps else 0.0},
+        "loop_lag_ms": {"p50": round(_percentile(lag, 50), 1), "max": round(max(lag), 1) if lag else 0.0},
+        "client_lag_ms_max": round(max(client_lag), 1) if client_lag else 0.0,
+        "cpu_ms_per_request": round(cpu_used * 1000 / len(ok), 2) if ok else 0.0,
+        "cpu_workers_sampled": len(cpu_by_pid),
+    }
+
+
+def _print_load_report(summary: dict) -> None:
+    rows = [
+        ("Mode", f"{summary['mode']} via {summary['provider']}"),
+        ("Duration", f"{summary['duration_s']}s"),
+        ("Requests", f"{summary['ok']}/{summary['requests']} ok"),
+        ("Errors", ", ".join(f"{k}={v}" for k, v in summary["errors"].items()) or "none"),
+        ("Throughput", f"{summary['rps']} req/s"),
+        ("TTFT", f"p50 {summary['ttft_ms']['p50']}ms  p99 {summary['ttft_ms']['p99']}ms"),
+        ("Total", f"p50 {summary['total_ms']['p50']}ms  p99 {summary['total_ms']['p99']}ms"),
+        ("Chunk gap", f"p50 {summary['gap_ms']['p50']}ms  p99 {summary['gap_ms']['p99']}ms  max {summary['gap_ms']['max']}ms"),
+        ("Loop lag", f"p50 {summary['loop_lag_ms']['p50']}ms  max {summary['loop_lag_ms']['max']}ms"),
+        ("CPU/request", f"{summary['cpu_ms_per_request']}ms"
+                        + (f" ({summary['cpu_workers_sampled']} workers sampled)"
+                           if summary["cpu_workers_sampled"] > 1 else "")),
+    ]
+    width = 62
+    print()
+    print("╔" + "═" * width + "╗")
+    print("║" + " Load test ".center(width) + "║")
+    print("╠" + "═" * 14 + "╦" + "═" * (width - 15) + "╣")
+    for label, value in rows:
+        print("║" + f" {label:<12} " + "║" + f" {value[:width - 17]:<{width - 17}} " + "║")
+    print("╚" + "═" * 14 + "╩" + "═" * (width - 15) + "╝")
+    if summary["client_lag_ms_max"] > 100:
+        print(f"  [!] load generator loop lagged {summary['client_lag_ms_max']}ms — results may understate proxy capacity")
+    print()
+
+
+def cmd_load(args: argparse.Namespace) -> None:
+    """Spin up mock upstream + proxy (unless --no-spawn) and drive streaming load."""
+    workdir = tempfile.mkdtemp(prefix="claude-proxy-load-")
+    procs: list[subprocess.Popen] = []
+    if args.provider == "bedrock":
+        args.anthropic_unavailable = True
+    try:
+        if not args.no_spawn:
+            print(f"\nStarting mock upstream :{args.mock_port} and proxy :{args.port} (logs: {workdir})...")
+            procs = _spawn_stack(args, workdir)
+        mode = f"open-loop {args.rate} req/s" if args.rate else f"closed-loop x{args.concurrency}"
+        print(f"Driving {mode} for {args.duration}s ({args.payload} payload)...")
+        summary = asyncio.run(_run_load(args))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+    else:
+        _print_load_report(summary)
+
+
+# ---------------------------------------------------------------------------
+# Chaos scenarios
+# ---------------------------------------------------------------------------
+
+def _chaos_report(scenario: dict, results: list[dict], timeline: list[dict], params: dict) -> dict:
+    """Score one scenario run.
+
+    results are client-side (one per request, with sent_s); timeline is the
+    mock's record of every upstream attempt (t = arrival, target, outcome).
+    Retry amplification = upstream attempts / client requests; time-to-recover
+    = seconds after a fault window closes until its target serves a successful
+    request again (cooldowns and health probes decide this, not the mock).
+    """
+    faults = scenario["faults"]
+    first_fault = min((f["start"] for f in faults), default=params["duration_s"])
+    baseline = [r["total_ms"] for r in results if r["ok"] and r["sent_s"] < first_fault]
+    timeline = sorted(timeline, key=lambda e: e["t"])
+    lost = [r for r in results if not r["ok"]]
+
+    windows = []
+    for f in faults:
+        in_window = [r for r in results if f["start"] <= r["sent_s"] < f["end"]]
+        window_attempts = [e for e in timeline if f["start"] <= e["t"] < f["end"]]
+        latency = [r["total_ms"] for r in in_window if r["ok"]]
+        recovered_at = next((e["t"] for e in timeline
+                             if e["target"] == f["target"] and e["outcome"] == "ok" and e["t"] >= f["end"]), None)
+        windows.append({
+            "target": f["target"],
+            "kind": f["kind"],
+            "window_s": [f["start"], f["end"]],
+            "requests": len(in_window),
+            "lost": sum(1 for r in in_window if not r["ok"]),
+            "upstream_attempts": len(window_attempts),
+            "retry_amplification": round(len(window_attempts) / len(in_window), 2) if in_window else 0.0,
+            "latency_ms": {"p50": round(_percentile(latency, 50), 1), "p99": round(_percentile(latency, 99), 1)},
+            "time_to_recover_s": round(recovered_at - f["end"], 2) if recovered_at is not None else None,
+        })
+
+    return {
+        "scenario": scenario["name"],
+        "description": scenario["description"],
+        "params": params,
+        "requests": len(results),
+        "ok": len(results) - len(lost),
+        "lost": len(lost),
+        "lost_by_error": dict(Counter(r["error"] or "incomplete" for r in lost)),
+        "upstream_attempts": len(timeline),
+        "retry_amplification": round(len(timeline) / len(results), 2) if results else 0.0,
+        "attempts_by_target": {
+            f"{target}:{outcome}": n
+            for (target, outcome), n in sorted(Counter((e["target"], e["outcome"]) for e in timeline).items())
+        },
+        "baseline_latency_ms": {"p50": round(_percentile(baseline, 50), 1), "p99": round(_percentile(baseline, 99), 1)},
+        "faults": windows,
+    }
+
+
+def _print_chaos_report(report: dict) -> None:
+    p = report["params"]
+    rows = [
+        ("Load", f"open {p['rate']} req/s for {p['duration_s']}s (seed {p['seed']}, rev {p['git_rev']})"),
+        ("Requests", f"{report['ok']}/{report['requests']} ok, {report['lost']} lost"),
+        ("Lost by", ", ".join(f"{k}={v}" for k, v in report["lost_by_error"].items()) or "none"),
+        ("Upstream", f"{report['upstream_attempts']} attempts ({report['retry_amplification']}x amplification)"),
+        ("Baseline", f"p50 {report['baseline_latency_ms']['p50']}ms  p99 {report['baseline_latency_ms']['p99']}ms"),
+    ]
+    width = 78
+    print()
+    print("╔" + "═" * width + "╗")
+    print("║" + f" Chaos: {report['scenario']} ".center(width) + "║")
+    print("╠" + "═" * 14 + "╦" + "═" * (width - 15) + "╣")
+    for label, value in rows:
+        print("║" + f" {label:<12} " + "║" + f" {value[:width - 17]:<{width - 17}} " + "║")
+    print("╚" + "═" * 14 + "╩" + "═" * (width - 15) + "╝")
+    print(f"  {report['description']}")
+
+    if report["faults"]:
+        print(f"  {'Fault':<30} {'Window':>9} {'Req':>5} {'Lost':>5} {'Amp':>5} {'p50 ms':>8} {'p99 ms':>8} {'Recover':>9}")
+        for f in report["faults"]:
+            recover = f"{f['time_to_recover_s']}s" if f["time_to_recover_s"] is not None else "not seen"
+            window = f"{f['window_s'][0]:g}-{f['window_s'][1]:g}s"
+            print(f"  {f['target'] + ' ' + f['kind']:<30} {window:>9} {f['requests']:>5} {f['lost']:>5} "
+                  f"{f['retry_amplification']:>5} {f['latency_ms']['p50']:>8} {f['latency_ms']['p99']:>8} {recover:>9}")
+    print()
+
+
+async def _run_chaos(args: argparse.Namespace, duration: float) -> tuple[list[dict], list[dict]]:
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    url = f"http://127.0.0.1:{args.port}/v1/messages"
+    body = {"model": args.model, "max_tokens": 1024, "stream": True, "messages": PAYLOADS[args.payload]}
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=300.0), limits=limits) as client:
+        (await client.post(f"{mock_url}/mock/scenario/start")).raise_for_status()
+        results = await _open_loop(client, url, body, args.rate, duration, args.seed)
+        timeline = (await client.get(f"{mock_url}/mock/scenario")).json()["timeline"]
+    return results, timeline
+
+
+def cmd_chaos(args: argparse.Namespace) -> None:
+    """Run a chaos scenario against a freshly spawned mock + proxy (both providers)."""
+    scenario = SCENARIOS[args.scenario]
+    duration = args.duration or scenario.duration
+    args.provider = "fallback"
+    workdir = tempfile.mkdtemp(prefix="claude-proxy-chaos-")
+    procs: list[subprocess.Popen] = []
+    try:
+        print(f"\nStarting mock upstream :{args.mock_port} and proxy :{args.port} (logs: {workdir})...")
+        procs = _spawn_stack(args, workdir, extra_env={
+            "COOLDOWN_SECONDS": str(args.cooldown),
+            "HEALTH_PROBE_INTERVAL": str(args.probe_interval),
+        })
+        print(f"Scenario {scenario.name}: {scenario.description}")
+        print(f"Driving open-loop {args.rate} req/s for {duration}s...")
+        results, timeline = asyncio.run(_run_chaos(args, duration))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    params = {
+        "rate": args.rate,
+        "duration_s": duration,
+        "seed": args.seed,
+        "cooldown_s": args.cooldown,
+        "probe_interval_s": args.probe_interval,
+        "payload": args.payload,
+        "output_tokens": args.output_tokens,
+        "token_rate": args.token_rate,
+        "git_rev": _git_rev(),
+    }
+    report = _chaos_report(scenario.to_dict(), results, timeline, params)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_chaos_report(report)
+        if args.output:
+            print(f"  Report written to {args.output}\n")
+
+
+# ---------------------------------------------------------------------------
+# Transcript replay
+# ---------------------------------------------------------------------------
+
+def _load_replay_sessions(args: argparse.Namespace) -> list[Session]:
+    anonymizer = None if args.no_anonymize else Anonymizer(args.salt or secrets.token_hex(8))
+    if args.session:
+        paths = [Path(p) for p in args.session]
+    else:
+        paths = discover_sessions(args.projects_dir, args.project, args.sessions)
+    sessions = []
+    for path in paths:
+        session = load_session(str(path), anonymizer, args.max_requests)
+        if session.requests:
+            sessions.append(session)
+    return sessions
+
+
+def _replay_local(plan: list[tuple[float, ReplayRequest]]) -> list[dict]:
+    """Compress every request in-process, back to back (timing is ignored)."""
+    results = []
+    begin = time.perf_counter()
+    for _, request in plan:
+        sent = time.perf_counter() - begin
+        r = _dry_run_local_one(request.session_id, request.messages)
+        c = r.get("compression", {})
+        results.append({
+            "session": request.session_id, "index": request.index, "sent_s": sent,
+            "ok": "_error" not in r, "error": r.get("_error"),
+            "tokens_before": c.get("tokens_before", 0), "tokens_after": c.get("tokens_after", 0),
+            "latency_ms": r.get("_elapsed_ms", 0.0), "ttft_ms": None,
+        })
+    return results
+
+
+async def _replay_plan(plan: list[tuple[float, ReplayRequest]], send, speed: float) -> list[dict]:
+    """Call `send(request, start)` for every request at its planned offset.
+
+    speed <= 0 sends back to back (one in flight); otherwise open loop, with
+    latency measured from the scheduled time as in _open_loop.
+    """
+    begin = time.perf_counter()
+    if speed <= 0:
+        results = []
+        for _, request in plan:
+            start = time.perf_counter()
+            result = await send(request, start)
+            result["sent_s"] = start - begin
+            results.append(result)
+    else:
+        tasks = []
+        for offset, request in plan:
+            delay = begin + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(send(request, begin + offset)))
+        results = list(await asyncio.gather(*tasks))
+        for result, (offset, _) in zip(results, plan):
+            result["sent_s"] = offset
+    for result, (_, request) in zip(results, plan):
+        result.update(session=request.session_id, index=request.index)
+    return results
+
+
+async def _replay_dry_run(port: int, plan: list[tuple[float, ReplayRequest]], speed: float) -> list[dict]:
+    url = f"http://localhost:{port}/v1/messages/dry-run"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=120.0), limits=limits) as client:
+
+        async def send(request: ReplayRequest, start: float) -> dict:
+            result = {"ok": False, "error": None, "tokens_before": 0, "tokens_after": 0, "ttft_ms": None}
+            payload = {"model": request.model, "messages": request.messages, "max_tokens": 1}
+            try:
+                resp = await client.post(url, json=payload, headers={"Authorization": "Bearer bench"})
+                if resp.status_code != 200:
+                    result["error"] = f"HTTP {resp.status_code}"
+                else:
+                    c = resp.json()["compression"]
+                    result.update(ok=True, tokens_before=c["tokens_before"], tokens_after=c["tokens_after"])
+            except httpx.HTTPError as e:
+                result["error"] = type(e).__name__
+            result["latency_ms"] = (time.perf_counter() - start) * 1000
+            return result
+
+        return await _replay_plan(plan, send, speed)
+
+
+async def _replay_proxy(args: argparse.Namespace, plan: list[tuple[float, ReplayRequest]]) -> list[dict]:
+    """Stream every request through the proxy to the mock upstream.
+
+    Tokens before/after are chars/4 estimates of the replayed messages and of
+    what the mock received (its usage.input_tokens), so compression is measured
+    end to end. Transcript models the mock doesn't serve (the proxy would
+    reject them) are replaced with claude-sonnet-4-6 unless --model is given.
+    """
+    url = f"http://127.0.0.1:{args.port}/v1/messages"
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(10.0, read=300.0), limits=limits) as client:
+
+        async def send(request: ReplayRequest, start: float) -> dict:
+            model = args.model or (request.model if request.model in MOCK_MODELS else "claude-sonnet-4-6")
+            body = {"model": model, "max_tokens": 1024, "stream": True, "messages": request.messages}
+            r = await _stream_one(client, url, body, start)
+            return {
+                "ok": r["ok"] and r["input_tokens"] is not None, "error": r["error"],
+                "tokens_before": estimate_tokens(request.messages), "tokens_after": r["input_tokens"] or 0,
+                "latency_ms": r["total_ms"], "ttft_ms": r["ttft_ms"],
+            }
+
+        return await _replay_plan(plan, send, args.speed)
+
+
+def _replay_stats(results: list[dict]) -> dict:
+    ok = [r for r in results if r["ok"]]
+    before = sum(r["tokens_before"] for r in ok)
+    after = sum(r["tokens_after"] for r in ok)
+    per_request = [(1 - r["tokens_after"] / r["tokens_before"]) * 100 for r in ok if r["tokens_before"]]
+    latency = [r["latency_ms"] for r in ok]
+    ttft = [r["ttft_ms"] for r in ok if r.get("ttft_ms") is not None]
+    stats = {
+        "requests": len(results),
+        "ok": len(ok),
+        "tokens_before": before,
+        "tokens_after": after,
+        "reduction_pct": round((1 - after / before) * 100, 1) if before else 0.0,
+        "reduction_pct_p50": round(_percentile(per_request, 50), 1),
+        "latency_ms": {p: round(_percentile(latency, int(p[1:])), 1) for p in ("p50", "p90", "p99")},
+    }
+    stats["latency_ms"]["max"] = round(max(latency), 1) if latency else 0.0
+    if ttft:
+        stats["ttft_ms"] = {"p50": round(_percentile(ttft, 50), 1), "p99": round(_percentile(ttft, 99), 1)}
+    return stats
+
+
+def _replay_report(sessions: list[Session], plan: list[tuple[float, ReplayRequest]],
+                   results: list[dict], wall: float, params: dict) -> dict:
+    by_session: dict[str, list[dict]] = {}
+    for r in results:
+        by_session.setdefault(r["session"], []).append(r)
+    errors = Counter(r["error"] or "incomplete" for r in results if not r["ok"])
+    timestamps = [request.timestamp for _, request in plan]
+    return {
+        "params": params,
+        "original_span_s": round(max(timestamps) - min(timestamps), 1) if timestamps else 0.0,
+        "replay_span_s": round(wall, 1),
+        "errors": dict(errors),
+        "total": _replay_stats(results),
+        "sessions": [
+            {"session": s.session_id, "project": s.project, **_replay_stats(by_session.get(s.session_id, []))}
+            for s in sessions
+        ],
+    }
+
+
+def _print_replay_report(report: dict) -> None:
+    cols = [("Session", 10), ("Reqs", 5), ("Before", 9), ("After", 9), ("Ratio", 6), ("p50 ms", 7), ("p99 ms", 7)]
+    inner = sum(w + 2 for _, w in cols) + len(cols) - 1
+
+    def line(left: str, mid: str, right: str) -> str:
+        return left + mid.join("═" * (w + 2) for _, w in cols) + right
+
+    def row(values: list[str]) -> str:
+        return "║" + "║".join(f" {v[:w].ljust(w)} " for v, (_, w) in zip(values, cols)) + "║"
+
+    def cells(name: str, s: dict) -> list[str]:
+        return [name, f"{s['ok']}/{s['requests']}", str(s["tokens_before"]), str(s["tokens_after"]),
+                f"{s['reduction_pct']:.1f}%", str(s["latency_ms"]["p50"]), str(s["latency_ms"]["p99"])]
+
+    params = report["params"]
+    title = f" Replay — {params['target']}, {params['timing']} "
+    print()
+    print("╔" + "═" * inner + "╗")
+    print("║" + title.center(inner) + "║")
+    print(line("╠", "╦", "╣"))
+    print(row([name for name, _ in cols]))
+    print(line("╠", "╬", "╣"))
+    for s in report["sessions"]:
+        print(row(cells(s["session"][:8], s)))
+    print(line("╠", "╬", "╣"))
+    print(row(cells("TOTAL", report["total"])))
+    print(line("╚", "╩", "╝"))
+    total = report["total"]
+    print(f"  Span       original {report['original_span_s']}s → replayed in {report['replay_span_s']}s")
+    print(f"  Latency    p50 {total['latency_ms']['p50']}ms  p90 {total['latency_ms']['p90']}ms  "
+          f"p99 {total['latency_ms']['p99']}ms  max {total['latency_ms']['max']}ms")
+    if "ttft_ms" in total:
+        print(f"  TTFT       p50 {total['ttft_ms']['p50']}ms  p99 {total['ttft_ms']['p99']}ms")
+    print(f"  Ratio      median per request {total['reduction_pct_p50']:.1f}%")
+    if report["errors"]:
+        print("  Errors     " + ", ".join(f"{k}={v}" for k, v in report["errors"].items()))
+    print()
+
+
+def cmd_replay(args: argparse.Namespace) -> None:
+    """Replay reconstructed transcript requests through dry-run or the full proxy."""
+    sessions = _load_replay_sessions(args)
+    if not sessions:
+        print(f"No replayable requests found under {args.projects_dir or DEFAULT_PROJECTS_DIR}")
+        sys.exit(1)
+    plan = schedule(sessions, args.speed, args.max_gap)
+    if args.target == "dry-run" and args.local:
+        timing = "back to back"
+    elif args.speed <= 0:
+        timing = "back to back"
+    else:
+        timing = "real time" if args.speed == 1 else f"{args.speed:g}x"
+        if args.max_gap is not None:
+            timing += f", gaps ≤{args.max_gap:g}s"
+    print(f"\nReplaying {len(plan)} requests from {len(sessions)} sessions ({timing})...")
+
+    workdir = tempfile.mkdtemp(prefix="claude-proxy-replay-")
+    procs: list[subprocess.Popen] = []
+    wall_start = time.perf_counter()
+    try:
+        if args.target == "dry-run":
+            args.port = args.port or 47000
+            if args.local:
+                _init_local_compactor()
+                wall_start = time.perf_counter()
+                results = _replay_local(plan)
+            else:
+                results = asyncio.run(_replay_dry_run(args.port, plan, args.speed))
+        else:
+            args.port = args.port or 47050
+            if args.provider == "bedrock":
+                args.anthropic_unavailable = True
+            if not args.no_spawn:
+                print(f"Starting mock upstream :{args.mock_port} and proxy :{args.port} (logs: {workdir})...")
+                procs = _spawn_stack(args, workdir)
+            wall_start = time.perf_counter()
+            results = asyncio.run(_replay_proxy(args, plan))
+    finally:
+        for proc in reversed(procs):
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    wall = time.perf_counter() - wall_start
+
+    params = {
+        "target": "in-process" if args.target == "dry-run" and args.local else args.target,
+        "timing": timing,
+        "speed": args.speed,
+        "max_gap_s": args.max_gap,
+        "anonymized": not args.no_anonymize,
+        "git_rev": _git_rev(),
+    }
+    report = _replay_report(sessions, plan, results, wall, params)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        _print_replay_report(report)
+        if args.output:
+            print(f"  Report written to {args.output}\n")
+
+
 # ---------------------------------------------------------------------------
 # CLI entry point
 # ---------------------------------------------------------------------------
@@ -1020,6 +1943,24 @@ def main() -> None:
     p_dry.add_argument("--port", type=int, default=47000)
     p_dry.add_argument("--dir", metavar="DIR", default=None,
                        help="Directory for code-explorer scenario (default: claude-proxy dir)")
+    p_dry.add_argument("--local", action="store_true", help="Compress in-process instead of via a running proxy")
+    p_dry.add_argument("--repeat", type=int, default=1, help="Run every scenario N times")
+    p_dry.add_argument("--record", action="store_true", help="Append the samples to the bench history")
+    p_dry.add_argument("--db", default=None, help="History database (default: ~/.cache/claude-proxy/bench-history.db)")
+
+    p_hist = sub.add_parser("history", help="Recorded dry-run trend and regression check")
+    p_hist.add_argument("--db", default=None, help="History database (default: ~/.cache/claude-proxy/bench-history.db)")
+    p_hist.add_argument("--limit", type=int, default=6, help="Most recent runs to show")
+    p_hist.add_argument("--scenario", default=None, help="Only this scenario")
+    p_hist.add_argument("--source", default=None, help='Only runs from this source ("local" or "port:47000")')
+    p_hist.add_argument("--baseline", default=None, metavar="REV",
+                        help="Compare against the latest run of this git revision (default: previous revision)")
+    p_hist.add_argument("--timing-tolerance", type=float, default=0.10,
+                        help="Slowdown (fraction of baseline mean) the CI must exceed to count as a regression")
+    p_hist.add_argument("--ratio-tolerance", type=float, default=0.5,
+                        help="Reduction drop (percentage points) the CI must exceed to count as a regression")
+    p_hist.add_argument("--check", action="store_true", help="Exit 1 if the latest run regressed")
+    p_hist.add_argument("--json", action="store_true", help="Print runs and findings as JSON")
 
     p_cmp = sub.add_parser("compare", help="Compare two proxy ports side-by-side")
     p_cmp.add_argument("--primary", type=int, default=47000)
@@ -1031,14 +1972,83 @@ def main() -> None:
     p_watch.add_argument("--port", type=int, default=47000)
     p_watch.add_argument("--interval", type=float, default=2.0)
 
+    p_load = sub.add_parser("load", help="Streaming load test against a mock upstream")
+    p_load.add_argument("--port", type=int, default=47050, help="Proxy port (spawned unless --no-spawn)")
+    p_load.add_argument("--mock-port", type=int, default=47100)
+    p_load.add_argument("--no-spawn", action="store_true",
+                        help="Use an already running proxy (start it with PROXY_ANTHROPIC_URL pointing at the mock)")
+    p_load.add_argument("--workers", type=int, default=1, help="Proxy workers when spawning")
+    p_load.add_argument("--concurrency", type=int, default=10, help="Closed-loop concurrent clients")
+    p_load.add_argument("--rate", type=float, default=None, help="Open-loop arrival rate (req/s); overrides --concurrency")
+    p_load.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load")
+    p_load.add_argument("--payload", choices=sorted(PAYLOADS), default="short")
+    p_load.add_argument("--model", default="claude-sonnet-4-6")
+    p_load.add_argument("--provider", choices=["anthropic", "bedrock", "fallback"], default="anthropic",
+                        help="Upstream path to exercise (bedrock: mock bedrock-runtime via BEDROCK_ENDPOINT_URL; "
+                             "fallback: both, Anthropic first)")
+    p_load.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    add_mock_arguments(p_load)
+
+    p_chaos = sub.add_parser("chaos", help="Scripted outage scenario with a recovery report")
+    p_chaos.add_argument("--port", type=int, default=47050, help="Proxy port")
+    p_chaos.add_argument("--mock-port", type=int, default=47100)
+    p_chaos.add_argument("--workers", type=int, default=1, help="Proxy workers")
+    p_chaos.add_argument("--rate", type=float, default=5.0, help="Open-loop arrival rate (req/s)")
+    p_chaos.add_argument("--duration", type=float, default=None, help="Seconds of load (default: scenario length)")
+    p_chaos.add_argument("--payload", choices=sorted(PAYLOADS), default="short")
+    p_chaos.add_argument("--model", default="claude-sonnet-4-6")
+    p_chaos.add_argument("--cooldown", type=int, default=10, help="Proxy COOLDOWN_SECONDS for the run")
+    p_chaos.add_argument("--probe-interval", type=int, default=5, help="Proxy HEALTH_PROBE_INTERVAL for the run")
+    p_chaos.add_argument("--output", default=None, help="Also write the JSON report here")
+    p_chaos.add_argument("--json", action="store_true", help="Print the report as JSON")
+    add_mock_arguments(p_chaos)
+    # Short responses keep slow-drip windows tractable; fixed seed keeps runs reproducible
+    p_chaos.set_defaults(output_tokens=50, seed=1234)
+
+    p_replay = sub.add_parser("replay", help="Replay real Claude Code transcripts (anonymized)")
+    p_replay.add_argument("--target", choices=["dry-run", "proxy"], default="dry-run",
+                          help="dry-run: compression only; proxy: full proxy against the mock upstream")
+    p_replay.add_argument("--local", action="store_true", help="dry-run: compress in-process instead of via a proxy")
+    p_replay.add_argument("--projects-dir", default=None, help="Transcript root (default: ~/.claude/projects)")
+    p_replay.add_argument("--project", default=None, help="Only projects whose directory name contains this")
+    p_replay.add_argument("--session", action="append", default=None, metavar="FILE",
+                          help="Replay this transcript file (repeatable; overrides discovery)")
+    p_replay.add_argument("--sessions", type=int, default=5, help="Most recent sessions to replay")
+    p_replay.add_argument("--max-requests", type=int, default=None, help="First N requests of each session")
+    p_replay.add_argument("--speed", type=float, default=0.0,
+                          help="Time compression of the original arrivals (1 = real time, 0 = back to back)")
+    p_replay.add_argument("--max-gap", type=float, default=30.0, help="Cap idle gaps at this many seconds")
+    p_replay.add_argument("--salt", default=None, help="Anonymization salt (default: random per run)")
+    p_replay.add_argument("--no-anonymize", action="store_true", help="Send the original text")
+    p_replay.add_argument("--port", type=int, default=None,
+                          help="Proxy port (default: 47000 for dry-run, 47050 for a spawned proxy)")
+    p_replay.add_argument("--mock-port", type=int, default=47100)
+    p_replay.add_argument("--no-spawn", action="store_true", help="proxy: use an already running proxy + mock")
+    p_replay.add_argument("--workers", type=int, default=1, help="Proxy workers when spawning")
+    p_replay.add_argument("--model", default=None, help="proxy: override the transcript's model")
+    p_replay.add_argument("--provider", choices=["anthropic", "bedrock", "fallback"], default="anthropic")
+    p_replay.add_argument("--output", default=None, help="Also write the JSON report here")
+    p_replay.add_argument("--json", action="store_true", help="Print the report as JSON")
+    add_mock_arguments(p_replay)
+
     args = parser.parse_args()
 
     if args.command == "dry-run":
-        cmd_dry_run(args.port, args.dir)
+        cmd_dry_run(args.port, args.dir, repeat=args.repeat, record=args.record, local=args.local, db_path=args.db)
+    elif args.command == "history":
+        cmd_history(args)
     elif args.command == "compare":
         cmd_compare(args.primary, args.secondary, args.dir)
     elif args.command == "watch":
         cmd_watch(args.port, args.interval)
+    elif args.command == "load":
+        cmd_load(args)
+    elif args.command == "chaos":
+        if not args.scenario:
+            p_chaos.error(f"--scenario is required (one of: {', '.join(sorted(SCENARIOS))})")
+        cmd_chaos(args)
+    elif args.command == "replay":
+        cmd_replay(args)
 
 
 if __name__ == "__main__":
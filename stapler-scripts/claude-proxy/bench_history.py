@@ -0,0 +1,199 @@
+"""Benchmark history store and regression detection for `bench.py`.
+
+`bench.py dry-run --record` appends one run (git revision, compactor version,
+source) with every repeat of every scenario to a SQLite file. `bench.py history`
+reads it back, summarizes each scenario as mean ± 95% confidence interval,
+and compares the latest run against a baseline run with a Welch interval on
+the difference of means:
+
+  timing_ms      regression if the whole interval sits above +timing_tolerance
+                 (fraction of the baseline mean) — i.e. slower beyond noise
+  reduction_pct  regression if the whole interval sits below -ratio_tolerance
+                 percentage points — i.e. compresses less beyond noise
+"""
+import math
+import os
+import sqlite3
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_DB_PATH = os.path.expanduser("~/.cache/claude-proxy/bench-history.db")
+
+METRICS = ("reduction_pct", "timing_ms")
+
+# Two-sided 95% Student t critical values by degrees of freedom (df > 30 → normal)
+_T_975 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+]
+
+
+def t_critical(df: float) -> float:
+    """95% two-sided t critical value (df rounded down, at least 1)."""
+    df = max(1, int(df))
+    return _T_975[df - 1] if df <= len(_T_975) else 1.96
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    """Mean, sample stdev and 95% confidence interval of the mean."""
+    n = len(values)
+    if n == 0:
+        return {"n": 0, "mean": 0.0, "stdev": 0.0, "ci_low": 0.0, "ci_high": 0.0}
+    mean = statistics.fmean(values)
+    stdev = statistics.stdev(values) if n > 1 else 0.0
+    half = t_critical(n - 1) * stdev / math.sqrt(n) if n > 1 else 0.0
+    return {"n": n, "mean": mean, "stdev": stdev, "ci_low": mean - half, "ci_high": mean + half}
+
+
+def diff_interval(baseline: List[float], current: List[float]) -> Dict[str, float]:
+    """Welch 95% interval for mean(current) - mean(baseline)."""
+    b, c = summarize(baseline), summarize(current)
+    diff = c["mean"] - b["mean"]
+    var_b = b["stdev"] ** 2 / b["n"] if b["n"] else 0.0
+    var_c = c["stdev"] ** 2 / c["n"] if c["n"] else 0.0
+    se = math.sqrt(var_b + var_c)
+    if se == 0:
+        return {"diff": diff, "ci_low": diff, "ci_high": diff}
+    # Welch–Satterthwaite degrees of freedom
+    denom = (var_b ** 2 / (b["n"] - 1) if b["n"] > 1 else 0.0) + (var_c ** 2 / (c["n"] - 1) if c["n"] > 1 else 0.0)
+    df = (var_b + var_c) ** 2 / denom if denom else 1
+    half = t_critical(df) * se
+    return {"diff": diff, "ci_low": diff - half, "ci_high": diff + half}
+
+
+def detect_regressions(
+    baseline: Dict[str, List[Dict[str, float]]],
+    current: Dict[str, List[Dict[str, float]]],
+    timing_tolerance: float = 0.10,
+    ratio_tolerance: float = 0.5,
+) -> List[Dict[str, Any]]:
+    """Compare two runs' samples ({scenario: [sample, ...]}) scenario by scenario.
+
+    Returns one entry per scenario present in both runs with the per-metric
+    intervals and a verdict: "regression", "improvement" or "ok".
+    """
+    findings = []
+    for scenario in sorted(set(baseline) & set(current)):
+        entry: Dict[str, Any] = {"scenario": scenario, "verdict": "ok", "metrics": {}}
+        for metric in METRICS:
+            b = [s[metric] for s in baseline[scenario] if s.get(metric) is not None]
+            c = [s[metric] for s in current[scenario] if s.get(metric) is not None]
+            if not b or not c:
+                continue
+            interval = diff_interval(b, c)
+            if metric == "timing_ms":
+                threshold = timing_tolerance * statistics.fmean(b)
+                worse, better = interval["ci_low"] > threshold, interval["ci_high"] < -threshold
+            else:
+                worse, better = interval["ci_high"] < -ratio_tolerance, interval["ci_low"] > ratio_tolerance
+            verdict = "regression" if worse else "improvement" if better else "ok"
+            entry["metrics"][metric] = {
+                "baseline": summarize(b), "current": summarize(c), **interval, "verdict": verdict,
+            }
+            if verdict == "regression":
+                entry["verdict"] = "regression"
+            elif verdict == "improvement" and entry["verdict"] == "ok":
+                entry["verdict"] = "improvement"
+        findings.append(entry)
+    return findings
+
+
+class BenchHistory:
+    """SQLite store of benchmark runs and their per-scenario samples."""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or DEFAULT_DB_PATH
+        os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+        self._init_db()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self) -> None:
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created REAL NOT NULL,
+                    git_rev TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    engine_version TEXT,
+                    repeats INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS samples (
+                    run_id INTEGER NOT NULL REFERENCES runs(id) ON DELETE CASCADE,
+                    scenario TEXT NOT NULL,
+                    repeat INTEGER NOT NULL,
+                    tokens_before INTEGER,
+                    tokens_after INTEGER,
+                    reduction_pct REAL,
+                    timing_ms REAL,
+                    elapsed_ms REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_samples_run ON samples(run_id, scenario);
+                CREATE INDEX IF NOT EXISTS idx_runs_rev ON runs(git_rev);
+            """)
+
+    def record_run(self, git_rev: str, source: str, samples: List[Dict[str, Any]],
+                   engine_version: Optional[str] = None, created: Optional[float] = None) -> int:
+        """Store one run. Each sample: scenario, repeat, tokens_before/after, reduction_pct, timing_ms, elapsed_ms."""
+        repeats = max((s["repeat"] for s in samples), default=-1) + 1
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO runs (created, git_rev, source, engine_version, repeats) VALUES (?, ?, ?, ?, ?)",
+                (created or time.time(), git_rev, source, engine_version, repeats),
+            )
+            run_id = cur.lastrowid
+            conn.executemany(
+                """INSERT INTO samples (run_id, scenario, repeat, tokens_before, tokens_after,
+                                        reduction_pct, timing_ms, elapsed_ms)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                [(run_id, s["scenario"], s["repeat"], s.get("tokens_before"), s.get("tokens_after"),
+                  s.get("reduction_pct"), s.get("timing_ms"), s.get("elapsed_ms")) for s in samples],
+            )
+        return run_id
+
+    def runs(self, limit: Optional[int] = None, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Runs oldest first (the newest `limit` of them), optionally for one source."""
+        query = "SELECT * FROM runs"
+        params: list = []
+        if source:
+            query += " WHERE source = ?"
+            params.append(source)
+        query += " ORDER BY id DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._connect() as conn:
+            rows = [dict(r) for r in conn.execute(query, params)]
+        return rows[::-1]
+
+    def samples(self, run_id: int) -> Dict[str, List[Dict[str, Any]]]:
+        """{scenario: [sample, ...]} for one run."""
+        out: Dict[str, List[Dict[str, Any]]] = {}
+        with self._connect() as conn:
+            for row in conn.execute(
+                "SELECT * FROM samples WHERE run_id = ? ORDER BY scenario, repeat", (run_id,)
+            ):
+                out.setdefault(row["scenario"], []).append(dict(row))
+        return out
+
+    def baseline_for(self, run: Dict[str, Any], git_rev: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Baseline to compare `run` against: the latest earlier run of `git_rev`,
+        or by default the latest earlier run (same source) from a different revision."""
+        with self._connect() as conn:
+            if git_rev:
+                row = conn.execute(
+                    "SELECT * FROM runs WHERE id < ? AND source = ? AND git_rev LIKE ? ORDER BY id DESC LIMIT 1",
+                    (run["id"], run["source"], f"{git_rev}%"),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    "SELECT * FROM runs WHERE id < ? AND source = ? AND git_rev != ? ORDER BY id DESC LIMIT 1",
+                    (run["id"], run["source"], run["git_rev"]),
+                ).fetchone()
+        return dict(row) if row else None
@@ -0,0 +1,195 @@
+"""Automatic cache_control breakpoint placement.
+
+Clients send prompt-cache markers of varying quality: some none, some only on
+the system prompt, some on blocks that change every turn. BreakpointOptimizer
+rewrites the markers of a /v1/messages body to one of a few placements at
+stable prefix boundaries (the cache prefix runs tools → system → messages):
+
+  client       leave the client's markers alone (the baseline)
+  tail         system + the final message (each turn writes the prefix the
+               next one reads, relying on the 20-block lookback)
+  stable_tail  system + the previous user turn (the prefix the last request
+               wrote, so this one reads it even after a long tool turn) +
+               the final message
+  full         stable_tail + the first user message (the conversation root,
+               which survives client-side compaction of later turns)
+
+Tools get no marker of their own: both providers strip cache_control from
+tool definitions, and the system breakpoint already covers the tools prefix.
+At most MAX_BREAKPOINTS markers are placed.
+
+Which placement works best depends on the client's request shape, so it is
+learned per client (User-Agent product) from the usage each response reports:
+every placement is tried `min_samples` times, then the one with the highest
+mean cache-read ratio (cache_read / all input tokens) is used, exploring the
+others with probability `epsilon`. A conversation keeps the placement it was
+first given, so its cache reads are measured under one placement; it is
+recognised by conversation_key(), which ignores the markers the client moves
+every turn. State is per worker and in memory.
+"""
+import logging
+import random
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from affinity import conversation_key
+
+logger = logging.getLogger(__name__)
+
+MAX_BREAKPOINTS = 4  # Anthropic / Bedrock limit per request
+PLACEMENTS = ("client", "tail", "stable_tail", "full")
+UNCACHEABLE_BLOCKS = ("thinking", "redacted_thinking")
+
+
+def client_name(user_agent: Optional[str]) -> str:
+    """Product part of a User-Agent ("claude-cli/2.0.14 (external, cli)" → "claude-cli")."""
+    if not user_agent:
+        return "unknown"
+    return user_agent.split("/", 1)[0].split(" ", 1)[0].strip().lower() or "unknown"
+
+
+def _strip_markers(blocks: List[Any]) -> Tuple[List[Any], List[Any]]:
+    """(blocks without cache_control, the markers removed)."""
+    removed, out = [], []
+    for block in blocks:
+        if isinstance(block, dict) and "cache_control" in block:
+            block = dict(block)
+            removed.append(block.pop("cache_control"))
+            out.append(block)
+        else:
+            out.append(block)
+    return out, removed
+
+
+def _as_blocks(content: Any) -> List[Any]:
+    if isinstance(content, str):
+        return [{"type": "text", "text": content}] if content else []
+    return list(content) if isinstance(content, list) else []
+
+
+def _mark_last(blocks: List[Any], marker: Dict[str, Any]) -> bool:
+    """Put `marker` on the last block that can carry one. False if there is none."""
+    for i in range(len(blocks) - 1, -1, -1):
+        block = blocks[i]
+        if not isinstance(block, dict) or block.get("type") in UNCACHEABLE_BLOCKS:
+            continue
+        if block.get("type") == "text" and not block.get("text"):
+            continue
+        blocks[i] = {**block, "cache_control": marker}
+        return True
+    return False
+
+
+def place_breakpoints(body: Dict[str, Any], placement: str) -> Dict[str, Any]:
+    """`body` with its system / message markers replaced by `placement`'s (shallow copies; input untouched)."""
+    if placement == "client":
+        return body
+    messages = body.get("messages") or []
+    system = body.get("system")
+
+    # Drop the client's markers, keeping their settings (e.g. ttl) if they agree on one
+    new_system = _as_blocks(system) if system else []
+    new_system, markers = _strip_markers(new_system)
+    new_messages = []
+    for message in messages:
+        if isinstance(message, dict) and isinstance(message.get("content"), list):
+            content, removed = _strip_markers(message["content"])
+            if removed:
+                markers += removed
+                message = {**message, "content": content}
+        new_messages.append(message)
+    marker = markers[0] if markers and all(m == markers[0] for m in markers) else {"type": "ephemeral"}
+
+    user_turns = [i for i, m in enumerate(new_messages) if isinstance(m, dict) and m.get("role") == "user"]
+    targets = [len(new_messages) - 1] if new_messages else []
+    if placement in ("stable_tail", "full") and len(user_turns) >= 2:
+        targets.append(user_turns[-2])
+    if placement == "full" and user_turns:
+        targets.append(user_turns[0])
+
+    placed = 0
+    if new_system and _mark_last(new_system, marker):
+        placed += 1
+    for index in sorted(set(targets), reverse=True):
+        if placed >= MAX_BREAKPOINTS:
+            break
+        message = new_messages[index]
+        if not isinstance(message, dict):
+            continue
+        content = _as_blocks(message.get("content"))
+        if _mark_last(content, marker):
+            new_messages[index] = {**message, "content": content}
+            placed += 1
+
+    out = {**body, "messages": new_messages}
+    if system:
+        out["system"] = new_system
+    return out
+
+
+class _Arm:
+    __slots__ = ("samples", "read_ratio")
+
+    def __init__(self):
+        self.samples = 0
+        self.read_ratio = 0.0  # mean cache_read / all input tokens
+
+
+class BreakpointOptimizer:
+    """Per-client choice of breakpoint placement, learned from response usage."""
+
+    def __init__(self, epsilon: float = 0.1, min_samples: int = 10, max_conversations: int = 4096,
+                 rng: Optional[random.Random] = None):
+        self.epsilon = epsilon
+        self.min_samples = min_samples
+        self.max_conversations = max_conversations
+        self._rng = rng or random.Random()
+        self._arms: Dict[str, Dict[str, _Arm]] = {}  # client → placement → arm
+        self._conversations: "OrderedDict[str, str]" = OrderedDict()  # conversation key → placement (LRU)
+
+    def _choose(self, client: str) -> str:
+        arms = self._arms.setdefault(client, {p: _Arm() for p in PLACEMENTS})
+        untried = [p for p in PLACEMENTS if arms[p].samples < self.min_samples]
+        if untried:
+            return min(untried, key=lambda p: arms[p].samples)
+        if self._rng.random() < self.epsilon:
+            return self._rng.choice(PLACEMENTS)
+        return max(PLACEMENTS, key=lambda p: arms[p].read_ratio)
+
+    def apply(self, body: Dict[str, Any], client: str) -> Tuple[Dict[str, Any], str]:
+        """(body with breakpoints placed, placement used) — pass the placement back to observe()."""
+        key = conversation_key(body)
+        placement = self._conversations.get(key) if key else None
+        if placement is None:
+            placement = self._choose(client)
+            if key:
+                self._conversations[key] = placement
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+        elif key:
+            self._conversations.move_to_end(key)
+        return place_breakpoints(body, placement), placement
+
+    def observe(self, client: str, placement: str, usage: Optional[Dict[str, Any]]) -> None:
+        """Score `placement` for `client` with a response's usage."""
+        if not usage:
+            return
+        read = usage.get("cache_read_input_tokens") or 0
+        total = read + (usage.get("cache_creation_input_tokens") or 0) + (usage.get("input_tokens") or 0)
+        if total <= 0:
+            return
+        arm = self._arms.setdefault(client, {p: _Arm() for p in PLACEMENTS})[placement]
+        arm.samples += 1
+        arm.read_ratio += (read / total - arm.read_ratio) / arm.samples
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "conversations": len(self._conversations),
+            "clients": {
+                client: {
+                    placement: {"samples": arm.samples, "read_ratio": round(arm.read_ratio, 4)}
+                    for placement, arm in arms.items()
+                }
+                for client, arms in self._arms.items()
+            },
+        }
@@ -0,0 +1,105 @@
+"""Scripted outage timelines for mock_upstream.py (see `bench.py chaos`).
+
+A Scenario is a list of Faults, each active on one upstream ("anthropic" or
+"bedrock") for a window of seconds measured from the scenario clock start.
+The mock consults the active fault on every request, so the proxy's real
+FallbackHandler — cooldowns, Bedrock retries, health probes, stream resume —
+is exercised under load and the outcome can be measured end to end.
+
+Fault kinds:
+  overloaded         Anthropic 529 overloaded_error / Bedrock 503 ServiceUnavailable
+  rate_limit         Anthropic 429 / Bedrock 429 ThrottlingException
+  server_error       Anthropic 500 api_error / Bedrock 500 InternalServerException
+  slow_drip          stream completes, but at `token_rate` tokens/sec
+  disconnect         connection dropped after `after_tokens` content deltas
+  credential_expiry  Anthropic 401 / Bedrock 403 ExpiredTokenException
+"""
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional
+
+FAULT_KINDS = ("overloaded", "rate_limit", "server_error", "slow_drip", "disconnect", "credential_expiry")
+
+# Faults answered with an error status before any response body is sent
+ERROR_FAULTS = ("overloaded", "rate_limit", "server_error", "credential_expiry")
+
+
+@dataclass
+class Fault:
+    target: str  # "anthropic" or "bedrock"
+    kind: str  # one of FAULT_KINDS
+    start: float  # seconds from scenario start
+    end: float
+    rate: float = 1.0  # fraction of requests in the window that are affected
+    retry_after: Optional[int] = None  # retry-after header on 429/529 (None = omit)
+    token_rate: float = 2.0  # slow_drip pacing
+    after_tokens: int = 10  # disconnect point
+
+    def __post_init__(self):
+        if self.kind not in FAULT_KINDS:
+            raise ValueError(f"unknown fault kind {self.kind!r} (expected one of {', '.join(FAULT_KINDS)})")
+        if self.target not in ("anthropic", "bedrock"):
+            raise ValueError(f"unknown fault target {self.target!r}")
+
+
+@dataclass
+class Scenario:
+    name: str
+    description: str
+    duration: float  # seconds of load to drive
+    faults: List[Fault] = field(default_factory=list)
+
+    def active(self, target: str, elapsed: float) -> Optional[Fault]:
+        """The fault covering `target` at `elapsed` seconds, if any (first match wins)."""
+        for fault in self.faults:
+            if fault.target == target and fault.start <= elapsed < fault.end:
+                return fault
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+SCENARIOS: Dict[str, Scenario] = {s.name: s for s in [
+    Scenario(
+        "529-storm",
+        "Anthropic returns 529 overloaded for 20s; traffic should shift to Bedrock and come back",
+        duration=60,
+        faults=[Fault("anthropic", "overloaded", 10, 30, retry_after=5)],
+    ),
+    Scenario(
+        "outage",
+        "Anthropic returns 500 for 20s; recovery depends on the health-probe loop",
+        duration=60,
+        faults=[Fault("anthropic", "server_error", 10, 30)],
+    ),
+    Scenario(
+        "throttle-both",
+        "Anthropic rate limited while Bedrock throttles half its calls — Bedrock retry amplification",
+        duration=60,
+        faults=[
+            Fault("anthropic", "rate_limit", 10, 40, retry_after=10),
+            Fault("bedrock", "rate_limit", 15, 30, rate=0.5),
+        ],
+    ),
+    Scenario(
+        "slow-drip",
+        "Anthropic streams at 10 tokens/sec for 20s — no error, just latency",
+        duration=60,
+        faults=[Fault("anthropic", "slow_drip", 10, 30, token_rate=10.0)],
+    ),
+    Scenario(
+        "mid-stream-disconnect",
+        "Half of Anthropic streams drop after 10 tokens for 20s; streams should resume on Bedrock",
+        duration=60,
+        faults=[Fault("anthropic", "disconnect", 10, 30, rate=0.5, after_tokens=10)],
+    ),
+    Scenario(
+        "credential-expiry",
+        "Anthropic OAuth token rejected for 20s; Bedrock credentials also expire for the last 5s of it",
+        duration=60,
+        faults=[
+            Fault("anthropic", "credential_expiry", 10, 30),
+            Fault("bedrock", "credential_expiry", 25, 30),
+        ],
+    ),
+]}
@@ -27,9 +27,7 @@ import json
 import logging
 from typing import Any
 
-from openfeature import api
-from openfeature.provider.in_memory_provider import InMemoryFlag, InMemoryProvider
-
+import tracing
 from config import COMPRESS_ENABLED, COMPRESS_FLOOR_BYTES
 
 logger = logging.getLogger(__name__)
@@ -62,6 +60,10 @@ def init_compactor() -> None:
         logger.error(f"FusionEngine init failed — compression disabled: {e}")
         return
 
+    # Imported here rather than at module level: only needed when compression is on
+    from openfeature import api
+    from openfeature.provider.in_memory_provider import InMemoryFlag, InMemoryProvider
+
     flags = {
         "compression-enabled": InMemoryFlag(
             default_variant="on",
@@ -233,7 +235,10 @@ def _run_compression_sync(
     if total_bytes < flags.get("floor", COMPRESS_FLOOR_BYTES):
         return messages, {"skipped": "below_floor", "total_bytes": total_bytes}
 
-    result = _engine.compress_messages(messages)
+    # asyncio.to_thread runs this in a copy of the caller's context, so the span nests under the request
+    with tracing.span("compactor.engine", **{"compactor.total_bytes": total_bytes,
+                                             "compactor.message_count": len(messages)}):
+        result = _engine.compress_messages(messages)
     return result["messages"], result["stats"]
 
 
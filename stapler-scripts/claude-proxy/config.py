@@ -1,7 +1,7 @@
 """Configuration settings for Claude Proxy."""
 import os
 import multiprocessing
-from typing import Optional
+from typing import List, Optional
 
 # OAuth token for Anthropic API — falls back to macOS Keychain entry written by Claude Code
 def _get_token_from_keychain() -> Optional[str]:
@@ -24,20 +24,63 @@ def _get_token_from_keychain() -> Optional[str]:
 CLAUDE_CODE_OAUTH_TOKEN: Optional[str] = (
     os.environ.get("CLAUDE_CODE_OAUTH_TOKEN") or _get_token_from_keychain()
 )
+ANTHROPIC_CREDENTIALS: List[str] = [t.strip() for t in os.environ.get("ANTHROPIC_CREDENTIALS", "").split(",") if t.strip()]  # Token / API key pool used instead of the request's token (see providers/anthropic_pool.py)
 
 # AWS settings for Bedrock
 AWS_PROFILE: str = os.environ.get("AWS_PROFILE", "Sandbox.AdministratorAccess")
 AWS_REGION: str = os.environ.get("AWS_REGION", "us-west-2")
 
+# Upstream endpoints — override to point at a local mock (see mock_upstream.py, `bench.py load`).
+# Not ANTHROPIC_BASE_URL: Claude Code reads that one to find this proxy.
+ANTHROPIC_API_URL: str = os.environ.get("PROXY_ANTHROPIC_URL", "https://api.anthropic.com")
+BEDROCK_ENABLED: bool = os.environ.get("BEDROCK_ENABLED", "1") != "0"  # Set to 0 for Anthropic-only
+BEDROCK_ENDPOINT_URL: Optional[str] = os.environ.get("BEDROCK_ENDPOINT_URL") or None  # bedrock-runtime endpoint override
+
 # Proxy settings
 PROXY_PORT: int = int(os.environ.get("PROXY_PORT", "47000"))
 COOLDOWN_SECONDS: int = int(os.environ.get("COOLDOWN_SECONDS", "300"))  # 5 minutes
+HEALTH_PROBE_INTERVAL: int = int(os.environ.get("HEALTH_PROBE_INTERVAL", "60"))  # Server-error cooldown / probe period
 REQUEST_TIMEOUT: int = int(os.environ.get("REQUEST_TIMEOUT", "300"))  # 5 minutes
+BEDROCK_ENDPOINTS: List[str] = [s.strip() for s in os.environ.get("BEDROCK_ENDPOINTS", "").split(",") if s.strip()]  # Regions / profile@region to spread load over (see providers/bedrock_pool.py); default: AWS_REGION
 BEDROCK_MAX_RETRIES: int = int(os.environ.get("BEDROCK_MAX_RETRIES", "20"))  # Retry rate limits/timeouts
 BEDROCK_THREAD_POOL_SIZE: int = int(os.environ.get("BEDROCK_THREAD_POOL_SIZE", "40"))  # Threads for boto3 calls per worker
+BEDROCK_POOL_AUTOSCALE: bool = os.environ.get("BEDROCK_POOL_AUTOSCALE", "0") == "1"  # Grow the boto3 pools when calls queue (see thread_pool.py)
+BEDROCK_POOL_MAX_SIZE: int = int(os.environ.get("BEDROCK_POOL_MAX_SIZE", str(BEDROCK_THREAD_POOL_SIZE * 2)))  # Autoscaling ceiling per pool
+BEDROCK_POOL_TARGET_WAIT_MS: float = float(os.environ.get("BEDROCK_POOL_TARGET_WAIT_MS", "50"))  # Grow when p95 queue wait exceeds this
+BEDROCK_CREDENTIAL_REFRESH_AHEAD: int = int(os.environ.get("BEDROCK_CREDENTIAL_REFRESH_AHEAD", "600"))  # Refresh AWS credentials this many seconds before expiry
+BEDROCK_CREDENTIAL_CHECK_INTERVAL: int = int(os.environ.get("BEDROCK_CREDENTIAL_CHECK_INTERVAL", "60"))  # Longest gap between background credential checks
+PROVIDER_AFFINITY: bool = os.environ.get("PROVIDER_AFFINITY", "1") != "0"  # Keep conversations on the provider holding their warm prompt cache (see affinity.py)
+AFFINITY_TTL: int = int(os.environ.get("AFFINITY_TTL", "300"))  # Seconds a conversation stays pinned after its last cached response (prompt cache lifetime)
+AFFINITY_MIN_CACHED_TOKENS: int = int(os.environ.get("AFFINITY_MIN_CACHED_TOKENS", "4096"))  # Smaller caches aren't worth pinning a conversation for
+CACHE_BREAKPOINTS: bool = os.environ.get("CACHE_BREAKPOINTS", "0") == "1"  # Re-place cache_control markers at stable prefix boundaries (see cache_breakpoints.py)
+CACHE_BREAKPOINTS_EPSILON: float = float(os.environ.get("CACHE_BREAKPOINTS_EPSILON", "0.1"))  # Share of conversations given a non-best placement to keep learning
+PRIORITY_MAX_CONCURRENT: int = int(os.environ.get("PRIORITY_MAX_CONCURRENT", "0"))  # Upstream requests in flight per worker before the rest queue by priority (0 = never queue)
+PRIORITY_WEIGHTS: str = os.environ.get("PRIORITY_WEIGHTS", "interactive=4,background=1")  # Share of queued slots per class
+PRIORITY_RULES: Optional[str] = os.environ.get("PRIORITY_RULES")  # JSON list of classification rules; unset = built-in rules (see priority.py)
+STREAM_RESUME_ENABLED: bool = os.environ.get("STREAM_RESUME", "1") != "0"  # Continue interrupted streams on the next provider
 WORKERS: int = int(os.environ.get("WORKERS", str(multiprocessing.cpu_count())))  # Default: one worker per CPU core
+PRELOAD_WORKERS: bool = os.environ.get("PRELOAD_WORKERS", "0") == "1"  # `python main.py`: import shared packages once, then fork workers (see startup.py)
+DEBUG_TOKEN: Optional[str] = os.environ.get("PROXY_DEBUG_TOKEN") or None  # Enables /debug/* (Bearer token); unset = disabled
+TRACING: Optional[str] = os.environ.get("PROXY_TRACING") or None  # OpenTelemetry spans: "file" or "otlp"; unset = off (see tracing.py)
+TRACE_FILE: Optional[str] = os.environ.get("PROXY_TRACE_FILE") or None  # PROXY_TRACING=file output; default $LOG_DIR/claude-proxy.traces.jsonl
+REQUEST_SNAPSHOT_MAX_BYTES: int = int(os.environ.get("REQUEST_SNAPSHOT_MAX_BYTES", str(32 * 1024 * 1024)))  # Compressed request bodies kept in memory for /requests/{id}, per worker
+REQUEST_SNAPSHOT_SPILL_BYTES: int = int(os.environ.get("REQUEST_SNAPSHOT_SPILL_BYTES", "0"))  # mmap'd on-disk ring for evicted snapshots, per worker; 0 = off
+COUNT_TOKENS_LOCAL: bool = os.environ.get("COUNT_TOKENS_LOCAL", "1") != "0"  # Answer count_tokens locally when confident (see token_estimator.py)
+COUNT_TOKENS_TOLERANCE: float = float(os.environ.get("COUNT_TOKENS_TOLERANCE", "0.02"))  # Max expected relative error of a local answer
+COUNT_TOKENS_VERIFY_EVERY: int = int(os.environ.get("COUNT_TOKENS_VERIFY_EVERY", "10"))  # Check every Nth local answer upstream (0 = never)
 
 # Compression (stapler-compactor)
 # Set STAPLER_COMPRESS=0 to disable all compression (killswitch per ADR-004)
 COMPRESS_ENABLED: bool = os.environ.get("STAPLER_COMPRESS", "1") != "0"
-COMPRESS_FLOOR_BYTES: int = int(os.environ.get("COMPRESS_FLOOR_BYTES", "4096"))
\ No newline at end of file
+COMPRESS_FLOOR_BYTES: int = int(os.environ.get("COMPRESS_FLOOR_BYTES", "4096"))
+
+# Error tracker retention (applied hourly by a background task)
+ERROR_OCCURRENCE_RETENTION_DAYS: int = int(os.environ.get("ERROR_OCCURRENCE_RETENTION_DAYS", "90"))  # Raw per-error rows
+ERROR_HOURLY_RETENTION_DAYS: int = int(os.environ.get("ERROR_HOURLY_RETENTION_DAYS", "30"))  # Hourly rollups
+ERROR_DAILY_RETENTION_DAYS: int = int(os.environ.get("ERROR_DAILY_RETENTION_DAYS", "400"))  # Daily rollups
+
+# Logging
+LOG_DIR: str = os.environ.get("LOG_DIR", "/tmp")  # claude-proxy.app.log / claude-proxy.http.log live here
+LOG_FORMAT: str = os.environ.get("LOG_FORMAT", "text")  # "text" or "json" (one JSON object per line)
+LOG_SAMPLE_BURST: int = int(os.environ.get("LOG_SAMPLE_BURST", "20"))  # INFO/DEBUG records per call site per window (0 = no sampling)
+LOG_SAMPLE_WINDOW: float = float(os.environ.get("LOG_SAMPLE_WINDOW", "1.0"))  # Sampling window in seconds
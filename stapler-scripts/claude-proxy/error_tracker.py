@@ -8,12 +8,15 @@ This module provides:
 - macOS desktop notifications for new errors
 """
 
+import functools
 import hashlib
 import json
 import logging
+import queue
 import re
 import sqlite3
 import subprocess
+import threading
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -27,6 +30,42 @@ logger = logging.getLogger(__name__)
 # Story 1: Core Error Fingerprinting
 # =============================================================================
 
+# Patterns are compiled once at import — these run for every tracked error line
+
+# "Bedrock validation error: An error occurred (ValidationException) when calling the InvokeModel operation: message"
+_BEDROCK_SDK_RE = re.compile(
+    r'(?:Bedrock\s+)?(?:validation\s+)?(?:error:\s+)?An error occurred \((\w+)\) when calling the (\w+) operation:?\s*(.+)',
+    re.IGNORECASE,
+)
+# "Bedrock: ThrottlingException - Rate exceeded"
+_BEDROCK_SIMPLE_RE = re.compile(r'(?:Bedrock|bedrock):?\s+(\w+(?:Exception|Error))\s*[-:]\s*(.+)', re.IGNORECASE)
+# "SomeException: message"
+_GENERIC_EXCEPTION_RE = re.compile(r'(\w+(?:Exception|Error)):?\s*(.+)')
+
+# (pattern, replacement) pairs applied in order by normalize_message
+_NORMALIZE_PATTERNS = [
+    # Tool use IDs: toolu_bdrk_01XXXXX, toolu_01XXXXX (Anthropic/Bedrock tool IDs)
+    (re.compile(r'\btoolu_(?:bdrk_)?[0-9a-zA-Z]+'), '<TOOL_ID>'),
+    # UUID pattern: 8-4-4-4-12 hex digits
+    (re.compile(r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b'), '<UUID>'),
+    # AWS ARN pattern: arn:aws:service:region:account:resource
+    (re.compile(r'arn:aws:[a-z0-9-]+:[a-z0-9-]*:\d+:[a-zA-Z0-9/._-]+'), '<MODEL_ARN>'),
+    # Long numeric IDs (>10 digits, likely dynamic IDs not semantic numbers)
+    # But avoid replacing standalone small numbers (token counts, HTTP codes, etc.)
+    (re.compile(r'\b\d{11,}\b'), '<ID>'),
+    # Request ID patterns (common formats)
+    (re.compile(r'\brequest[_\s]?id[:\s]+[a-zA-Z0-9-]+', re.IGNORECASE), 'request_id <REQUEST_ID>'),
+    # Short hexadecimal IDs — 8 chars (request IDs like [b69743ce]) through 15 chars
+    # Must be bounded by non-word chars to avoid matching partial tokens
+    (re.compile(r'(?<!\w)[0-9a-fA-F]{8,15}(?!\w)'), '<HEX_ID>'),
+    # Long hexadecimal IDs (≥16 chars)
+    (re.compile(r'\b[0-9a-fA-F]{16,}\b'), '<HEX_ID>'),
+]
+
+# Error messages repeat heavily (throttling storms), so parsing and hashing
+# results are memoized per distinct message
+FINGERPRINT_CACHE_SIZE = 4096
+
 
 def extract_signature(error_message: str, provider: Optional[str] = None,
                      request_context: Optional[Dict[str, Any]] = None) -> Dict[str, str]:
@@ -64,9 +103,7 @@ def extract_signature(error_message: str, provider: Optional[str] = None,
     }
 
     # Pattern 1: Bedrock AWS SDK format
-    # "Bedrock validation error: An error occurred (ValidationException) when calling the InvokeModel operation: message"
-    bedrock_pattern = r'(?:Bedrock\s+)?(?:validation\s+)?(?:error:\s+)?An error occurred \((\w+)\) when calling the (\w+) operation:?\s*(.+)'
-    match = re.search(bedrock_pattern, error_message, re.IGNORECASE)
+    match = _BEDROCK_SDK_RE.search(error_message)
     if match:
         signature['provider'] = 'bedrock'
         signature['error_type'] = match.group(1)  # ValidationException
@@ -75,9 +112,7 @@ def extract_signature(error_message: str, provider: Optional[str] = None,
         return signature
 
     # Pattern 2: Bedrock simple format
-    # "Bedrock: ThrottlingException - Rate exceeded"
-    bedrock_simple = r'(?:Bedrock|bedrock):?\s+(\w+(?:Exception|Error))\s*[-:]\s*(.+)'
-    match = re.search(bedrock_simple, error_message, re.IGNORECASE)
+    match = _BEDROCK_SIMPLE_RE.search(error_message)
     if match:
         signature['provider'] = 'bedrock'
         signature['error_type'] = match.group(1)
@@ -106,9 +141,7 @@ def extract_signature(error_message: str, provider: Optional[str] = None,
         return signature
 
     # Pattern 6: Generic exception format (last resort)
-    # "SomeException: message"
-    generic_pattern = r'(\w+(?:Exception|Error)):?\s*(.+)'
-    match = re.search(generic_pattern, error_message)
+    match = _GENERIC_EXCEPTION_RE.search(error_message)
     if match:
         signature['error_type'] = match.group(1)
         signature['message'] = match.group(2).strip()
@@ -148,58 +181,9 @@ def normalize_message(message: str) -> str:
         >>> normalize_message("Maximum tokens 4096 exceeded")
         'Maximum tokens 4096 exceeded'  # Preserve semantic numbers
     """
-    # Tool use IDs: toolu_bdrk_01XXXXX, toolu_01XXXXX (Anthropic/Bedrock tool IDs)
-    normalized = re.sub(
-        r'\btoolu_(?:bdrk_)?[0-9a-zA-Z]+',
-        '<TOOL_ID>',
-        message
-    )
-
-    # UUID pattern: 8-4-4-4-12 hex digits
-    normalized = re.sub(
-        r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b',
-        '<UUID>',
-        normalized
-    )
-
-    # AWS ARN pattern: arn:aws:service:region:account:resource
-    normalized = re.sub(
-        r'arn:aws:[a-z0-9-]+:[a-z0-9-]*:\d+:[a-zA-Z0-9/._-]+',
-        '<MODEL_ARN>',
-        normalized
-    )
-
-    # Long numeric IDs (>10 digits, likely dynamic IDs not semantic numbers)
-    # But avoid replacing standalone small numbers (token counts, HTTP codes, etc.)
-    normalized = re.sub(
-        r'\b\d{11,}\b',
-        '<ID>',
-        normalized
-    )
-
-    # Request ID patterns (common formats)
-    normalized = re.sub(
-        r'\brequest[_\s]?id[:\s]+[a-zA-Z0-9-]+',
-        'request_id <REQUEST_ID>',
-        normalized,
-        flags=re.IGNORECASE
-    )
-
-    # Short hexadecimal IDs — 8 chars (request IDs like [b69743ce]) through 15 chars
-    # Must be bounded by non-word chars to avoid matching partial tokens
-    normalized = re.sub(
-        r'(?<!\w)[0-9a-fA-F]{8,15}(?!\w)',
-        '<HEX_ID>',
-        normalized
-    )
-
-    # Long hexadecimal IDs (≥16 chars)
-    normalized = re.sub(
-        r'\b[0-9a-fA-F]{16,}\b',
-        '<HEX_ID>',
-        normalized
-    )
-
+    normalized = message
+    for pattern, replacement in _NORMALIZE_PATTERNS:
+        normalized = pattern.sub(replacement, normalized)
     return normalized
 
 
@@ -221,26 +205,61 @@ def compute_fingerprint(signature: Dict[str, str]) -> str:
         >>> compute_fingerprint(sig)
         'a1b2c3d4e5f67890'  # Example (actual hash will differ)
     """
+    return _fingerprint(signature['provider'], signature['operation'],
+                        signature['error_type'], signature['message'])
+
+
+@functools.lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def _fingerprint(provider: str, operation: str, error_type: str, message: str) -> str:
     # Normalize message before hashing
-    normalized_msg = normalize_message(signature['message'])
+    normalized_msg = normalize_message(message)
 
     # Combine components in stable order
-    fingerprint_input = (
-        f"{signature['provider']}:"
-        f"{signature['operation']}:"
-        f"{signature['error_type']}:"
-        f"{normalized_msg}"
-    )
+    fingerprint_input = f"{provider}:{operation}:{error_type}:{normalized_msg}"
 
     # Compute SHA256 and take first 16 chars
     hash_obj = hashlib.sha256(fingerprint_input.encode('utf-8'))
     return hash_obj.hexdigest()[:16]
 
 
+def fingerprint_error(error_message: str, provider: Optional[str] = None) -> Tuple[Dict[str, str], str]:
+    """Extract signature and fingerprint for a raw error message, memoized.
+
+    Equivalent to extract_signature() followed by compute_fingerprint(), but
+    repeated messages skip the regex and hashing work entirely.
+
+    Returns:
+        Tuple of (signature, fingerprint). The signature is a fresh dict each call.
+    """
+    items, fingerprint = _signature_and_fingerprint(error_message, provider)
+    return dict(items), fingerprint
+
+
+@functools.lru_cache(maxsize=FINGERPRINT_CACHE_SIZE)
+def _signature_and_fingerprint(error_message: str, provider: Optional[str]) -> Tuple[tuple, str]:
+    signature = extract_signature(error_message, provider=provider)
+    return tuple(signature.items()), compute_fingerprint(signature)
+
+
 # =============================================================================
 # Story 2: Persistent Storage
 # =============================================================================
 
+# resolution -> rollup table
+ROLLUP_TABLES = {'hour': 'error_rollups_hourly', 'day': 'error_rollups_daily'}
+
+# SQL expression deriving a rollup bucket from error_occurrences.timestamp (ISO format)
+_BUCKET_SQL = {
+    'hour': "substr(o.timestamp, 1, 13) || ':00:00'",
+    'day': "substr(o.timestamp, 1, 10)",
+}
+
+
+def _hour_bucket(timestamp: str) -> str:
+    """ISO timestamp → hourly bucket key (YYYY-MM-DDTHH:00:00)."""
+    return timestamp[:13] + ':00:00'
+
+
 
 class ErrorTracker:
     """Persistent error tracking with SQLite storage.
@@ -250,14 +269,23 @@ class ErrorTracker:
     - Error fingerprinting and deduplication
     - 90-day retention policy
     - Query capabilities
+
+    Only genuinely new fingerprints are written to SQLite immediately (so the
+    is_new answer is authoritative). Repeats of known fingerprints accumulate
+    in memory — count, last_seen and occurrence rows — and are flushed in one
+    transaction every flush_interval seconds, once flush_threshold occurrences
+    are pending, or before any read.
     """
 
-    def __init__(self, db_path: Optional[str] = None):
+    def __init__(self, db_path: Optional[str] = None, flush_interval: float = 5.0,
+                 flush_threshold: int = 500):
         """Initialize error tracker with SQLite database.
 
         Args:
             db_path: Path to SQLite database file.
                      Defaults to ~/.cache/claude-proxy/error_tracker.db
+            flush_interval: Max seconds repeat counts stay buffered in memory
+            flush_threshold: Pending occurrences that force an early flush
         """
         if db_path is None:
             cache_dir = Path.home() / '.cache' / 'claude-proxy'
@@ -265,11 +293,21 @@ class ErrorTracker:
             db_path = str(cache_dir / 'error_tracker.db')
 
         self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._writer_conn: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+        self._known: set = set()  # fingerprints already in error_types
+        self._pending_counts: Dict[str, List] = {}  # fingerprint -> [count, last_seen]
+        self._pending_occurrences: List[tuple] = []
+        self._pending_rollups: Dict[Tuple[str, str, str], int] = {}  # (hour, fingerprint, provider) -> count
+        self._last_flush = time.monotonic()
         self._init_database()
 
     def _init_database(self) -> None:
         """Initialize database schema with WAL mode enabled."""
-        conn = sqlite3.connect(self.db_path)
+        # Autocommit: the rollup migration below manages its own transaction
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
         cursor = conn.cursor()
 
         # Enable WAL mode for better concurrency
@@ -324,10 +362,56 @@ class ErrorTracker:
             ON error_types(last_seen)
         """)
 
-        conn.commit()
+        # Rollup tables: per-fingerprint counts per hour / per day, maintained
+        # incrementally so time-series queries never scan error_occurrences.
+        # Every worker opens the database at startup: the check, the tables and
+        # the backfill share one write transaction, so only one of them migrates
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self._create_rollup_tables(cursor)
+            cursor.execute("COMMIT")
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+
+        self._known = {row[0] for row in cursor.execute("SELECT fingerprint FROM error_types")}
         conn.close()
 
-        logger.info(f"Error tracker database initialized: {self.db_path}")
+        logger.info(f"Error tracker database initialized: {self.db_path} ({len(self._known)} known error types)")
+
+    @staticmethod
+    def _create_rollup_tables(cursor: sqlite3.Cursor) -> None:
+        """Create the rollup tables, backfilling them if the database predates them (inside a transaction)."""
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='error_rollups_hourly'")
+        needs_backfill = cursor.fetchone() is None
+        for table in ROLLUP_TABLES.values():
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,  -- hourly: YYYY-MM-DDTHH:00:00, daily: YYYY-MM-DD
+                    fingerprint TEXT NOT NULL,
+                    provider TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (bucket, fingerprint)
+                ) WITHOUT ROWID
+            """)
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_fingerprint
+                ON {table}(fingerprint, bucket)
+            """)
+            cursor.execute(f"""
+                CREATE INDEX IF NOT EXISTS idx_{table}_provider
+                ON {table}(provider, bucket)
+            """)
+
+        if needs_backfill:
+            # One-time migration for databases created before rollups existed
+            for resolution, table in ROLLUP_TABLES.items():
+                cursor.execute(f"""
+                    INSERT INTO {table} (bucket, fingerprint, provider, count)
+                    SELECT {_BUCKET_SQL[resolution]}, o.fingerprint, t.provider, COUNT(*)
+                    FROM error_occurrences o JOIN error_types t ON t.fingerprint = o.fingerprint
+                    GROUP BY 1, 2
+                """)
 
     def record_error(self, signature: Dict[str, str],
                     context: Optional[Dict[str, Any]] = None) -> Tuple[str, bool]:
@@ -349,14 +433,145 @@ class ErrorTracker:
             >>> print(f"Fingerprint: {fp}, New: {is_new}")
             Fingerprint: a1b2c3d4e5f67890, New: True
         """
-        # Compute fingerprint
-        fingerprint = compute_fingerprint(signature)
-        timestamp = datetime.now().isoformat()
+        return self.record_errors([(signature, context)])[0]
 
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def record_errors(self, errors: List[Tuple[Dict[str, str], Optional[Dict[str, Any]]]]) -> List[Tuple[str, bool]]:
+        """Record a batch of errors.
 
-        # Check if error type already exists
+        New fingerprints are inserted in a single transaction on one persistent
+        connection (WAL, synchronous=NORMAL); repeats of known fingerprints are
+        counted in memory until the next flush. Occurrence timestamps come from
+        context['timestamp'] when present, so queueing delay does not skew them.
+
+        Args:
+            errors: List of (signature, context) tuples
+
+        Returns:
+            List of (fingerprint, is_new) tuples in input order
+        """
+        results = []
+        with self._writer_lock:
+            conn = None
+            try:
+                for signature, context in errors:
+                    fingerprint = compute_fingerprint(signature)
+                    timestamp = (context or {}).get('timestamp') or datetime.now().isoformat()
+                    if fingerprint in self._known:
+                        pending = self._pending_counts.setdefault(fingerprint, [0, timestamp])
+                        pending[0] += 1
+                        pending[1] = max(pending[1], timestamp)
+                        self._pending_occurrences.append(self._occurrence_row(fingerprint, context, timestamp))
+                        key = (_hour_bucket(timestamp), fingerprint, signature['provider'])
+                        self._pending_rollups[key] = self._pending_rollups.get(key, 0) + 1
+                        results.append((fingerprint, False))
+                        continue
+                    if conn is None:
+                        conn = self._get_writer_connection()
+                    is_new = self._insert_error(conn.cursor(), fingerprint, signature, context, timestamp)
+                    self._known.add(fingerprint)
+                    results.append((fingerprint, is_new))
+                if conn is not None:
+                    conn.commit()
+            except Exception:
+                if conn is not None:
+                    conn.rollback()
+                raise
+
+            if (len(self._pending_occurrences) >= self.flush_threshold
+                    or time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush_locked()
+        return results
+
+    def flush(self) -> int:
+        """Write buffered repeat counts and occurrences to SQLite.
+
+        Returns:
+            Number of occurrences written
+        """
+        with self._writer_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> int:
+        self._last_flush = time.monotonic()
+        if not self._pending_occurrences:
+            return 0
+        conn = self._get_writer_connection()
+        try:
+            # count + ? keeps increments from other worker processes intact
+            conn.executemany("""
+                UPDATE error_types
+                SET count = count + ?,
+                    last_seen = MAX(last_seen, ?)
+                WHERE fingerprint = ?
+            """, [(count, last_seen, fp) for fp, (count, last_seen) in self._pending_counts.items()])
+            conn.executemany("""
+                INSERT INTO error_occurrences
+                (fingerprint, timestamp, request_id, model, context)
+                VALUES (?, ?, ?, ?, ?)
+            """, self._pending_occurrences)
+            self._upsert_rollups(conn, [(hour, fp, provider, count)
+                                        for (hour, fp, provider), count in self._pending_rollups.items()])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        written = len(self._pending_occurrences)
+        self._pending_counts.clear()
+        self._pending_occurrences.clear()
+        self._pending_rollups.clear()
+        return written
+
+    @staticmethod
+    def _upsert_rollups(conn, rows: List[Tuple[str, str, str, int]]) -> None:
+        """Add (hour_bucket, fingerprint, provider, count) rows to the hourly and daily rollups."""
+        if not rows:
+            return
+        daily: Dict[Tuple[str, str, str], int] = {}
+        for hour, fingerprint, provider, count in rows:
+            key = (hour[:10], fingerprint, provider)
+            daily[key] = daily.get(key, 0) + count
+        upsert = """
+            INSERT INTO {table} (bucket, fingerprint, provider, count)
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT(bucket, fingerprint) DO UPDATE SET count = count + excluded.count
+        """
+        conn.executemany(upsert.format(table=ROLLUP_TABLES['hour']), rows)
+        conn.executemany(upsert.format(table=ROLLUP_TABLES['day']),
+                         [(day, fp, provider, count) for (day, fp, provider), count in daily.items()])
+
+    def _get_writer_connection(self) -> sqlite3.Connection:
+        """Return the persistent writer connection, opening it on first use."""
+        if self._writer_conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # WAL + NORMAL only fsyncs at checkpoints — safe against app crashes
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._writer_conn = conn
+        return self._writer_conn
+
+    def close(self) -> None:
+        """Flush buffered counts and close the persistent writer connection."""
+        with self._writer_lock:
+            if self._pending_occurrences:
+                self._flush_locked()
+            if self._writer_conn is not None:
+                self._writer_conn.close()
+                self._writer_conn = None
+
+    @staticmethod
+    def _occurrence_row(fingerprint: str, context: Optional[Dict[str, Any]], timestamp: str) -> tuple:
+        return (
+            fingerprint,
+            timestamp,
+            context.get('request_id') if context else None,
+            context.get('model') if context else None,
+            json.dumps(context) if context else None,
+        )
+
+    def _insert_error(self, cursor: sqlite3.Cursor, fingerprint: str, signature: Dict[str, str],
+                      context: Optional[Dict[str, Any]], timestamp: str) -> bool:
+        """Upsert the error type and insert an occurrence row. Returns is_new."""
+        # Another worker process may have inserted it since we loaded _known
         cursor.execute("SELECT count FROM error_types WHERE fingerprint = ?", (fingerprint,))
         existing = cursor.fetchone()
         is_new = existing is None
@@ -386,23 +601,14 @@ class ErrorTracker:
             """, (timestamp, fingerprint))
 
         # Insert occurrence record
-        context_json = json.dumps(context) if context else None
         cursor.execute("""
             INSERT INTO error_occurrences
             (fingerprint, timestamp, request_id, model, context)
             VALUES (?, ?, ?, ?, ?)
-        """, (
-            fingerprint,
-            timestamp,
-            context.get('request_id') if context else None,
-            context.get('model') if context else None,
-            context_json
-        ))
+        """, self._occurrence_row(fingerprint, context, timestamp))
+        self._upsert_rollups(cursor, [(_hour_bucket(timestamp), fingerprint, signature['provider'], 1)])
 
-        conn.commit()
-        conn.close()
-
-        return fingerprint, is_new
+        return is_new
 
     def get_error_by_fingerprint(self, fingerprint: str) -> Optional[Dict[str, Any]]:
         """Retrieve error details by fingerprint.
@@ -413,6 +619,7 @@ class ErrorTracker:
         Returns:
             Dict with error details or None if not found
         """
+        self.flush()
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
@@ -442,6 +649,7 @@ class ErrorTracker:
         Returns:
             List of error dicts sorted by last_seen (descending)
         """
+        self.flush()
         conn = sqlite3.connect(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
@@ -478,6 +686,7 @@ class ErrorTracker:
         Returns:
             Number of occurrences deleted
         """
+        self.flush()
         cutoff_date = datetime.now() - timedelta(days=max_age_days)
         cutoff_iso = cutoff_date.isoformat()
 
@@ -495,6 +704,86 @@ class ErrorTracker:
         logger.info(f"Pruned {deleted} error occurrences older than {max_age_days} days")
         return deleted
 
+    def apply_retention(self, occurrence_days: int = 90, hourly_days: int = 30,
+                        daily_days: int = 400) -> Dict[str, int]:
+        """Prune detailed occurrences and rollups past their retention windows.
+
+        Hourly rollups outlive raw occurrences only as long as dashboards need
+        fine-grained history; daily rollups keep long-term trends cheaply.
+
+        Returns:
+            Dict of rows deleted per table
+        """
+        deleted = {'error_occurrences': self.prune_old_occurrences(max_age_days=occurrence_days)}
+        now = datetime.now()
+        cutoffs = {
+            ROLLUP_TABLES['hour']: _hour_bucket((now - timedelta(days=hourly_days)).isoformat()),
+            ROLLUP_TABLES['day']: (now - timedelta(days=daily_days)).date().isoformat(),
+        }
+        conn = sqlite3.connect(self.db_path)
+        for table, cutoff in cutoffs.items():
+            cursor = conn.execute(f"DELETE FROM {table} WHERE bucket < ?", (cutoff,))
+            deleted[table] = cursor.rowcount
+        conn.commit()
+        conn.close()
+
+        logger.info(f"Error retention applied: {deleted}")
+        return deleted
+
+    def get_error_timeseries(self, resolution: str = 'hour', fingerprint: Optional[str] = None,
+                             provider: Optional[str] = None, since: Optional[str] = None,
+                             until: Optional[str] = None, group_by: str = 'fingerprint') -> List[Dict[str, Any]]:
+        """Error counts per time bucket, read from the rollup tables.
+
+        Args:
+            resolution: 'hour' or 'day'
+            fingerprint: Only this fingerprint
+            provider: Only this provider
+            since: ISO timestamp/date — first bucket to include (bucket containing it)
+            until: ISO timestamp/date — buckets strictly before this
+            group_by: 'fingerprint' (one series per fingerprint) or 'provider'
+                      (counts summed across fingerprints per provider)
+
+        Returns:
+            List of dicts with bucket, provider, count (and fingerprint when
+            grouped by fingerprint), ordered by bucket
+        """
+        if resolution not in ROLLUP_TABLES:
+            raise ValueError(f"resolution must be one of {sorted(ROLLUP_TABLES)}")
+        if group_by not in ('fingerprint', 'provider'):
+            raise ValueError("group_by must be 'fingerprint' or 'provider'")
+
+        self.flush()
+        columns = "bucket, fingerprint, provider, count" if group_by == 'fingerprint' \
+            else "bucket, provider, SUM(count) AS count"
+        query = f"SELECT {columns} FROM {ROLLUP_TABLES[resolution]} WHERE 1=1"
+        params: List[Any] = []
+
+        if fingerprint:
+            query += " AND fingerprint = ?"
+            params.append(fingerprint)
+        if provider:
+            query += " AND provider = ?"
+            params.append(provider)
+        if since:
+            query += " AND bucket >= ?"
+            # A bare date sorts before every hourly bucket of that day, so it can be used as-is
+            params.append(_hour_bucket(since) if resolution == 'hour' and len(since) >= 13 else since[:10])
+        if until:
+            query += " AND bucket < ?"
+            params.append(until)
+
+        if group_by == 'provider':
+            query += " GROUP BY bucket, provider"
+        query += " ORDER BY bucket"
+
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute(query, params).fetchall()
+        conn.close()
+
+        return [dict(row) for row in rows]
+
 
 # =============================================================================
 # Story 4: Alert Delivery (defined before Story 3 to avoid forward reference)
@@ -582,6 +871,26 @@ class AlertManager:
 # Story 3: Logging Integration
 # =============================================================================
 
+# (pattern, has_model) — extract request_id, provider[, model] from the log line
+_LOG_CONTEXT_PATTERNS = [
+    # [request_id] ✗ provider: error_type (model=model) - message
+    (re.compile(r'\[([a-f0-9]{8})\] ✗ (\w+):.+\(model=([^)]+)\)'), True),
+    # [request_id] ✗ provider (model=model): message
+    (re.compile(r'\[([a-f0-9]{8})\] ✗ (\w+) \(model=([^)]+)\)'), True),
+    # [request_id] ✗ provider: message (no model info)
+    (re.compile(r'\[([a-f0-9]{8})\] ✗ (\w+)[:]\s*(.+)'), False),
+]
+
+# Capture the error message after the log prefix, tried in order
+_LOG_PREFIX_PATTERNS = [
+    # [request_id] ✗ provider: error_type (model=model) - MESSAGE
+    re.compile(r'\[[a-zA-Z0-9]{8}\] ✗ \w+:\s*[^(]+\([^)]+\)\s*-\s*(.+)'),
+    # [request_id] ✗ provider (model=model): MESSAGE
+    re.compile(r'\[[a-zA-Z0-9]{8}\] ✗ \w+\s*\([^)]+\):\s*(.+)'),
+    # [request_id] ✗ provider: MESSAGE (no model)
+    re.compile(r'\[[a-zA-Z0-9]{8}\] ✗ \w+:\s*(.+)'),
+]
+
 
 class ErrorTrackingHandler(logging.Handler):
     """Custom logging handler that captures ERROR+ logs and tracks errors.
@@ -594,18 +903,30 @@ class ErrorTrackingHandler(logging.Handler):
     """
 
     def __init__(self, tracker: ErrorTracker, alert_manager: Optional[AlertManager] = None,
-                 level: int = logging.ERROR):
+                 level: int = logging.ERROR, background: bool = False, batch_size: int = 100):
         """Initialize handler with error tracker.
 
         Args:
             tracker: ErrorTracker instance for persistence
             alert_manager: Optional AlertManager for notifications (default: creates new one)
             level: Logging level threshold (default: ERROR)
+            background: If True, emit() only enqueues the record; a writer thread
+                        parses, persists (batched) and alerts off the calling thread
+            batch_size: Maximum records per SQLite transaction in background mode
         """
         super().__init__(level=level)
         self.tracker = tracker
         self.alert_manager = alert_manager or AlertManager()
+        self.batch_size = batch_size
         self._recursion_guard = 0
+        self._queue: Optional[queue.SimpleQueue] = None
+        self._writer: Optional[threading.Thread] = None
+        if background:
+            self._queue = queue.SimpleQueue()
+            self._writer = threading.Thread(
+                target=self._writer_loop, name="error-tracker-writer", daemon=True
+            )
+            self._writer.start()
 
     def _parse_error_log_record(self, record: logging.LogRecord) -> Tuple[Optional[str], Optional[str], Optional[str]]:
         """Parse log record to extract request_id, provider, and model.
@@ -621,32 +942,51 @@ class ErrorTrackingHandler(logging.Handler):
         Returns:
             Tuple of (request_id, provider, model) or (None, None, None) if parsing fails
         """
-        message = record.getMessage()
-
-        # Pattern 1: [request_id] ✗ provider: error_type (model=model) - message
-        pattern1 = r'\[([a-f0-9]{8})\] ✗ (\w+):.+\(model=([^)]+)\)'
-        match = re.search(pattern1, message)
-        if match:
-            return match.group(1), match.group(2), match.group(3)
-
-        # Pattern 2: [request_id] ✗ provider (model=model): message
-        pattern2 = r'\[([a-f0-9]{8})\] ✗ (\w+) \(model=([^)]+)\)'
-        match = re.search(pattern2, message)
-        if match:
-            return match.group(1), match.group(2), match.group(3)
-
-        # Pattern 3: [request_id] ✗ provider: message (no model info)
-        pattern3 = r'\[([a-f0-9]{8})\] ✗ (\w+)[:]\s*(.+)'
-        match = re.search(pattern3, message)
-        if match:
-            return match.group(1), match.group(2), None
+        return self._parse_error_message(record.getMessage())
+
+    def _parse_error_message(self, message: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Extract (request_id, provider, model) from a formatted error log message."""
+        for pattern, has_model in _LOG_CONTEXT_PATTERNS:
+            match = pattern.search(message)
+            if match:
+                return match.group(1), match.group(2), match.group(3) if has_model else None
 
         # No match - return None
         return None, None, None
 
+    def _build_error(self, message: str, created: float, levelname: str,
+                     module: str) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Turn a formatted error log message into (signature, context)."""
+        # Extract context from log message
+        request_id, provider, model = self._parse_error_message(message)
+
+        # Strip the "[request_id] ✗ provider (model=...)" prefix to get the actual error message
+        error_message = message
+        for pattern in _LOG_PREFIX_PATTERNS:
+            match = pattern.search(message)
+            if match:
+                error_message = match.group(1)
+                break
+
+        # Extract signature (memoized — the stripped message repeats across requests)
+        signature, _ = fingerprint_error(error_message, provider=provider)
+
+        # Build context
+        context = {
+            'request_id': request_id,
+            'model': model,
+            'timestamp': datetime.fromtimestamp(created).isoformat(),
+            'level': levelname,
+            'module': module,
+        }
+        return signature, context
+
     def emit(self, record: logging.LogRecord) -> None:
         """Handle log record by extracting error signature and recording.
 
+        In background mode this only formats the message and enqueues it, so a
+        burst of errors on the event loop never waits on regexes or SQLite.
+
         Args:
             record: LogRecord from logging system
         """
@@ -666,43 +1006,11 @@ class ErrorTrackingHandler(logging.Handler):
             if '✗' not in message:
                 return
 
-            # Extract context from log record
-            request_id, provider, model = self._parse_error_log_record(record)
-
-            # Extract error signature from message
-            # Remove the prefix part ([request_id] ✗ provider (model=...) to get the actual error message
-            error_message = message
+            if self._queue is not None:
+                self._queue.put((message, record.created, record.levelname, record.module))
+                return
 
-            # Try to strip the prefix to get just the error message
-            # Pattern 1: [request_id] ✗ provider: error_type (model=model) - MESSAGE
-            pattern1 = r'\[[a-zA-Z0-9]{8}\] ✗ \w+:\s*[^(]+\([^)]+\)\s*-\s*(.+)'
-            match = re.search(pattern1, message)
-            if match:
-                error_message = match.group(1)
-            else:
-                # Pattern 2: [request_id] ✗ provider (model=model): MESSAGE
-                pattern2 = r'\[[a-zA-Z0-9]{8}\] ✗ \w+\s*\([^)]+\):\s*(.+)'
-                match = re.search(pattern2, message)
-                if match:
-                    error_message = match.group(1)
-                else:
-                    # Pattern 3: [request_id] ✗ provider: MESSAGE (no model)
-                    pattern3 = r'\[[a-zA-Z0-9]{8}\] ✗ \w+:\s*(.+)'
-                    match = re.search(pattern3, message)
-                    if match:
-                        error_message = match.group(1)
-
-            # Extract signature
-            signature = extract_signature(error_message, provider=provider)
-
-            # Build context
-            context = {
-                'request_id': request_id,
-                'model': model,
-                'timestamp': datetime.fromtimestamp(record.created).isoformat(),
-                'level': record.levelname,
-                'module': record.module,
-            }
+            signature, context = self._build_error(message, record.created, record.levelname, record.module)
 
             # Record error
             fingerprint, is_new = self.tracker.record_error(signature, context)
@@ -723,6 +1031,88 @@ class ErrorTrackingHandler(logging.Handler):
         finally:
             self._recursion_guard -= 1
 
+    def _writer_loop(self) -> None:
+        """Background thread: drain the queue and persist records in batches.
+
+        Queue items are record tuples, threading.Event flush markers (set once
+        everything queued before them is written) or None to stop.
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout=self.tracker.flush_interval)
+            except queue.Empty:
+                # Idle — push buffered repeat counts to SQLite
+                self._flush_tracker()
+                continue
+            batch = []
+            waiters = []
+            stop = False
+            while True:
+                if item is None:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    batch.append(item)
+                if stop or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            if waiters or stop:
+                self._flush_tracker()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch: List[Tuple[str, float, str, str]]) -> None:
+        """Parse, persist and alert for one batch of queued records."""
+        import sys
+        errors = []
+        for item in batch:
+            try:
+                errors.append(self._build_error(*item))
+            except Exception as e:
+                print(f"ERROR: ErrorTrackingHandler failed: {e}", file=sys.stderr)
+
+        try:
+            results = self.tracker.record_errors(errors)
+        except Exception as e:
+            print(f"ERROR: ErrorTrackingHandler batch write failed ({len(errors)} errors): {e}", file=sys.stderr)
+            return
+
+        logger.debug(f"Captured {len(results)} errors in one batch")
+        for (fingerprint, is_new), (signature, _) in zip(results, errors):
+            if is_new:
+                self.alert_manager.send_desktop_notification(fingerprint, signature)
+
+    def _flush_tracker(self) -> None:
+        try:
+            self.tracker.flush()
+        except Exception as e:
+            import sys
+            print(f"ERROR: ErrorTrackingHandler flush failed: {e}", file=sys.stderr)
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until every record queued so far has been written (background mode)."""
+        if self._writer is None or not self._writer.is_alive():
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Drain the queue, stop the writer thread and detach the handler."""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout=5.0)
+        super().close()
+
 
 # Note: AlertManager moved before ErrorTrackingHandler to fix forward reference
 
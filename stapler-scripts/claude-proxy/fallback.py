@@ -5,19 +5,31 @@ import json
 import logging
 from typing import Dict, Any, List, AsyncIterator, Optional
 from providers import Provider, RateLimitError, ValidationError, TimeoutError, AuthenticationError, ModelUnsupportedError, ServerError
+from stream_resume import StreamAccumulator, StreamInterrupted
+from affinity import conversation_key, usage_from_chunk
+from logging_setup import NEVER_SAMPLE
 import config
+import timing
+import tracing
 import diskcache
+import httpx
 import os
 
 logger = logging.getLogger(__name__)
 
 
+def _is_upstream_failure(error: Exception) -> bool:
+    """A 5xx or a dropped / timed-out connection: the provider's fault, worth a cooldown."""
+    return isinstance(error, (ServerError, TimeoutError, ConnectionError, httpx.TransportError))
+
+
 class FallbackHandler:
     """Orchestrates providers with automatic fallback on rate limits."""
 
-    def __init__(self, providers: List[Provider], metrics=None):
+    def __init__(self, providers: List[Provider], metrics=None, affinity=None):
         self.providers = providers
         self.metrics = metrics
+        self.affinity = affinity  # ProviderAffinity: keep conversations where their prompt cache is warm
         # Use diskcache for persistent cooldown tracking across restarts
         cache_dir = os.path.expanduser("~/.cache/claude-proxy/cooldowns")
         self.cooldowns = diskcache.Cache(cache_dir)
@@ -64,8 +76,41 @@ class FallbackHandler:
         if seconds is None:
             seconds = config.COOLDOWN_SECONDS
         self.cooldowns.set(provider_name, {"until": time.time() + seconds, "reason": reason})
+        tracing.add_event("provider.cooldown", **{"provider.name": provider_name, "seconds": seconds, "reason": reason})
         logger.warning(f"Provider {provider_name} in cooldown for {seconds}s (reason={reason}, persisted to disk)")
 
+    def _route(self, body: Dict[str, Any], req_prefix: str = "") -> tuple:
+        """Provider order for this request and its conversation key.
+
+        Moves the provider holding the conversation's warm prompt cache to the
+        front, unless it is in cooldown (then the usual order applies and the
+        conversation moves on).
+        """
+        if self.affinity is None:
+            return self.providers, None
+        key = conversation_key(body)
+        warm = self.affinity.warm_provider(key)
+        if warm is None or warm == self.providers[0].name or self._is_in_cooldown(warm):
+            return self.providers, key
+        preferred = [p for p in self.providers if p.name == warm]
+        if not preferred:
+            return self.providers, key
+        self.affinity.sticky_routes += 1
+        logger.info(f"{req_prefix}⚓ Staying on {warm} (prompt cache warm for this conversation)")
+        return preferred + [p for p in self.providers if p.name != warm], key
+
+    def _record_cache_usage(self, key: Optional[str], provider_name: str, usage: Optional[Dict[str, Any]]):
+        """Prompt-cache usage of a completed request: metrics, and where the conversation's cache now lives."""
+        if not usage:
+            return
+        if self.metrics:
+            self.metrics.record_prompt_cache(provider_name, usage)
+        if self.affinity is not None:
+            try:
+                self.affinity.record(key, provider_name, usage)
+            except Exception as e:
+                logger.warning(f"Failed to record provider affinity: {e}")
+
     async def send_message(
         self,
         body: Dict[str, Any],
@@ -79,8 +124,9 @@ class FallbackHandler:
         last_error = None
         req_prefix = f"[{request_id}] " if request_id else ""
         model = body.get("model", "unknown")
+        providers, affinity_key = self._route(body, req_prefix)
 
-        for provider in self.providers:
+        for provider in providers:
             # Skip providers in cooldown
             if self._is_in_cooldown(provider.name):
                 logger.debug(f"{req_prefix}Skipping {provider.name} (cooldown)")
@@ -95,14 +141,17 @@ class FallbackHandler:
                     else:
                         logger.info(f"{req_prefix}→ {provider.name} (model={model})")
 
-                    result = await provider.send_message(body, token, auth_type, headers, request_id)
+                    with tracing.span("fallback.attempt", **{"provider.name": provider.name, "fallback.attempt": attempt + 1}):
+                        result = await provider.send_message(body, token, auth_type, headers, request_id)
                     duration_ms = (time.time() - start_time) * 1000
-                    logger.info(f"{req_prefix}✓ {provider.name} ({duration_ms:.0f}ms, model={model})")
+                    timing.record("upstream", duration_ms)
+                    logger.info(f"{req_prefix}✓ {provider.name} ({duration_ms:.0f}ms, model={model})", extra=NEVER_SAMPLE)
                     if self.metrics:
                         self.metrics.record_request_complete(provider.name, model, start_time, True, stream=False)
                         if request_id:
                             self.metrics.update_request_timing(request_id, provider.name, duration_ms)
                         self.metrics.record_provider_latency(provider.name, duration_ms)
+                    self._record_cache_usage(affinity_key, provider.name, result.get("usage") if isinstance(result, dict) else None)
                     return result
 
                 except TimeoutError as e:
@@ -134,6 +183,7 @@ class FallbackHandler:
                     # Exponential backoff: 2s, 4s, 8s, etc.
                     backoff = 2 ** attempt
                     logger.info(f"{req_prefix}⏸ Waiting {backoff}s before retry...")
+                    tracing.add_event("retry.backoff", **{"provider.name": provider.name, "backoff_s": backoff})
                     await asyncio.sleep(backoff)
                     continue
 
@@ -145,8 +195,8 @@ class FallbackHandler:
 
                 except ServerError as e:
                     # 5xx from this provider — short cooldown, fall through to next provider
-                    logger.warning(f"{req_prefix}✗ {provider.name}: server error {e.status_code} (model={model}) - cooling down 60s and falling back")
-                    self._set_cooldown(provider.name, seconds=60, reason="server_error")
+                    logger.warning(f"{req_prefix}✗ {provider.name}: server error {e.status_code} (model={model}) - cooling down {config.HEALTH_PROBE_INTERVAL}s and falling back")
+                    self._set_cooldown(provider.name, seconds=config.HEALTH_PROBE_INTERVAL, reason="server_error")
                     if self.metrics:
                         self.metrics.record_fallback(provider.name, "bedrock", "server_error")
                     last_error = e
@@ -193,8 +243,9 @@ class FallbackHandler:
         last_error = None
         req_prefix = f"[{request_id}] " if request_id else ""
         model = body.get("model", "unknown")
+        providers, affinity_key = self._route(body, req_prefix)
 
-        for provider in self.providers:
+        for provider in providers:
             # Skip providers in cooldown
             if self._is_in_cooldown(provider.name):
                 logger.debug(f"{req_prefix}Skipping {provider.name} (cooldown)")
@@ -211,33 +262,53 @@ class FallbackHandler:
 
                     chunk_count = 0
                     all_chunks = []
+                    cache_usage = None
                     first_chunk_time = None
                     bedrock_invocation_ms = 0
                     bedrock_first_byte_ms = 0
-                    async for chunk in provider.stream_message(body, token, auth_type, headers, request_id):
-                        if first_chunk_time is None:
-                            first_chunk_time = time.time()
-                        chunk_count += 1
-                        # Capture chunks for short stream analysis
-                        if chunk_count <= 20:
-                            all_chunks.append(chunk)
-                        # Log first chunk for debugging
-                        if chunk_count == 1:
-                            logger.debug(f"{req_prefix}{provider.name} first chunk: {chunk[:100]}...")
-                        # Extract Bedrock invocation metrics from message_stop event
-                        if provider.name == "bedrock" and "message_stop" in chunk:
-                            try:
-                                raw = chunk.strip()
-                                if raw.startswith("data: "):
-                                    raw = raw[6:]
-                                data = json.loads(raw)
-                                bm = data.get("amazon-bedrock-invocationMetrics", {})
-                                if bm:
-                                    bedrock_invocation_ms = bm.get("invocationLatency", 0)
-                                    bedrock_first_byte_ms = bm.get("firstByteLatency", 0)
-                            except Exception:
-                                pass
-                        yield chunk
+                    accumulator = StreamAccumulator() if config.STREAM_RESUME_ENABLED else None
+                    with tracing.span("fallback.attempt", **{"provider.name": provider.name, "fallback.attempt": attempt + 1,
+                                                             "stream": True}):
+                        try:
+                            async for chunk in provider.stream_message(body, token, auth_type, headers, request_id):
+                                if accumulator:
+                                    event = accumulator.feed(chunk)
+                                    # An in-band error after message_start is a mid-stream failure too
+                                    if event and event.get("type") == "error" and accumulator.message_started:
+                                        error = event.get("error") or {}
+                                        raise ServerError(f"in-stream error: {error.get('message', error.get('type'))}",
+                                                          529 if error.get("type") == "overloaded_error" else 500)
+                                if first_chunk_time is None:
+                                    first_chunk_time = time.time()
+                                chunk_count += 1
+                                # message_start (first event) carries the input / prompt-cache token counts
+                                if cache_usage is None and chunk_count <= 2:
+                                    cache_usage = usage_from_chunk(chunk)
+                                # Capture chunks for short stream analysis
+                                if chunk_count <= 20:
+                                    all_chunks.append(chunk)
+                                # Log first chunk for debugging
+                                if chunk_count == 1:
+                                    logger.debug(f"{req_prefix}{provider.name} first chunk: {chunk[:100]}...")
+                                # Extract Bedrock invocation metrics from message_stop event
+                                if provider.name == "bedrock" and "message_stop" in chunk:
+                                    try:
+                                        raw = chunk.strip()
+                                        if raw.startswith("data: "):
+                                            raw = raw[6:]
+                                        data = json.loads(raw)
+                                        bm = data.get("amazon-bedrock-invocationMetrics", {})
+                                        if bm:
+                                            bedrock_invocation_ms = bm.get("invocationLatency", 0)
+                                            bedrock_first_byte_ms = bm.get("firstByteLatency", 0)
+                                    except Exception:
+                                        pass
+                                yield chunk
+                        except Exception as e:
+                            if chunk_count == 0:
+                                raise
+                            # Bytes already reached the client — a plain fallback would replay the response
+                            raise StreamInterrupted(provider.name, e, accumulator) from e
 
                     # Log suspiciously short streams with complete response
                     if chunk_count < 20:
@@ -247,7 +318,9 @@ class FallbackHandler:
 
                     duration_ms = (time.time() - start_time) * 1000
                     first_byte_ms = ((first_chunk_time - start_time) * 1000) if first_chunk_time else 0.0
-                    logger.info(f"{req_prefix}✓ {provider.name} stream ({chunk_count} chunks, {duration_ms:.0f}ms, TTFT {first_byte_ms:.0f}ms, model={model})")
+                    timing.record("ttft", first_byte_ms)
+                    timing.record("stream", duration_ms - first_byte_ms)
+                    logger.info(f"{req_prefix}✓ {provider.name} stream ({chunk_count} chunks, {duration_ms:.0f}ms, TTFT {first_byte_ms:.0f}ms, model={model})", extra=NEVER_SAMPLE)
                     if self.metrics:
                         self.metrics.record_request_complete(provider.name, model, start_time, True, stream=True)
                         if request_id:
@@ -256,6 +329,36 @@ class FallbackHandler:
                                 bedrock_invocation_ms, bedrock_first_byte_ms
                             )
                         self.metrics.record_provider_latency(provider.name, duration_ms, first_byte_ms)
+                    self._record_cache_usage(affinity_key, provider.name, cache_usage)
+                    return
+
+                except StreamInterrupted as e:
+                    logger.warning(f"{req_prefix}✗ {provider.name}: stream interrupted after {chunk_count} chunks (model={model}) - {e.cause}")
+                    if _is_upstream_failure(e.cause):
+                        # As for a ServerError before the first chunk: send the next requests elsewhere
+                        self._set_cooldown(provider.name, seconds=config.HEALTH_PROBE_INTERVAL, reason="stream_interrupted")
+                    accumulator = e.accumulator
+                    if accumulator is None or not accumulator.can_resume(body):
+                        if self.metrics:
+                            self.metrics.record_request_complete(provider.name, model, start_time, False, "interrupted", stream=True)
+                        raise e.cause
+                    with tracing.span("fallback.resume", **{"provider.name": provider.name}):
+                        async for chunk in self._resume_stream(body, token, auth_type, headers, request_id, provider, accumulator):
+                            yield chunk
+                    resumed_by = accumulator.resumed_by
+                    duration_ms = (time.time() - start_time) * 1000
+                    first_byte_ms = ((first_chunk_time - start_time) * 1000) if first_chunk_time else 0.0
+                    timing.record("ttft", first_byte_ms)
+                    timing.record("stream", duration_ms - first_byte_ms)
+                    logger.info(f"{req_prefix}✓ {provider.name}→{resumed_by} resumed stream ({duration_ms:.0f}ms, TTFT {first_byte_ms:.0f}ms, model={model})")
+                    if self.metrics:
+                        self.metrics.record_fallback(provider.name, resumed_by, "stream_resume")
+                        self.metrics.record_request_complete(resumed_by, model, start_time, True, stream=True)
+                        if request_id:
+                            self.metrics.update_request_timing(request_id, resumed_by, duration_ms, first_byte_ms)
+                        self.metrics.record_provider_latency(resumed_by, duration_ms, first_byte_ms)
+                    # The conversation's prompt cache is now warm on the provider that finished it
+                    self._record_cache_usage(affinity_key, resumed_by, accumulator.resumed_usage)
                     return
 
                 except TimeoutError as e:
@@ -287,6 +390,7 @@ class FallbackHandler:
                     # Exponential backoff: 2s, 4s, 8s, etc.
                     backoff = 2 ** attempt
                     logger.info(f"{req_prefix}⏸ Waiting {backoff}s before retry...")
+                    tracing.add_event("retry.backoff", **{"provider.name": provider.name, "backoff_s": backoff})
                     await asyncio.sleep(backoff)
                     continue
 
@@ -298,8 +402,8 @@ class FallbackHandler:
 
                 except ServerError as e:
                     # 5xx from this provider — short cooldown, fall through to next provider
-                    logger.warning(f"{req_prefix}✗ {provider.name}: server error {e.status_code} (model={model}) - cooling down 60s and falling back")
-                    self._set_cooldown(provider.name, seconds=60, reason="server_error")
+                    logger.warning(f"{req_prefix}✗ {provider.name}: server error {e.status_code} (model={model}) - cooling down {config.HEALTH_PROBE_INTERVAL}s and falling back")
+                    self._set_cooldown(provider.name, seconds=config.HEALTH_PROBE_INTERVAL, reason="server_error")
                     if self.metrics:
                         self.metrics.record_fallback(provider.name, "bedrock", "server_error")
                     last_error = e
@@ -333,6 +437,54 @@ class FallbackHandler:
             raise last_error
         raise Exception("All providers are in cooldown or failed")
 
+    async def _resume_stream(
+        self,
+        body: Dict[str, Any],
+        token: str,
+        auth_type: str,
+        headers: Optional[Dict[str, str]],
+        request_id: Optional[str],
+        failed: Provider,
+        accumulator: StreamAccumulator,
+    ) -> AsyncIterator[str]:
+        """Continue an interrupted stream on another provider, stitched into the same SSE stream.
+
+        Tries the providers after the failed one first, wrapping round so the failed
+        provider itself is the last resort. Sets accumulator.resumed_by (and
+        resumed_usage, from the continuation's message_start) on success.
+        """
+        req_prefix = f"[{request_id}] " if request_id else ""
+        continuation = accumulator.continuation_body(body)
+        start = self.providers.index(failed) + 1 if failed in self.providers else 0
+        candidates = self.providers[start:] + self.providers[:start]
+        last_error = None
+
+        for provider in candidates:
+            if provider is not failed and self._is_in_cooldown(provider.name):
+                continue
+            logger.info(f"{req_prefix}⟳ {provider.name} resuming stream ({len(accumulator.emitted_text())} chars emitted)")
+            stitcher = accumulator.stitcher()
+            usage = None
+            try:
+                async for chunk in provider.stream_message(continuation, token, auth_type, headers, request_id):
+                    # The stitcher drops the continuation's message_start; keep its usage first
+                    if usage is None:
+                        usage = usage_from_chunk(chunk)
+                    out = stitcher.translate(chunk)
+                    if out is not None:
+                        yield out
+                accumulator.resumed_by, accumulator.resumed_usage = provider.name, usage
+                return
+            except Exception as e:
+                last_error = e
+                if stitcher.emitted:
+                    # Failed again after adding to the stream — give up rather than stack resumes
+                    logger.error(f"{req_prefix}✗ {provider.name}: resumed stream interrupted - {e}")
+                    raise
+                logger.warning(f"{req_prefix}✗ {provider.name}: resume failed - {e}")
+
+        raise last_error or Exception("No provider available to resume stream")
+
     async def _probe_provider(self, provider_name: str) -> tuple:
         """Send a minimal probe request to check if a provider has recovered.
 
@@ -346,8 +498,9 @@ class FallbackHandler:
         if not provider:
             return False, "provider not in list"
 
-        token = config.CLAUDE_CODE_OAUTH_TOKEN
-        if not token:
+        # A credential pool (ANTHROPIC_CREDENTIALS) supplies its own tokens
+        token = config.CLAUDE_CODE_OAUTH_TOKEN or ""
+        if not token and getattr(provider, "credentials", None) is None:
             return False, "no OAuth token configured — cannot probe"
 
         probe_body = {
@@ -369,10 +522,10 @@ class FallbackHandler:
     async def start_health_check_loop(self):
         """Background task: probe providers in server_error cooldown and clear on recovery.
 
-        Runs every 60 seconds. Only probes server_error cooldowns — rate_limit cooldowns
+        Runs every HEALTH_PROBE_INTERVAL seconds (default 60). Only probes server_error cooldowns — rate_limit cooldowns
         have an authoritative retry-after and are left to expire naturally.
         """
-        PROBE_INTERVAL = 60
+        PROBE_INTERVAL = config.HEALTH_PROBE_INTERVAL
         while True:
             await asyncio.sleep(PROBE_INTERVAL)
             try:
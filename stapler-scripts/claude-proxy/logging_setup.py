@@ -0,0 +1,260 @@
+"""Non-blocking logging pipeline for claude-proxy.
+
+Loggers only ever touch a QueueHandler: the record is formatted, put on an
+in-memory queue, and a QueueListener thread does the file writes, rotation
+renames and error tracking. The request path never blocks on disk I/O.
+
+Also provides:
+- SamplingFilter: rate-limits high-frequency INFO/DEBUG call sites
+- JsonFormatter: one JSON object per line (LOG_FORMAT=json)
+- LoggingStats: logging overhead counters reported in /metrics
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Any, List, Optional, Tuple
+
+
+class LoggingStats:
+    """Counters for the cost of logging on caller threads and on the listener."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.enqueued = 0
+        self.enqueue_ns_total = 0
+        self.enqueue_ns_max = 0
+        self.sampled_out = 0
+        self.handled = 0
+        self.handle_ns_total = 0
+        self.handle_ns_max = 0
+
+    def record_enqueue(self, elapsed_ns: int) -> None:
+        with self._lock:
+            self.enqueued += 1
+            self.enqueue_ns_total += elapsed_ns
+            if elapsed_ns > self.enqueue_ns_max:
+                self.enqueue_ns_max = elapsed_ns
+
+    def record_sampled_out(self) -> None:
+        with self._lock:
+            self.sampled_out += 1
+
+    def record_handle(self, elapsed_ns: int) -> None:
+        with self._lock:
+            self.handled += 1
+            self.handle_ns_total += elapsed_ns
+            if elapsed_ns > self.handle_ns_max:
+                self.handle_ns_max = elapsed_ns
+
+    def snapshot(self, log_queue: Optional[queue.SimpleQueue] = None) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "records_enqueued": self.enqueued,
+                "records_sampled_out": self.sampled_out,
+                "records_written": self.handled,
+                "queue_depth": log_queue.qsize() if log_queue is not None else 0,
+                # Time spent inside logger calls on the event loop / worker threads
+                "enqueue_avg_us": round(self.enqueue_ns_total / self.enqueued / 1000, 1) if self.enqueued else 0.0,
+                "enqueue_max_us": round(self.enqueue_ns_max / 1000, 1),
+                "enqueue_total_ms": round(self.enqueue_ns_total / 1e6, 1),
+                # Time the listener thread spends in handlers (file I/O, error tracking)
+                "write_avg_us": round(self.handle_ns_total / self.handled / 1000, 1) if self.handled else 0.0,
+                "write_max_us": round(self.handle_ns_max / 1000, 1),
+            }
+
+
+# `logger.info(..., extra=NEVER_SAMPLE)`: per-request summary lines that must survive sampling
+NEVER_SAMPLE = {"never_sample": True}
+
+
+class SamplingFilter(logging.Filter):
+    """Rate-limit chatty log call sites.
+
+    Each call site (file + line) may emit `burst` records per `window` seconds;
+    the rest are dropped before they are queued. The first record of the next
+    window notes how many were suppressed. WARNING and above, and records
+    logged with extra=NEVER_SAMPLE, always pass. Loggers run on the event loop
+    and on executor threads, so the per-site state is behind a lock.
+    """
+
+    def __init__(self, burst: int = 20, window: float = 1.0, stats: Optional[LoggingStats] = None):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self.stats = stats
+        self._lock = threading.Lock()
+        self._sites: Dict[Tuple[str, int], List] = {}  # (pathname, lineno) -> [window_start, count, suppressed]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.burst <= 0 or getattr(record, "never_sample", False):
+            return True
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or record.created - site[0] >= self.window:
+                suppressed = site[2] if site else 0
+                self._sites[key] = [record.created, 1, 0]
+            elif site[1] < self.burst:
+                site[1] += 1
+                return True
+            else:
+                site[2] += 1
+                if self.stats:
+                    self.stats.record_sampled_out()
+                return False
+        if suppressed:
+            record.sampled_out = suppressed
+            record.msg = f"{record.msg} [+{suppressed} similar suppressed]"
+        return True
+
+
+class LoggerNameFilter(logging.Filter):
+    """Pass (or, with exclude=True, drop) records from the given logger trees."""
+
+    def __init__(self, names: List[str], exclude: bool = False):
+        super().__init__()
+        self.prefixes = tuple(names)
+        self.exclude = exclude
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        matched = record.name in self.prefixes or record.name.startswith(tuple(p + "." for p in self.prefixes))
+        return matched != self.exclude
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        message = entry["msg"]
+        # Request-scoped lines are prefixed "[request_id] ..." throughout the proxy
+        if message.startswith("[") and message[9:10] == "]":
+            entry["request_id"] = message[1:9]
+        # Set by tracing's log record factory when PROXY_TRACING is on
+        trace_id = getattr(record, "trace_id", None)
+        if trace_id:
+            entry["trace_id"] = trace_id
+            entry["span_id"] = record.span_id
+        sampled_out = getattr(record, "sampled_out", None)
+        if sampled_out:
+            entry["sampled_out"] = sampled_out
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class InstrumentedQueueHandler(QueueHandler):
+    """QueueHandler that records how long each enqueue takes on the calling thread."""
+
+    def __init__(self, log_queue, stats: LoggingStats):
+        super().__init__(log_queue)
+        self.stats = stats
+
+    def emit(self, record: logging.LogRecord) -> None:
+        start = time.perf_counter_ns()
+        super().emit(record)
+        self.stats.record_enqueue(time.perf_counter_ns() - start)
+
+
+class InstrumentedQueueListener(QueueListener):
+    """QueueListener that records per-record handler time on the listener thread."""
+
+    def __init__(self, log_queue, *handlers, stats: LoggingStats):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self.stats = stats
+
+    def handle(self, record: logging.LogRecord) -> None:
+        start = time.perf_counter_ns()
+        super().handle(record)
+        self.stats.record_handle(time.perf_counter_ns() - start)
+
+
+class LoggingPipeline:
+    """Handle on the configured queue, listener and stats (see configure_logging)."""
+
+    def __init__(self, log_queue: queue.SimpleQueue, listener: QueueListener, stats: LoggingStats):
+        self.queue = log_queue
+        self.listener = listener
+        self.stats = stats
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.stats.snapshot(self.queue)
+
+    def stop(self) -> None:
+        """Drain the queue and stop the listener thread (idempotent)."""
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+
+HTTP_LOGGERS = ["httpx", "httpcore"]
+
+
+def configure_logging(
+    app_log_path: str = "/tmp/claude-proxy.app.log",
+    http_log_path: str = "/tmp/claude-proxy.http.log",
+    extra_handlers: Optional[List[logging.Handler]] = None,
+    log_format: str = "text",
+    sample_burst: int = 20,
+    sample_window: float = 1.0,
+    level: int = logging.INFO,
+) -> LoggingPipeline:
+    """Route all proxy logging through a single queue and background listener.
+
+    Application logs go to app_log_path (text or JSON lines), httpx/httpcore
+    logs to http_log_path, and extra_handlers (e.g. ErrorTrackingHandler) see
+    application records only — all on the listener thread.
+    """
+    stats = LoggingStats()
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    # Keep 10 files of 10MB each (100MB total) for application logs
+    app_handler = RotatingFileHandler(app_log_path, maxBytes=10*1024*1024, backupCount=10)
+    if log_format == "json":
+        app_handler.setFormatter(JsonFormatter())
+    else:
+        app_handler.setFormatter(logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            datefmt='%Y-%m-%d %H:%M:%S'
+        ))
+    app_handler.addFilter(LoggerNameFilter(HTTP_LOGGERS, exclude=True))
+
+    # HTTP request logs (httpx, httpcore) are noisy — less history
+    http_handler = RotatingFileHandler(http_log_path, maxBytes=10*1024*1024, backupCount=5)
+    http_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(name)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    http_handler.addFilter(LoggerNameFilter(HTTP_LOGGERS))
+
+    handlers: List[logging.Handler] = [app_handler, http_handler]
+    for handler in extra_handlers or []:
+        handler.addFilter(LoggerNameFilter(HTTP_LOGGERS, exclude=True))
+        handlers.append(handler)
+
+    queue_handler = InstrumentedQueueHandler(log_queue, stats)
+    queue_handler.addFilter(SamplingFilter(burst=sample_burst, window=sample_window, stats=stats))
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    root_logger.addHandler(queue_handler)
+
+    for name in HTTP_LOGGERS:
+        http_logger = logging.getLogger(name)
+        http_logger.handlers.clear()  # Remove inherited handlers
+        http_logger.addHandler(queue_handler)
+        http_logger.propagate = False  # Don't duplicate through the root logger
+
+    listener = InstrumentedQueueListener(log_queue, *handlers, stats=stats)
+    listener.start()
+    return LoggingPipeline(log_queue, listener, stats)
@@ -1,68 +1,68 @@
 """Claude Proxy - Simple OAuth + Bedrock fallback proxy for Claude Code."""
+import startup  # first: its clock covers every import below
+
+if __name__ == "__main__":
+    # `python main.py` only launches workers, and they import `main` themselves:
+    # don't build the app (providers, logging threads, caches) in this process too
+    startup.serve()
+    raise SystemExit(0)
+
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException, Response
-from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
-from typing import Dict, Any
+from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse, PlainTextResponse
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional
 import asyncio
 import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
 import time
+import atexit
+import itertools
+import httpx
 
-from auth import get_auth_from_request
+from auth import get_auth_from_request, require_debug_token
 from providers.anthropic import AnthropicProvider
-from providers.bedrock import BedrockProvider
 from providers import ValidationError, AuthenticationError, RateLimitError
 from fallback import FallbackHandler
+from affinity import ProviderAffinity, usage_from_chunk
+from cache_breakpoints import BreakpointOptimizer, client_name
+from priority import WeightedFairQueue, classify, parse_rules, parse_weights
 from metrics import MetricsCollector
+from snapshot_store import SnapshotStore
+from metrics_stream import MetricsBroadcaster
+from token_estimator import Estimate, TokenEstimator
 from compactor import compress_messages, get_flags, init_compactor
 from error_tracker import ErrorTracker, ErrorTrackingHandler
+from logging_setup import NEVER_SAMPLE, configure_logging
+from profiler import MODES as PROFILE_MODES, InflightMiddleware, InflightRegistry, ProfilerBusy, SamplingProfiler, collapse
 import config
+import timing
+import tracing
 
-# Configure logging with rotation and separate files
-# Keep 10 files of 10MB each (100MB total) per log type
-
-# Application logs (main, fallback, providers) - meaningful logs
-app_handler = RotatingFileHandler(
-    '/tmp/claude-proxy.app.log',
-    maxBytes=10*1024*1024,  # 10MB per file
-    backupCount=10
-)
-app_handler.setFormatter(logging.Formatter(
-    '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-))
+startup.mark("imports")
 
-# HTTP request logs (httpx, httpcore) - noisy logs
-http_handler = RotatingFileHandler(
-    '/tmp/claude-proxy.http.log',
-    maxBytes=10*1024*1024,  # 10MB per file
-    backupCount=5  # Less history for noisy logs
+# Initialize error tracking
+error_tracker = ErrorTracker()
+# background=True: parsing, SQLite writes and alerts run on a dedicated writer
+# thread, so error storms don't stall the logging listener either
+error_tracking_handler = ErrorTrackingHandler(error_tracker, background=True)
+
+# Configure logging: every logger call just enqueues; a listener thread writes the
+# rotating files (claude-proxy.app.log, claude-proxy.http.log for httpx/httpcore)
+# and feeds the error tracker
+logging_pipeline = configure_logging(
+    app_log_path=os.path.join(config.LOG_DIR, "claude-proxy.app.log"),
+    http_log_path=os.path.join(config.LOG_DIR, "claude-proxy.http.log"),
+    extra_handlers=[error_tracking_handler],
+    log_format=config.LOG_FORMAT,
+    sample_burst=config.LOG_SAMPLE_BURST,
+    sample_window=config.LOG_SAMPLE_WINDOW,
 )
-http_handler.setFormatter(logging.Formatter(
-    '%(asctime)s - %(name)s - %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-))
-
-# Configure root logger for application logs
-root_logger = logging.getLogger()
-root_logger.setLevel(logging.INFO)
-root_logger.addHandler(app_handler)
-
-# Configure httpx/httpcore to use separate log file
-for http_logger_name in ['httpx', 'httpcore']:
-    http_logger = logging.getLogger(http_logger_name)
-    http_logger.handlers.clear()  # Remove inherited handlers
-    http_logger.addHandler(http_handler)
-    http_logger.propagate = False  # Don't propagate to root logger
+atexit.register(logging_pipeline.stop)
 
 logger = logging.getLogger(__name__)
-
-# Initialize error tracking
-error_tracker = ErrorTracker()
-error_tracking_handler = ErrorTrackingHandler(error_tracker)
-root_logger.addHandler(error_tracking_handler)
-logger.info("Error tracking handler attached")
+logger.info("Logging pipeline started (error tracking attached)")
 
 
 def _msg_type_summary(messages: list) -> tuple[str, dict]:
@@ -105,38 +105,111 @@ async def _monitor_event_loop_lag():
             logger.debug(f"Event loop lag: {lag_ms:.1f}ms")
 
 
+WORKER_HEARTBEAT_INTERVAL = 30  # seconds between this worker's startup / RSS reports to the shared metrics cache
+
+
+async def _worker_heartbeat_loop():
+    """Publish this worker's startup times and memory so /metrics can list every worker."""
+    while True:
+        try:
+            await asyncio.to_thread(metrics.record_worker, os.getpid(), startup.stats(), WORKER_HEARTBEAT_INTERVAL * 3)
+        except Exception as e:
+            logger.warning(f"Worker heartbeat failed: {e}")
+        await asyncio.sleep(WORKER_HEARTBEAT_INTERVAL)
+
+
+ERROR_RETENTION_INTERVAL = 3600  # seconds
+
+
+async def _error_retention_loop():
+    """Apply error tracker retention at startup and then hourly, in one worker per round."""
+    while True:
+        try:
+            # The lease lapses just before the next round, so any worker may take that one
+            if await asyncio.to_thread(metrics.acquire_lease, "error_retention", ERROR_RETENTION_INTERVAL - 60):
+                await asyncio.to_thread(
+                    error_tracker.apply_retention,
+                    occurrence_days=config.ERROR_OCCURRENCE_RETENTION_DAYS,
+                    hourly_days=config.ERROR_HOURLY_RETENTION_DAYS,
+                    daily_days=config.ERROR_DAILY_RETENTION_DAYS,
+                )
+        except Exception as e:
+            logger.warning(f"Error retention failed: {e}")
+        await asyncio.sleep(ERROR_RETENTION_INTERVAL)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     asyncio.create_task(_monitor_event_loop_lag())
+    asyncio.create_task(_error_retention_loop())
     asyncio.create_task(fallback.start_health_check_loop())
+    if bedrock is not None:
+        # Keeps AWS credentials fresh off the request path (see BedrockProvider's credential manager)
+        asyncio.create_task(bedrock.run_credential_refresh_loop())
     init_compactor()
-    # Set anyio's default thread limiter to match BEDROCK_THREAD_POOL_SIZE
-    # so streaming boto3 calls (which must use anyio threads for from_thread.run) are bounded
-    import anyio
-    limiter = anyio.to_thread.current_default_thread_limiter()
-    limiter.total_tokens = config.BEDROCK_THREAD_POOL_SIZE
-    logger.info(f"anyio thread limiter set to {config.BEDROCK_THREAD_POOL_SIZE} threads")
+    # Attribute tasks spawned inside a request (streaming bodies, task groups) to it for /debug/*
+    inflight.install(asyncio.get_running_loop())
+    # Streaming boto3 calls (anyio threads, for from_thread.run) are bounded by
+    # BedrockProvider.stream_limiter, not anyio's default limiter
+    # Per worker: the BatchSpanProcessor's export thread doesn't survive a fork
+    tracing.setup_tracing(config.TRACING, config.TRACE_FILE)
+    startup.mark("ready")
+    logger.info(f"Worker ready: {startup.stats()}")
+    asyncio.create_task(_worker_heartbeat_loop())
     yield
+    metrics.remove_worker(os.getpid())
+    tracing.shutdown_tracing()
+    metrics.snapshots.close()
 
 
 # Initialize FastAPI app
 app = FastAPI(title="Claude Proxy", version="1.0.0", lifespan=lifespan)
 
+# In-flight request tracking and the on-demand profiler behind /debug/*
+inflight = InflightRegistry()
+profiler = SamplingProfiler(inflight)
+
 # Initialize metrics collector
-metrics = MetricsCollector()
+metrics = MetricsCollector(snapshots=SnapshotStore(
+    max_bytes=config.REQUEST_SNAPSHOT_MAX_BYTES,
+    spill_dir=os.path.expanduser("~/.cache/claude-proxy/snapshots"),
+    spill_bytes=config.REQUEST_SNAPSHOT_SPILL_BYTES,
+))
 
 # Initialize providers
 anthropic = AnthropicProvider()
-try:
-    bedrock = BedrockProvider()
-    providers = [anthropic, bedrock]
-except Exception as e:
-    logger.warning(f"Bedrock provider unavailable (no AWS config?): {e} — running Anthropic-only")
-    bedrock = None
-    providers = [anthropic]
+bedrock = None
+providers = [anthropic]
+if not config.BEDROCK_ENABLED:
+    logger.info("Bedrock disabled (BEDROCK_ENABLED=0) — running Anthropic-only")
+else:
+    try:
+        # Imported here: boto3 / botocore are the heaviest imports, and unused without Bedrock
+        from providers.bedrock import BedrockProvider
+        bedrock = BedrockProvider()
+        providers = [anthropic, bedrock]
+    except Exception as e:
+        logger.warning(f"Bedrock provider unavailable (no AWS config?): {e} — running Anthropic-only")
+
+# Create fallback handler with provider priority; with several providers (or
+# pool credentials), keep each conversation where its prompt cache is warm
+affinity = None
+if config.PROVIDER_AFFINITY and (len(providers) > 1 or len(anthropic.credentials or ()) > 1):
+    affinity = ProviderAffinity(ttl=config.AFFINITY_TTL, min_cached_tokens=config.AFFINITY_MIN_CACHED_TOKENS)
+    anthropic.affinity = affinity
+fallback = FallbackHandler(providers, metrics=metrics, affinity=affinity)
+
+# Optional cache_control placement, learned per client from response usage
+breakpoint_optimizer = BreakpointOptimizer(epsilon=config.CACHE_BREAKPOINTS_EPSILON) if config.CACHE_BREAKPOINTS else None
 
-# Create fallback handler with provider priority
-fallback = FallbackHandler(providers, metrics=metrics)
+# Interactive vs background classes; under contention queued requests get slots in weighted-fair order
+priority_rules = parse_rules(config.PRIORITY_RULES)
+priority_queue = WeightedFairQueue(config.PRIORITY_MAX_CONCURRENT, parse_weights(config.PRIORITY_WEIGHTS))
+
+# Local count_tokens answers (exact-count cache + calibrated estimate)
+token_estimator = TokenEstimator(tolerance=config.COUNT_TOKENS_TOLERANCE)
+_count_tokens_local_answers = itertools.count(1)
+_count_tokens_verifications: set = set()
 
 
 # Dashboard HTML template
@@ -600,12 +673,18 @@ DASHBOARD_HTML = """
             });
         }
 
-        // Load metrics and update dashboard
+        // Load metrics and update dashboard (fallback when /metrics/stream is unavailable)
         async function loadMetrics() {
             try {
                 const response = await fetch('/metrics');
-                const data = await response.json();
+                renderMetrics(await response.json());
+            } catch (error) {
+                console.error('Failed to load metrics:', error);
+            }
+        }
 
+        function renderMetrics(data) {
+            try {
                 // Update stats
                 document.getElementById('total-requests').textContent = data.summary.total_requests.toLocaleString();
                 document.getElementById('success-rate').textContent = data.summary.success_rate.toFixed(1) + '%';
@@ -801,7 +880,7 @@ DASHBOARD_HTML = """
                 document.getElementById('refresh-time').textContent = `↺ ${now.toLocaleTimeString()}`;
 
             } catch (error) {
-                console.error('Failed to load metrics:', error);
+                console.error('Failed to render metrics:', error);
             }
         }
 
@@ -849,40 +928,60 @@ DASHBOARD_HTML = """
 
         async function loadErrorTypes() {
             try {
-                const data = await fetch('/errors/summary').then(r => r.json());
-                const tbody = document.getElementById('error-types-body');
-                if (data.errors && data.errors.length > 0) {
-                    tbody.innerHTML = data.errors.map(e => {
-                        const first = new Date(e.first_seen).toLocaleString();
-                        const last = new Date(e.last_seen).toLocaleString();
-                        const fp = e.fingerprint.substring(0, 8);
-                        const msg = e.message.length > 80 ? e.message.substring(0, 80) + '…' : e.message;
-                        return `
-                            <tr>
-                                <td style="font-family:monospace;font-size:11px;">${fp}</td>
-                                <td>${e.provider}</td>
-                                <td><span class="error-type">${e.error_type}</span></td>
-                                <td>${e.count}</td>
-                                <td style="font-size:11px;">${first}</td>
-                                <td style="font-size:11px;">${last}</td>
-                                <td style="font-size:11px;max-width:300px;word-break:break-word;" title="${e.message}">${msg}</td>
-                            </tr>
-                        `;
-                    }).join('');
-                } else {
-                    tbody.innerHTML = '<tr><td colspan="7" class="no-errors">No errors recorded yet</td></tr>';
-                }
+                renderErrorTypes(await fetch('/errors/summary').then(r => r.json()));
             } catch (error) {
                 console.error('Failed to load error types:', error);
             }
         }
 
-        // Initialize and start auto-refresh
+        function renderErrorTypes(data) {
+            const tbody = document.getElementById('error-types-body');
+            if (data.errors && data.errors.length > 0) {
+                tbody.innerHTML = data.errors.map(e => {
+                    const first = new Date(e.first_seen).toLocaleString();
+                    const last = new Date(e.last_seen).toLocaleString();
+                    const fp = e.fingerprint.substring(0, 8);
+                    const msg = e.message.length > 80 ? e.message.substring(0, 80) + '…' : e.message;
+                    return `
+                        <tr>
+                            <td style="font-family:monospace;font-size:11px;">${fp}</td>
+                            <td>${e.provider}</td>
+                            <td><span class="error-type">${e.error_type}</span></td>
+                            <td>${e.count}</td>
+                            <td style="font-size:11px;">${first}</td>
+                            <td style="font-size:11px;">${last}</td>
+                            <td style="font-size:11px;max-width:300px;word-break:break-word;" title="${e.message}">${msg}</td>
+                        </tr>
+                    `;
+                }).join('');
+            } else {
+                tbody.innerHTML = '<tr><td colspan="7" class="no-errors">No errors recorded yet</td></tr>';
+            }
+        }
+
+        // Live updates: one full snapshot, then only the top-level keys that changed
+        function connectMetricsStream() {
+            let state = {};
+            const source = new EventSource('/metrics/stream');
+            const render = () => {
+                renderMetrics(state);
+                if (state.error_summary) renderErrorTypes(state.error_summary);
+            };
+            source.addEventListener('snapshot', e => { state = JSON.parse(e.data); render(); });
+            source.addEventListener('delta', e => { Object.assign(state, JSON.parse(e.data)); render(); });
+            // EventSource reconnects by itself (the server ends each stream every 30s)
+        }
+
+        // Initialize and start live updates
         initCharts();
-        loadMetrics();
-        loadErrorTypes();
-        setInterval(loadMetrics, 30000); // Refresh every 30 seconds
-        setInterval(loadErrorTypes, 60000); // Refresh error types every 60 seconds
+        if (window.EventSource) {
+            connectMetricsStream();
+        } else {
+            loadMetrics();
+            loadErrorTypes();
+            setInterval(loadMetrics, 30000); // Refresh every 30 seconds
+            setInterval(loadErrorTypes, 60000); // Refresh error types every 60 seconds
+        }
     </script>
 </body>
 </html>
@@ -904,9 +1003,16 @@ async def monitor_request_duration(request: Request, call_next):
 
     # Add duration header for monitoring
     response.headers["X-Request-Duration"] = f"{duration:.2f}"
+    # Alongside any per-phase entries the endpoint set (see timing.py)
+    response.headers.append("Server-Timing", f"total;dur={duration * 1000:.1f}")
     return response
 
 
+# Added last so it is outermost: every task of a request, including the one
+# above, is attributed to it
+app.add_middleware(InflightMiddleware, registry=inflight)
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
@@ -945,29 +1051,56 @@ async def messages_endpoint(request: Request):
     import uuid
     request_id = str(uuid.uuid4())[:8]
 
-    logger.info(f"[{request_id}] → /v1/messages")
+    # Root span of the request's trace; a streaming response ends it when the stream does
+    root_span = tracing.start_span("proxy.messages", **{"proxy.request_id": request_id})
+    handed_off = False
+    try:
+        with tracing.use_span(root_span, end_on_exit=False):
+            response = await _handle_messages(request, request_id, root_span)
+        handed_off = isinstance(response, StreamingResponse)
+        return response
+    finally:
+        if root_span is not None and not handed_off:
+            root_span.end()
+
+
+async def _handle_messages(request: Request, request_id: str, root_span):
+    logger.info(f"[{request_id}] → /v1/messages", extra=NEVER_SAMPLE)
+
+    # Providers and fallback add their phases (clean, connect, ttft, ...) through the context
+    phases = timing.PhaseTimer()
+    timing.activate(phases)
 
     try:
         # Get authentication
-        token, auth_type = get_auth_from_request(request)
+        with phases.measure("auth"):
+            token, auth_type = get_auth_from_request(request)
 
         # Parse request body
-        body = await request.json()
+        with phases.measure("parse"):
+            body = await request.json()
 
         # Collect message type analytics before compression mutates the body
         original_messages = body.get("messages", [])
-        _msg_types_json, _msg_types_dict = _msg_type_summary(original_messages)
+        with phases.measure("summary"):
+            _msg_types_json, _msg_types_dict = _msg_type_summary(original_messages)
         _has_cm = "context_management" in body
         _message_count = len(original_messages)
 
-        # Store body in ring buffer for dashboard inspection (before compression)
-        metrics.store_request_body(request_id, body)
+        # Snapshot the body for dashboard inspection (before compression) — the wire bytes, as-is
+        with phases.measure("snapshot"):
+            metrics.store_request_body(request_id, raw=await request.body())
 
         _beta = request.headers.get("anthropic-beta", "")
+        tracing.set_attributes(**{
+            "proxy.model": body.get("model"), "proxy.stream": bool(body.get("stream", False)),
+            "proxy.message_count": _message_count, "proxy.max_tokens": body.get("max_tokens"),
+        })
         logger.info(
             f"[{request_id}] model={body.get('model')} max_tokens={body.get('max_tokens')} "
             f"stream={body.get('stream', False)} msgs={_message_count} "
-            f"types={_msg_types_json or '{}'} cm={_has_cm} beta={_beta or 'none'}"
+            f"types={_msg_types_json or '{}'} cm={_has_cm} beta={_beta or 'none'}",
+            extra=NEVER_SAMPLE,
         )
 
         # Compression tracking vars (populated below if compression runs)
@@ -977,25 +1110,44 @@ async def messages_endpoint(request: Request):
         if config.COMPRESS_ENABLED:
             try:
                 flags = get_flags()
-                compressed_msgs, updated_tools, comp_stats = await compress_messages(
-                    body.get("messages", []),
-                    body.get("tools") or [],
-                    flags,
-                )
+                with phases.measure("compress"), tracing.span("compactor.compress"):
+                    compressed_msgs, updated_tools, comp_stats = await compress_messages(
+                        body.get("messages", []),
+                        body.get("tools") or [],
+                        flags,
+                    )
+                    tracing.set_attributes(**{
+                        "compactor.original_tokens": comp_stats.get("original_tokens"),
+                        "compactor.compressed_tokens": comp_stats.get("compressed_tokens"),
+                        "compactor.skipped": comp_stats.get("skipped"),
+                    })
                 body = {**body, "messages": compressed_msgs, "tools": updated_tools}
                 if comp_stats and "original_tokens" in comp_stats:
                     metrics.record_compression(
                         comp_stats["original_tokens"],
                         comp_stats["compressed_tokens"],
                     )
-                metrics.store_request_body(request_id, body, stage="compressed")
+                with phases.measure("snapshot"):
+                    metrics.store_request_body(request_id, body, stage="compressed")
             except Exception as comp_err:
                 logger.error(f"[{request_id}] Compression failed — forwarding uncompressed: {comp_err}")
 
+        # Re-place prompt-cache breakpoints at stable prefix boundaries (see cache_breakpoints.py)
+        cache_client, cache_placement = client_name(request.headers.get("user-agent")), None
+        if breakpoint_optimizer is not None:
+            try:
+                body, cache_placement = breakpoint_optimizer.apply(body, cache_client)
+                logger.debug(f"[{request_id}] cache breakpoints: {cache_placement} (client={cache_client})")
+            except Exception as bp_err:
+                logger.error(f"[{request_id}] Breakpoint placement failed — forwarding client markers: {bp_err}")
+
         _tokens_before = comp_stats.get("original_tokens", 0)
         _tokens_after = comp_stats.get("compressed_tokens", 0)
         _compressed = bool(_tokens_before)
 
+        priority = classify(body, request.headers, priority_rules, priority_queue.weights)
+        tracing.set_attributes(**{"proxy.priority": priority})
+
         # Get headers to forward
         headers = {}
         if "anthropic-version" in request.headers:
@@ -1009,37 +1161,52 @@ async def messages_endpoint(request: Request):
             chunk_count = 0
             async def generate():
                 nonlocal chunk_count
-                try:
-                    async for chunk in fallback.stream_message(body, token, auth_type, headers, request_id):
-                        chunk_count += 1
-                        # Log first 3 chunks to debug
-                        if chunk_count <= 3:
-                            logger.debug(f"[{request_id}] Yielding chunk {chunk_count}: {chunk[:150]}...")
-                        yield chunk
-                except RateLimitError as e:
-                    # Return rate limit error event with retry info
-                    logger.error(f"🚫 [{request_id}] RATE LIMIT in streaming - returning overloaded_error event: {e}")
-                    error_event = {
-                        "type": "error",
-                        "error": {
-                            "type": "overloaded_error",  # Use overloaded_error for better retry handling
-                            "message": "Both Anthropic and AWS Bedrock have rate limited your requests after 20+ retry attempts. Please wait 30-60 seconds before trying again. This usually happens during high-traffic periods."
+                # Starlette iterates this in its own task; keep the timer and root span current there too
+                timing.activate(phases)
+                with tracing.use_span(root_span):
+                    try:
+                        # Taken inside the generator so a response that is never iterated holds no slot;
+                        # the slot is held until the stream ends
+                        async with priority_queue.slot(priority) as waited_ms:
+                            phases.record("queue", waited_ms)
+                            async for chunk in fallback.stream_message(body, token, auth_type, headers, request_id):
+                                chunk_count += 1
+                                if cache_placement and chunk_count <= 2:
+                                    usage = usage_from_chunk(chunk)
+                                    if usage:
+                                        breakpoint_optimizer.observe(cache_client, cache_placement, usage)
+                                # Log first 3 chunks to debug
+                                if chunk_count <= 3:
+                                    logger.debug(f"[{request_id}] Yielding chunk {chunk_count}: {chunk[:150]}...")
+                                yield chunk
+                    except RateLimitError as e:
+                        # Return rate limit error event with retry info
+                        logger.error(f"🚫 [{request_id}] RATE LIMIT in streaming - returning overloaded_error event: {e}")
+                        error_event = {
+                            "type": "error",
+                            "error": {
+                                "type": "overloaded_error",  # Use overloaded_error for better retry handling
+                                "message": "Both Anthropic and AWS Bedrock have rate limited your requests after 20+ retry attempts. Please wait 30-60 seconds before trying again. This usually happens during high-traffic periods."
+                            }
                         }
-                    }
-                    yield f"data: {json.dumps(error_event)}\n\n"
-                except Exception as e:
-                    # Return generic error event for other errors
-                    error_event = {
-                        "type": "error",
-                        "error": {"type": "api_error", "message": str(e)}
-                    }
-                    yield f"data: {json.dumps(error_event)}\n\n"
+                        yield f"data: {json.dumps(error_event)}\n\n"
+                    except Exception as e:
+                        # Return generic error event for other errors
+                        error_event = {
+                            "type": "error",
+                            "error": {"type": "api_error", "message": str(e)}
+                        }
+                        yield f"data: {json.dumps(error_event)}\n\n"
+                    finally:
+                        metrics.record_phases(request_id, phases.rounded())
+                        tracing.set_attributes(**{f"phase.{k}_ms": v for k, v in phases.rounded().items()})
+                        logger.info(f"[{request_id}] phases {phases.server_timing()} priority={priority}", extra=NEVER_SAMPLE)
 
             metrics.record_request_detail(request_id, body.get("model", "unknown"),
                 _tokens_before, _tokens_after, _compressed, stream=True,
                 msg_types=_msg_types_json, has_context_management=_has_cm,
                 message_count=_message_count)
-            logger.info(f"[{request_id}] ✓ Starting streaming response")
+            logger.info(f"[{request_id}] ✓ Starting streaming response", extra=NEVER_SAMPLE)
             return StreamingResponse(
                 generate(),
                 media_type="text/event-stream",
@@ -1047,18 +1214,30 @@ async def messages_endpoint(request: Request):
                     "Cache-Control": "no-cache",
                     "Connection": "keep-alive",
                     "X-Accel-Buffering": "no",
-                    "X-Request-ID": request_id
+                    "X-Request-ID": request_id,
+                    # Upstream phases are still to come; they go to /requests and /metrics
+                    "Server-Timing": phases.server_timing(),
                 }
             )
         else:
             # Non-streaming response
-            result = await fallback.send_message(body, token, auth_type, headers, request_id)
+            async with priority_queue.slot(priority) as waited_ms:
+                phases.record("queue", waited_ms)
+                result = await fallback.send_message(body, token, auth_type, headers, request_id)
+            if cache_placement and isinstance(result, dict):
+                breakpoint_optimizer.observe(cache_client, cache_placement, result.get("usage"))
             metrics.record_request_detail(request_id, body.get("model", "unknown"),
                 _tokens_before, _tokens_after, _compressed, stream=False,
                 msg_types=_msg_types_json, has_context_management=_has_cm,
                 message_count=_message_count)
-            logger.info(f"[{request_id}] ✓ Non-streaming response complete")
-            return JSONResponse(content=result, headers={"X-Request-ID": request_id})
+            metrics.record_phases(request_id, phases.rounded())
+            tracing.set_attributes(**{f"phase.{k}_ms": v for k, v in phases.rounded().items()})
+            logger.info(f"[{request_id}] ✓ Non-streaming response complete (phases {phases.server_timing()} priority={priority})",
+                        extra=NEVER_SAMPLE)
+            return JSONResponse(content=result, headers={
+                "X-Request-ID": request_id,
+                "Server-Timing": phases.server_timing(),
+            })
 
     except HTTPException:
         raise
@@ -1142,14 +1321,14 @@ async def messages_dry_run(request: Request):
 @app.get("/requests")
 async def recent_requests_endpoint():
     """Return the last 100 request details (newest first) for benchmarking inspection."""
-    return JSONResponse(metrics.get_recent_requests())
+    return Response(content=metrics.get_recent_requests_json(), media_type="application/json")
 
 
 @app.post("/v1/messages/count_tokens")
 async def count_tokens_endpoint(request: Request):
     """
-    Token counting endpoint - passthrough to Anthropic API.
-    Used by Claude Code to count tokens before making actual requests.
+    Token counting endpoint - answered locally when confident, else passthrough to Anthropic API.
+    Used by Claude Code to count tokens before making actual requests (see token_estimator.py).
     """
     import uuid
     request_id = str(uuid.uuid4())[:8]
@@ -1164,16 +1343,8 @@ async def count_tokens_endpoint(request: Request):
 
         logger.info(f"[{request_id}] → /v1/messages/count_tokens (model={model})")
 
-        # Get headers to forward
-        headers = {}
-        if "anthropic-version" in request.headers:
-            headers["anthropic-version"] = request.headers["anthropic-version"]
-        if "anthropic-beta" in request.headers:
-            headers["anthropic-beta"] = request.headers["anthropic-beta"]
-
-        # Forward to Anthropic API (only anthropic provider supports token counting)
-        from providers.anthropic import AnthropicProvider
-        provider = AnthropicProvider()
+        # Only the anthropic provider supports token counting
+        provider = anthropic
 
         # Normalize model name
         if "model" in body:
@@ -1186,33 +1357,67 @@ async def count_tokens_endpoint(request: Request):
         else:
             api_headers["x-api-key"] = token
 
-        if "anthropic-version" in headers:
-            api_headers["anthropic-version"] = headers["anthropic-version"]
-        if "anthropic-beta" in headers:
-            api_headers["anthropic-beta"] = headers["anthropic-beta"]
+        if "anthropic-version" in request.headers:
+            api_headers["anthropic-version"] = request.headers["anthropic-version"]
+        if "anthropic-beta" in request.headers:
+            api_headers["anthropic-beta"] = request.headers["anthropic-beta"]
+
+        # Local answer: an exact count seen before, or a calibrated estimate within tolerance
+        estimate = None
+        if config.COUNT_TOKENS_LOCAL:
+            estimate = await asyncio.to_thread(token_estimator.estimate, body)
+            if estimate.confident:
+                logger.info(f"[{request_id}] ✓ count_tokens: {estimate.tokens} tokens (model={model}, {estimate.source})")
+                metrics.record_count_tokens(success=True, model=model, token_count=estimate.tokens, source=estimate.source)
+                answered = next(_count_tokens_local_answers)
+                if config.COUNT_TOKENS_VERIFY_EVERY and answered % config.COUNT_TOKENS_VERIFY_EVERY == 0:
+                    # Keep measuring accuracy: check a sample of local answers upstream, off the response path
+                    task = asyncio.create_task(_verify_count_tokens(body, api_headers, estimate))
+                    _count_tokens_verifications.add(task)
+                    task.add_done_callback(_count_tokens_verifications.discard)
+                return JSONResponse(content={"input_tokens": estimate.tokens},
+                                    headers={"X-Request-ID": request_id, "X-Token-Count-Source": estimate.source})
 
         # Make request to count_tokens endpoint
-        response = await provider.client.post(
-            f"{provider.base_url}/v1/messages/count_tokens",
-            json=body,
-            headers=api_headers
-        )
-
-        if response.status_code != 200:
-            # Known Claude Code bug: count_tokens is called without proper auth headers
-            # This is harmless - regular message requests work fine
-            if response.status_code == 401:
-                logger.info(f"[{request_id}] count_tokens auth error (known Claude Code bug): {response.status_code}")
-            else:
-                logger.error(f"[{request_id}] ✗ count_tokens failed: {response.status_code} - {response.text}")
+        try:
+            response = await provider.client.post(
+                f"{provider.base_url}/v1/messages/count_tokens",
+                json=body,
+                headers=api_headers
+            )
+        except httpx.HTTPError as e:
+            if estimate is None:
+                raise
+            logger.warning(f"[{request_id}] count_tokens upstream unreachable ({type(e).__name__}: {e}) — answering with estimate")
+            response = None
+
+        if response is None or response.status_code != 200:
+            if response is not None:
+                # Known Claude Code bug: count_tokens is called without proper auth headers
+                # This is harmless - regular message requests work fine
+                if response.status_code == 401:
+                    logger.info(f"[{request_id}] count_tokens auth error (known Claude Code bug): {response.status_code}")
+                else:
+                    logger.error(f"[{request_id}] ✗ count_tokens failed: {response.status_code} - {response.text}")
+            # Auth / rate-limit / outage: a rough local count beats no count (it drives auto-compaction).
+            # A 400 is about the request itself and is passed through.
+            if estimate is not None and (response is None or response.status_code in (401, 403, 429)
+                                         or response.status_code >= 500):
+                metrics.record_count_tokens(success=True, model=model, token_count=estimate.tokens, source="fallback")
+                return JSONResponse(content={"input_tokens": estimate.tokens},
+                                    headers={"X-Request-ID": request_id, "X-Token-Count-Source": "fallback"})
             metrics.record_count_tokens(success=False, model=model)
             raise HTTPException(status_code=response.status_code, detail=response.text)
 
         result = response.json()
         token_count = result.get('input_tokens', 0)
-        logger.info(f"[{request_id}] ✓ count_tokens: {token_count} tokens (model={model})")
+        if estimate is not None:
+            token_estimator.observe(estimate, token_count)
+            logger.info(f"[{request_id}] ✓ count_tokens: {token_count} tokens (model={model}, estimate {estimate.tokens})")
+        else:
+            logger.info(f"[{request_id}] ✓ count_tokens: {token_count} tokens (model={model})")
         metrics.record_count_tokens(success=True, model=model, token_count=token_count)
-        return JSONResponse(content=result, headers={"X-Request-ID": request_id})
+        return JSONResponse(content=result, headers={"X-Request-ID": request_id, "X-Token-Count-Source": "upstream"})
 
     except HTTPException:
         raise
@@ -1221,6 +1426,18 @@ async def count_tokens_endpoint(request: Request):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def _verify_count_tokens(body: Dict[str, Any], api_headers: Dict[str, str], estimate: Estimate):
+    """Score a local count_tokens answer against upstream (feeds /metrics count_tokens.local.verified)."""
+    try:
+        response = await anthropic.client.post(
+            f"{anthropic.base_url}/v1/messages/count_tokens", json=body, headers=api_headers
+        )
+        if response.status_code == 200:
+            token_estimator.observe(estimate, response.json().get("input_tokens", 0), answered_locally=True)
+    except Exception as e:
+        logger.debug(f"count_tokens verification failed: {e}")
+
+
 @app.post("/chat/completions")
 @app.post("/v1/chat/completions")
 async def openai_compatibility_endpoint(request: Request):
@@ -1309,7 +1526,7 @@ async def openai_compatibility_endpoint(request: Request):
                 }],
                 "usage": result.get("usage", {})
             }
-            logger.info(f"[{request_id}] ✓ OpenAI non-streaming response complete")
+            logger.info(f"[{request_id}] ✓ OpenAI non-streaming response complete", extra=NEVER_SAMPLE)
             return JSONResponse(content=openai_response, headers={"X-Request-ID": request_id})
 
     except HTTPException:
@@ -1387,22 +1604,66 @@ async def errors_summary():
         return JSONResponse({"errors": [], "total": 0, "error": str(e)})
 
 
+@app.get("/errors/timeseries")
+async def errors_timeseries(
+    resolution: str = "hour",
+    fingerprint: Optional[str] = None,
+    provider: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    group_by: str = "fingerprint",
+):
+    """Error counts per hour/day from the rollup tables.
+
+    Defaults to the last 24 hours (resolution=hour) or 30 days (resolution=day).
+    group_by=provider sums fingerprints into one series per provider.
+    """
+    if since is None:
+        window = timedelta(hours=24) if resolution == "hour" else timedelta(days=30)
+        since = (datetime.now() - window).isoformat()
+    try:
+        series = await asyncio.to_thread(
+            error_tracker.get_error_timeseries,
+            resolution=resolution, fingerprint=fingerprint, provider=provider,
+            since=since, until=until, group_by=group_by,
+        )
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return JSONResponse({"resolution": resolution, "since": since, "group_by": group_by, "series": series})
+
+
 @app.get("/requests/{request_id}")
 async def get_request_body(request_id: str, stage: str = "original"):
     """Return stored request body snapshot (stage: 'original' or 'compressed')."""
-    body = metrics.get_request_body(request_id, stage)
+    # Snapshots are stored compressed; decompress off the event loop
+    body = await asyncio.to_thread(metrics.get_request_body, request_id, stage)
     if body is None:
         return JSONResponse({"error": "not found or evicted"}, status_code=404)
-    return JSONResponse(body)
+    return Response(content=body, media_type="application/json")
 
 
 @app.get("/metrics")
 async def get_metrics():
     """JSON metrics endpoint for dashboard and API consumers."""
+    return JSONResponse(await _collect_metrics())
+
+
+async def _collect_metrics() -> Dict[str, Any]:
     stats = await asyncio.to_thread(metrics.get_stats)
 
     # Add count_tokens stats
     stats["count_tokens"] = metrics.get_count_tokens_stats()
+    stats["count_tokens"]["local"] = token_estimator.stats()
+    stats["logging"] = logging_pipeline.snapshot()
+    stats["request_snapshots"] = metrics.snapshots.stats()
+    # Live (uncached) process figures — bench.py load samples these during a run
+    stats["process"] = {
+        "pid": os.getpid(),
+        "cpu_seconds": round(time.process_time(), 3),
+        "current_lag_ms": round(metrics.current_lag_ms, 2),
+    }
+    # This worker's startup times and memory; every worker's last report is in stats["workers"]
+    stats["startup"] = startup.stats()
 
     # Add live cooldown status from FallbackHandler
     def _cooldown_status(provider_name):
@@ -1414,8 +1675,85 @@ async def get_metrics():
         return {"cooling_down": remaining > 0, "remaining_seconds": remaining, "reason": reason}
 
     stats["cooldowns"] = {p.name: _cooldown_status(p.name) for p in fallback.providers}
+    if anthropic.credentials is not None:
+        stats["anthropic_credentials"] = anthropic.credentials.stats()
+    if affinity is not None:
+        stats["provider_affinity"] = affinity.stats()
+    if breakpoint_optimizer is not None:
+        stats["cache_breakpoints"] = breakpoint_optimizer.stats()
+    stats["priority"] = priority_queue.stats()
+    if bedrock is not None:
+        stats["bedrock_pools"] = bedrock.pool_stats()
+        stats["bedrock_credentials"] = bedrock.credential_status()
+        stats["bedrock_endpoints"] = bedrock.endpoint_stats()
+    return stats
+
+
+_error_summary_cache: Dict[str, Any] = {"at": 0.0, "value": None}
+ERROR_SUMMARY_REFRESH = 30  # seconds between error-tracker queries for the metrics stream
+
+
+async def _metrics_stream_snapshot() -> Dict[str, Any]:
+    """One tick of /metrics/stream: /metrics plus the error summary, shared by every viewer."""
+    stats = dict(await _collect_metrics())
+    # get_stats() is cached for 5s; these are cheap enough to read live every tick
+    stats["recent_requests"] = metrics.get_recent_requests()
+    stats["current_lag_ms"] = round(metrics.current_lag_ms, 2)
+    now = time.monotonic()
+    if now - _error_summary_cache["at"] >= ERROR_SUMMARY_REFRESH:
+        try:
+            errors = await asyncio.to_thread(error_tracker.search_errors, limit=100)
+            _error_summary_cache["value"] = {"errors": errors, "total": len(errors)}
+        except Exception as e:
+            logger.error(f"Failed to query error tracker: {e}")
+        _error_summary_cache["at"] = now
+    stats["error_summary"] = _error_summary_cache["value"]
+    return stats
+
+
+metrics_broadcaster = MetricsBroadcaster(_metrics_stream_snapshot)
+
+
+@app.get("/metrics/stream")
+async def metrics_stream():
+    """Server-sent events: a /metrics snapshot, then per-second deltas (see metrics_stream.py)."""
+    return StreamingResponse(
+        metrics_broadcaster.subscribe(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return JSONResponse(stats)
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 10.0, hz: int = 100, mode: str = "threads"):
+    """Sample this worker for `seconds` and return collapsed stacks (flamegraph.pl / speedscope).
+
+    mode=threads: what every thread executes, event-loop frames tagged with the
+    running request. mode=tasks: where every pending asyncio task is suspended.
+    """
+    require_debug_token(request)
+    if not 0 < seconds <= 120:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 120]")
+    if not 1 <= hz <= 1000:
+        raise HTTPException(status_code=400, detail="hz must be in [1, 1000]")
+    if mode not in PROFILE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(PROFILE_MODES)}")
+    try:
+        counts = await profiler.profile(seconds, hz, mode)
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(collapse(counts), headers={
+        "X-Profile-PID": str(os.getpid()),
+        "X-Profile-Mode": mode,
+        "X-Profile-Samples": str(sum(counts.values())),
+    })
+
+
+@app.get("/debug/tasks")
+async def debug_tasks(request: Request):
+    """In-flight requests (oldest first) with age and current await point, plus background tasks."""
+    require_debug_token(request)
+    return JSONResponse(inflight.snapshot())
 
 
 @app.get("/")
@@ -1432,6 +1770,7 @@ async def root():
             "/v1beta/* - Generic Google Gemini API proxy for Antigravity CLI",
             "/dashboard - Monitoring dashboard (HTML)",
             "/metrics - Metrics endpoint (JSON)",
+            "/debug/profile, /debug/tasks - Live profiling (needs PROXY_DEBUG_TOKEN)",
             "/health - Health check"
         ]
     }
@@ -1604,18 +1943,4 @@ async def gemini_proxy_endpoint(request: Request, path: str):
                 raise HTTPException(status_code=500, detail=str(e))
 
 
-if __name__ == "__main__":
-    import uvicorn
-
-    # Note: workers > 1 requires passing app as import string
-    # Each worker gets its own process and event loop
-    uvicorn.run(
-        "main:app",  # Import string required for multi-worker mode
-        host="127.0.0.1",
-        port=config.PROXY_PORT,
-        workers=config.WORKERS,
-        log_level="info",
-        # Enable asyncio debug mode in each worker
-        loop="asyncio",
-        access_log=True
-    )
\ No newline at end of file
+startup.mark("app")
@@ -1,18 +1,23 @@
 """Metrics collection and reporting for Claude Proxy."""
+import bisect
+import json
+import threading
 import time
 import os
 import asyncio
-from dataclasses import dataclass, asdict
-from typing import Dict, Any, Optional
+from dataclasses import dataclass, field, fields
+from typing import Dict, Any, Iterator, List, Optional
 from collections import deque
 import diskcache
 from datetime import datetime, timedelta
 import logging
 
+from snapshot_store import SnapshotStore
+
 logger = logging.getLogger(__name__)
 
 
-@dataclass
+@dataclass(slots=True)
 class RequestDetail:
     """Lightweight per-request record for the recent requests feed."""
     request_id: str
@@ -33,12 +38,109 @@ class RequestDetail:
     first_byte_ms: float = 0.0     # time to first SSE chunk (TTFT)
     bedrock_invocation_ms: int = 0  # Bedrock's own invocationLatency from message_stop
     bedrock_first_byte_ms: int = 0  # Bedrock's own firstByteLatency from message_stop
+    # Per-phase breakdown in ms, e.g. {"parse": 1.2, "compress": 40.3, "ttft": 820.0} (see timing.py)
+    phases: Dict[str, float] = field(default_factory=dict)
+
+
+_DETAIL_FIELDS = tuple(f.name for f in fields(RequestDetail))
+
+
+class RequestFeed:
+    """Fixed-size ring of RequestDetail records (newest first) with a request_id → slot index.
+
+    Timing / phase updates find their record through the index instead of
+    scanning the feed. Each slot caches its dict and JSON renderings, rebuilt
+    only after that record changes, so reading the feed doesn't re-serialize
+    records that haven't changed. Reads come from /metrics' worker thread as
+    well as the event loop, hence the lock.
+    """
+
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self._records: List[Optional[RequestDetail]] = [None] * capacity
+        self._dicts: List[Optional[Dict[str, Any]]] = [None] * capacity
+        self._json: List[Optional[str]] = [None] * capacity
+        self._index: Dict[str, int] = {}
+        self._next = 0  # slot the next record goes into
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, detail: RequestDetail) -> None:
+        with self._lock:
+            slot = self._next
+            evicted = self._records[slot]
+            if evicted is not None and self._index.get(evicted.request_id) == slot:
+                del self._index[evicted.request_id]
+            self._records[slot] = detail
+            self._dicts[slot] = self._json[slot] = None
+            self._index[detail.request_id] = slot
+            self._next = (slot + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def update(self, request_id: str, **values: Any) -> bool:
+        """Set fields on the record for request_id; False if it has already been evicted."""
+        with self._lock:
+            slot = self._index.get(request_id)
+            if slot is None:
+                return False
+            detail = self._records[slot]
+            for name, value in values.items():
+                setattr(detail, name, value)
+            self._dicts[slot] = self._json[slot] = None
+            return True
+
+    def get(self, request_id: str) -> Optional[RequestDetail]:
+        slot = self._index.get(request_id)
+        return self._records[slot] if slot is not None else None
+
+    def _slots(self) -> Iterator[int]:
+        """Occupied slots, newest first."""
+        return ((self._next - 1 - i) % self.capacity for i in range(self._count))
+
+    def _dict(self, slot: int) -> Dict[str, Any]:
+        view = self._dicts[slot]
+        if view is None:
+            detail = self._records[slot]
+            view = {name: getattr(detail, name) for name in _DETAIL_FIELDS}
+            view["phases"] = dict(view["phases"])
+            self._dicts[slot] = view
+        return view
+
+    def dicts(self) -> List[Dict[str, Any]]:
+        """Records as dicts, newest first (cached per record — treat as read-only)."""
+        with self._lock:
+            return [self._dict(slot) for slot in self._slots()]
+
+    def json(self) -> str:
+        """The feed as a JSON array, newest first, from per-record cached JSON."""
+        with self._lock:
+            parts = []
+            for slot in self._slots():
+                text = self._json[slot]
+                if text is None:
+                    # Same encoding as JSONResponse
+                    text = self._json[slot] = json.dumps(self._dict(slot), ensure_ascii=False,
+                                                         allow_nan=False, separators=(",", ":"))
+                parts.append(text)
+        return "[" + ",".join(parts) + "]"
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[RequestDetail]:
+        with self._lock:
+            records = [self._records[slot] for slot in self._slots()]
+        return iter(records)
+
+
+# Upper bounds (ms) of the per-phase histogram buckets; the last bucket is open-ended
+PHASE_BUCKETS_MS = (1, 5, 25, 100, 500, 2500, 10000)
 
 
 class MetricsCollector:
     """Collects and reports proxy metrics using diskcache for persistence."""
 
-    def __init__(self, cache_dir: Optional[str] = None):
+    def __init__(self, cache_dir: Optional[str] = None, snapshots: Optional[SnapshotStore] = None):
         """Initialize metrics collector with persistent cache."""
         if cache_dir is None:
             cache_dir = os.path.expanduser("~/.cache/claude-proxy/metrics")
@@ -48,10 +150,9 @@ class MetricsCollector:
 
         # In-memory deques for recent items (no file locking!)
         self.recent_errors: deque = deque(maxlen=20)
-        self.recent_requests: deque[RequestDetail] = deque(maxlen=100)
-        # Ring buffer: request_id → full request body dict (last 50)
-        self._request_bodies: dict[str, Any] = {}
-        self._request_body_order: deque[str] = deque(maxlen=50)
+        self.recent_requests = RequestFeed(capacity=100)
+        # Compressed request body snapshots, bounded by bytes (see snapshot_store.py)
+        self.snapshots = snapshots if snapshots is not None else SnapshotStore(max_bytes=32 * 1024 * 1024)
 
         # Cached stats (updated every 5s instead of computing on every request)
         self._cached_stats = None
@@ -64,6 +165,9 @@ class MetricsCollector:
         self._lag_last_flush: float = time.time()
         self._LAG_FLUSH_INTERVAL = 60  # seconds
 
+        # Per-phase histograms (in-memory, per worker): phase -> {count, sum_ms, max_ms, buckets}
+        self._phase_stats: Dict[str, Dict[str, Any]] = {}
+
         logger.info(f"Metrics collector initialized: {cache_dir}")
 
     def _incr(self, key: str, value: int = 1):
@@ -179,7 +283,7 @@ class MetricsCollector:
         message_count: int = 0,
     ):
         """Record a lightweight per-request entry for the recent requests feed."""
-        self.recent_requests.appendleft(RequestDetail(
+        self.recent_requests.append(RequestDetail(
             request_id=request_id,
             timestamp=datetime.now().isoformat(),
             model=model,
@@ -202,14 +306,41 @@ class MetricsCollector:
         bedrock_first_byte_ms: int = 0,
     ):
         """Update timing fields on an existing RequestDetail record (called from fallback after completion)."""
-        for detail in self.recent_requests:
-            if detail.request_id == request_id:
-                detail.provider = provider
-                detail.duration_ms = round(duration_ms, 1)
-                detail.first_byte_ms = round(first_byte_ms, 1)
-                detail.bedrock_invocation_ms = bedrock_invocation_ms
-                detail.bedrock_first_byte_ms = bedrock_first_byte_ms
-                return
+        self.recent_requests.update(
+            request_id,
+            provider=provider,
+            duration_ms=round(duration_ms, 1),
+            first_byte_ms=round(first_byte_ms, 1),
+            bedrock_invocation_ms=bedrock_invocation_ms,
+            bedrock_first_byte_ms=bedrock_first_byte_ms,
+        )
+
+    def record_phases(self, request_id: str, phases: Dict[str, float]):
+        """Attach a request's phase timings to its RequestDetail and add them to the phase histograms."""
+        self.recent_requests.update(request_id, phases=dict(phases))
+        for name, ms in phases.items():
+            stat = self._phase_stats.get(name)
+            if stat is None:
+                stat = self._phase_stats[name] = {
+                    "count": 0, "sum_ms": 0.0, "max_ms": 0.0, "buckets": [0] * (len(PHASE_BUCKETS_MS) + 1),
+                }
+            stat["count"] += 1
+            stat["sum_ms"] += ms
+            stat["max_ms"] = max(stat["max_ms"], ms)
+            stat["buckets"][bisect.bisect_right(PHASE_BUCKETS_MS, ms)] += 1
+
+    def get_phase_stats(self) -> Dict[str, Any]:
+        """Per-phase count / avg / max and histogram buckets ("< 1ms", ..., "> 10000ms")."""
+        labels = [f"< {b}ms" for b in PHASE_BUCKETS_MS] + [f"> {PHASE_BUCKETS_MS[-1]}ms"]
+        return {
+            name: {
+                "count": stat["count"],
+                "avg_ms": round(stat["sum_ms"] / stat["count"], 1) if stat["count"] else 0,
+                "max_ms": round(stat["max_ms"], 1),
+                "buckets": dict(zip(labels, stat["buckets"])),
+            }
+            for name, stat in self._phase_stats.items()
+        }
 
     def record_provider_latency(self, provider: str, duration_ms: float, first_byte_ms: float = 0.0):
         """Record per-provider latency for aggregate stats (sum+count for avg calculation)."""
@@ -232,32 +363,104 @@ class MetricsCollector:
         else:
             self._incr(f"latency:{provider}:gt60s")
 
+    def record_prompt_cache(self, provider: str, usage: Optional[Dict[str, Any]]):
+        """Record a response's prompt-cache usage (input / cache read / cache write tokens)."""
+        if not usage:
+            return
+        self._incr(f"prompt_cache:{provider}:responses")
+        self._incr(f"prompt_cache:{provider}:input", int(usage.get("input_tokens") or 0))
+        self._incr(f"prompt_cache:{provider}:read", int(usage.get("cache_read_input_tokens") or 0))
+        self._incr(f"prompt_cache:{provider}:write", int(usage.get("cache_creation_input_tokens") or 0))
+
+    def get_prompt_cache_stats(self) -> dict:
+        """Per-provider prompt-cache token totals and read ratio (cache reads / all input tokens)."""
+        stats = {}
+        for pname in ["anthropic", "bedrock"]:
+            read = self._get(f"prompt_cache:{pname}:read", 0)
+            write = self._get(f"prompt_cache:{pname}:write", 0)
+            uncached = self._get(f"prompt_cache:{pname}:input", 0)
+            total = read + write + uncached
+            stats[pname] = {
+                "responses": self._get(f"prompt_cache:{pname}:responses", 0),
+                "read_tokens": read,
+                "write_tokens": write,
+                "uncached_tokens": uncached,
+                "read_ratio": round(read / total, 4) if total else 0.0,
+            }
+        return stats
+
+    def acquire_lease(self, name: str, ttl: float) -> bool:
+        """True for exactly one caller (across workers) until `ttl` seconds have passed."""
+        try:
+            return self.cache.add(f"lease:{name}", os.getpid(), expire=ttl)
+        except Exception as e:
+            logger.error(f"Failed to acquire lease {name}: {e}")
+            return False
+
+    def record_worker(self, pid: int, info: Dict[str, Any], ttl: float):
+        """Publish a worker's startup / memory report; it disappears `ttl` seconds after the worker stops."""
+        try:
+            self.cache.set(f"worker:{pid}", info, expire=ttl)
+        except Exception as e:
+            logger.error(f"Failed to record worker {pid}: {e}")
+
+    def remove_worker(self, pid: int):
+        """Drop a stopping worker's report (a crashed worker's expires on its own)."""
+        self.cache.delete(f"worker:{pid}")
+
+    def get_worker_stats(self) -> dict:
+        """Last startup / memory report of every live worker, by pid, plus totals."""
+        workers = {}
+        for key in self.cache.iterkeys():
+            if isinstance(key, str) and key.startswith("worker:"):
+                info = self._get(key, None)
+                if info:
+                    workers[key[7:]] = info
+        memory = [w.get("memory", {}) for w in workers.values()]
+        return {
+            "count": len(workers),
+            "total_rss_mb": round(sum(m.get("rss_mb", m.get("peak_rss_mb", 0)) for m in memory), 1),
+            "total_pss_mb": round(sum(m.get("pss_mb", 0) for m in memory), 1),
+            "workers": workers,
+        }
+
     def get_recent_requests(self) -> list[dict]:
         """Return recent request details as a list of dicts (newest first)."""
-        return [asdict(r) for r in self.recent_requests]
+        return self.recent_requests.dicts()
+
+    def get_recent_requests_json(self) -> str:
+        """Recent request details as a JSON array (newest first), without re-encoding unchanged records."""
+        return self.recent_requests.json()
 
-    def store_request_body(self, request_id: str, body: dict, stage: str = "original"):
+    def store_request_body(self, request_id: str, body: Any = None, stage: str = "original",
+                           raw: Optional[bytes] = None):
         """Store request body snapshot for a request_id.
 
         stage: 'original' (before compression) or 'compressed' (after).
-        Keyed as '{request_id}:{stage}'. Each unique key counts against the ring buffer.
+        Pass `raw` (the request's JSON bytes) instead of `body` when the body is
+        unchanged from the wire. Serialization and compression happen off the
+        event loop; the oldest snapshots are evicted by total compressed size.
+        """
+        self.snapshots.put(request_id, stage, body=body, raw=raw)
+
+    def get_request_body(self, request_id: str, stage: str = "original") -> Optional[bytes]:
+        """Return stored request body snapshot as JSON bytes, or None if evicted.
+
+        Decompresses on demand — call from a worker thread for large bodies.
+        """
+        return self.snapshots.get(request_id, stage)
+
+    def record_count_tokens(self, success: bool, model: str = "unknown", token_count: int = 0,
+                            source: str = "upstream"):
+        """Record a count_tokens call result.
+
+        source: where a successful count came from — upstream, exact / anchored /
+        estimate (answered locally), or fallback (estimate after upstream failed).
         """
-        key = f"{request_id}:{stage}"
-        if len(self._request_body_order) == self._request_body_order.maxlen:
-            oldest = self._request_body_order[0]
-            self._request_bodies.pop(oldest, None)
-        self._request_body_order.append(key)
-        self._request_bodies[key] = body
-
-    def get_request_body(self, request_id: str, stage: str = "original") -> Optional[dict]:
-        """Return stored request body snapshot, or None if evicted."""
-        return self._request_bodies.get(f"{request_id}:{stage}")
-
-    def record_count_tokens(self, success: bool, model: str = "unknown", token_count: int = 0):
-        """Record a count_tokens call result."""
         self._incr("count_tokens:total")
         if success:
             self._incr("count_tokens:success")
+            self._incr(f"count_tokens:source:{source}")
             if token_count > 0:
                 self._set("count_tokens:last_count", token_count)
                 self._set("count_tokens:last_model", model)
@@ -276,6 +479,10 @@ class MetricsCollector:
             "failure_rate": round(failures / total, 3) if total > 0 else 0,
             "last_count": self._get("count_tokens:last_count", 0),
             "last_model": self._get("count_tokens:last_model", ""),
+            "sources": {
+                source: self._get(f"count_tokens:source:{source}", 0)
+                for source in ("upstream", "exact", "anchored", "estimate", "fallback")
+            },
         }
 
     def record_fallback(self, from_provider: str, to_provider: str, reason: str):
@@ -297,6 +504,11 @@ class MetricsCollector:
         self._lag_mem.clear()
         self._lag_last_flush = time.time()
 
+    @property
+    def current_lag_ms(self) -> float:
+        """Most recent event loop lag sample (in-memory, not the 5s stats cache)."""
+        return self._lag_current_ms
+
     async def record_event_loop_lag_async(self, lag_ms: float):
         """Record an event loop lag sample — pure in-memory, no disk I/O."""
         minute_key = datetime.now().strftime("%Y-%m-%dT%H:%M")
@@ -475,6 +687,7 @@ class MetricsCollector:
             },
             "providers": providers,
             "provider_latency": provider_latency,
+            "prompt_cache": self.get_prompt_cache_stats(),
             "models": top_models,
             "error_types": error_types,
             "duration_distribution": duration_distribution,
@@ -485,5 +698,7 @@ class MetricsCollector:
             "recent_errors": recent_errors,
             "recent_requests": self.get_recent_requests(),
             "compression": self.get_compression_stats(),
+            "phase_timing": self.get_phase_stats(),
+            "workers": self.get_worker_stats(),
             "timestamp": datetime.now().isoformat()
         }
@@ -0,0 +1,134 @@
+"""Server-sent-events push of /metrics for the dashboard.
+
+Polling /metrics costs a get_stats() and an error-tracker query per viewer
+per poll. MetricsBroadcaster instead runs one producer per worker — only
+while someone is subscribed — that builds the snapshot every `interval`
+seconds and fans it out:
+
+  event: snapshot   the full payload, first message on every connection
+  event: delta      only the top-level keys whose value changed since the
+                    previous tick (merge with Object.assign); nothing is
+                    sent when nothing changed
+  : ping            comment line after `keepalive` quiet seconds
+
+N viewers cost one producer. A viewer that falls behind doesn't queue: its
+pending deltas are merged, so it catches up with the latest values in one
+message. Each connection ends after `max_age` seconds (EventSource
+reconnects after the `retry:` delay) so open dashboards never hold up a
+graceful shutdown for long.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _event(name: str, payload: Dict[str, Any]) -> str:
+    return f"event: {name}\ndata: {_encode(payload)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self):
+        self.pending: Dict[str, Any] = {}
+        self.ready = asyncio.Event()
+
+    def offer(self, delta: Dict[str, Any]) -> None:
+        self.pending.update(delta)  # coalesce while the viewer is behind
+        self.ready.set()
+
+    def take(self) -> Dict[str, Any]:
+        delta, self.pending = self.pending, {}
+        self.ready.clear()
+        return delta
+
+
+class MetricsBroadcaster:
+    """One shared snapshot producer fanned out to any number of SSE subscribers."""
+
+    def __init__(self, produce: Callable[[], Awaitable[Dict[str, Any]]], interval: float = 1.0,
+                 keepalive: float = 15.0, max_age: float = 30.0, retry_ms: int = 1000):
+        self.produce = produce
+        self.interval = interval
+        self.keepalive = keepalive
+        self.max_age = max_age
+        self.retry_ms = retry_ms
+        self._subscribers: List[_Subscriber] = []
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._encoded: Dict[str, str] = {}  # key → JSON of the last published value
+        self._task: Optional[asyncio.Task] = None
+        self._first = asyncio.Event()
+        self.ticks = 0
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def _diff(self, snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        """Top-level keys of `snapshot` whose value changed since the last tick (and record them)."""
+        delta = {}
+        encoded = {}
+        for key, value in snapshot.items():
+            text = _encode(value)
+            encoded[key] = text
+            if self._encoded.get(key) != text:
+                delta[key] = value
+        self._encoded = encoded
+        return delta
+
+    async def _run(self) -> None:
+        try:
+            while self._subscribers:
+                started = time.monotonic()
+                try:
+                    snapshot = await self.produce()
+                except Exception as e:
+                    logger.warning(f"Metrics stream snapshot failed: {e}")
+                else:
+                    delta = self._diff(snapshot)
+                    self._snapshot = snapshot
+                    self.ticks += 1
+                    self._first.set()
+                    if delta:
+                        for subscriber in self._subscribers:
+                            subscriber.offer(delta)
+                await asyncio.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+        finally:
+            # Next subscriber starts a fresh producer (and gets a fresh snapshot)
+            self._task = None
+            self._snapshot = None
+            self._encoded = {}
+            self._first = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """SSE text for one viewer: a snapshot, then deltas, until max_age or disconnect."""
+        subscriber = _Subscriber()
+        self._subscribers.append(subscriber)
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        try:
+            deadline = time.monotonic() + self.max_age  # counts the wait for the first snapshot too
+            yield f"retry: {self.retry_ms}\n\n"
+            sent_snapshot = False
+            while (remaining := deadline - time.monotonic()) > 0:
+                ready = subscriber.ready if sent_snapshot else self._first
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout=min(self.keepalive, remaining))
+                except asyncio.TimeoutError:
+                    if deadline - time.monotonic() > 0:
+                        yield ": ping\n\n"
+                    continue
+                if not sent_snapshot:
+                    subscriber.take()  # the snapshot already includes anything pending
+                    sent_snapshot = True
+                    yield _event("snapshot", self._snapshot)
+                else:
+                    yield _event("delta", subscriber.take())
+        finally:
+            self._subscribers.remove(subscriber)
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+"""
+mock_upstream.py — Local stand-in for the Anthropic Messages API and Bedrock runtime.
+
+Serves /v1/messages (streaming and non-streaming), /v1/messages/count_tokens and
+/v1/models with synthetic responses so proxy throughput, TTFT and tail latency
+can be measured without touching the real API. Point the proxy at it with
+PROXY_ANTHROPIC_URL=http://127.0.0.1:<port> (bench.py load does this for you).
+
+The same server speaks the bedrock-runtime InvokeModel and
+InvokeModelWithResponseStream protocol (/model/{modelId}/invoke and
+/model/{modelId}/invoke-with-response-stream), including AWS event-stream
+binary framing and amazon-bedrock-invocationMetrics on message_stop. Point
+BedrockProvider at it with BEDROCK_ENDPOINT_URL=http://127.0.0.1:<port> and any
+static AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY (requests are not verified).
+
+Knobs:
+  --token-rate     output tokens per second per stream
+  --output-tokens  tokens per response
+  --ttft-ms        delay before the first content delta
+  --jitter         ± fraction applied to every delay (0.2 = ±20%)
+  --error-429      probability a request is rejected with 429 (retry-after set)
+  --error-5xx      probability a request fails with --server-error-status
+                   (Bedrock: ThrottlingException / ServiceUnavailableException)
+  --anthropic-unavailable
+                   reject every /v1/messages call with 429 so the proxy falls
+                   back to Bedrock (bench.py load --provider bedrock)
+
+  --scenario       scripted outage timeline from chaos.SCENARIOS (529 storms,
+                   slow drip, mid-stream disconnects, credential expiry)
+
+Responses report usage.input_tokens as a chars/4 estimate of the messages the
+mock actually received, so a caller can see what compression left of its
+request (bench.py replay does).
+
+GET /mock/stats returns request / error / stream counters. With --scenario,
+POST /mock/scenario/start restarts the scenario clock (otherwise it starts on
+the first request) and GET /mock/scenario returns the per-request timeline.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import struct
+import time
+import uuid
+import zlib
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+from chaos import ERROR_FAULTS, SCENARIOS, Fault, Scenario
+
+MOCK_MODELS = [
+    "claude-haiku-4-5-20251001",
+    "claude-sonnet-4-5-20250929",
+    "claude-sonnet-4-6",
+    "claude-opus-4-6",
+]
+
+TIMELINE_LIMIT = 200_000  # upstream attempts kept per scenario run
+
+
+@dataclass
+class MockUpstreamConfig:
+    token_rate: float = 50.0  # output tokens per second per stream
+    output_tokens: int = 200
+    ttft_ms: float = 300.0
+    jitter: float = 0.2  # ± fraction applied to every delay
+    error_429_rate: float = 0.0
+    error_5xx_rate: float = 0.0
+    server_error_status: int = 529
+    retry_after: int = 1
+    anthropic_available: bool = True  # False: /v1/messages always 429s
+    scenario: Optional[str] = None  # chaos.SCENARIOS name
+    seed: Optional[int] = None
+
+
+class MockDisconnect(ConnectionError):
+    """Raised inside a streaming body to drop the connection mid-response."""
+
+
+def estimate_tokens(messages: Any) -> int:
+    """Rough chars/4 token estimate — plenty for a mock."""
+    return max(1, len(json.dumps(messages)) // 4)
+
+
+def encode_event_stream_message(headers: Dict[str, str], payload: bytes) -> bytes:
+    """Encode one AWS event-stream message (application/vnd.amazon.eventstream).
+
+    Layout: total length, headers length and prelude CRC32 (4 bytes each,
+    big-endian), then string-typed headers, the payload and a CRC32 over
+    everything before it.
+    """
+    encoded_headers = b""
+    for name, value in headers.items():
+        name_bytes, value_bytes = name.encode(), value.encode()
+        encoded_headers += struct.pack("!B", len(name_bytes)) + name_bytes
+        encoded_headers += struct.pack("!BH", 7, len(value_bytes)) + value_bytes  # 7 = string
+    total_length = 12 + len(encoded_headers) + len(payload) + 4
+    prelude = struct.pack("!II", total_length, len(encoded_headers))
+    message = prelude + struct.pack("!I", zlib.crc32(prelude)) + encoded_headers + payload
+    return message + struct.pack("!I", zlib.crc32(message))
+
+
+def bedrock_chunk_message(data: Dict[str, Any]) -> bytes:
+    """Wrap an Anthropic stream event the way InvokeModelWithResponseStream does."""
+    payload = json.dumps({"bytes": base64.b64encode(json.dumps(data).encode()).decode()}).encode()
+    return encode_event_stream_message(
+        {":event-type": "chunk", ":content-type": "application/json", ":message-type": "event"},
+        payload,
+    )
+
+
+class MockUpstream:
+    """Synthetic Anthropic responses with configurable pacing and error injection."""
+
+    def __init__(self, cfg: MockUpstreamConfig):
+        self.cfg = cfg
+        self.rng = random.Random(cfg.seed)
+        self.stats: Dict[str, int] = {
+            "requests": 0,
+            "bedrock_requests": 0,
+            "anthropic_rejected": 0,
+            "streams_started": 0,
+            "streams_completed": 0,
+            "rate_limited": 0,
+            "server_errors": 0,
+        }
+        self.scenario: Optional[Scenario] = SCENARIOS[cfg.scenario] if cfg.scenario else None
+        self.scenario_start: Optional[float] = None
+        self.timeline: List[Dict[str, Any]] = []
+
+    def start_scenario(self) -> None:
+        """(Re)start the scenario clock and clear the timeline."""
+        self.scenario_start = time.perf_counter()
+        self.timeline.clear()
+
+    def begin(self, target: str) -> Tuple[float, Optional[Fault]]:
+        """Scenario time of a new upstream attempt and the fault (if any) it hits."""
+        if self.scenario is None:
+            return 0.0, None
+        if self.scenario_start is None:
+            self.start_scenario()
+        elapsed = time.perf_counter() - self.scenario_start
+        fault = self.scenario.active(target, elapsed)
+        if fault is not None and fault.rate < 1.0 and self.rng.random() >= fault.rate:
+            fault = None
+        return elapsed, fault
+
+    def record(self, target: str, t: float, outcome: str) -> None:
+        """Append an upstream attempt to the scenario timeline."""
+        if self.scenario is not None and len(self.timeline) < TIMELINE_LIMIT:
+            self.timeline.append({"t": round(t, 3), "target": target, "outcome": outcome})
+
+    @staticmethod
+    def fault_response(fault: Fault) -> JSONResponse:
+        """Error response for an ERROR_FAULTS fault, in the target API's error shape."""
+        headers = {"retry-after": str(fault.retry_after)} if fault.retry_after is not None else {}
+        if fault.target == "anthropic":
+            status, error_type, message = {
+                "overloaded": (529, "overloaded_error", "Overloaded"),
+                "rate_limit": (429, "rate_limit_error", "mock rate limit"),
+                "server_error": (500, "api_error", "Internal server error"),
+                "credential_expiry": (401, "authentication_error", "OAuth token has expired"),
+            }[fault.kind]
+            return JSONResponse(
+                {"type": "error", "error": {"type": error_type, "message": message}},
+                status_code=status, headers=headers,
+            )
+        status, code, message = {
+            "overloaded": (503, "ServiceUnavailableException", "Service unavailable"),
+            "rate_limit": (429, "ThrottlingException", "Too many requests, please wait before trying again."),
+            "server_error": (500, "InternalServerException", "Internal server error"),
+            "credential_expiry": (403, "ExpiredTokenException", "The security token included in the request is expired"),
+        }[fault.kind]
+        headers["x-amzn-ErrorType"] = f"{code}:"
+        return JSONResponse({"message": message}, status_code=status, headers=headers)
+
+    def _delay(self, seconds: float) -> float:
+        if self.cfg.jitter <= 0:
+            return seconds
+        return max(0.0, seconds * (1 + self.rng.uniform(-self.cfg.jitter, self.cfg.jitter)))
+
+    def _roll_error(self) -> Optional[str]:
+        """Roll for an injected error: "429", "5xx" or None."""
+        roll = self.rng.random()
+        if roll < self.cfg.error_429_rate:
+            self.stats["rate_limited"] += 1
+            return "429"
+        if roll < self.cfg.error_429_rate + self.cfg.error_5xx_rate:
+            self.stats["server_errors"] += 1
+            return "5xx"
+        return None
+
+    def injected_error(self) -> Optional[JSONResponse]:
+        """Roll for an injected 429/5xx; returns the error response or None."""
+        kind = self._roll_error()
+        if kind == "429":
+            return JSONResponse(
+                {"type": "error", "error": {"type": "rate_limit_error", "message": "mock rate limit"}},
+                status_code=429,
+                headers={"retry-after": str(self.cfg.retry_after)},
+            )
+        if kind == "5xx":
+            status = self.cfg.server_error_status
+            error_type = "overloaded_error" if status == 529 else "api_error"
+            return JSONResponse(
+                {"type": "error", "error": {"type": error_type, "message": f"mock {status}"}},
+                status_code=status,
+                headers={"retry-after": str(self.cfg.retry_after)},
+            )
+        return None
+
+    def injected_bedrock_error(self) -> Optional[JSONResponse]:
+        """Roll for an injected error, shaped like a bedrock-runtime rest-json error."""
+        kind = self._roll_error()
+        if kind is None:
+            return None
+        if kind == "429":
+            status, code, message = 429, "ThrottlingException", "Too many requests, please wait before trying again."
+        else:
+            status, code, message = 503, "ServiceUnavailableException", "mock service unavailable"
+        # botocore reads the error code from x-amzn-ErrorType
+        return JSONResponse({"message": message}, status_code=status, headers={"x-amzn-ErrorType": f"{code}:"})
+
+    def _message(self, model: str, text: str = "", input_tokens: int = 25) -> Dict[str, Any]:
+        return {
+            "id": f"msg_mock_{uuid.uuid4().hex[:20]}",
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": text}] if text else [],
+            "stop_reason": "end_turn" if text else None,
+            "stop_sequence": None,
+            "usage": {"input_tokens": input_tokens, "output_tokens": self.cfg.output_tokens if text else 1},
+        }
+
+    @staticmethod
+    def _event(event_type: str, data: Dict[str, Any]) -> str:
+        return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+    async def _events(self, model: str, timing: Dict[str, float], fault: Optional[Fault] = None,
+                      input_tokens: int = 25) -> AsyncIterator[Dict[str, Any]]:
+        """Yield a complete Anthropic event sequence, paced by token_rate.
+
+        Sets timing["first_token"] (perf_counter) when the first delta is produced.
+        A slow_drip fault overrides the pacing; a disconnect fault raises
+        MockDisconnect after fault.after_tokens deltas.
+        """
+        token_rate = fault.token_rate if fault and fault.kind == "slow_drip" else self.cfg.token_rate
+        disconnect_after = fault.after_tokens if fault and fault.kind == "disconnect" else None
+        self.stats["streams_started"] += 1
+        yield {"type": "message_start", "message": self._message(model, input_tokens=input_tokens)}
+        yield {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}
+        await asyncio.sleep(self._delay(self.cfg.ttft_ms / 1000))
+
+        interval = 1.0 / token_rate if token_rate > 0 else 0.0
+        for i in range(self.cfg.output_tokens):
+            if i == disconnect_after:
+                raise MockDisconnect(f"mock disconnect after {i} tokens")
+            if i == 0:
+                timing["first_token"] = time.perf_counter()
+            yield {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": f"tok{i} "}}
+            if interval:
+                await asyncio.sleep(self._delay(interval))
+
+        yield {"type": "content_block_stop", "index": 0}
+        yield {
+            "type": "message_delta",
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+            "usage": {"output_tokens": self.cfg.output_tokens},
+        }
+        yield {"type": "message_stop"}
+        self.stats["streams_completed"] += 1
+
+    async def stream(self, model: str, t: float = 0.0, fault: Optional[Fault] = None,
+                     input_tokens: int = 25) -> AsyncIterator[str]:
+        """Yield a complete Anthropic SSE response."""
+        try:
+            async for event in self._events(model, {}, fault, input_tokens):
+                yield self._event(event["type"], event)
+        finally:
+            self.record("anthropic", t, fault.kind if fault else "ok")
+
+    async def bedrock_stream(self, model_id: str, t: float = 0.0, fault: Optional[Fault] = None,
+                             input_tokens: int = 25) -> AsyncIterator[bytes]:
+        """Yield an InvokeModelWithResponseStream body as event-stream messages."""
+        timing = {"start": time.perf_counter()}
+        try:
+            async for event in self._bedrock_events(model_id, timing, fault, input_tokens):
+                yield bedrock_chunk_message(event)
+        finally:
+            self.record("bedrock", t, fault.kind if fault else "ok")
+
+    async def _bedrock_events(self, model_id: str, timing: Dict[str, float], fault: Optional[Fault],
+                              input_tokens: int = 25) -> AsyncIterator[Dict[str, Any]]:
+        async for event in self._events(self._bedrock_model_name(model_id), timing, fault, input_tokens):
+            if event["type"] == "message_stop":
+                now = time.perf_counter()
+                event["amazon-bedrock-invocationMetrics"] = {
+                    "inputTokenCount": input_tokens,
+                    "outputTokenCount": self.cfg.output_tokens,
+                    "invocationLatency": int((now - timing["start"]) * 1000),
+                    "firstByteLatency": int((timing.get("first_token", now) - timing["start"]) * 1000),
+                }
+            yield event
+
+    @staticmethod
+    def _bedrock_model_name(model_id: str) -> str:
+        """us.anthropic.claude-x-v1:0 -> claude-x-v1:0 (what Bedrock reports as "model")."""
+        return model_id.split("anthropic.", 1)[-1]
+
+    async def complete(self, model: str, fault: Optional[Fault] = None, input_tokens: int = 25) -> Dict[str, Any]:
+        """Non-streaming response after the time the equivalent stream would take."""
+        token_rate = fault.token_rate if fault and fault.kind == "slow_drip" else self.cfg.token_rate
+        total = self.cfg.ttft_ms / 1000
+        if token_rate > 0:
+            total += self.cfg.output_tokens / token_rate
+        await asyncio.sleep(self._delay(total))
+        if fault and fault.kind == "disconnect":
+            raise MockDisconnect("mock disconnect before response")
+        return self._message(model, " ".join(f"tok{i}" for i in range(self.cfg.output_tokens)), input_tokens)
+
+
+def create_app(cfg: Optional[MockUpstreamConfig] = None) -> FastAPI:
+    """Build the mock upstream FastAPI app."""
+    mock = MockUpstream(cfg or MockUpstreamConfig())
+    app = FastAPI(title="Mock Anthropic / Bedrock upstream")
+    app.state.mock = mock
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        mock.stats["requests"] += 1
+        if not mock.cfg.anthropic_available:
+            mock.stats["anthropic_rejected"] += 1
+            return JSONResponse(
+                {"type": "error", "error": {"type": "rate_limit_error", "message": "mock anthropic unavailable"}},
+                status_code=429,
+                headers={"retry-after": "3600"},
+            )
+        t, fault = mock.begin("anthropic")
+        if fault is not None and fault.kind in ERROR_FAULTS:
+            mock.record("anthropic", t, fault.kind)
+            return mock.fault_response(fault)
+        error = mock.injected_error()
+        if error is not None:
+            mock.record("anthropic", t, "injected_error")
+            return error
+        model = body.get("model", MOCK_MODELS[0])
+        input_tokens = estimate_tokens(body.get("messages", []))
+        if body.get("stream"):
+            return StreamingResponse(mock.stream(model, t, fault, input_tokens), media_type="text/event-stream")
+        try:
+            return JSONResponse(await mock.complete(model, fault, input_tokens))
+        finally:
+            mock.record("anthropic", t, fault.kind if fault else "ok")
+
+    @app.post("/v1/messages/count_tokens")
+    async def count_tokens(request: Request):
+        body = await request.json()
+        return {"input_tokens": estimate_tokens(body.get("messages", []))}
+
+    @app.get("/v1/models")
+    async def models():
+        return {"data": [{"id": m, "type": "model"} for m in MOCK_MODELS], "has_more": False}
+
+    @app.post("/model/{model_id}/invoke")
+    async def bedrock_invoke(model_id: str, request: Request):
+        body = await request.json()
+        mock.stats["bedrock_requests"] += 1
+        t, fault = mock.begin("bedrock")
+        if fault is not None and fault.kind in ERROR_FAULTS:
+            mock.record("bedrock", t, fault.kind)
+            return mock.fault_response(fault)
+        error = mock.injected_bedrock_error()
+        if error is not None:
+            mock.record("bedrock", t, "injected_error")
+            return error
+        start = time.perf_counter()
+        try:
+            result = await mock.complete(mock._bedrock_model_name(model_id), fault,
+                                         estimate_tokens(body.get("messages", [])))
+        finally:
+            mock.record("bedrock", t, fault.kind if fault else "ok")
+        return Response(
+            json.dumps(result),
+            media_type="application/json",
+            headers={
+                "x-amzn-bedrock-input-token-count": str(result["usage"]["input_tokens"]),
+                "x-amzn-bedrock-output-token-count": str(result["usage"]["output_tokens"]),
+                "x-amzn-bedrock-invocation-latency": str(int((time.perf_counter() - start) * 1000)),
+            },
+        )
+
+    @app.post("/model/{model_id}/invoke-with-response-stream")
+    async def bedrock_invoke_stream(model_id: str, request: Request):
+        body = await request.json()
+        mock.stats["bedrock_requests"] += 1
+        t, fault = mock.begin("bedrock")
+        if fault is not None and fault.kind in ERROR_FAULTS:
+            mock.record("bedrock", t, fault.kind)
+            return mock.fault_response(fault)
+        error = mock.injected_bedrock_error()
+        if error is not None:
+            mock.record("bedrock", t, "injected_error")
+            return error
+        return StreamingResponse(
+            mock.bedrock_stream(model_id, t, fault, estimate_tokens(body.get("messages", []))),
+            media_type="application/vnd.amazon.eventstream",
+            headers={"x-amzn-bedrock-content-type": "application/json"},
+        )
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {"config": asdict(mock.cfg), **mock.stats, "timestamp": time.time()}
+
+    @app.post("/mock/scenario/start")
+    async def scenario_start():
+        mock.start_scenario()
+        return {"scenario": mock.cfg.scenario, "started": True}
+
+    @app.get("/mock/scenario")
+    async def scenario():
+        elapsed = time.perf_counter() - mock.scenario_start if mock.scenario_start is not None else None
+        return {
+            "scenario": mock.scenario.to_dict() if mock.scenario else None,
+            "elapsed": elapsed,
+            "timeline": mock.timeline,
+        }
+
+    return app
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser) -> None:
+    """Register the mock pacing / error-injection flags on a parser (shared with bench.py)."""
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Output tokens/sec per stream")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Tokens per response")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Delay before first content delta")
+    parser.add_argument("--jitter", type=float, default=0.2, help="± fraction applied to every delay")
+    parser.add_argument("--error-429", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="Probability of an injected 5xx")
+    parser.add_argument("--server-error-status", type=int, default=529, help="Status used for injected 5xx")
+    parser.add_argument("--seed", type=int, default=None, help="RNG seed for reproducible jitter/errors")
+    parser.add_argument("--anthropic-unavailable", action="store_true",
+                        help="Reject all /v1/messages calls with 429 (forces proxy fallback to Bedrock)")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default=None,
+                        help="Scripted outage timeline (see chaos.py)")
+
+
+def mock_args_to_argv(args: argparse.Namespace) -> list[str]:
+    """Turn parsed mock flags back into argv for spawning `mock_upstream.py` as a subprocess."""
+    argv = [
+        "--token-rate", str(args.token_rate),
+        "--output-tokens", str(args.output_tokens),
+        "--ttft-ms", str(args.ttft_ms),
+        "--jitter", str(args.jitter),
+        "--error-429", str(args.error_429),
+        "--error-5xx", str(args.error_5xx),
+        "--server-error-status", str(args.server_error_status),
+    ]
+    if args.seed is not None:
+        argv += ["--seed", str(args.seed)]
+    if args.anthropic_unavailable:
+        argv.append("--anthropic-unavailable")
+    if args.scenario:
+        argv += ["--scenario", args.scenario]
+    return argv
+
+
+def config_from_args(args: argparse.Namespace) -> MockUpstreamConfig:
+    return MockUpstreamConfig(
+        token_rate=args.token_rate,
+        output_tokens=args.output_tokens,
+        ttft_ms=args.ttft_ms,
+        jitter=args.jitter,
+        error_429_rate=args.error_429,
+        error_5xx_rate=args.error_5xx,
+        server_error_status=args.server_error_status,
+        anthropic_available=not args.anthropic_unavailable,
+        scenario=args.scenario,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(
+        description="Mock Anthropic / Bedrock upstream for proxy benchmarking",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    parser.add_argument("--port", type=int, default=47100)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(config_from_args(args)), host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
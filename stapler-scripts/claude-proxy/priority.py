@@ -0,0 +1,182 @@
+"""Priority classes and a weighted-fair queue in front of FallbackHandler.
+
+Every /v1/messages request used to go upstream as soon as it arrived, so a
+burst of background work (subagents, haiku title / quota calls) could take
+the capacity the interactive main session needs. Requests now get a class:
+
+  classify()  an explicit `x-proxy-priority: <class>` header wins; otherwise
+              the first matching rule (PRIORITY_RULES, JSON) decides, and the
+              default rules make haiku, non-streaming and small max_tokens
+              requests "background". Anything unmatched is "interactive"
+
+and, with PRIORITY_MAX_CONCURRENT set, pass through a WeightedFairQueue: at
+most that many requests are upstream at once per worker, and the rest wait.
+Under contention a slot goes to the waiter with the smallest virtual finish
+tag. Each class's tags advance by 1 / weight per request, so with weights
+interactive=4, background=1, interactive requests get four slots for each
+background one. A waiting background request still gets its turn, so neither
+class starves. Without contention nothing waits. A stream holds its slot
+until it ends.
+
+Queueing delay per class (avg / p50 / p95 / max over recent requests) is in
+/metrics under "priority" and in the request's "queue" phase.
+"""
+import asyncio
+import heapq
+import itertools
+import json
+import re
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Mapping, Optional
+
+from thread_pool import WINDOW, latency_summary
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITY_HEADER = "x-proxy-priority"
+
+DEFAULT_RULES: List[Dict[str, Any]] = [
+    {"class": BACKGROUND, "model": "haiku"},
+    {"class": BACKGROUND, "stream": False},
+    {"class": BACKGROUND, "max_tokens_lte": 1024},
+]
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """"interactive=4,background=1" → {"interactive": 4.0, "background": 1.0}."""
+    weights = {}
+    for part in spec.split(","):
+        name, _, value = part.partition("=")
+        if name.strip() and value.strip():
+            weights[name.strip()] = max(float(value), 0.01)
+    return weights or {INTERACTIVE: 4.0, BACKGROUND: 1.0}
+
+
+def parse_rules(spec: Optional[str]) -> List[Dict[str, Any]]:
+    """PRIORITY_RULES JSON (a list of rules), or the default rules."""
+    if not spec:
+        return DEFAULT_RULES
+    rules = json.loads(spec)
+    if not isinstance(rules, list) or not all(isinstance(r, dict) and "class" in r for r in rules):
+        raise ValueError("PRIORITY_RULES must be a JSON list of objects with a \"class\"")
+    return rules
+
+
+def _matches(rule: Dict[str, Any], body: Dict[str, Any], headers: Mapping[str, str]) -> bool:
+    """All of a rule's conditions hold (model regex, stream, max_tokens_lte, header [+ value regex])."""
+    if "model" in rule and not re.search(rule["model"], str(body.get("model", ""))):
+        return False
+    if "stream" in rule and bool(body.get("stream", False)) != rule["stream"]:
+        return False
+    if "max_tokens_lte" in rule and not (body.get("max_tokens") or 0) <= rule["max_tokens_lte"]:
+        return False
+    if "header" in rule:
+        value = headers.get(rule["header"])
+        if value is None or ("value" in rule and not re.search(rule["value"], value)):
+            return False
+    return True
+
+
+def classify(body: Dict[str, Any], headers: Mapping[str, str], rules: List[Dict[str, Any]],
+             classes: Mapping[str, float]) -> str:
+    """Priority class of a /v1/messages request (one of `classes`)."""
+    explicit = headers.get(PRIORITY_HEADER)
+    if explicit in classes:
+        return explicit
+    for rule in rules:
+        if rule["class"] in classes and _matches(rule, body, headers):
+            return rule["class"]
+    return INTERACTIVE if INTERACTIVE in classes else next(iter(classes))
+
+
+class _ClassStats:
+    __slots__ = ("requests", "queued", "waited", "in_flight", "waits")
+
+    def __init__(self):
+        self.requests = 0
+        self.queued = 0     # waiting right now
+        self.waited = 0     # requests that had to queue
+        self.in_flight = 0
+        self.waits: Deque[float] = deque(maxlen=WINDOW)  # queueing delay (ms), every request
+
+
+class WeightedFairQueue:
+    """Concurrency gate that admits waiting requests in weighted-fair order (event loop only)."""
+
+    def __init__(self, capacity: int, weights: Dict[str, float]):
+        self.capacity = capacity  # 0 = unlimited (classification and stats only)
+        self.weights = weights
+        self.in_flight = 0
+        self._heap: List[tuple] = []  # (virtual finish tag, seq, class, future)
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_tag = {name: 0.0 for name in weights}
+        self._stats = {name: _ClassStats() for name in weights}
+
+    @asynccontextmanager
+    async def slot(self, priority: str) -> AsyncIterator[float]:
+        """Hold an upstream slot for the block; yields the queueing delay in ms."""
+        waited_ms = await self.acquire(priority)
+        try:
+            yield waited_ms
+        finally:
+            self.release(priority)
+
+    async def acquire(self, priority: str) -> float:
+        stats = self._stats[priority]
+        stats.requests += 1
+        if self.capacity <= 0 or (self.in_flight < self.capacity and not self._heap):
+            self.in_flight += 1
+            stats.in_flight += 1
+            stats.waits.append(0.0)
+            return 0.0
+
+        tag = max(self._virtual_time, self._last_tag[priority]) + 1.0 / self.weights[priority]
+        self._last_tag[priority] = tag
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, (tag, next(self._seq), priority, future))
+        stats.queued += 1
+        stats.waited += 1
+        started = time.perf_counter()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(priority)  # admitted just as the request went away: pass the slot on
+            raise
+        finally:
+            stats.queued -= 1
+        waited_ms = (time.perf_counter() - started) * 1000
+        stats.waits.append(waited_ms)
+        return waited_ms
+
+    def release(self, priority: str) -> None:
+        self.in_flight -= 1
+        self._stats[priority].in_flight -= 1
+        while self._heap and (self.capacity <= 0 or self.in_flight < self.capacity):
+            tag, _, waiting, future = heapq.heappop(self._heap)
+            if future.done():
+                continue  # cancelled while waiting
+            self._virtual_time = tag
+            self.in_flight += 1
+            self._stats[waiting].in_flight += 1
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.capacity,
+            "in_flight": self.in_flight,
+            "classes": {
+                name: {
+                    "weight": self.weights[name],
+                    "requests": s.requests,
+                    "in_flight": s.in_flight,
+                    "queued": s.queued,
+                    "waited": s.waited,
+                    "queue_wait_ms": latency_summary(list(s.waits)),
+                }
+                for name, s in self._stats.items()
+            },
+        }
@@ -0,0 +1,327 @@
+"""In-process sampling profiler and in-flight request introspection for /debug/*.
+
+profile.sh attaches py-spy from outside (sudo, restart-free but not always
+available). This module profiles the worker from inside, on demand:
+
+  threads  a sampler thread reads sys._current_frames() at `hz` and records
+           what every thread is executing. Frames on the event-loop thread are
+           labelled with the asyncio task running at that instant (the request
+           route for request tasks), so CPU spent in a handler is attributed to
+           its endpoint. Executor / anyio worker threads show boto3 I/O.
+  tasks    an in-loop sampler records where every pending asyncio task is
+           suspended (its await chain) — a wall-clock view of what requests
+           are waiting on.
+
+Both return Brendan Gregg collapsed stacks ("root;...;leaf count" per line),
+ready for flamegraph.pl, speedscope or inferno. Unlike py-spy, the thread
+sampler needs the GIL to take a sample, so it lands where the running thread
+releases it (I/O, select) or is forced off it (every sys.getswitchinterval(),
+5ms): CPU bursts much shorter than that are under-counted, long ones — a big
+compression pass, JSON encoding — show up as expected.
+
+Requests are tracked by InflightMiddleware (pure ASGI, so it spans the whole
+response body) plus a loop task factory that attributes every task created
+inside a request — Starlette runs StreamingResponse bodies in a child task — to
+that request.
+"""
+import asyncio
+import contextvars
+import gc
+import inspect
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+MODES = ("threads", "tasks")
+
+_current_request: contextvars.ContextVar[Optional["InflightRequest"]] = contextvars.ContextVar(
+    "inflight_request", default=None
+)
+
+# ThreadPoolExecutor-0_12 -> ThreadPoolExecutor-0: one flame per pool, not per thread
+_THREAD_SUFFIX_RE = re.compile(r"_\d+$")
+
+# The proxy's own code (main.py, fallback.py, providers/...) as opposed to framework frames
+_APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@dataclass
+class InflightRequest:
+    id: int
+    method: str
+    path: str
+    started: float  # time.monotonic()
+    tasks: List[asyncio.Task] = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        return f"{self.method} {self.path}"
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}".replace(";", ":")
+
+
+def _frame_at(frame) -> str:
+    return f"{_frame_label(frame.f_code)}:{frame.f_lineno}"
+
+
+def _next_awaitable(obj: Any) -> Any:
+    """What a suspended coroutine / generator is waiting on, if inspectable."""
+    for attr in ("cr_await", "ag_await", "gi_yieldfrom"):
+        nxt = getattr(obj, attr, None)
+        if nxt is not None:
+            return nxt
+    # `await agen.asend()` / `async for` — the asend object only exposes its
+    # generator to the GC, but that is enough to keep walking
+    if type(obj).__name__ in ("async_generator_asend", "async_generator_athrow"):
+        for ref in gc.get_referents(obj):
+            if inspect.isasyncgen(ref):
+                return ref
+    return None
+
+
+def await_chain(task: asyncio.Task) -> List[Any]:
+    """Frames of a suspended task, outermost first, plus the final awaited object."""
+    chain: List[Any] = []
+    obj: Any = task.get_coro()
+    while obj is not None:
+        frame = getattr(obj, "cr_frame", None) or getattr(obj, "ag_frame", None) or getattr(obj, "gi_frame", None)
+        if frame is not None:
+            chain.append(frame)
+        elif inspect.iscoroutine(obj) or inspect.isasyncgen(obj) or inspect.isgenerator(obj):
+            break  # finished or currently running
+        elif _next_awaitable(obj) is None:
+            chain.append(obj)  # Future, Task, or an opaque awaitable
+            break
+        obj = _next_awaitable(obj)
+    return chain
+
+
+def _describe_awaited(obj: Any) -> str:
+    if isinstance(obj, asyncio.Task):
+        return f"<Task {obj.get_name()}>"
+    name = type(obj).__name__
+    # `await future` suspends in the future's iterator, which hides the future itself
+    return "<Future>" if name == "FutureIter" else f"<{name}>"
+
+
+def _is_app_frame(frame) -> bool:
+    path = os.path.abspath(frame.f_code.co_filename)
+    return path.startswith(_APP_DIR) and "site-packages" not in path  # uv puts .venv inside the project
+
+
+class InflightRegistry:
+    """In-flight requests and the asyncio tasks working on them."""
+
+    def __init__(self):
+        self._requests: Dict[int, InflightRequest] = {}
+        self._task_owner: Dict[asyncio.Task, InflightRequest] = {}
+        self._ids = itertools.count(1)
+
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Wrap the loop's task factory so tasks spawned inside a request are attributed to it."""
+        previous = loop.get_task_factory()
+
+        def factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            owner = context.get(_current_request) if context is not None else _current_request.get()
+            if owner is not None:
+                self._attach(owner, task)
+            return task
+
+        loop.set_task_factory(factory)
+
+    def _attach(self, owner: InflightRequest, task: asyncio.Task) -> None:
+        owner.tasks.append(task)
+        self._task_owner[task] = owner
+        task.add_done_callback(self._detach)
+
+    def _detach(self, task: asyncio.Task) -> None:
+        owner = self._task_owner.pop(task, None)
+        if owner is not None and task in owner.tasks:
+            owner.tasks.remove(task)
+
+    def begin(self, method: str, path: str) -> tuple:
+        """Register the request handled by the current task; returns a token for end()."""
+        request = InflightRequest(next(self._ids), method, path, time.monotonic())
+        self._requests[request.id] = request
+        task = asyncio.current_task()
+        if task is not None:
+            request.tasks.append(task)
+            self._task_owner[task] = request
+        return request, _current_request.set(request)
+
+    def end(self, token: tuple) -> None:
+        request, ctx_token = token
+        _current_request.reset(ctx_token)
+        self._requests.pop(request.id, None)
+        task = asyncio.current_task()
+        if task is not None and self._task_owner.get(task) is request:
+            del self._task_owner[task]
+
+    def owner(self, task: Optional[asyncio.Task]) -> Optional[InflightRequest]:
+        return self._task_owner.get(task) if task is not None else None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """In-flight requests (oldest first) with each task's await point, plus background tasks."""
+        now = time.monotonic()
+        requests = []
+        for request in sorted(self._requests.values(), key=lambda r: r.started):
+            tasks = [self._describe_task(t) for t in list(request.tasks) if not t.done()]
+            # The task suspended inside proxy code is the one doing the work; the rest
+            # are framework plumbing (disconnect listeners, middleware task groups)
+            working = max(tasks, key=lambda t: (t["app_frame"] is not None, len(t["await_stack"])), default=None)
+            requests.append({
+                "id": request.id,
+                "method": request.method,
+                "path": request.path,
+                "age_s": round(now - request.started, 3),
+                "app_frame": working["app_frame"] if working else None,
+                "await_point": working["await_point"] if working else None,
+                "tasks": tasks,
+            })
+        current = asyncio.current_task()
+        background = [
+            self._describe_task(t) for t in asyncio.all_tasks()
+            if t is not current and t not in self._task_owner
+        ]
+        return {"pid": os.getpid(), "inflight": requests, "background_tasks": background}
+
+    @staticmethod
+    def _describe_task(task: asyncio.Task) -> Dict[str, Any]:
+        chain = await_chain(task)
+        frames = [f for f in chain if hasattr(f, "f_code")]
+        awaiting = _describe_awaited(chain[-1]) if chain and not hasattr(chain[-1], "f_code") else None
+        point = _frame_at(frames[-1]) if frames else None
+        if point and awaiting:
+            point = f"{point} awaiting {awaiting}"
+        app_frames = [f for f in frames if _is_app_frame(f)]
+        return {
+            "name": task.get_name(),
+            "await_point": point,  # innermost suspension point, usually in asyncio / httpcore
+            "app_frame": _frame_at(app_frames[-1]) if app_frames else None,  # innermost proxy-code frame
+            "await_stack": [_frame_at(f) for f in frames],
+        }
+
+
+class InflightMiddleware:
+    """Pure ASGI middleware registering each HTTP request for /debug/tasks and task-aware profiles."""
+
+    def __init__(self, app, registry: InflightRegistry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = self.registry.begin(scope.get("method", ""), scope.get("path", ""))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.registry.end(token)
+
+
+class ProfilerBusy(RuntimeError):
+    """A profile is already running in this worker."""
+
+
+class SamplingProfiler:
+    """On-demand sampling profiler for the running worker (one profile at a time)."""
+
+    def __init__(self, registry: InflightRegistry):
+        self.registry = registry
+        self._running = False
+
+    async def profile(self, seconds: float, hz: int = 100, mode: str = "threads") -> Counter:
+        """Sample for `seconds` and return {collapsed stack: samples}."""
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode!r} (expected one of {', '.join(MODES)})")
+        if self._running:
+            raise ProfilerBusy("a profile is already running in this worker")
+        self._running = True
+        try:
+            if mode == "threads":
+                return await self._profile_threads(seconds, 1.0 / hz)
+            return await self._profile_tasks(seconds, 1.0 / hz)
+        finally:
+            self._running = False
+
+    async def _profile_threads(self, seconds: float, interval: float) -> Counter:
+        loop = asyncio.get_running_loop()
+        counts: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(
+            target=self._sample_threads, args=(loop, threading.get_ident(), interval, stop, counts),
+            name="debug-profiler", daemon=True,
+        )
+        sampler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            stop.set()
+            await asyncio.to_thread(sampler.join)
+        return counts
+
+    def _sample_threads(self, loop: asyncio.AbstractEventLoop, loop_ident: int,
+                        interval: float, stop: threading.Event, counts: Counter) -> None:
+        me = threading.get_ident()
+        current_tasks = getattr(asyncio.tasks, "_current_tasks", {})
+        while not stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                root = [f"thread:{_THREAD_SUFFIX_RE.sub('', names.get(ident, str(ident)))}"]
+                if ident == loop_ident:
+                    task = current_tasks.get(loop)
+                    owner = self.registry.owner(task)
+                    if owner is not None:
+                        root.append(f"task:{owner.label}")
+                    elif task is not None:
+                        root.append(f"task:{_task_label(task)}")
+                    else:
+                        root.append("loop")
+                counts[";".join(root + stack[::-1])] += 1
+            stop.wait(interval)
+
+    async def _profile_tasks(self, seconds: float, interval: float) -> Counter:
+        counts: Counter = Counter()
+        me = asyncio.current_task()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            for task in asyncio.all_tasks():
+                if task is me or task.done():
+                    continue
+                owner = self.registry.owner(task)
+                root = f"request:{owner.label}" if owner is not None else f"background:{_task_label(task)}"
+                chain = await_chain(task)
+                stack = [_frame_label(f.f_code) if hasattr(f, "f_code") else _describe_awaited(f) for f in chain]
+                counts[";".join([root] + stack)] += 1
+            await asyncio.sleep(interval)
+        return counts
+
+
+def _task_label(task: asyncio.Task) -> str:
+    coro = task.get_coro()
+    return getattr(coro, "__qualname__", None) or task.get_name()
+
+
+def collapse(counts: Counter) -> str:
+    """Collapsed-stack text, heaviest stacks first."""
+    return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
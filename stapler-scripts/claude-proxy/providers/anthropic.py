@@ -2,9 +2,15 @@
 import httpx
 import json
 import os
+import time
 import diskcache
 from typing import Dict, Any, AsyncIterator, Optional
+import config
+import timing
+import tracing
+from affinity import conversation_key, usage_from_chunk
 from . import Provider, RateLimitError, ValidationError, AuthenticationError, ModelUnsupportedError, ServerError, TimeoutError
+from .anthropic_pool import Credential, CredentialPool
 
 _model_cache = diskcache.Cache(
     os.path.expanduser("~/.cache/claude-proxy/model-cache"),
@@ -17,7 +23,7 @@ class AnthropicProvider(Provider):
     """Provider for Anthropic API with OAuth support."""
 
     def __init__(self):
-        self.base_url = "https://api.anthropic.com"
+        self.base_url = config.ANTHROPIC_API_URL.rstrip("/")
         # Timeout settings for long-running requests
         # connect: 10s to establish connection
         # read: 600s (10min) to read response chunks (for long streaming responses)
@@ -25,6 +31,10 @@ class AnthropicProvider(Provider):
         # pool: 30s to acquire connection from pool
         timeout = httpx.Timeout(10.0, read=600.0, write=30.0, pool=30.0)
         self.client = httpx.AsyncClient(timeout=timeout)
+        # Configured accounts / keys used instead of the request's token (see anthropic_pool.py)
+        self.credentials = CredentialPool(config.ANTHROPIC_CREDENTIALS) if config.ANTHROPIC_CREDENTIALS else None
+        # ProviderAffinity (set by main): keeps a conversation on the credential holding its prompt cache
+        self.affinity = None
 
     @property
     def name(self) -> str:
@@ -37,7 +47,7 @@ class AnthropicProvider(Provider):
         """
         import logging
         logger = logging.getLogger(__name__)
-        cache_key = f"anthropic_models:{auth_type}"
+        cache_key = f"anthropic_models:{self.base_url}:{auth_type}"
         cached = _model_cache.get(cache_key)
         if cached is not None:
             return cached
@@ -167,6 +177,49 @@ class AnthropicProvider(Provider):
 
         return body
 
+    def _next_credential(self, tried: list, request_id: Optional[str], pinned: Optional[str] = None) -> Credential:
+        """Pool credential for the next attempt, or RateLimitError once none is available."""
+        credential = self.credentials.pick(exclude=tried, pinned=pinned)
+        if credential is None:
+            retry_after = self.credentials.retry_after()
+            raise RateLimitError(f"All {len(self.credentials)} Anthropic credentials are cooling down", retry_after=retry_after)
+        if tried:
+            import logging
+            req_prefix = f"[{request_id}] " if request_id else ""
+            logging.getLogger(__name__).info(f"{req_prefix}⇄ Anthropic: {tried[-1].name} cooling down - retrying with {credential.name}")
+            tracing.add_event("anthropic.credential_shift", **{"from": tried[-1].name, "to": credential.name})
+        tried.append(credential)
+        return credential
+
+    def _pinned_credential(self, body: Dict[str, Any]) -> tuple:
+        """(conversation key, id of the credential holding its warm prompt cache) for a pool request."""
+        if self.affinity is None:
+            return None, None
+        key = conversation_key(body)
+        return key, self.affinity.warm_credential(key)
+
+    def _record_credential_usage(self, key: Optional[str], credential: Credential, usage: Optional[Dict[str, Any]]) -> None:
+        """A pool request completed: count its prompt-cache usage and note the credential its cache is on."""
+        if not usage:
+            return
+        self.credentials.record_usage(credential, usage)
+        if self.affinity is not None:
+            try:
+                self.affinity.record(key, self.name, usage, credential=credential.id)
+            except Exception as e:
+                import logging
+                logging.getLogger(__name__).warning(f"Failed to record credential affinity: {e}")
+
+    def _check_credential_response(self, credential: Optional[Credential], status_code: int, response_headers) -> None:
+        """Feed a pool credential's rate-limit state from a response (before its status is acted on)."""
+        if credential is None:
+            return
+        self.credentials.observe(credential, response_headers)
+        if status_code == 429:
+            self.credentials.cool_down(credential, int(response_headers.get("retry-after", 60)), "rate_limit")
+        elif status_code == 401:
+            self.credentials.cool_down(credential, config.COOLDOWN_SECONDS, "auth")
+
     async def send_message(
         self,
         body: Dict[str, Any],
@@ -175,7 +228,33 @@ class AnthropicProvider(Provider):
         headers: Optional[Dict[str, str]] = None,
         request_id: Optional[str] = None
     ) -> Dict[str, Any]:
-        """Send message to Anthropic API."""
+        """Send message to Anthropic API (with a credential pool: the best credential, shifting on 429 / 401)."""
+        if self.credentials is None:
+            return await self._send_message(body, token, auth_type, headers, request_id)
+        key, pinned = self._pinned_credential(body)
+        tried = []
+        while True:
+            credential = self._next_credential(tried, request_id, pinned)
+            self.credentials.start(credential)
+            try:
+                result = await self._send_message(body, credential.token, credential.auth_type, headers, request_id, credential)
+                self._record_credential_usage(key, credential, result.get("usage") if isinstance(result, dict) else None)
+                return result
+            except (RateLimitError, AuthenticationError):
+                if credential.limited_until <= time.time():
+                    raise  # overloaded (529) etc.: not this credential's doing
+            finally:
+                self.credentials.finish(credential)
+
+    async def _send_message(
+        self,
+        body: Dict[str, Any],
+        token: str,
+        auth_type: str,
+        headers: Optional[Dict[str, str]] = None,
+        request_id: Optional[str] = None,
+        credential: Optional[Credential] = None
+    ) -> Dict[str, Any]:
         import logging
         logger = logging.getLogger(__name__)
 
@@ -190,7 +269,8 @@ class AnthropicProvider(Provider):
             raise ModelUnsupportedError(f"Model '{model}' not available on Anthropic API")
 
         # Clean request body to remove unsupported fields
-        body = self._clean_request_body(body)
+        with timing.measure("clean"):
+            body = self._clean_request_body(body)
 
         if "tools" in body:
             custom_count = sum(1 for t in body['tools'] if isinstance(t, dict) and 'custom' in t)
@@ -203,11 +283,14 @@ class AnthropicProvider(Provider):
 
         headers = self._build_headers(token, auth_type, headers)
 
-        response = await self.client.post(
-            f"{self.base_url}/v1/messages",
-            json=body,
-            headers=headers
-        )
+        with tracing.span("anthropic.request", **{"http.url": f"{self.base_url}/v1/messages"}):
+            response = await self.client.post(
+                f"{self.base_url}/v1/messages",
+                json=body,
+                headers=headers
+            )
+            tracing.set_attributes(**{"http.status_code": response.status_code})
+        self._check_credential_response(credential, response.status_code, response.headers)
 
         # Check for rate limit and overloaded errors
         if response.status_code == 429:
@@ -251,7 +334,43 @@ class AnthropicProvider(Provider):
         headers: Optional[Dict[str, str]] = None,
         request_id: Optional[str] = None
     ) -> AsyncIterator[str]:
-        """Stream message from Anthropic API."""
+        """Stream message from Anthropic API (with a credential pool: the best credential, shifting on 429 / 401)."""
+        if self.credentials is None:
+            async for chunk in self._stream_message(body, token, auth_type, headers, request_id):
+                yield chunk
+            return
+        key, pinned = self._pinned_credential(body)
+        tried = []
+        while True:
+            credential = self._next_credential(tried, request_id, pinned)
+            self.credentials.start(credential)
+            yielded = False
+            usage = None
+            try:
+                async for chunk in self._stream_message(body, credential.token, credential.auth_type,
+                                                        headers, request_id, credential):
+                    if not yielded:
+                        usage = usage_from_chunk(chunk)  # message_start comes first
+                    yielded = True
+                    yield chunk
+                self._record_credential_usage(key, credential, usage)
+                return
+            except (RateLimitError, AuthenticationError):
+                # Status errors come before any event; after one, the stream is the client's already
+                if yielded or credential.limited_until <= time.time():
+                    raise
+            finally:
+                self.credentials.finish(credential)
+
+    async def _stream_message(
+        self,
+        body: Dict[str, Any],
+        token: str,
+        auth_type: str,
+        headers: Optional[Dict[str, str]] = None,
+        request_id: Optional[str] = None,
+        credential: Optional[Credential] = None
+    ) -> AsyncIterator[str]:
         import logging
         logger = logging.getLogger(__name__)
 
@@ -270,7 +389,8 @@ class AnthropicProvider(Provider):
             raise ModelUnsupportedError(f"Model '{model}' not available on Anthropic API")
 
         # Clean request body to remove unsupported fields
-        body = self._clean_request_body(body)
+        with timing.measure("clean"):
+            body = self._clean_request_body(body)
 
         if "tools" in body:
             custom_count = sum(1 for t in body['tools'] if isinstance(t, dict) and 'custom' in t)
@@ -283,39 +403,45 @@ class AnthropicProvider(Provider):
 
         headers = self._build_headers(token, auth_type, headers)
 
-        async with self.client.stream(
-            "POST",
-            f"{self.base_url}/v1/messages",
-            json=body,
-            headers=headers
-        ) as response:
-            # Check for rate limit and overloaded errors
-            if response.status_code == 429:
-                retry_after = int(response.headers.get("retry-after", 60))
-                raise RateLimitError("Rate limit exceeded", retry_after=retry_after)
-
-            if response.status_code == 529:
-                retry_after = int(response.headers.get("retry-after", 60))
-                raise RateLimitError("API overloaded", retry_after=retry_after)
-
-            if response.status_code == 401:
-                error_text = await response.aread()
-                raise AuthenticationError(f"Anthropic API error (401): {error_text}")
-
-            if 400 <= response.status_code < 500:
-                error_text = await response.aread()
-                error_str = error_text.decode() if isinstance(error_text, bytes) else str(error_text)
-                if "Invalid model name" in error_str or "invalid_model" in error_str:
-                    raise ModelUnsupportedError(f"Model '{body.get('model')}' not recognized by Anthropic API")
-                raise ValidationError(f"Anthropic API error ({response.status_code}): {error_text}", status_code=response.status_code)
-
-            if response.status_code == 504:
-                raise TimeoutError(f"Anthropic API timeout (504)")
-
-            if response.status_code != 200:
-                error_text = await response.aread()
-                raise ServerError(f"Anthropic API error ({response.status_code}): {error_text}", status_code=response.status_code)
-
-            async for line in response.aiter_lines():
-                if line.startswith("data: "):
-                    yield line + "\n\n"
\ No newline at end of file
+        with tracing.span("anthropic.request", **{"http.url": f"{self.base_url}/v1/messages", "stream": True}):
+            connect_start = time.perf_counter()
+            async with self.client.stream(
+                "POST",
+                f"{self.base_url}/v1/messages",
+                json=body,
+                headers=headers
+            ) as response:
+                # The context manager returns once the response headers are in
+                timing.record("connect", (time.perf_counter() - connect_start) * 1000)
+                tracing.set_attributes(**{"http.status_code": response.status_code})
+                self._check_credential_response(credential, response.status_code, response.headers)
+                # Check for rate limit and overloaded errors
+                if response.status_code == 429:
+                    retry_after = int(response.headers.get("retry-after", 60))
+                    raise RateLimitError("Rate limit exceeded", retry_after=retry_after)
+
+                if response.status_code == 529:
+                    retry_after = int(response.headers.get("retry-after", 60))
+                    raise RateLimitError("API overloaded", retry_after=retry_after)
+
+                if response.status_code == 401:
+                    error_text = await response.aread()
+                    raise AuthenticationError(f"Anthropic API error (401): {error_text}")
+
+                if 400 <= response.status_code < 500:
+                    error_text = await response.aread()
+                    error_str = error_text.decode() if isinstance(error_text, bytes) else str(error_text)
+                    if "Invalid model name" in error_str or "invalid_model" in error_str:
+                        raise ModelUnsupportedError(f"Model '{body.get('model')}' not recognized by Anthropic API")
+                    raise ValidationError(f"Anthropic API error ({response.status_code}): {error_text}", status_code=response.status_code)
+
+                if response.status_code == 504:
+                    raise TimeoutError(f"Anthropic API timeout (504)")
+
+                if response.status_code != 200:
+                    error_text = await response.aread()
+                    raise ServerError(f"Anthropic API error ({response.status_code}): {error_text}", status_code=response.status_code)
+
+                async for line in response.aiter_lines():
+                    if line.startswith("data: "):
+                        yield line + "\n\n"
\ No newline at end of file
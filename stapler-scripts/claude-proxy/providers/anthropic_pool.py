@@ -0,0 +1,204 @@
+"""Anthropic credential pool: several accounts / API keys behind one provider.
+
+Without a pool, AnthropicProvider sends the request's own token (or
+CLAUDE_CODE_OAUTH_TOKEN), and one account's 429 puts the whole provider in
+cooldown: everything goes to Bedrock for COOLDOWN_SECONDS. With
+ANTHROPIC_CREDENTIALS set, each request instead uses the pool credential with
+the most headroom, and a 429 (or 401) cools down only that credential:
+
+  headroom  the smallest remaining / limit fraction across the rate-limit
+            headers of the credential's last response (requests, tokens,
+            input / output tokens; 1 − utilization of the subscription
+            windows for OAuth tokens). A window whose reset time has passed
+            counts as full; a credential with no response yet counts as 1.0
+  score     headroom / (in-flight + 1): in-flight requests will use some of
+            the headroom the last headers reported
+  pinned    prompt caches are per account, so a conversation whose cache is
+            warm on a credential (ProviderAffinity records which, next to the
+            provider) stays on it while it is out of cooldown and its headroom
+            is above PIN_MIN_HEADROOM. Only new or unpinned conversations are
+            balanced by score; otherwise each turn would move to whichever
+            credential the last response left with the most headroom, and
+            re-write its whole prefix there
+  cooldown  a 429 cools the credential down for its retry-after. A rejected
+            subscription status lasts until the reported reset, and a 401
+            lasts COOLDOWN_SECONDS. Cooldowns live in diskcache so all
+            workers skip the credential
+
+The request moves to the next credential right away. RateLimitError, and with
+it the provider-level cooldown in FallbackHandler, happens only when no
+credential is left, with retry_after = the soonest recovery. Tokens never
+appear in logs or /metrics: credentials are named by a short hash. Request
+counts, pinned picks and prompt-cache usage per credential are per worker.
+"""
+import hashlib
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+import diskcache
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_KINDS = ("requests", "tokens", "input-tokens", "output-tokens")
+UNIFIED_WINDOW = re.compile(r"^anthropic-ratelimit-unified-([\w-]+)-utilization$")
+PIN_MIN_HEADROOM = 0.1  # below this a conversation's credential is no longer kept for it
+
+
+def _epoch(value: Optional[str]) -> Optional[float]:
+    """Reset header value (RFC 3339 or epoch seconds) → epoch seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class Credential:
+    """One pool token and its live rate-limit state."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.auth_type = "oauth" if token.startswith("sk-ant-oat") else "api_key"
+        self.id = hashlib.blake2b(token.encode(), digest_size=4).hexdigest()
+        self.name = f"{self.auth_type}-{self.id}"
+        self.windows: Dict[str, tuple] = {}  # window → (remaining fraction, reset epoch or None)
+        self.in_flight = 0
+        self.requests = 0
+        self.pinned = 0  # requests sent here because their conversation's cache is warm here
+        self.cooldowns = 0
+        self.limited_until = 0.0  # this worker's copy of the shared cooldown
+        self.cache_tokens = {"responses": 0, "input": 0, "read": 0, "write": 0}
+
+    def headroom(self, now: float) -> float:
+        fractions = [fraction for fraction, reset in self.windows.values() if reset is None or reset > now]
+        return max(0.0, min(fractions)) if fractions else 1.0
+
+
+class CredentialPool:
+    """Headroom-first credential choice with per-credential cooldowns."""
+
+    def __init__(self, tokens: Iterable[str], cache_dir: Optional[str] = None):
+        self.credentials: List[Credential] = []
+        for token in tokens:
+            if token and all(c.token != token for c in self.credentials):
+                self.credentials.append(Credential(token))
+        if cache_dir is None:
+            cache_dir = os.path.expanduser("~/.cache/claude-proxy/credential-cooldowns")
+        self.cooldowns = diskcache.Cache(cache_dir)
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def cooldown_remaining(self, credential: Credential) -> float:
+        entry = self.cooldowns.get(credential.id)
+        remaining = (entry["until"] - time.time()) if entry else 0.0
+        credential.limited_until = time.time() + remaining if remaining > 0 else 0.0
+        return max(0.0, remaining)
+
+    def pick(self, exclude: Iterable[Credential] = (), pinned: Optional[str] = None) -> Optional[Credential]:
+        """Available credential: the conversation's `pinned` one (by id) while it has headroom,
+        else the one with the best headroom per in-flight request; None if none is available."""
+        now = time.time()
+        available = [c for c in self.credentials if c not in exclude and not self.cooldown_remaining(c)]
+        if not available:
+            return None
+        for credential in available:
+            if credential.id == pinned and credential.headroom(now) > PIN_MIN_HEADROOM:
+                credential.pinned += 1
+                return credential
+        return max(available, key=lambda c: c.headroom(now) / (c.in_flight + 1))
+
+    def start(self, credential: Credential) -> None:
+        credential.in_flight += 1
+        credential.requests += 1
+
+    def finish(self, credential: Credential) -> None:
+        credential.in_flight -= 1
+
+    def observe(self, credential: Credential, headers: Mapping[str, str]) -> None:
+        """Update a credential's headroom from a response's rate-limit headers."""
+        windows = {}
+        for kind in RATE_LIMIT_KINDS:
+            limit = headers.get(f"anthropic-ratelimit-{kind}-limit")
+            remaining = headers.get(f"anthropic-ratelimit-{kind}-remaining")
+            try:
+                if limit and remaining is not None and float(limit) > 0:
+                    windows[kind] = (float(remaining) / float(limit),
+                                     _epoch(headers.get(f"anthropic-ratelimit-{kind}-reset")))
+            except ValueError:
+                continue
+        for name, value in headers.items():
+            match = UNIFIED_WINDOW.match(name.lower())
+            if match:
+                try:
+                    windows[match.group(1)] = (1.0 - float(value),
+                                               _epoch(headers.get(f"anthropic-ratelimit-unified-{match.group(1)}-reset")))
+                except ValueError:
+                    continue
+        if windows:
+            credential.windows = windows
+        if headers.get("anthropic-ratelimit-unified-status") == "rejected":
+            reset = _epoch(headers.get("anthropic-ratelimit-unified-reset"))
+            if reset:
+                self.cool_down(credential, reset - time.time(), "subscription limit")
+
+    def record_usage(self, credential: Credential, usage: Optional[Mapping[str, Any]]) -> None:
+        """Count a response's prompt-cache usage (input / cache read / cache write tokens) for `credential`."""
+        if not usage:
+            return
+        tokens = credential.cache_tokens
+        tokens["responses"] += 1
+        tokens["input"] += int(usage.get("input_tokens") or 0)
+        tokens["read"] += int(usage.get("cache_read_input_tokens") or 0)
+        tokens["write"] += int(usage.get("cache_creation_input_tokens") or 0)
+
+    def cool_down(self, credential: Credential, seconds: Optional[float], reason: str) -> None:
+        """Skip `credential` in every worker for `seconds`."""
+        seconds = max(1.0, float(seconds or 60))
+        credential.cooldowns += 1
+        credential.limited_until = time.time() + seconds
+        self.cooldowns.set(credential.id, {"until": credential.limited_until, "reason": reason}, expire=seconds)
+        logger.warning(f"Anthropic credential {credential.name} in cooldown for {seconds:.0f}s (reason={reason})")
+
+    def retry_after(self) -> int:
+        """Seconds until the first credential leaves cooldown."""
+        remaining = [self.cooldown_remaining(c) for c in self.credentials]
+        return max(1, int(min(remaining) + 0.999)) if remaining else 60
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            c.name: {
+                "auth_type": c.auth_type,
+                "headroom": round(c.headroom(now), 3),
+                "windows": {w: round(fraction, 3) for w, (fraction, reset) in c.windows.items()
+                            if reset is None or reset > now},
+                "cooldown_remaining_s": round(self.cooldown_remaining(c), 1),
+                "in_flight": c.in_flight,
+                "requests": c.requests,
+                "pinned": c.pinned,
+                "cooldowns": c.cooldowns,
+                "prompt_cache": _cache_stats(c.cache_tokens),
+            }
+            for c in self.credentials
+        }
+
+
+def _cache_stats(tokens: Mapping[str, int]) -> Dict[str, Any]:
+    total = tokens["read"] + tokens["write"] + tokens["input"]
+    return {
+        "responses": tokens["responses"],
+        "read_tokens": tokens["read"],
+        "write_tokens": tokens["write"],
+        "uncached_tokens": tokens["input"],
+        "read_ratio": round(tokens["read"] / total, 4) if total else 0.0,
+    }
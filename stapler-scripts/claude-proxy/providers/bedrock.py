@@ -3,24 +3,30 @@ import json
 import anyio
 import boto3
 import asyncio
+import functools
 import logging
 import os
 import time
 import configparser
 from datetime import datetime, timedelta
-from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from botocore.config import Config
-from botocore.exceptions import ReadTimeoutError, ConnectTimeoutError
+from botocore.exceptions import ClientError, ReadTimeoutError, ConnectTimeoutError
 from typing import Dict, Any, AsyncIterator, Optional, Tuple
 from diskcache import Cache
 from . import Provider, RateLimitError, ValidationError, TimeoutError, AuthenticationError
 import config
-from aws_sso_lib import login as sso_login
+import timing
+import tracing
+from thread_pool import InstrumentedThreadPoolExecutor, PoolAutoscaler, PoolStats, run_in_thread
+from .bedrock_pool import INVOKE, STREAM, BedrockEndpoint, EndpointPool, parse_endpoints
 
 # Shared lock file for coordinating SSO login across multiple workers
 SSO_LOCK_FILE = "/tmp/claude-proxy-sso-login.lock"
 SSO_LOCK_TIMEOUT = 120  # 2 minutes
+CREDENTIAL_RETRY_INTERVAL = 5  # Credential manager re-check while SSO login / another worker's refresh is pending
+CREDENTIAL_LEASE_TTL = 30  # Upper bound on one worker's hold of the cross-worker refresh lease
+SSO_LOGIN_BACKOFF = 120  # Minimum gap between a worker's SSO logins while they don't yield valid credentials
 
 logger = logging.getLogger(__name__)
 
@@ -122,15 +128,42 @@ class BedrockProvider(Provider):
         self.client = self.session.client(
             "bedrock-runtime",
             region_name=config.AWS_REGION,
+            endpoint_url=config.BEDROCK_ENDPOINT_URL,  # None = regional AWS endpoint
             config=boto_config
         )
+        # Regions / profiles requests are spread over (see bedrock_pool.py); default: AWS_REGION only
+        self.endpoints = EndpointPool(self._open_endpoints(parse_endpoints(config.BEDROCK_ENDPOINTS, config.AWS_REGION)))
+        self._connect_endpoints(self.session, self.client)
         # Thread pool for running blocking boto3 calls without blocking event loop
         # Sized via BEDROCK_THREAD_POOL_SIZE (default 40) — all boto3 calls use this pool
-        self.executor = ThreadPoolExecutor(max_workers=config.BEDROCK_THREAD_POOL_SIZE, thread_name_prefix="bedrock-io")
+        self.executor = InstrumentedThreadPoolExecutor(
+            max_workers=config.BEDROCK_THREAD_POOL_SIZE, thread_name_prefix="bedrock-io", name="bedrock.executor"
+        )
+        # Streaming calls need anyio worker threads (anyio.from_thread); bound them separately, same size
+        self.stream_limiter = anyio.CapacityLimiter(config.BEDROCK_THREAD_POOL_SIZE)
+        self.stream_stats = PoolStats("bedrock.stream_threads", config.BEDROCK_THREAD_POOL_SIZE)
+        self.autoscalers = []
+        if config.BEDROCK_POOL_AUTOSCALE:
+            self.autoscalers = [
+                PoolAutoscaler(self.executor.stats, self.executor.resize,
+                               config.BEDROCK_POOL_MAX_SIZE, config.BEDROCK_POOL_TARGET_WAIT_MS),
+                PoolAutoscaler(self.stream_stats, lambda size: setattr(self.stream_limiter, "total_tokens", size),
+                               config.BEDROCK_POOL_MAX_SIZE, config.BEDROCK_POOL_TARGET_WAIT_MS),
+            ]
         # Disk cache for SSO config and credential validity checks
         # Shared across all workers via /tmp directory
         self._cache_dir = "/tmp/claude-proxy-bedrock-cache"
         self.cache = self._init_cache()
+        # Published by the credential manager (run_credential_refresh_loop), read per request
+        self._credential_error: Optional[str] = None
+        self._credential_expiry: Optional[datetime] = None
+        self._credential_checked_at = 0.0
+        self._credential_refreshes = 0
+        self._force_refresh = False
+        self._sso_login_at = 0.0  # when this worker last ran an SSO login, and whether it succeeded
+        self._sso_login_ok = False
+        self._credential_loop: Optional[asyncio.AbstractEventLoop] = None
+        self._credential_wakeup: Optional[asyncio.Event] = None
 
     def _init_cache(self) -> Cache:
         """Initialize diskcache, resetting if the SQLite schema is corrupt/missing."""
@@ -179,6 +212,25 @@ class BedrockProvider(Provider):
             else:
                 raise
 
+    def _cache_add(self, key: str, value, expire=None) -> bool:
+        """Atomic cache add (False if the key exists), with recovery from schema corruption."""
+        import sqlite3
+        try:
+            return self.cache.add(key, value, expire=expire)
+        except sqlite3.OperationalError as e:
+            if "no such table" in str(e):
+                logger.warning(f"Cache schema error on add ({e}), reinitializing")
+                self.cache.close()
+                self.cache = self._init_cache()
+                return self.cache.add(key, value, expire=expire)
+            raise
+
+    def _cache_delete(self, key: str) -> None:
+        try:
+            self.cache.delete(key)
+        except Exception as e:
+            logger.debug(f"Cache delete of {key} failed: {e}")
+
     @property
     def name(self) -> str:
         return "bedrock"
@@ -206,138 +258,224 @@ class BedrockProvider(Provider):
 
         return False
 
-    def _check_and_refresh_credentials(self):
-        """Check if credentials are expiring soon and refresh proactively."""
-        # Check cache first - avoid expensive boto3 calls on every request
-        cache_key = f"creds_valid:{config.AWS_PROFILE}"
-        cached_result = self._cache_get(cache_key)
-        if cached_result:
-            is_valid, minutes_remaining = cached_result
-            if is_valid and minutes_remaining > 5:
-                # Credentials recently validated and still have >5 min
-                logger.debug(f"Using cached credential validity (valid for {minutes_remaining}m)")
-                return
-            else:
-                logger.debug(f"Cached credentials expiring soon ({minutes_remaining}m), re-checking")
+    # -----------------------------------------------------------------------
+    # Credential manager
+    #
+    # run_credential_refresh_loop() (started from the app lifespan) owns every
+    # credential check: it refreshes ahead of expiry, drives SSO login, and
+    # publishes the outcome by swapping self.client / self._credential_error
+    # (one reference assignment each). Requests only read those references —
+    # no diskcache read, lock-file stat or boto3 credential call per request.
+    # Across workers, the SSO lock file keeps one browser login in flight and
+    # a diskcache lease lets one worker at a time re-invoke credential_process.
+    # -----------------------------------------------------------------------
+
+    def _pick_endpoint(self, tried: list, kind: str) -> BedrockEndpoint:
+        """Hot-path credential gate and endpoint choice for the next attempt of a request.
+
+        Endpoints on the default profile use the managed session: while the
+        manager has published a credential error they are left out, and
+        `profile@region` endpoints (their own boto3-refreshed credentials)
+        keep serving. Raises the error once no endpoint is left to try.
+        """
+        error = self._credential_error
+        exclude = tried + [e for e in self.endpoints if e.profile is None] if error else tried
+        endpoint = self.endpoints.pick(exclude=exclude, kind=kind)
+        if endpoint is None:
+            if tried:
+                raise RateLimitError("Bedrock rate limit exceeded")  # every usable endpoint throttled this request
+            raise AuthenticationError(error)
+        return endpoint
+
+    def request_credential_refresh(self) -> None:
+        """Run the credential manager now (e.g. after an expired-token error), from any thread."""
+        self._force_refresh = True
+        loop, wakeup = self._credential_loop, self._credential_wakeup
+        if loop is not None and wakeup is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def run_credential_refresh_loop(self) -> None:
+        """Background task: keep credentials fresh and publish the current client."""
+        self._credential_loop = asyncio.get_running_loop()
+        self._credential_wakeup = asyncio.Event()
+        while True:
+            self._credential_wakeup.clear()
+            try:
+                # Off the event loop, and off self.executor so it never queues behind requests
+                delay = await asyncio.to_thread(self._refresh_credentials)
+            except Exception as e:
+                # Make credential errors visible - these indicate SSO issues
+                logger.warning(f"⚠️  Credential check error: {e}")
+                logger.warning(f"   This may indicate expired SSO session. Run: aws-vault exec {config.AWS_PROFILE} -- aws sts get-caller-identity")
+                delay = CREDENTIAL_RETRY_INTERVAL
+            self._credential_checked_at = time.time()
+            try:
+                await asyncio.wait_for(self._credential_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
 
+    def _refresh_credentials(self) -> float:
+        """One credential-manager pass (worker thread). Returns seconds until the next pass."""
         # Check shared lock file to see if SSO login is in progress (across all workers)
         in_progress, elapsed = self._is_sso_login_in_progress()
         if in_progress:
-            # Try to get credentials - user may have completed SSO login
-            # Create new session and force credential cache invalidation
-            logger.debug(f"SSO login in progress for {elapsed}s, checking if credentials now available")
-            self._recreate_client()
-
-            # Make a test API call to verify credentials actually work
-            # This forces boto3 to re-invoke credential_process (aws-vault)
+            # The user may have completed SSO login: a new session re-invokes credential_process (aws-vault)
+            session, client = self._build_client()
             try:
                 # Use STS GetCallerIdentity as a cheap test call
-                test_client = self.session.client('sts', region_name=config.AWS_REGION)
-                identity = test_client.get_caller_identity()
-                # Success! Credentials work
-                logger.info(f"✓ SSO login completed successfully after {elapsed}s - verified with STS call (Account: {identity['Account']})")
-                self._clear_sso_lock()
-                # Cache successful validation (assume new SSO tokens are valid for 1 hour)
-                cache_key = f"creds_valid:{config.AWS_PROFILE}"
-                self._cache_set(cache_key, (True, 60), expire=30)  # Cache for 30s
-                return  # Credentials valid, continue with request
+                identity = session.client('sts', region_name=config.AWS_REGION).get_caller_identity()
             except Exception as e:
-                # Credentials still not available or invalid
-                error_type = type(e).__name__
-                error_msg = str(e).lower()
-                logger.debug(f"SSO login still in progress: {error_type}: {e}")
-
-                # If we get UnauthorizedSSOTokenError, SSO login incomplete
-                if 'unauthorized' in error_msg or 'expired' in error_msg or 'invalid' in error_msg:
-                    raise AuthenticationError(f"AWS SSO login in progress (started {elapsed}s ago). Please complete authentication in browser and retry.")
-                else:
-                    # Some other error - let it propagate
-                    raise
-
-        try:
-            # Get current credentials from session
-            credentials = self.session.get_credentials()
-            if not credentials:
-                logger.error("❌ No credentials found - SSO login required")
-                # Trigger SSO login automatically (respects in-progress flag)
-                browser_opened = self._trigger_sso_login()
-                if browser_opened:
-                    raise AuthenticationError("No AWS credentials found. Browser opened for SSO login - please complete authentication and retry.")
-                else:
-                    raise AuthenticationError("AWS SSO login already in progress. Please complete authentication in browser and retry.")
-
-            # Check if credentials have an expiry time
-            # Works with SSO, assume role, credential_process (aws-vault), etc.
-            if hasattr(credentials, '_expiry_time') and credentials._expiry_time:
-                expiry_time = credentials._expiry_time
-
-                # Calculate time until expiry
-                now = datetime.now(expiry_time.tzinfo) if expiry_time.tzinfo else datetime.now()
-                time_until_expiry = expiry_time - now
-
-                # Check if already expired
-                if time_until_expiry < timedelta(0):
-                    logger.error(f"❌ Credentials expired {int(abs(time_until_expiry.total_seconds() / 60))}m ago - SSO login required")
-                    # Trigger SSO login automatically (respects in-progress flag)
-                    browser_opened = self._trigger_sso_login()
-                    if browser_opened:
-                        raise AuthenticationError("AWS SSO session expired. Browser opened for login - please complete authentication and retry.")
-                    else:
-                        raise AuthenticationError("AWS SSO login already in progress. Please complete authentication in browser and retry.")
-                # Refresh if expiring within 5 minutes
-                elif time_until_expiry < timedelta(minutes=5):
-                    logger.warning(f"🔄 Credentials expiring in {int(time_until_expiry.total_seconds() / 60)}m, refreshing proactively")
-                    self._recreate_client()
-                    # Verify refresh worked by checking expiry again
-                    refreshed_creds = self.session.get_credentials()
-                    if refreshed_creds and hasattr(refreshed_creds, '_expiry_time') and refreshed_creds._expiry_time:
-                        new_expiry = refreshed_creds._expiry_time
-                        new_time_until_expiry = new_expiry - datetime.now(new_expiry.tzinfo if new_expiry.tzinfo else None)
-                        if new_time_until_expiry > timedelta(minutes=15):
-                            logger.info(f"✓ Credentials refreshed successfully (valid for {int(new_time_until_expiry.total_seconds() / 60)}m)")
-                            self._clear_sso_lock()
-                            # Cache successful refresh
-                            cache_key = f"creds_valid:{config.AWS_PROFILE}"
-                            minutes = int(new_time_until_expiry.total_seconds() / 60)
-                            self._cache_set(cache_key, (True, minutes), expire=30)
-                        else:
-                            logger.warning(f"⚠️  Credentials still expiring soon ({int(new_time_until_expiry.total_seconds() / 60)}m) after refresh")
-                elif time_until_expiry < timedelta(minutes=15):
-                    logger.debug(f"Credentials valid for {int(time_until_expiry.total_seconds() / 60)} minutes")
-                    # Cache that credentials are valid
-                    cache_key = f"creds_valid:{config.AWS_PROFILE}"
-                    minutes = int(time_until_expiry.total_seconds() / 60)
-                    self._cache_set(cache_key, (True, minutes), expire=30)
-                else:
-                    # Credentials valid for >15 minutes
-                    logger.debug(f"Credentials valid for {int(time_until_expiry.total_seconds() / 60)} minutes")
-                    # Cache that credentials are valid
-                    cache_key = f"creds_valid:{config.AWS_PROFILE}"
-                    minutes = int(time_until_expiry.total_seconds() / 60)
-                    self._cache_set(cache_key, (True, minutes), expire=30)
-        except Exception as e:
-            # Make credential errors visible - these indicate SSO issues
-            logger.warning(f"⚠️  Credential check error: {e}")
-            logger.warning(f"   This may indicate expired SSO session. Run: aws-vault exec {config.AWS_PROFILE} -- aws sts get-caller-identity")
+                logger.debug(f"SSO login still in progress for {elapsed}s: {type(e).__name__}: {e}")
+                self._credential_error = f"AWS SSO login in progress (started {elapsed}s ago). Please complete authentication in browser and retry."
+                return CREDENTIAL_RETRY_INTERVAL
+            logger.info(f"✓ SSO login completed successfully after {elapsed}s - verified with STS call (Account: {identity['Account']})")
+            self._clear_sso_lock()
+            self._publish_client(session, client)
+
+        credentials = self.session.get_credentials()
+        if not credentials:
+            logger.error("❌ No credentials found - SSO login required")
+            return self._login_via_sso("No AWS credentials found.")
+
+        # Works with SSO, assume role, credential_process (aws-vault), etc.; static keys have no expiry
+        expiry_time = getattr(credentials, '_expiry_time', None)
+        if not expiry_time:
+            self._credential_expiry, self._credential_error = None, None
+            return config.BEDROCK_CREDENTIAL_CHECK_INTERVAL
+
+        remaining = self._seconds_until(expiry_time)
+        if remaining <= 0:
+            logger.error(f"❌ Credentials expired {int(-remaining / 60)}m ago - SSO login required")
+            return self._login_via_sso("AWS SSO session expired.")
+
+        if remaining < config.BEDROCK_CREDENTIAL_REFRESH_AHEAD or self._force_refresh:
+            # One worker at a time re-invokes credential_process; the others find
+            # the lease taken and retry shortly, by which time aws-vault has cached the result
+            lease_key = f"creds_refresh:{config.AWS_PROFILE}"
+            if not self._cache_add(lease_key, os.getpid(), expire=CREDENTIAL_LEASE_TTL):
+                logger.debug("Credential refresh in progress in another worker, checking again shortly")
+                return CREDENTIAL_RETRY_INTERVAL
+            try:
+                logger.warning(f"🔄 Credentials expiring in {int(remaining / 60)}m, refreshing ahead of expiry")
+                session, client = self._build_client()
+                refreshed = session.get_credentials()
+                new_expiry = getattr(refreshed, '_expiry_time', None) if refreshed else None
+                if not new_expiry:
+                    self._publish_client(session, client)
+                    self._credential_expiry, self._credential_error = None, None
+                    return config.BEDROCK_CREDENTIAL_CHECK_INTERVAL
+                new_remaining = self._seconds_until(new_expiry)
+                if new_remaining > remaining:
+                    self._publish_client(session, client)
+                    expiry_time, remaining = new_expiry, new_remaining
+                    logger.info(f"✓ Credentials refreshed successfully (valid for {int(remaining / 60)}m)")
+                    self._clear_sso_lock()
+                self._force_refresh = False
+            finally:
+                self._cache_delete(lease_key)
+
+        self._credential_expiry, self._credential_error = expiry_time, None
+        until_refresh = remaining - config.BEDROCK_CREDENTIAL_REFRESH_AHEAD
+        if until_refresh <= 0:
+            logger.warning(f"⚠️  Credentials still expiring soon ({int(remaining / 60)}m) after refresh")
+            # Retry, without hammering credential_process, until they expire
+            return max(CREDENTIAL_RETRY_INTERVAL, min(config.BEDROCK_CREDENTIAL_CHECK_INTERVAL, remaining / 4))
+        logger.debug(f"Credentials valid for {int(remaining / 60)} minutes")
+        return max(CREDENTIAL_RETRY_INTERVAL, min(config.BEDROCK_CREDENTIAL_CHECK_INTERVAL, until_refresh))
+
+    def _login_via_sso(self, reason: str) -> float:
+        """Trigger SSO login (respects the in-progress flag and SSO_LOGIN_BACKOFF) and publish the outcome.
+
+        The error stays set until a later pass finds valid credentials: a login that
+        completes without producing them (wrong profile, a cached token that doesn't
+        refresh) must not reopen the browser on every pass.
+        """
+        since_login = time.time() - self._sso_login_at
+        if since_login < SSO_LOGIN_BACKOFF:
+            outcome = "completed" if self._sso_login_ok else "failed"
+            self._credential_error = (f"{reason} AWS SSO login {outcome} {int(since_login)}s ago without valid credentials "
+                                      f"for profile {config.AWS_PROFILE}; retrying login in {int(SSO_LOGIN_BACKOFF - since_login)}s.")
+            return CREDENTIAL_RETRY_INTERVAL
+
+        logged_in = self._trigger_sso_login()
+        if not logged_in and self._is_sso_login_in_progress()[0]:
+            # Another worker holds the login lock: its browser window is the one to complete
+            self._credential_error = f"{reason} AWS SSO login in progress - please complete authentication in browser and retry."
+            return CREDENTIAL_RETRY_INTERVAL
+        self._sso_login_at, self._sso_login_ok = time.time(), logged_in
+        if logged_in:
+            # Pick up the refreshed SSO token cache; the next pass checks the credentials it yields
+            self._publish_client(*self._build_client())
+            self._credential_error = f"{reason} AWS SSO login completed - verifying the new credentials."
+        else:
+            self._credential_error = f"{reason} AWS SSO login failed - run: aws sso login --profile {config.AWS_PROFILE}"
+        return CREDENTIAL_RETRY_INTERVAL
+
+    @staticmethod
+    def _seconds_until(expiry_time: datetime) -> float:
+        now = datetime.now(expiry_time.tzinfo) if expiry_time.tzinfo else datetime.now()
+        return (expiry_time - now).total_seconds()
+
+    def _publish_client(self, session: boto3.Session, client: Any) -> None:
+        """Swap in a fully built session/client; in-flight calls keep the client they started with."""
+        self._connect_endpoints(session, client)
+        self.session = session
+        self.client = client
+        self._credential_refreshes += 1
+
+    def _open_endpoints(self, endpoints: list) -> list:
+        """Give endpoints on their own AWS profile a session and client; drop any that can't be set up.
+
+        Those sessions aren't managed by the credential manager: boto3 refreshes
+        their (SSO / credential_process) credentials itself as they expire.
+        """
+        opened = []
+        for endpoint in endpoints:
+            if endpoint.profile and endpoint.profile != config.AWS_PROFILE:
+                try:
+                    endpoint.client = self._make_client(boto3.Session(profile_name=endpoint.profile), endpoint.region)
+                except Exception as e:
+                    logger.warning(f"Bedrock endpoint {endpoint.name} unavailable: {e}")
+                    continue
+            else:
+                endpoint.profile = None
+            opened.append(endpoint)
+        return opened or [BedrockEndpoint(config.AWS_REGION)]
+
+    def _connect_endpoints(self, session: boto3.Session, client: Any) -> None:
+        """Point the default-profile endpoints at `session` (`client` serves AWS_REGION)."""
+        for endpoint in self.endpoints:
+            if endpoint.profile is None:
+                endpoint.client = client if endpoint.region == config.AWS_REGION else self._make_client(session, endpoint.region)
+
+    def endpoint_stats(self) -> Dict[str, Any]:
+        """Health, in-flight requests, EWMA latency and throttles per endpoint (for /metrics)."""
+        return self.endpoints.stats()
+
+    def credential_status(self) -> Dict[str, Any]:
+        """What the credential manager last published (for /metrics)."""
+        expires_in = self._seconds_until(self._credential_expiry) if self._credential_expiry else None
+        return {
+            "managed": self._credential_loop is not None,
+            "expires_in_s": int(expires_in) if expires_in is not None else None,
+            "last_check_age_s": round(time.time() - self._credential_checked_at, 1) if self._credential_checked_at else None,
+            "refreshes": self._credential_refreshes,
+            "error": self._credential_error,
+        }
 
-    def _recreate_client(self):
-        """Recreate boto3 client and force credential cache invalidation.
+    def _build_client(self) -> Tuple[boto3.Session, Any]:
+        """Build a new boto3 session and client with credential cache invalidation.
 
         This is necessary because boto3 caches credentials and won't re-invoke
         credential_process (aws-vault) until the cached credentials expire.
         """
-        boto_config = Config(
-            read_timeout=config.REQUEST_TIMEOUT,
-            connect_timeout=30,
-            retries={'max_attempts': 0}
-        )
         # Create completely new session to force credential refresh
-        self.session = boto3.Session()
+        session = boto3.Session()
 
         # Force credential cache invalidation by getting credentials and invalidating them
         # This makes boto3 re-invoke credential_process (aws-vault) on next use
         try:
-            creds = self.session.get_credentials()
+            creds = session.get_credentials()
             if creds and hasattr(creds, '_refresh'):
                 # Force refresh on next access
                 logger.debug("Invalidating boto3 credential cache")
@@ -347,9 +485,19 @@ class BedrockProvider(Provider):
         except Exception as e:
             logger.debug(f"Error invalidating credentials: {e}")
 
-        self.client = self.session.client(
+        return session, self._make_client(session, config.AWS_REGION)
+
+    @staticmethod
+    def _make_client(session: boto3.Session, region: str) -> Any:
+        boto_config = Config(
+            read_timeout=config.REQUEST_TIMEOUT,
+            connect_timeout=30,
+            retries={'max_attempts': 0}
+        )
+        return session.client(
             "bedrock-runtime",
-            region_name=config.AWS_REGION,
+            region_name=region,
+            endpoint_url=config.BEDROCK_ENDPOINT_URL,  # None = regional AWS endpoint
             config=boto_config
         )
 
@@ -476,6 +624,8 @@ class BedrockProvider(Provider):
 
             # Use aws-sso-lib to trigger interactive SSO login
             # This opens browser and updates ~/.aws/sso/cache/
+            # (imported here: only needed once the SSO session has expired)
+            from aws_sso_lib import login as sso_login
             token = sso_login(
                 start_url=start_url,
                 sso_region=sso_region,
@@ -708,9 +858,11 @@ class BedrockProvider(Provider):
 
     def _handle_bedrock_error(self, e: Exception) -> None:
         """Handle Bedrock exceptions and convert to appropriate error types."""
-        if isinstance(e, self.client.exceptions.ThrottlingException):
+        # Clients of other AWS profiles (endpoint pool) raise their own session's exception classes
+        code = e.response.get("Error", {}).get("Code") if isinstance(e, ClientError) else None
+        if isinstance(e, self.client.exceptions.ThrottlingException) or code == "ThrottlingException":
             raise RateLimitError("Bedrock rate limit exceeded")
-        elif isinstance(e, self.client.exceptions.ValidationException):
+        elif isinstance(e, self.client.exceptions.ValidationException) or code == "ValidationException":
             raise ValidationError(f"Bedrock validation error: {str(e)}", status_code=400)
         elif isinstance(e, (ReadTimeoutError, ConnectTimeoutError)):
             raise TimeoutError(f"Bedrock timeout: {str(e)}")
@@ -719,6 +871,7 @@ class BedrockProvider(Provider):
             # Check for expired security token (aws-vault/SSO issue)
             if "security token" in error_msg and "expired" in error_msg:
                 logger.error(f"❌ AWS credentials expired. Run: aws-vault exec {config.AWS_PROFILE} -- aws sts get-caller-identity")
+                self.request_credential_refresh()
                 raise AuthenticationError(f"AWS credentials expired. Run 'aws-vault exec {config.AWS_PROFILE}' to refresh SSO session")
             # Check for invalid credentials
             if "credentials" in error_msg and ("invalid" in error_msg or "not found" in error_msg or "unable to locate" in error_msg):
@@ -737,6 +890,24 @@ class BedrockProvider(Provider):
                 raise TimeoutError(f"Bedrock timeout: {str(e)}")
             raise
 
+    def pool_stats(self) -> Dict[str, Any]:
+        """Queue depth, queue wait, active threads and run time of both boto3 pools (for /metrics)."""
+        executor = self.executor.stats.snapshot()
+        executor["threads"] = self.executor.threads
+        return {
+            "executor": executor,
+            "stream_threads": self.stream_stats.snapshot(),
+            "autoscale": {
+                "enabled": bool(self.autoscalers),
+                "max_size": config.BEDROCK_POOL_MAX_SIZE,
+                "target_wait_ms": config.BEDROCK_POOL_TARGET_WAIT_MS,
+            },
+        }
+
+    def _maybe_grow_pools(self) -> None:
+        for autoscaler in self.autoscalers:
+            autoscaler.maybe_grow()
+
     async def send_message(
         self,
         body: Dict[str, Any],
@@ -746,9 +917,7 @@ class BedrockProvider(Provider):
         request_id: Optional[str] = None
     ) -> Dict[str, Any]:
         """Send message to Bedrock."""
-        # Proactively refresh credentials if expiring soon
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(self.executor, self._check_and_refresh_credentials)
+        self._maybe_grow_pools()
 
         # Convert model name
         original_model = body.get("model", "claude-3-haiku-20240307")
@@ -756,29 +925,59 @@ class BedrockProvider(Provider):
         bedrock_model = self._convert_to_bedrock_model(original_model)
 
         # Prepare Bedrock request body (pass normalized model for beta compatibility checking)
-        bedrock_body = self._prepare_bedrock_body(body, normalized_model, headers)
-
-        try:
-            # Run invoke_model in dedicated thread pool (not anyio's default pool)
-            # This ensures all Bedrock I/O shares the same bounded, configurable executor
-            loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                self.executor,
-                lambda: self.client.invoke_model(
-                    modelId=bedrock_model,
-                    contentType="application/json",
-                    accept="application/json",
-                    body=json.dumps(bedrock_body)
+        with timing.measure("clean"):
+            bedrock_body = self._prepare_bedrock_body(body, normalized_model, headers)
+
+        request_json = json.dumps(bedrock_body)
+        tried = []
+        while True:
+            # Credentials are kept fresh by the background credential manager; this only reads its result
+            endpoint = self._pick_endpoint(tried, INVOKE)
+            tried.append(endpoint)
+            client = endpoint.client
+            self.endpoints.start(endpoint)
+            started = time.monotonic()
+            try:
+                # Run invoke_model in dedicated thread pool (not anyio's default pool)
+                # This ensures all Bedrock I/O shares the same bounded, configurable executor
+                loop = asyncio.get_event_loop()
+                response = await loop.run_in_executor(
+                    self.executor,
+                    tracing.in_context(lambda: client.invoke_model(
+                        modelId=endpoint.model_id(bedrock_model),
+                        contentType="application/json",
+                        accept="application/json",
+                        body=request_json
+                    ), "bedrock.invoke")
                 )
-            )
 
-            # Reading response body is also blocking I/O — run in same pool
-            body_content = await loop.run_in_executor(self.executor, response["body"].read)
-            result = json.loads(body_content)
-            return self._convert_response(result, original_model)
+                # Reading response body is also blocking I/O — run in same pool
+                body_content = await loop.run_in_executor(self.executor, tracing.in_context(response["body"].read, "bedrock.read"))
+                self.endpoints.record_latency(endpoint, (time.monotonic() - started) * 1000, INVOKE)
+                result = json.loads(body_content)
+                return self._convert_response(result, original_model)
 
-        except Exception as e:
-            self._handle_bedrock_error(e)
+            except Exception as e:
+                try:
+                    self._handle_bedrock_error(e)
+                except RateLimitError:
+                    if not self._shift_after_throttle(endpoint, tried, request_id):
+                        raise
+            finally:
+                self.endpoints.finish(endpoint)
+
+    def _shift_after_throttle(self, endpoint: BedrockEndpoint, tried: list, request_id: Optional[str]) -> bool:
+        """Cool down a throttled endpoint; True if another endpoint is left to try for this request."""
+        if len(self.endpoints) == 1:
+            return False  # nothing to shift to: FallbackHandler's backoff handles it as before
+        seconds = self.endpoints.throttled(endpoint)
+        req_prefix = f"[{request_id}] " if request_id else ""
+        if len(tried) < len(self.endpoints):
+            logger.warning(f"{req_prefix}⇄ Bedrock {endpoint.name} throttled (cooling down {seconds:.0f}s) - shifting to another endpoint")
+            tracing.add_event("bedrock.endpoint_throttled", **{"bedrock.endpoint": endpoint.name, "cooldown_s": seconds})
+            return True
+        logger.warning(f"{req_prefix}✗ Bedrock throttled on all {len(tried)} endpoints")
+        return False
 
     async def stream_message(
         self,
@@ -789,9 +988,7 @@ class BedrockProvider(Provider):
         request_id: Optional[str] = None
     ) -> AsyncIterator[str]:
         """Stream message from Bedrock."""
-        # Proactively refresh credentials if expiring soon
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(self.executor, self._check_and_refresh_credentials)
+        self._maybe_grow_pools()
 
         # Convert model name
         original_model = body.get("model", "claude-3-haiku-20240307")
@@ -799,32 +996,63 @@ class BedrockProvider(Provider):
         bedrock_model = self._convert_to_bedrock_model(original_model)
 
         # Prepare Bedrock request body (pass normalized model for beta compatibility checking)
-        bedrock_body = self._prepare_bedrock_body(body, normalized_model, headers)
-
-        send_stream, receive_stream = anyio.create_memory_object_stream(max_buffer_size=10)
-
-        async with anyio.create_task_group() as tg:
-            tg.start_soon(
-                anyio.to_thread.run_sync,
-                self._stream_bedrock_sync,
-                send_stream,
-                bedrock_model,
-                bedrock_body
-            )
-
-            async with receive_stream:
-                async for item in receive_stream:
-                    yield item
-
-    def _stream_bedrock_sync(self, send_stream, bedrock_model: str, bedrock_body: Dict[str, Any]):
+        with timing.measure("clean"):
+            bedrock_body = self._prepare_bedrock_body(body, normalized_model, headers)
+
+        tried = []
+        while True:
+            # Credentials are kept fresh by the background credential manager; this only reads its result
+            endpoint = self._pick_endpoint(tried, STREAM)
+            tried.append(endpoint)
+            send_stream, receive_stream = anyio.create_memory_object_stream(max_buffer_size=10)
+            yielded = False
+            self.endpoints.start(endpoint)
+            try:
+                async with anyio.create_task_group() as tg:
+                    tg.start_soon(
+                        functools.partial(run_in_thread, limiter=self.stream_limiter),
+                        self.stream_stats,
+                        tracing.in_context(self._stream_bedrock_sync, "bedrock.invoke_stream"),
+                        send_stream,
+                        bedrock_model,
+                        bedrock_body,
+                        endpoint
+                    )
+
+                    async with receive_stream:
+                        async for item in receive_stream:
+                            yielded = True
+                            yield item
+                return
+            except BaseExceptionGroup as eg:
+                # The task group wraps the worker's RateLimitError / TimeoutError / AuthenticationError;
+                # unwrap it so FallbackHandler's retry and fallback logic can classify it
+                if len(eg.exceptions) != 1:
+                    raise
+                error = eg.exceptions[0]
+            finally:
+                self.endpoints.finish(endpoint)
+            # A throttle arrives before any event, so the request can still move to another endpoint
+            if not (isinstance(error, RateLimitError) and not yielded
+                    and self._shift_after_throttle(endpoint, tried, request_id)):
+                raise error from None
+
+    def _stream_bedrock_sync(self, send_stream, bedrock_model: str, bedrock_body: Dict[str, Any],
+                             endpoint: Optional[BedrockEndpoint] = None):
         """Synchronous worker to stream from Bedrock in a thread."""
+        client = endpoint.client if endpoint else self.client
         try:
-            response = self.client.invoke_model_with_response_stream(
-                modelId=bedrock_model,
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps(bedrock_body)
-            )
+            # Runs in the caller's context (tracing.in_context), so the request's timer is current
+            started = time.monotonic()
+            with timing.measure("connect"):
+                response = client.invoke_model_with_response_stream(
+                    modelId=endpoint.model_id(bedrock_model) if endpoint else bedrock_model,
+                    contentType="application/json",
+                    accept="application/json",
+                    body=json.dumps(bedrock_body)
+                )
+            if endpoint:
+                self.endpoints.record_latency(endpoint, (time.monotonic() - started) * 1000, STREAM)
 
             for event in response["body"]:
                 chunk = json.loads(event["chunk"]["bytes"])
@@ -0,0 +1,150 @@
+"""Bedrock endpoint pool: several regions / AWS profiles behind one provider.
+
+BedrockProvider used to call a single region, so a ThrottlingException there
+could only be retried, after a backoff sleep, against the same region.
+With BEDROCK_ENDPOINTS set, each request goes to the best endpoint at that
+moment:
+
+  healthy   not in a throttle cooldown (COOLDOWN doubled per consecutive
+            throttle, up to MAX_COOLDOWN; one success resets it)
+  score     (in-flight + 1) × EWMA latency: the expected wait behind the
+            requests already running there. An endpoint with no latency
+            sample yet scores as the fastest known, so it gets tried
+
+A throttled endpoint goes into cooldown, and the request moves on to the next
+endpoint right away. RateLimitError (and FallbackHandler's backoff) happens
+only once every endpoint has throttled that request. When every endpoint is
+cooling down, the one closest to recovery is still tried: with a single
+endpoint, behaviour is the same as before the pool existed.
+
+Streams and plain calls keep separate EWMAs, and each request is scored with
+its own kind's: for a stream the latency is the time to the response headers
+(invoke_model_with_response_stream returning), for invoke_model the whole
+generation. Mixing them would let a few long non-streaming calls make a
+healthy region look 10-100x slower to streams. State is per worker.
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+COOLDOWN = 30.0  # seconds, first throttle
+MAX_COOLDOWN = 300.0
+EWMA_ALPHA = 0.2
+
+STREAM = "stream"  # latency kinds: time to the stream's response headers ...
+INVOKE = "invoke"  # ... and a whole invoke_model call
+
+# Cross-region inference profile prefix per region family (model IDs are mapped with "us.")
+INFERENCE_PREFIXES = {"us": "us", "eu": "eu", "ap": "apac"}
+
+
+class BedrockEndpoint:
+    """One region (+ optional AWS profile) and its live routing state."""
+
+    def __init__(self, region: str, profile: Optional[str] = None, client: Any = None):
+        self.region = region
+        self.profile = profile  # None = the provider's managed default session
+        self.name = f"{profile}@{region}" if profile else region
+        self.client = client
+        self.in_flight = 0
+        self.ewma_ms: Dict[str, float] = {}  # latency kind → EWMA (ms)
+        self.cooldown_until = 0.0
+        self.consecutive_throttles = 0
+        self.requests = 0
+        self.throttles = 0
+
+    def model_id(self, model_id: str) -> str:
+        """`model_id` with its inference profile prefix matching this endpoint's region."""
+        prefix = INFERENCE_PREFIXES.get(self.region.split("-", 1)[0])
+        if prefix and model_id.startswith("us.") and prefix != "us":
+            return f"{prefix}.{model_id[3:]}"
+        return model_id
+
+
+def parse_endpoints(specs: Iterable[str], default_region: str) -> List[BedrockEndpoint]:
+    """BEDROCK_ENDPOINTS entries ("us-east-1", "profile@us-east-2") → endpoints; default: one, default_region."""
+    endpoints = []
+    for spec in specs:
+        profile, _, region = spec.rpartition("@")
+        endpoints.append(BedrockEndpoint(region.strip(), profile.strip() or None))
+    return endpoints or [BedrockEndpoint(default_region)]
+
+
+class EndpointPool:
+    """Least-loaded healthy endpoint selection with throttle cooldowns."""
+
+    def __init__(self, endpoints: List[BedrockEndpoint], cooldown: float = COOLDOWN,
+                 max_cooldown: float = MAX_COOLDOWN, alpha: float = EWMA_ALPHA):
+        self.endpoints = endpoints
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.alpha = alpha
+        self._lock = threading.Lock()  # latency samples land from stream worker threads
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def __iter__(self):
+        return iter(self.endpoints)
+
+    def pick(self, exclude: Iterable[BedrockEndpoint] = (), kind: str = STREAM) -> Optional[BedrockEndpoint]:
+        """Best endpoint not in `exclude` for a `kind` call: least expected wait among healthy ones,
+        else nearest recovery."""
+        candidates = [e for e in self.endpoints if e not in exclude]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [e for e in candidates if e.cooldown_until <= now]
+        if not healthy:
+            return min(candidates, key=lambda e: e.cooldown_until)
+        known = [e.ewma_ms[kind] for e in self.endpoints if kind in e.ewma_ms]
+        optimistic = min(known) if known else 1.0
+        return min(healthy, key=lambda e: (e.in_flight + 1) * e.ewma_ms.get(kind, optimistic))
+
+    def start(self, endpoint: BedrockEndpoint) -> None:
+        endpoint.in_flight += 1
+        endpoint.requests += 1
+
+    def finish(self, endpoint: BedrockEndpoint) -> None:
+        endpoint.in_flight -= 1
+
+    def record_latency(self, endpoint: BedrockEndpoint, latency_ms: float, kind: str = STREAM) -> None:
+        """A successful `kind` call took `latency_ms`: update that EWMA, end any cooldown."""
+        with self._lock:
+            ewma = endpoint.ewma_ms.get(kind)
+            endpoint.ewma_ms[kind] = latency_ms if ewma is None else ewma + self.alpha * (latency_ms - ewma)
+            endpoint.consecutive_throttles = 0
+            endpoint.cooldown_until = 0.0
+
+    def throttled(self, endpoint: BedrockEndpoint) -> float:
+        """Put `endpoint` in cooldown after a throttle; returns the cooldown in seconds."""
+        with self._lock:
+            endpoint.throttles += 1
+            endpoint.consecutive_throttles += 1
+            seconds = min(self.max_cooldown, self.cooldown * 2 ** (endpoint.consecutive_throttles - 1))
+            endpoint.cooldown_until = time.monotonic() + seconds
+        return seconds
+
+    def retry_after(self) -> int:
+        """Seconds until the first endpoint leaves cooldown (0 if one is healthy)."""
+        soonest = min(e.cooldown_until for e in self.endpoints) - time.monotonic()
+        return max(0, int(soonest + 0.999))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            e.name: {
+                "region": e.region,
+                "healthy": e.cooldown_until <= now,
+                "cooldown_remaining_s": round(max(0.0, e.cooldown_until - now), 1),
+                "in_flight": e.in_flight,
+                "ewma_first_byte_ms": round(e.ewma_ms[STREAM], 1) if STREAM in e.ewma_ms else None,
+                "ewma_invoke_ms": round(e.ewma_ms[INVOKE], 1) if INVOKE in e.ewma_ms else None,
+                "requests": e.requests,
+                "throttles": e.throttles,
+            }
+            for e in self.endpoints
+        }
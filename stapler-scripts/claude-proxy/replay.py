@@ -0,0 +1,260 @@
+"""Rebuild request bodies from local Claude Code transcripts (see `bench.py replay`).
+
+Claude Code writes one JSONL file per session under ~/.claude/projects/<project>/.
+Every assistant entry carries the API message id, so the request that produced
+it is the conversation up to that point: all user / assistant turns since the
+session start (or the last compact boundary), ending with the user turn that
+triggered it. One assistant message is often split over several entries (one
+per content block); entries sharing a message id are merged back together.
+
+What the transcript does not record — system prompt, tool definitions,
+max_tokens — is not reconstructed; only `messages` is replayed. Thinking
+blocks are dropped (their signatures can't survive anonymization) and
+images / documents become a short text placeholder.
+
+Anonymization is deterministic and structure-preserving so compression
+behaves as it would on the real text: every word maps to a pronounceable
+pseudo-word of the same length and case pattern (the same word always maps to
+the same pseudo-word), digit runs map to digit runs, and punctuation,
+whitespace, JSON keys, tool names and ids are kept. A short list of common
+English / code words (KEEP_WORDS) is left as is.
+"""
+import hashlib
+import json
+import os
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_PROJECTS_DIR = os.path.expanduser("~/.claude/projects")
+
+KEEP_WORDS = frozenset("""
+    a an and are as at be but by can def do does else false for from has have if import in is it
+    its let new no none not null of on or return self so that the then there this to true was
+    we were what when which will with you class const function var error file line test
+""".split())
+
+# Content block fields that carry structure, not user text
+_STRUCTURAL_KEYS = frozenset({"type", "id", "tool_use_id", "name", "is_error", "cache_control"})
+
+_TOKEN_RE = re.compile(r"[A-Za-z]+|[0-9]+")
+_CONSONANTS = "bcdfghjklmnprstvwz"
+_VOWELS = "aeiou"
+
+
+class Anonymizer:
+    """Deterministic, length- and case-preserving word substitution (per salt)."""
+
+    def __init__(self, salt: str = ""):
+        self.salt = salt
+        self._words: Dict[str, str] = {}
+
+    def _digest(self, word: str, length: int) -> bytes:
+        out = b""
+        counter = 0
+        while len(out) < length:
+            out += hashlib.blake2b(f"{self.salt}\0{counter}\0{word}".encode(), digest_size=32).digest()
+            counter += 1
+        return out[:length]
+
+    def _pseudo(self, word: str) -> str:
+        key = word.lower()
+        if key in KEEP_WORDS:
+            return word
+        mapped = self._words.get(key)
+        if mapped is None:
+            digest = self._digest(key, len(key))
+            if key.isdigit():
+                mapped = "".join(str(b % 10) for b in digest)
+            else:
+                # Alternate consonants and vowels so pseudo-words tokenize like words, not noise
+                mapped = "".join(
+                    (_CONSONANTS if i % 2 == 0 else _VOWELS)[b % (len(_CONSONANTS) if i % 2 == 0 else len(_VOWELS))]
+                    for i, b in enumerate(digest)
+                )
+            self._words[key] = mapped
+        return "".join(m.upper() if c.isupper() else m for c, m in zip(word, mapped))
+
+    def text(self, value: str) -> str:
+        return _TOKEN_RE.sub(lambda m: self._pseudo(m.group(0)), value)
+
+    def value(self, value: Any) -> Any:
+        """Anonymize every string inside a JSON value (dict keys are kept)."""
+        if isinstance(value, str):
+            return self.text(value)
+        if isinstance(value, list):
+            return [self.value(v) for v in value]
+        if isinstance(value, dict):
+            return {k: self.value(v) for k, v in value.items()}
+        return value
+
+
+def _clean_block(block: Any, anonymizer: Optional[Anonymizer]) -> Optional[Any]:
+    """One content block as it would be re-sent upstream, or None to drop it."""
+    if not isinstance(block, dict):
+        return block
+    kind = block.get("type")
+    if kind in ("thinking", "redacted_thinking"):
+        return None
+    if kind in ("image", "document"):
+        return {"type": "text", "text": f"[{kind}]"}
+    out = {}
+    for key, value in block.items():
+        if key in ("signature", "citations"):
+            continue
+        if key == "content" and isinstance(value, list):
+            # tool_result content is itself a list of blocks
+            value = clean_content(value, anonymizer)
+        elif key not in _STRUCTURAL_KEYS and anonymizer is not None:
+            value = anonymizer.value(value)
+        out[key] = value
+    return out
+
+
+def clean_content(content: Any, anonymizer: Optional[Anonymizer] = None) -> Any:
+    """Message content (string or block list) with dropped blocks removed and text anonymized."""
+    if isinstance(content, str):
+        return anonymizer.text(content) if anonymizer is not None else content
+    if not isinstance(content, list):
+        return content
+    return [b for b in (_clean_block(block, anonymizer) for block in content) if b is not None]
+
+
+def _as_blocks(content: Any) -> List[Any]:
+    return [{"type": "text", "text": content}] if isinstance(content, str) else list(content)
+
+
+@dataclass
+class ReplayRequest:
+    session_id: str
+    index: int  # position within the session
+    timestamp: float  # epoch seconds the request was sent (its triggering user turn)
+    model: str
+    messages: List[Dict[str, Any]]
+
+
+@dataclass
+class Session:
+    session_id: str
+    project: str
+    path: str
+    requests: List[ReplayRequest] = field(default_factory=list)
+
+
+def _parse_ts(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def load_session(path: str, anonymizer: Optional[Anonymizer] = None,
+                 max_requests: Optional[int] = None) -> Session:
+    """Reconstruct every main-thread request in one transcript file.
+
+    Sidechain (subagent) entries and synthetic assistant messages (client-side
+    API error placeholders) are skipped; a compact boundary starts a fresh
+    conversation, as it does in the client.
+    """
+    p = Path(path)
+    project = p.parent.name
+    session = Session(session_id=p.stem, project=anonymizer.text(project) if anonymizer else project, path=str(p))
+    messages: List[Dict[str, Any]] = []
+    current_id: Optional[str] = None
+    current_idx: Optional[int] = None  # position of the current response in `messages`
+    slot = 0  # where it goes if its first blocks were all dropped
+    last_user_ts: Optional[float] = None
+
+    with open(p, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(entry, dict) or entry.get("isSidechain"):
+                continue
+            kind = entry.get("type")
+            if kind == "system" and entry.get("subtype") == "compact_boundary":
+                messages, current_id, current_idx = [], None, None
+                continue
+            message = entry.get("message")
+            if kind not in ("user", "assistant") or not isinstance(message, dict):
+                continue
+            ts = _parse_ts(entry.get("timestamp"))
+            content = clean_content(message.get("content", ""), anonymizer)
+
+            if kind == "user":
+                last_user_ts = ts or last_user_ts
+                if messages and messages[-1]["role"] == "user":
+                    # Consecutive user entries (parallel tool results, hook output) are one turn
+                    messages[-1] = {"role": "user", "content": _as_blocks(messages[-1]["content"]) + _as_blocks(content)}
+                else:
+                    messages.append({"role": "user", "content": content})
+                continue
+
+            if message.get("model") == "<synthetic>":
+                continue
+            message_id = message.get("id")
+            if message_id and message_id == current_id:
+                # Later block of the same response; tool results may already have been logged after it
+                blocks = _as_blocks(content)
+                if current_idx is None:
+                    if blocks:
+                        current_idx = slot
+                        messages.insert(slot, {"role": "assistant", "content": blocks})
+                elif blocks:
+                    messages[current_idx] = {"role": "assistant", "content": messages[current_idx]["content"] + blocks}
+                continue
+            current_id, current_idx, slot = message_id, None, len(messages)
+            if messages and messages[-1]["role"] == "user":
+                if max_requests is not None and len(session.requests) >= max_requests:
+                    break
+                session.requests.append(ReplayRequest(
+                    session_id=session.session_id,
+                    index=len(session.requests),
+                    timestamp=last_user_ts or ts or 0.0,
+                    model=message.get("model", "unknown"),
+                    messages=list(messages),
+                ))
+            blocks = _as_blocks(content)
+            if blocks:
+                current_idx = len(messages)
+                messages.append({"role": "assistant", "content": blocks})
+    return session
+
+
+def discover_sessions(root: Optional[str] = None, project: Optional[str] = None,
+                      limit: Optional[int] = None) -> List[Path]:
+    """Session transcripts under `root`, newest first, optionally filtered by project substring."""
+    base = Path(root or DEFAULT_PROJECTS_DIR)
+    paths = [p for p in base.glob("*/*.jsonl") if project is None or project in p.parent.name]
+    paths.sort(key=lambda p: p.stat().st_mtime, reverse=True)
+    return paths[:limit] if limit else paths
+
+
+def schedule(sessions: List[Session], speed: float = 1.0,
+             max_gap: Optional[float] = 30.0) -> List[Tuple[float, ReplayRequest]]:
+    """All requests on one timeline as (send offset in seconds, request).
+
+    Original inter-arrival gaps across all sessions are kept (so sessions that
+    overlapped still overlap), each capped at `max_gap` seconds of idle time and
+    then divided by `speed`. speed <= 0 puts every offset at 0 — the caller
+    sends back to back.
+    """
+    requests = sorted((r for s in sessions for r in s.requests), key=lambda r: r.timestamp)
+    plan: List[Tuple[float, ReplayRequest]] = []
+    offset = 0.0
+    previous: Optional[float] = None
+    for request in requests:
+        if previous is not None and speed > 0:
+            gap = max(0.0, request.timestamp - previous)
+            if max_gap is not None:
+                gap = min(gap, max_gap)
+            offset += gap / speed
+        previous = request.timestamp
+        plan.append((offset, request))
+    return plan
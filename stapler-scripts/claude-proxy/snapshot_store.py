@@ -0,0 +1,226 @@
+"""Byte-budgeted, compressed request-body snapshots for /requests/{id}.
+
+Each /v1/messages request stores its body twice (original, and compressed
+when the compactor ran) so the dashboard can show what was sent. Claude Code
+bodies run to megabytes, so holding the dicts themselves pins hundreds of MB
+per worker. SnapshotStore instead keeps each snapshot as compressed JSON
+bytes and bounds the total by size:
+
+  put()   hands the body to a single background thread that serializes it
+          (or takes the raw request bytes as-is) and compresses it — zstd
+          when `zstandard` is installed, zlib otherwise — so the event loop
+          only pays for a submit. Snapshots are dropped, not queued without
+          bound, when the thread falls behind.
+  budget  oldest snapshots are evicted once the compressed total exceeds
+          REQUEST_SNAPSHOT_MAX_BYTES; with REQUEST_SNAPSHOT_SPILL_BYTES set
+          they move to a per-worker mmap'd ring instead and are only lost
+          when the ring wraps over them. The ring's file is unlinked as soon
+          as it is mapped, so a worker that dies leaves nothing behind.
+  get()   decompresses on demand (call it off the loop for large bodies) and
+          returns the JSON bytes, ready to send without re-encoding.
+"""
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, NamedTuple, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional: zlib is always available
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDING = 8  # snapshots waiting for the encoder thread before new ones are dropped
+
+
+class _Entry(NamedTuple):
+    codec: str
+    raw_len: int
+    blob: Optional[bytes]      # in memory, or None when spilled
+    offset: int = 0            # spill ring location
+    length: int = 0
+
+
+class _Codec:
+    """zstd when available, zlib otherwise; decodes whatever an entry was written with."""
+
+    def __init__(self):
+        self.name = "zstd" if zstandard is not None else "zlib"
+        self._local = threading.local()  # zstd (de)compressor objects are not thread-safe
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            if not hasattr(self._local, "c"):
+                self._local.c = zstandard.ZstdCompressor(level=3)
+            return self._local.c.compress(data)
+        return zlib.compress(data, 1)
+
+    def decompress(self, codec: str, blob: bytes) -> bytes:
+        if codec == "zstd":
+            if not hasattr(self._local, "d"):
+                self._local.d = zstandard.ZstdDecompressor()
+            return self._local.d.decompress(blob)
+        return zlib.decompress(blob)
+
+
+class SpillRing:
+    """Fixed-size mmap'd file written round-robin; a write invalidates the entries it overlaps.
+
+    The file is created (mkstemp: unique name, owner-only, never follows a
+    symlink) in `directory` and unlinked once mapped; the mapping keeps its pages.
+    """
+
+    def __init__(self, directory: str, size: int):
+        self.size = size
+        os.makedirs(directory, exist_ok=True)
+        fd, path = tempfile.mkstemp(prefix="snapshots.", suffix=".ring", dir=directory)
+        try:
+            os.unlink(path)
+            os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._pos = 0
+
+    def write(self, blob: bytes) -> int:
+        """Copy `blob` in at the write position (wrapping to 0 if it doesn't fit); returns its offset."""
+        if self._pos + len(blob) > self.size:
+            self._pos = 0
+        offset = self._pos
+        self._map[offset:offset + len(blob)] = blob
+        self._pos += len(blob)
+        return offset
+
+    def next_region(self, length: int) -> tuple:
+        """[start, end) the next write of `length` bytes will occupy."""
+        start = 0 if self._pos + length > self.size else self._pos
+        return start, start + length
+
+    def read(self, offset: int, length: int) -> bytes:
+        return self._map[offset:offset + length]
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class SnapshotStore:
+    """Compressed request-body snapshots keyed by (request_id, stage), bounded by total bytes."""
+
+    def __init__(self, max_bytes: int, spill_dir: Optional[str] = None, spill_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self._codec = _Codec()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()  # in memory, oldest first
+        self._spilled: "OrderedDict[str, _Entry]" = OrderedDict()  # in the ring, oldest first
+        self._bytes = 0
+        self._raw_bytes = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.dropped = 0
+        self.evicted = 0
+        self._ring: Optional[SpillRing] = None
+        if spill_bytes > 0 and spill_dir:
+            try:
+                self._ring = SpillRing(spill_dir, spill_bytes)
+            except OSError as e:
+                logger.warning(f"Request snapshot spill ring in {spill_dir} unavailable ({e}) — memory only")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+
+    def put(self, request_id: str, stage: str, body: Any = None, raw: Optional[bytes] = None) -> bool:
+        """Queue a snapshot (from the event loop). Pass the request's raw JSON bytes as `raw` when
+        the body is unchanged from the wire; otherwise `body` is serialized on the encoder thread.
+        Returns False if the encoder is behind and the snapshot was dropped."""
+        with self._lock:
+            if self._pending >= MAX_PENDING:
+                self.dropped += 1
+                return False
+            self._pending += 1
+        self._executor.submit(self._encode, f"{request_id}:{stage}", body, raw)
+        return True
+
+    def _encode(self, key: str, body: Any, raw: Optional[bytes]) -> None:
+        try:
+            data = raw if raw is not None else json.dumps(body, separators=(",", ":")).encode()
+            blob = self._codec.compress(data)
+            with self._lock:
+                self._drop(key)
+                self._entries[key] = _Entry(self._codec.name, len(data), blob)
+                self._bytes += len(blob)
+                self._raw_bytes += len(data)
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    self._evict_oldest()
+        except Exception as e:
+            logger.warning(f"Request snapshot {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _drop(self, key: str) -> None:
+        """Forget `key` (re-stored stage); caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.blob)
+            self._raw_bytes -= entry.raw_len
+        self._spilled.pop(key, None)
+
+    def _evict_oldest(self) -> None:
+        """Move the oldest in-memory snapshot to the spill ring, or discard it; caller holds the lock."""
+        key, entry = self._entries.popitem(last=False)
+        self._bytes -= len(entry.blob)
+        self._raw_bytes -= entry.raw_len
+        ring = self._ring
+        if ring is None or len(entry.blob) > ring.size:
+            self.evicted += 1
+            return
+        start, end = ring.next_region(len(entry.blob))
+        overwritten = [k for k, old in self._spilled.items() if old.offset < end and old.offset + old.length > start]
+        for k in overwritten:
+            del self._spilled[k]
+        self.evicted += len(overwritten)
+        offset = ring.write(entry.blob)
+        self._spilled[key] = entry._replace(blob=None, offset=offset, length=len(entry.blob))
+
+    def get(self, request_id: str, stage: str = "original") -> Optional[bytes]:
+        """Decompressed JSON bytes of a snapshot, or None if never stored / evicted."""
+        key = f"{request_id}:{stage}"
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                blob = entry.blob
+            else:
+                entry = self._spilled.get(key)
+                if entry is None:
+                    return None
+                blob = self._ring.read(entry.offset, entry.length)  # copy, safe once unlocked
+        return self._codec.decompress(entry.codec, blob)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Wait for queued snapshots to be stored."""
+        self._executor.submit(lambda: None).result(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "codec": self._codec.name,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "uncompressed_bytes": self._raw_bytes,
+                "ratio": round(self._raw_bytes / self._bytes, 2) if self._bytes else 0.0,
+                "spilled_entries": len(self._spilled),
+                "spill_bytes": self._ring.size if self._ring else 0,
+                "pending": self._pending,
+                "dropped": self.dropped,
+                "evicted": self.evicted,
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        if self._ring is not None:
+            self._ring.close()
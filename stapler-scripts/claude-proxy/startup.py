@@ -0,0 +1,284 @@
+"""Worker startup: timing, memory, import-time profile, preload-then-fork serving.
+
+Every uvicorn worker imports FastAPI, httpx, boto3/botocore, diskcache, ...
+and builds its providers when it imports main. With WORKERS = cpu_count()
+that cost, in both time and RSS, is paid once per worker. This module
+measures it and offers a way to share part of it:
+
+  marks         milliseconds since this worker started: "imports" (main's
+                import block), "app" (main's module body: providers, metrics,
+                routes) and "ready" (lifespan startup done). /metrics → startup
+  memory        RSS, plus on Linux PSS and shared / private pages
+                (/proc/self/smaps_rollup), and the peak RSS. PSS is what each
+                worker really costs once shared pages are split among the
+                processes mapping them
+  imports       `python startup.py [module] [--top N]`: runs `python -X
+                importtime -c "import main"` and reports the time spent per
+                top-level package and the slowest modules
+  preload       PRELOAD_WORKERS=1 `python main.py`: the supervisor imports the
+                heavy third-party packages once, freezes the GC (so collections
+                don't write to and unshare those pages), binds the socket and
+                forks the workers. Workers share those pages copy-on-write
+                and skip the imports. Each worker still imports main and builds
+                its own providers, caches and threads: none of those survive
+                a fork. SIGHUP starts a new set of workers and stops the old
+                ones RELOAD_GRACE later; a worker that dies is replaced
+
+Without PRELOAD_WORKERS (or with WORKERS=1, or without os.fork) `python
+main.py` runs uvicorn's own multi-worker supervisor as before.
+"""
+import argparse
+import gc
+import importlib
+import logging
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import config
+
+logger = logging.getLogger("uvicorn.error")  # the supervisor's log; uvicorn configures it
+
+# Third-party packages every worker imports; safe to import before a fork (no threads, sockets or files)
+PRELOAD_MODULES = (
+    "fastapi", "fastapi.responses", "starlette.routing", "pydantic", "anyio", "httpx", "diskcache",
+    "opentelemetry.trace", "openfeature.api", "claw_compactor.fusion.engine",
+)
+BEDROCK_PRELOAD_MODULES = ("boto3", "botocore.session", "botocore.config", "botocore.exceptions", "aws_sso_lib")
+
+RELOAD_GRACE = 5.0  # seconds new workers get to start before a SIGHUP stops the old ones
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$")
+
+_started = time.perf_counter()
+_marks: Dict[str, float] = {}
+_preload: Dict[str, Any] = {"enabled": False, "ms": 0.0, "modules": 0}
+
+
+def mark(name: str) -> None:
+    """Record that this worker reached `name` (ms since it started)."""
+    _marks[name] = round((time.perf_counter() - _started) * 1000, 1)
+
+
+def worker_started() -> None:
+    """Restart the clock in a freshly forked worker (the module was imported by the supervisor)."""
+    global _started
+    _started = time.perf_counter()
+    _marks.clear()
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+def memory() -> Dict[str, float]:
+    """This process's memory in MiB: rss and peak_rss, plus pss / shared / private where /proc has them."""
+    mib = 1024 * 1024
+    result = {"peak_rss_mb": round(_peak_rss_bytes() / mib, 1)}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            fields = {}
+            for line in f:
+                name, _, value = line.partition(":")
+                if value.strip().endswith("kB"):
+                    fields[name] = int(value.split()[0]) * 1024
+    except OSError:
+        return result
+    result["rss_mb"] = round(fields.get("Rss", 0) / mib, 1)
+    result["pss_mb"] = round(fields.get("Pss", 0) / mib, 1)
+    result["shared_mb"] = round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / mib, 1)
+    result["private_mb"] = round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / mib, 1)
+    return result
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "pid": os.getpid(),
+        "preloaded": _preload["enabled"],
+        "preload_ms": _preload["ms"],
+        "startup_ms": dict(_marks),
+        "uptime_s": round(time.perf_counter() - _started, 1),
+        "memory": memory(),
+    }
+
+
+# -- Import-time profile ------------------------------------------------------
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int, int]]:
+    """`-X importtime` stderr → [(module, self µs, cumulative µs, depth)]."""
+    entries = []
+    for line in output.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            entries.append((match.group(4), int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2))
+    return entries
+
+
+def import_profile(module: str = "main") -> List[Tuple[str, int, int, int]]:
+    """Import `module` in a fresh interpreter under -X importtime (module-level code runs, as in a worker)."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, timeout=300,
+    )
+    entries = parse_importtime(proc.stderr)
+    if proc.returncode != 0 and not entries:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    return entries
+
+
+def format_import_profile(entries: Sequence[Tuple[str, int, int, int]], module: str = "main", top: int = 15) -> str:
+    roots = [cumulative for name, _, cumulative, depth in entries if depth == 0 and name == module]
+    total = roots[0] if roots else sum(cumulative for _, _, cumulative, depth in entries if depth == 0)
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _, _ in entries:
+        packages[name.split(".")[0]] += self_us
+    lines = [f"import {module}: {total / 1000:.1f}ms ({len(entries)} modules)", "", "by top-level package (self time):"]
+    for name, self_us in sorted(packages.items(), key=lambda item: -item[1])[:top]:
+        lines.append(f"  {self_us / 1000:8.1f}ms  {100 * self_us / max(total, 1):5.1f}%  {name}")
+    lines += ["", "slowest modules (self time; module-level code included):"]
+    for name, self_us, cumulative, _ in sorted(entries, key=lambda e: -e[1])[:top]:
+        lines.append(f"  {self_us / 1000:8.1f}ms  (cumulative {cumulative / 1000:.1f}ms)  {name}")
+    return "\n".join(lines)
+
+
+# -- Preload-then-fork --------------------------------------------------------
+
+def preload(modules: Sequence[str]) -> Dict[str, float]:
+    """Import `modules` (skipping ones that aren't installed); returns ms per module."""
+    timings = {}
+    for name in modules:
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+        timings[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return timings
+
+
+def serve(host: str = "127.0.0.1", port: Optional[int] = None, workers: Optional[int] = None) -> None:
+    """Run the proxy: preload-then-fork with PRELOAD_WORKERS=1, else uvicorn's supervisor."""
+    import uvicorn
+
+    port = port or config.PROXY_PORT
+    workers = workers or config.WORKERS
+    if config.PRELOAD_WORKERS and workers > 1 and hasattr(os, "fork"):
+        _serve_preforked(host, port, workers)
+        return
+    # Note: workers > 1 requires passing app as import string
+    # Each worker gets its own process and event loop
+    uvicorn.run(
+        "main:app",  # Import string required for multi-worker mode
+        host=host,
+        port=port,
+        workers=workers,
+        log_level="info",
+        loop="asyncio",
+        access_log=True,
+    )
+
+
+def _serve_preforked(host: str, port: int, workers: int) -> None:
+    import uvicorn
+
+    uv_config = uvicorn.Config("main:app", host=host, port=port, log_level="info", loop="asyncio", access_log=True)
+    t0 = time.perf_counter()
+    modules = PRELOAD_MODULES + (BEDROCK_PRELOAD_MODULES if config.BEDROCK_ENABLED else ())
+    timings = preload(modules)
+    _preload.update(enabled=True, ms=round((time.perf_counter() - t0) * 1000, 1), modules=len(timings))
+    logger.info(f"Preloaded {len(timings)} modules in {_preload['ms']}ms: "
+                + ", ".join(f"{name}={ms}ms" for name, ms in timings.items()))
+    sock = uv_config.bind_socket()
+    gc.freeze()  # keep the collector from touching (and unsharing) the preloaded objects
+
+    children: Dict[int, bool] = {}  # pid → replace when it exits
+    retiring: Dict[int, float] = {}  # old worker pid → when to stop it (after a SIGHUP)
+    state = {"stopping": False}
+
+    def spawn() -> None:
+        sys.stdout.flush()
+        sys.stderr.flush()  # or the child inherits, and later writes, the supervisor's buffered output
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(uv_config, sock)
+        children[pid] = True
+
+    def stop(signum, _frame) -> None:
+        state["stopping"] = True
+        retiring.clear()
+        for pid in list(children):
+            _kill(pid, signal.SIGTERM)
+
+    def reload(_signum, _frame) -> None:
+        old = list(children)
+        logger.info(f"SIGHUP: starting {workers} new workers, stopping {len(old)} old ones in {RELOAD_GRACE:.0f}s")
+        for _ in range(workers):
+            spawn()
+        for pid in old:
+            children[pid] = False
+            retiring[pid] = time.monotonic() + RELOAD_GRACE
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGHUP, reload)
+    for _ in range(workers):
+        spawn()
+    logger.info(f"Supervisor {os.getpid()} serving http://{host}:{port} with {workers} preforked workers")
+
+    while children:
+        for pid, at in list(retiring.items()):
+            if at <= time.monotonic():
+                del retiring[pid]
+                _kill(pid, signal.SIGTERM)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        replace = children.pop(pid, False)
+        if replace and not state["stopping"]:
+            logger.warning(f"Worker {pid} exited (status {status}); starting a replacement")
+            time.sleep(1)  # don't spin on a worker that can't start
+            spawn()
+    sock.close()
+
+
+def _kill(pid: int, signum: int) -> None:
+    try:
+        os.kill(pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+def _run_worker(uv_config, sock) -> None:
+    """Forked worker: import main (the app) and serve on the inherited socket; never returns."""
+    import uvicorn
+
+    worker_started()
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        signal.signal(signum, signal.SIG_DFL)  # uvicorn installs its own INT / TERM handlers
+    code = 0
+    try:
+        uvicorn.Server(uv_config).run(sockets=[sock])
+    except BaseException:
+        logger.exception(f"Worker {os.getpid()} failed")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of a claude-proxy module")
+    parser.add_argument("module", nargs="?", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+    print(format_import_profile(import_profile(args.module), args.module, args.top))
@@ -0,0 +1,190 @@
+"""Mid-stream resumption for SSE responses.
+
+Once the first chunk of a stream has been forwarded to the client, FallbackHandler
+can no longer restart the request on another provider — the client would receive
+a second message_start and duplicated content. Instead, StreamAccumulator tracks
+the assistant content already emitted. On a mid-stream failure it builds a
+continuation request with that partial assistant turn prefilled. StreamStitcher
+then rewrites the continuation's events so they read as one uninterrupted stream:
+
+- the continuation's message_start is dropped (the client already has one)
+- block indices are shifted so they follow on from the blocks already emitted
+- if the failure happened inside a text block, the continuation's first text
+  block is merged into it (its content_block_start is dropped)
+
+Only text content can be resumed. A partial tool_use input or thinking block
+cannot be prefilled, so those streams fail with the original error as before.
+"""
+import copy
+import json
+from typing import Dict, Any, List, Optional
+
+
+def parse_sse_event(chunk: str) -> Optional[Dict[str, Any]]:
+    """Parse a 'data: {...}' SSE chunk into its JSON payload (None if not JSON data)."""
+    raw = chunk.strip()
+    if not raw.startswith("data: "):
+        return None
+    try:
+        event = json.loads(raw[6:])
+    except (ValueError, TypeError):
+        return None
+    return event if isinstance(event, dict) else None
+
+
+def format_sse_event(event: Dict[str, Any]) -> str:
+    """Serialize an event back into the 'data: {...}' chunk format providers emit."""
+    return f"data: {json.dumps(event)}\n\n"
+
+
+class StreamInterrupted(Exception):
+    """Raised when a stream fails after chunks have already been sent to the client."""
+
+    def __init__(self, provider_name: str, cause: Exception, accumulator: Optional["StreamAccumulator"]):
+        super().__init__(f"{provider_name} stream interrupted: {cause}")
+        self.provider_name = provider_name
+        self.cause = cause
+        self.accumulator = accumulator
+
+
+class StreamAccumulator:
+    """Records the assistant content emitted so far in one streamed response."""
+
+    def __init__(self):
+        self.message_started = False
+        self.message_stopped = False
+        self.blocks: Dict[int, Dict[str, Any]] = {}  # index -> {"type", "text", "closed"}
+        self.unresumable_reason: Optional[str] = None
+        self.resumed_by: Optional[str] = None  # provider that completed the stream, if resumed
+        self.resumed_usage: Optional[Dict[str, Any]] = None  # its message_start usage (prompt-cache counts)
+
+    def feed(self, chunk: str) -> Optional[Dict[str, Any]]:
+        """Record one outgoing chunk. Returns the parsed event (None for non-JSON chunks)."""
+        event = parse_sse_event(chunk)
+        if event is None:
+            return None
+        etype = event.get("type")
+        if etype == "message_start":
+            self.message_started = True
+        elif etype == "message_stop":
+            self.message_stopped = True
+        elif etype == "content_block_start":
+            block = event.get("content_block") or {}
+            btype = block.get("type", "unknown")
+            self.blocks[event.get("index", len(self.blocks))] = {
+                "type": btype,
+                "text": block.get("text", "") if btype == "text" else "",
+                "closed": False,
+            }
+            if btype != "text":
+                self.unresumable_reason = f"{btype} block in progress"
+        elif etype == "content_block_delta":
+            block = self.blocks.get(event.get("index"))
+            delta = event.get("delta") or {}
+            if block is not None and delta.get("type") == "text_delta":
+                block["text"] += delta.get("text", "")
+        elif etype == "content_block_stop":
+            block = self.blocks.get(event.get("index"))
+            if block is not None:
+                block["closed"] = True
+        return event
+
+    @property
+    def open_index(self) -> Optional[int]:
+        """Index of the block that was still open when the stream died, if any."""
+        for index, block in self.blocks.items():
+            if not block["closed"]:
+                return index
+        return None
+
+    @property
+    def next_index(self) -> int:
+        """First block index not yet used by the client."""
+        return max(self.blocks) + 1 if self.blocks else 0
+
+    def emitted_text(self) -> str:
+        """All assistant text emitted so far, in block order."""
+        return "".join(self.blocks[i]["text"] for i in sorted(self.blocks))
+
+    def can_resume(self, body: Dict[str, Any]) -> bool:
+        """Whether the partial turn can be continued by prefilling it."""
+        if not self.message_started or self.message_stopped:
+            return False
+        if self.unresumable_reason:
+            return False
+        # Extended thinking requires the assistant turn to start with a signed
+        # thinking block, which a text prefill cannot provide
+        if body.get("thinking"):
+            return False
+        return bool(self.emitted_text().strip())
+
+    def continuation_body(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the continuation request: the original body plus the partial assistant turn."""
+        # The API rejects a final assistant turn ending in whitespace, so the
+        # prefill is right-stripped and the stitcher drops it from the continuation
+        prefill = self.emitted_text().rstrip()
+        messages: List[Dict[str, Any]] = list(body.get("messages", []))
+        if messages and messages[-1].get("role") == "assistant":
+            # Client already prefilled the turn — the emitted text continues it
+            last = copy.deepcopy(messages[-1])
+            content = last.get("content", "")
+            if isinstance(content, str):
+                last["content"] = (content + prefill).rstrip()
+            else:
+                last["content"] = list(content) + [{"type": "text", "text": prefill}]
+            messages[-1] = last
+        else:
+            messages.append({"role": "assistant", "content": [{"type": "text", "text": prefill}]})
+        return {**body, "messages": messages}
+
+    def stitcher(self) -> "StreamStitcher":
+        """Create a stitcher that maps continuation events onto this stream."""
+        text = self.emitted_text()
+        return StreamStitcher(
+            open_index=self.open_index,
+            next_index=self.next_index,
+            trailing_whitespace=text[len(text.rstrip()):],
+        )
+
+
+class StreamStitcher:
+    """Rewrites continuation-stream events so they extend the interrupted stream."""
+
+    def __init__(self, open_index: Optional[int], next_index: int, trailing_whitespace: str = ""):
+        self.open_index = open_index
+        self.next_index = next_index
+        self.trailing_whitespace = trailing_whitespace
+        self.emitted = 0  # chunks handed to the client so far
+
+    def _map_index(self, index: int) -> int:
+        if self.open_index is not None:
+            return self.open_index + index
+        return self.next_index + index
+
+    def translate(self, chunk: str) -> Optional[str]:
+        """Return the chunk to send to the client, or None to drop it."""
+        event = parse_sse_event(chunk)
+        if event is None:
+            return None
+        etype = event.get("type")
+        if etype == "message_start":
+            return None
+
+        if "index" in event and etype in ("content_block_start", "content_block_delta", "content_block_stop"):
+            index = event["index"]
+            merging = self.open_index is not None and index == 0
+            if etype == "content_block_start" and merging:
+                # The client still has this text block open from the first attempt
+                return None
+            event = {**event, "index": self._map_index(index)}
+            if etype == "content_block_delta" and merging and self.trailing_whitespace:
+                delta = event.get("delta") or {}
+                text = delta.get("text", "")
+                if delta.get("type") == "text_delta" and text:
+                    if text.startswith(self.trailing_whitespace):
+                        text = text[len(self.trailing_whitespace):]
+                    event["delta"] = {**delta, "text": text}
+                    self.trailing_whitespace = ""
+
+        self.emitted += 1
+        return format_sse_event(event)
@@ -0,0 +1,163 @@
+"""Tests for affinity — conversations stay on the provider holding their warm prompt cache."""
+
+import json
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from affinity import ProviderAffinity, conversation_key, usage_from_chunk
+
+WARM = {"input_tokens": 12, "cache_read_input_tokens": 20000, "cache_creation_input_tokens": 300}
+COLD = {"input_tokens": 900, "cache_read_input_tokens": 0, "cache_creation_input_tokens": 0}
+
+
+def _body(turns=1, system="You are Claude Code."):
+    messages = [{"role": "user", "content": "fix the bug"}]
+    for i in range(turns - 1):
+        messages += [{"role": "assistant", "content": f"step {i}"}, {"role": "user", "content": f"ok {i}"}]
+    return {"model": "claude-sonnet-4-6", "system": system, "messages": messages}
+
+
+def _provider(name):
+    provider = MagicMock()
+    provider.name = name
+    provider.send_message = AsyncMock(return_value={"id": f"msg_{name}", "usage": WARM})
+    return provider
+
+
+@pytest.fixture
+def handler(tmp_path):
+    cooldowns = {}
+    affinity = ProviderAffinity(cache_dir=str(tmp_path), min_cached_tokens=1000)
+    with patch("fallback.diskcache.Cache") as mock_cache_cls:
+        mock_cache = MagicMock()
+        mock_cache.get.side_effect = cooldowns.get
+        mock_cache.__iter__.return_value = iter([])
+        mock_cache_cls.return_value = mock_cache
+        from fallback import FallbackHandler
+        handler = FallbackHandler([_provider("anthropic"), _provider("bedrock")], metrics=MagicMock(),
+                                  affinity=affinity)
+    handler.cooldown_entries = cooldowns
+    return handler
+
+
+def test_conversation_key_is_stable_as_the_conversation_grows():
+    assert conversation_key(_body(1)) == conversation_key(_body(5))
+    assert conversation_key(_body(1)) != conversation_key(_body(1, system="Other prompt"))
+    assert conversation_key({"model": "m", "messages": []}) is None
+
+
+def test_conversation_key_ignores_cache_control_markers():
+    marker = {"type": "ephemeral"}
+    turn1 = {"model": "claude-sonnet-4-6",
+             "system": [{"type": "text", "text": "You are Claude Code.", "cache_control": marker}],
+             "messages": [{"role": "user", "content": [{"type": "text", "text": "fix the bug", "cache_control": marker}]}]}
+    # Next turn: the client moved the marker from the first user message to the newest one
+    turn2 = {"model": "claude-sonnet-4-6",
+             "system": [{"type": "text", "text": "You are Claude Code.", "cache_control": marker}],
+             "messages": [{"role": "user", "content": [{"type": "text", "text": "fix the bug"}]},
+                          {"role": "assistant", "content": "done"},
+                          {"role": "user", "content": [{"type": "text", "text": "thanks", "cache_control": marker}]}]}
+    assert conversation_key(turn1) == conversation_key(turn2)
+    assert "cache_control" in turn1["messages"][0]["content"][0]  # the body itself is left alone
+
+
+def test_usage_from_message_start_chunk():
+    event = {"type": "message_start", "message": {"id": "msg_1", "usage": WARM}}
+    assert usage_from_chunk(f"data: {json.dumps(event)}\n\n") == WARM
+    assert usage_from_chunk('data: {"type": "ping"}\n\n') is None
+
+
+def test_affinity_pins_only_conversations_with_a_worthwhile_cache(tmp_path):
+    affinity = ProviderAffinity(cache_dir=str(tmp_path), min_cached_tokens=1000)
+    affinity.record("cold", "bedrock", COLD)
+    affinity.record("warm", "bedrock", WARM)
+    assert affinity.warm_provider("cold") is None
+    assert affinity.warm_provider("warm") == "bedrock"
+
+    affinity.record("warm", "anthropic", COLD)  # moved and its new cache is too small: unpinned
+    assert affinity.warm_provider("warm") is None
+    assert affinity.stats()["switches"] == 1
+
+
+def test_credential_is_kept_next_to_the_provider(tmp_path):
+    affinity = ProviderAffinity(cache_dir=str(tmp_path), min_cached_tokens=1000)
+    affinity.record("k", "anthropic", WARM, credential="c1")  # by AnthropicProvider
+    affinity.record("k", "anthropic", WARM)                   # then by FallbackHandler
+    assert affinity.warm_credential("k") == "c1"
+    affinity.record("k", "bedrock", WARM)
+    assert affinity.warm_provider("k") == "bedrock" and affinity.warm_credential("k") is None
+
+
+@pytest.mark.asyncio
+async def test_conversation_stays_on_warm_provider_after_cooldown_ends(handler):
+    anthropic, bedrock = handler.providers
+    body = _body(1)
+
+    # Anthropic cooling down: the conversation lands (and warms up) on Bedrock
+    handler.cooldown_entries["anthropic"] = {"until": time.time() + 60, "reason": "rate_limit"}
+    await handler.send_message(body, "token", "oauth")
+    assert bedrock.send_message.await_count == 1
+    handler.metrics.record_prompt_cache.assert_called_with("bedrock", WARM)
+
+    # Cooldown over: the grown conversation still goes to Bedrock, where its cache is
+    handler.cooldown_entries.clear()
+    result = await handler.send_message(_body(3), "token", "oauth")
+    assert result["id"] == "msg_bedrock" and anthropic.send_message.await_count == 0
+    assert handler.affinity.stats()["sticky_routes"] == 1
+
+    # A new conversation follows the normal order
+    await handler.send_message(_body(1, system="Another session"), "token", "oauth")
+    assert anthropic.send_message.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_warm_provider_in_cooldown_falls_back_as_usual(handler):
+    anthropic, bedrock = handler.providers
+    handler.affinity.record(conversation_key(_body(1)), "bedrock", WARM)
+    handler.cooldown_entries["bedrock"] = {"until": time.time() + 60, "reason": "server_error"}
+    result = await handler.send_message(_body(2), "token", "oauth")
+    assert result["id"] == "msg_anthropic"
+    assert handler.affinity.warm_provider(conversation_key(_body(1))) == "anthropic"
+
+
+@pytest.mark.asyncio
+async def test_resumed_stream_moves_the_conversation_to_the_resuming_provider(handler):
+    from providers import ServerError
+    anthropic, bedrock = handler.providers
+
+    def sse(event):
+        return f"data: {json.dumps(event)}\n\n"
+
+    def stream(usage, *texts):
+        return [sse({"type": "message_start", "message": {"id": "msg_1", "content": [], "usage": usage}}),
+                sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}})] + \
+               [sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": t}}) for t in texts]
+
+    async def dropped(*args, **kwargs):
+        for chunk in stream(COLD, "one two"):
+            yield chunk
+        raise ServerError("connection reset", 502)
+
+    async def resumed(*args, **kwargs):
+        for chunk in stream(WARM, " three") + [sse({"type": "content_block_stop", "index": 0}), sse({"type": "message_stop"})]:
+            yield chunk
+
+    anthropic.stream_message, bedrock.stream_message = dropped, resumed
+    chunks = [chunk async for chunk in handler.stream_message(_body(1), "token", "oauth")]
+
+    assert chunks[-1] == sse({"type": "message_stop"})
+    handler.metrics.record_prompt_cache.assert_called_once_with("bedrock", WARM)
+    assert handler.affinity.warm_provider(conversation_key(_body(1))) == "bedrock"
+
+
+def test_prompt_cache_read_ratio_per_provider(tmp_path):
+    from metrics import MetricsCollector
+    metrics = MetricsCollector(cache_dir=str(tmp_path))
+    metrics.record_prompt_cache("anthropic", WARM)
+    metrics.record_prompt_cache("anthropic", COLD)
+    stats = metrics.get_prompt_cache_stats()["anthropic"]
+    assert stats["responses"] == 2 and stats["read_tokens"] == 20000
+    assert stats["read_ratio"] == pytest.approx(20000 / (20000 + 300 + 912), abs=1e-4)
+    assert metrics.get_prompt_cache_stats()["bedrock"]["read_ratio"] == 0.0
@@ -0,0 +1,134 @@
+"""Tests for providers.anthropic_pool — headroom scheduling and per-credential cooldowns."""
+
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from providers import RateLimitError
+from affinity import ProviderAffinity
+from providers.anthropic_pool import CredentialPool
+
+BODY = {"model": "claude-sonnet-4-6", "max_tokens": 16, "messages": [{"role": "user", "content": "hi"}]}
+WARM = {"input_tokens": 10, "cache_read_input_tokens": 9000, "cache_creation_input_tokens": 1000}
+
+
+def _limits(remaining, limit=100, reset_in=60):
+    reset = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + reset_in))
+    return {"anthropic-ratelimit-requests-limit": str(limit), "anthropic-ratelimit-requests-remaining": str(remaining),
+            "anthropic-ratelimit-requests-reset": reset}
+
+
+def test_picks_most_headroom_per_in_flight_request(tmp_path):
+    pool = CredentialPool(["sk-ant-api-a", "sk-ant-api-b", "sk-ant-api-a"], cache_dir=str(tmp_path))
+    a, b = pool.credentials
+    assert len(pool) == 2 and a.name.startswith("api_key-") and "sk-ant" not in str(pool.stats())
+
+    pool.observe(a, _limits(80))
+    pool.observe(b, {**_limits(30), "anthropic-ratelimit-unified-5h-utilization": "0.5"})
+    assert b.headroom(time.time()) == pytest.approx(0.3)
+    assert pool.pick() is a
+    a.in_flight = 2  # 0.8 / 3 < 0.3
+    assert pool.pick() is b
+
+    pool.observe(b, _limits(0, reset_in=-1))  # window already reset: full again
+    assert b.headroom(time.time()) == 1.0
+
+
+def test_cooldowns_are_per_credential_and_shared_across_workers(tmp_path):
+    pool = CredentialPool(["sk-ant-oat-a", "sk-ant-oat-b"], cache_dir=str(tmp_path))
+    a, b = pool.credentials
+    pool.observe(a, {"anthropic-ratelimit-unified-status": "rejected",
+                     "anthropic-ratelimit-unified-reset": str(int(time.time()) + 120)})
+    assert pool.pick() is b
+
+    other_worker = CredentialPool(["sk-ant-oat-a", "sk-ant-oat-b"], cache_dir=str(tmp_path))
+    assert other_worker.pick().id == b.id
+    pool.cool_down(b, 30, "rate_limit")
+    assert other_worker.pick() is None and 25 <= other_worker.retry_after() <= 30
+
+
+def test_pinned_conversation_keeps_its_credential_until_cooldown_or_low_headroom(tmp_path):
+    pool = CredentialPool(["sk-ant-api-a", "sk-ant-api-b"], cache_dir=str(tmp_path))
+    a, b = pool.credentials
+    pool.observe(a, _limits(30))
+    pool.observe(b, _limits(80))
+    assert pool.pick() is b and pool.pick(pinned=a.id) is a  # a new conversation balances; a pinned one stays
+
+    pool.observe(a, _limits(5))  # below PIN_MIN_HEADROOM
+    assert pool.pick(pinned=a.id) is b
+    pool.observe(a, _limits(50))
+    pool.cool_down(a, 30, "rate_limit")
+    assert pool.pick(pinned=a.id) is b
+
+    pool.record_usage(b, WARM)
+    stats = pool.stats()
+    assert stats[a.name]["pinned"] == 1 and stats[b.name]["prompt_cache"]["read_ratio"] == 0.8991
+
+
+class TestProviderWithPool:
+    @pytest.fixture
+    def provider(self, tmp_path):
+        from providers.anthropic import AnthropicProvider
+        provider = AnthropicProvider()
+        provider.credentials = CredentialPool(["sk-ant-api-a", "sk-ant-api-b"], cache_dir=str(tmp_path))
+        provider.statuses = {}  # api key → status its requests get
+        provider.seen = []
+
+        def handler(request):
+            if request.url.path == "/v1/models":
+                return httpx.Response(404)
+            key = request.headers["x-api-key"]
+            provider.seen.append(key)
+            status = provider.statuses.get(key, 200)
+            if status != 200:
+                return httpx.Response(status, headers={"retry-after": "42"}, text="limited")
+            if json.loads(request.content).get("stream"):
+                return httpx.Response(200, headers=_limits(90), text='data: {"type": "message_start"}\n\n')
+            return httpx.Response(200, headers=_limits(90), json={"type": "message", "content": [], "usage": WARM})
+
+        provider.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        return provider
+
+    def test_rate_limited_credential_shifts_to_the_next(self, provider):
+        provider.statuses["sk-ant-api-a"] = 429
+        result = asyncio.run(provider.send_message(dict(BODY), "client-token", "oauth"))
+        assert result["type"] == "message" and provider.seen == ["sk-ant-api-a", "sk-ant-api-b"]
+        a, b = provider.credentials.credentials
+        assert 40 <= provider.credentials.cooldown_remaining(a) <= 42
+        assert b.headroom(time.time()) == pytest.approx(0.9) and a.in_flight == b.in_flight == 0
+
+        async def collect():
+            return [chunk async for chunk in provider.stream_message(dict(BODY), "client-token", "oauth")]
+
+        provider.seen.clear()
+        assert asyncio.run(collect()) == ['data: {"type": "message_start"}\n\n']
+        assert provider.seen == ["sk-ant-api-b"]  # a is still cooling down
+
+    def test_all_credentials_limited_raises_with_soonest_recovery(self, provider):
+        provider.statuses.update({"sk-ant-api-a": 429, "sk-ant-api-b": 429})
+        with pytest.raises(RateLimitError) as excinfo:
+            asyncio.run(provider.send_message(dict(BODY), "client-token", "oauth"))
+        assert 40 <= excinfo.value.retry_after <= 42
+
+    def test_overload_is_not_blamed_on_the_credential(self, provider):
+        provider.statuses["sk-ant-api-a"] = 529
+        with pytest.raises(RateLimitError, match="overloaded"):
+            asyncio.run(provider.send_message(dict(BODY), "client-token", "oauth"))
+        assert provider.seen == ["sk-ant-api-a"]
+        assert provider.credentials.cooldown_remaining(provider.credentials.credentials[0]) == 0
+
+    def test_conversation_stays_on_the_credential_holding_its_cache(self, provider, tmp_path):
+        provider.affinity = ProviderAffinity(cache_dir=str(tmp_path / "affinity"), min_cached_tokens=1000)
+        turn = lambda n: {**BODY, "messages": [{"role": "user", "content": "hi"}] * (2 * n - 1)}
+        asyncio.run(provider.send_message(turn(1), "client-token", "oauth"))
+        # a's response lowered its headroom below b's (untouched), but the cache is on a
+        asyncio.run(provider.send_message(turn(2), "client-token", "oauth"))
+        assert provider.seen == ["sk-ant-api-a", "sk-ant-api-a"]
+
+        asyncio.run(provider.send_message({**BODY, "system": "another conversation"}, "client-token", "oauth"))
+        assert provider.seen[-1] == "sk-ant-api-b"  # new conversations are balanced
+        a, _ = provider.credentials.credentials
+        assert provider.credentials.stats()[a.name]["prompt_cache"]["responses"] == 2
@@ -0,0 +1,127 @@
+"""Tests for providers.bedrock_pool — endpoint choice, throttle cooldowns, shifting load between regions."""
+
+import asyncio
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from botocore.exceptions import ClientError
+
+from providers import AuthenticationError, RateLimitError
+from providers.bedrock_pool import INVOKE, STREAM, BedrockEndpoint, EndpointPool, parse_endpoints
+
+THROTTLE = ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many tokens"}}, "InvokeModel")
+BODY = {"model": "claude-sonnet-4-6", "max_tokens": 16, "messages": [{"role": "user", "content": "hi"}]}
+
+
+def test_parse_endpoints():
+    endpoints = parse_endpoints(["us-east-1", "other@us-east-2"], "us-west-2")
+    assert [(e.name, e.region, e.profile) for e in endpoints] == [
+        ("us-east-1", "us-east-1", None), ("other@us-east-2", "us-east-2", "other")]
+    assert [e.name for e in parse_endpoints([], "us-west-2")] == ["us-west-2"]
+    assert BedrockEndpoint("eu-west-1").model_id("us.anthropic.claude-sonnet-4-6") == "eu.anthropic.claude-sonnet-4-6"
+    assert BedrockEndpoint("us-east-1").model_id("us.anthropic.claude-sonnet-4-6") == "us.anthropic.claude-sonnet-4-6"
+
+
+def test_picks_least_expected_wait_and_skips_cooling_endpoints():
+    west, east, eu = BedrockEndpoint("us-west-2"), BedrockEndpoint("us-east-1"), BedrockEndpoint("eu-west-1")
+    pool = EndpointPool([west, east, eu])
+    pool.record_latency(west, 100)
+    pool.record_latency(east, 300)
+    assert pool.pick() is west  # eu has no sample: scores as the fastest known, ties go to list order
+    west.in_flight = 3
+    assert pool.pick() is eu
+    eu.in_flight = 3
+    assert pool.pick() is east  # 1 × 300ms beats 4 × 100ms
+
+    assert pool.throttled(east) == 30 and pool.throttled(east) == 60  # doubles per consecutive throttle
+    assert pool.pick() is west and pool.pick(exclude=[west]) is eu
+    for endpoint in (west, eu):
+        pool.throttled(endpoint)
+    assert pool.pick() is west  # all cooling down: nearest recovery is still tried
+    assert 0 < pool.retry_after() <= 30
+
+    pool.record_latency(east, 300)
+    assert pool.stats()["us-east-1"]["healthy"] and east.consecutive_throttles == 0
+
+
+def test_long_invoke_calls_do_not_skew_stream_scores():
+    west, east = BedrockEndpoint("us-west-2"), BedrockEndpoint("us-east-1")
+    pool = EndpointPool([west, east])
+    pool.record_latency(west, 200, STREAM)
+    pool.record_latency(east, 300, STREAM)
+    pool.record_latency(west, 40000, INVOKE)  # a whole non-streaming generation
+    pool.record_latency(east, 20000, INVOKE)
+    assert pool.pick(kind=STREAM) is west
+    assert pool.pick(kind=INVOKE) is east
+    stats = pool.stats()["us-west-2"]
+    assert stats["ewma_first_byte_ms"] == 200.0 and stats["ewma_invoke_ms"] == 40000.0
+
+
+def _provider(*regions):
+    with patch("providers.bedrock.boto3.Session"), \
+         patch("providers.bedrock.Cache"), \
+         patch("providers.bedrock.config") as mock_config:
+        mock_config.BEDROCK_THREAD_POOL_SIZE = 4
+        mock_config.BEDROCK_POOL_AUTOSCALE = False
+        from providers.bedrock import BedrockProvider
+        provider = BedrockProvider()
+    provider.client.exceptions.ThrottlingException = type("ThrottlingException", (Exception,), {})
+    provider.client.exceptions.ValidationException = type("ValidationException", (Exception,), {})
+    provider.executor = None  # default loop executor
+    provider.endpoints = EndpointPool([BedrockEndpoint(region, client=MagicMock()) for region in regions])
+    return provider, list(provider.endpoints)
+
+
+def test_throttled_region_shifts_request_without_sleeping():
+    provider, (west, eu) = _provider("us-west-2", "eu-west-1")
+    west.client.invoke_model.side_effect = THROTTLE
+    eu.client.invoke_model.return_value = {"body": io.BytesIO(json.dumps({"content": [{"type": "text", "text": "ok"}]}).encode())}
+
+    result = asyncio.run(provider.send_message(BODY, "", "oauth"))
+    assert result["content"][0]["text"] == "ok"
+    assert eu.client.invoke_model.call_args.kwargs["modelId"].startswith("eu.anthropic.")
+    assert west.cooldown_until > 0 and west.in_flight == eu.in_flight == 0
+
+    # West is cooling down: the next request goes straight to eu
+    west.client.invoke_model.reset_mock()
+    eu.client.invoke_model.return_value = {"body": io.BytesIO(b'{"content": []}')}
+    asyncio.run(provider.send_message(BODY, "", "oauth"))
+    west.client.invoke_model.assert_not_called()
+
+
+def test_stream_shifts_on_throttle_and_rate_limits_when_every_region_throttles():
+    provider, (west, east) = _provider("us-west-2", "us-east-1")
+    west.client.invoke_model_with_response_stream.side_effect = THROTTLE
+    east.client.invoke_model_with_response_stream.return_value = {
+        "body": [{"chunk": {"bytes": json.dumps({"type": "message_start"}).encode()}}]}
+
+    async def collect():
+        return [chunk async for chunk in provider.stream_message(BODY, "", "oauth")]
+
+    assert [json.loads(c[6:])["type"] for c in asyncio.run(collect())] == ["message_start"]
+    assert east.ewma_ms[STREAM] > 0 and INVOKE not in east.ewma_ms
+
+    east.client.invoke_model_with_response_stream.side_effect = THROTTLE
+    with pytest.raises(RateLimitError):
+        asyncio.run(collect())
+    assert provider.endpoint_stats()["us-east-1"]["throttles"] == 1
+
+
+def test_expired_default_credentials_leave_profile_endpoints_serving():
+    provider, (west, other) = _provider("us-west-2", "us-east-1")
+    other.profile = "other"  # own boto3 session, refreshed by boto3 itself
+    provider._credential_error = "AWS SSO session expired."
+    other.client.invoke_model.return_value = {"body": io.BytesIO(b'{"content": []}')}
+
+    asyncio.run(provider.send_message(BODY, "", "oauth"))
+    west.client.invoke_model.assert_not_called()
+
+    other.client.invoke_model.side_effect = THROTTLE
+    with pytest.raises(RateLimitError):  # the only usable endpoint throttled
+        asyncio.run(provider.send_message(BODY, "", "oauth"))
+
+    other.profile = None
+    with pytest.raises(AuthenticationError, match="SSO session expired"):
+        asyncio.run(provider.send_message(BODY, "", "oauth"))
@@ -0,0 +1,99 @@
+"""Tests for bench_history — benchmark run store and regression detection."""
+
+import pytest
+
+from bench_history import BenchHistory, detect_regressions, diff_interval, summarize, t_critical
+
+
+def samples(timings, ratio=50.0):
+    return [{"timing_ms": t, "reduction_pct": ratio} for t in timings]
+
+
+class TestStatistics:
+    def test_summarize_interval(self):
+        s = summarize([10.0, 12.0, 14.0])
+        assert s["mean"] == 12.0
+        assert s["stdev"] == 2.0
+        half = t_critical(2) * 2.0 / 3 ** 0.5
+        assert s["ci_low"] == pytest.approx(12.0 - half)
+        assert s["ci_high"] == pytest.approx(12.0 + half)
+
+    def test_single_sample_has_zero_width(self):
+        s = summarize([5.0])
+        assert s["ci_low"] == s["ci_high"] == 5.0
+
+    def test_diff_interval_contains_zero_for_same_distribution(self):
+        interval = diff_interval([10, 11, 9, 10, 10], [10, 9, 11, 10, 10])
+        assert interval["ci_low"] < 0 < interval["ci_high"]
+
+
+class TestDetectRegressions:
+    def test_clear_slowdown_is_regression(self):
+        baseline = {"log-dump": samples([10.0, 10.2, 9.9, 10.1, 10.0])}
+        current = {"log-dump": samples([14.0, 14.2, 13.9, 14.1, 14.0])}
+
+        [finding] = detect_regressions(baseline, current)
+        assert finding["verdict"] == "regression"
+        assert finding["metrics"]["timing_ms"]["verdict"] == "regression"
+
+    def test_noise_within_tolerance_is_ok(self):
+        baseline = {"log-dump": samples([10.0, 12.0, 8.0, 11.0, 9.0])}
+        current = {"log-dump": samples([10.5, 12.5, 8.5, 11.5, 9.5])}
+
+        [finding] = detect_regressions(baseline, current)
+        assert finding["verdict"] == "ok"
+
+    def test_ratio_drop_is_regression(self):
+        baseline = {"junit-xml": samples([10.0] * 3, ratio=59.7)}
+        current = {"junit-xml": samples([10.0] * 3, ratio=55.0)}
+
+        [finding] = detect_regressions(baseline, current)
+        assert finding["metrics"]["reduction_pct"]["verdict"] == "regression"
+        assert finding["metrics"]["timing_ms"]["verdict"] == "ok"
+
+    def test_speedup_is_improvement(self):
+        baseline = {"xml-config": samples([20.0, 20.1, 19.9])}
+        current = {"xml-config": samples([10.0, 10.1, 9.9])}
+
+        [finding] = detect_regressions(baseline, current)
+        assert finding["verdict"] == "improvement"
+
+    def test_only_shared_scenarios_compared(self):
+        findings = detect_regressions({"a": samples([1.0]), "b": samples([1.0])}, {"b": samples([1.0])})
+        assert [f["scenario"] for f in findings] == ["b"]
+
+
+class TestBenchHistory:
+    def _record(self, history, rev, timing, created):
+        return history.record_run(rev, "local", [
+            {"scenario": "log-dump", "repeat": i, "tokens_before": 100, "tokens_after": 20,
+             "reduction_pct": 80.0, "timing_ms": timing, "elapsed_ms": timing + 1}
+            for i in range(3)
+        ], engine_version="7.1.0", created=created)
+
+    def test_round_trip(self, tmp_path):
+        history = BenchHistory(str(tmp_path / "h.db"))
+        run_id = self._record(history, "abc1234", 10.0, 1000.0)
+
+        [run] = history.runs()
+        assert run["id"] == run_id
+        assert run["repeats"] == 3
+        assert [s["timing_ms"] for s in history.samples(run_id)["log-dump"]] == [10.0] * 3
+
+    def test_baseline_is_previous_revision(self, tmp_path):
+        history = BenchHistory(str(tmp_path / "h.db"))
+        first = self._record(history, "aaa1111", 10.0, 1000.0)
+        self._record(history, "bbb2222", 10.0, 2000.0)
+        latest_id = self._record(history, "bbb2222", 10.0, 3000.0)
+
+        latest = history.runs()[-1]
+        assert latest["id"] == latest_id
+        assert history.baseline_for(latest)["id"] == first
+        assert history.baseline_for(latest, "bbb")["git_rev"] == "bbb2222"
+
+    def test_runs_limit_keeps_newest(self, tmp_path):
+        history = BenchHistory(str(tmp_path / "h.db"))
+        for i in range(4):
+            self._record(history, f"rev{i}", 10.0, 1000.0 + i)
+
+        assert [r["git_rev"] for r in history.runs(limit=2)] == ["rev2", "rev3"]
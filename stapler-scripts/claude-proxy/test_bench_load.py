@@ -0,0 +1,17 @@
+"""Tests for the bench.py load summary."""
+
+import argparse
+
+from bench import _summarize_load
+
+
+def test_cpu_per_request_sums_each_workers_own_delta():
+    args = argparse.Namespace(rate=None, concurrency=4, provider="anthropic")
+    results = [{"ok": True, "error": None, "ttft_ms": 10.0, "total_ms": 50.0, "gaps_ms": [1.0]}] * 10
+    # Two workers answer /metrics alternately; their process CPU clocks are unrelated
+    samples = [{"proxy": {"pid": pid, "cpu_seconds": cpu}, "t": i}
+               for i, (pid, cpu) in enumerate([(1, 5.0), (2, 0.5), (1, 5.4), (2, 0.6), (3, 9.0)])]
+
+    summary = _summarize_load(args, results, samples, wall=1.0)
+    assert summary["cpu_ms_per_request"] == 50.0  # (0.4 + 0.1) s over 10 requests
+    assert summary["cpu_workers_sampled"] == 3
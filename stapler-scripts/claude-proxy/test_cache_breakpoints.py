@@ -0,0 +1,95 @@
+"""Tests for cache_breakpoints — marker placement and per-client learning from usage."""
+
+import random
+
+from cache_breakpoints import MAX_BREAKPOINTS, BreakpointOptimizer, client_name, place_breakpoints
+
+
+def _body(turns=3, system="You are Claude Code."):
+    messages = [{"role": "user", "content": "fix the bug"}]
+    for i in range(turns - 1):
+        messages += [
+            {"role": "assistant", "content": [{"type": "thinking", "thinking": "hmm"},
+                                              {"type": "tool_use", "id": f"t{i}", "name": "Read", "input": {}}]},
+            {"role": "user", "content": [{"type": "tool_result", "tool_use_id": f"t{i}", "content": "ok",
+                                          "cache_control": {"type": "ephemeral"}}]},
+        ]
+    return {"model": "claude-sonnet-4-6", "system": system, "messages": messages}
+
+
+def _marked(body):
+    """[(where, index)] of blocks carrying cache_control."""
+    out = [("system", i) for i, b in enumerate(body["system"]) if "cache_control" in b] \
+        if isinstance(body["system"], list) else []
+    for i, message in enumerate(body["messages"]):
+        if isinstance(message["content"], list):
+            out += [("message", i) for b in message["content"] if "cache_control" in b]
+    return out
+
+
+def test_placements_mark_stable_boundaries_without_touching_input():
+    body = _body(3)
+    original = repr(body)
+
+    assert place_breakpoints(body, "client") is body
+    assert _marked(place_breakpoints(body, "tail")) == [("system", 0), ("message", 4)]
+    assert _marked(place_breakpoints(body, "stable_tail")) == [("system", 0), ("message", 2), ("message", 4)]
+    full = place_breakpoints(body, "full")
+    assert _marked(full) == [("system", 0), ("message", 0), ("message", 2), ("message", 4)]
+    assert len(_marked(full)) <= MAX_BREAKPOINTS
+    assert full["messages"][0]["content"] == [{"type": "text", "text": "fix the bug",
+                                               "cache_control": {"type": "ephemeral"}}]
+    assert repr(body) == original
+
+
+def test_markers_skip_thinking_blocks_and_keep_client_ttl():
+    body = _body(2)
+    body["messages"][1]["content"] = [{"type": "thinking", "thinking": "only thinking"}]
+    body["messages"][2]["content"][0]["cache_control"] = {"type": "ephemeral", "ttl": "1h"}
+    placed = place_breakpoints(body, "tail")
+    assert "cache_control" not in placed["messages"][1]["content"][0]
+    assert placed["messages"][2]["content"][0]["cache_control"] == {"type": "ephemeral", "ttl": "1h"}
+    assert placed["system"][0]["cache_control"] == {"type": "ephemeral", "ttl": "1h"}
+
+
+def test_learns_best_placement_per_client_and_keeps_it_per_conversation():
+    optimizer = BreakpointOptimizer(epsilon=0.0, min_samples=2, rng=random.Random(0))
+    ratios = {"client": 0.2, "tail": 0.5, "stable_tail": 0.9, "full": 0.8}
+    first = {}
+    for n in range(8):
+        _, placement = optimizer.apply(_body(2, system=f"session {n}"), "claude-cli")
+        first[n] = placement
+        read = int(ratios[placement] * 1000)
+        optimizer.observe("claude-cli", placement, {"input_tokens": 1000 - read, "cache_read_input_tokens": read})
+
+    _, placement = optimizer.apply(_body(2, system="new session"), "claude-cli")
+    assert placement == "stable_tail"
+    _, again = optimizer.apply(_body(5, system="session 0"), "claude-cli")  # same conversation, grown
+    assert again == first[0]
+    assert optimizer.stats()["clients"]["claude-cli"]["stable_tail"] == {"samples": 2, "read_ratio": 0.9}
+
+    _, other = optimizer.apply(_body(2, system="litellm session"), "litellm")
+    assert other == "client"  # a new client starts exploring from scratch
+
+
+def test_conversation_keeps_its_placement_when_the_client_moves_its_markers():
+    optimizer = BreakpointOptimizer(epsilon=0.0, min_samples=1, rng=random.Random(0))
+    marker = {"type": "ephemeral"}
+    turn1 = {"model": "claude-sonnet-4-6", "system": "You are Claude Code.",
+             "messages": [{"role": "user", "content": [{"type": "text", "text": "fix the bug", "cache_control": marker}]}]}
+    _, first = optimizer.apply(turn1, "claude-cli")
+    optimizer.observe("claude-cli", first, {"input_tokens": 100, "cache_creation_input_tokens": 900})
+
+    # Turn 2: the marker moved from the first user message to the newest one
+    turn2 = {"model": "claude-sonnet-4-6", "system": "You are Claude Code.",
+             "messages": [{"role": "user", "content": [{"type": "text", "text": "fix the bug"}]},
+                          {"role": "assistant", "content": [{"type": "text", "text": "done"}]},
+                          {"role": "user", "content": [{"type": "text", "text": "thanks", "cache_control": marker}]}]}
+    _, second = optimizer.apply(turn2, "claude-cli")
+    assert second == first  # a new conversation would now get an untried placement
+    assert optimizer.stats()["conversations"] == 1
+
+
+def test_client_name():
+    assert client_name("claude-cli/2.0.14 (external, cli)") == "claude-cli"
+    assert client_name(None) == "unknown"
@@ -0,0 +1,112 @@
+"""Tests for chaos scenarios: fault timelines in mock_upstream and the bench.py chaos report."""
+
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from bench import _chaos_report
+from chaos import SCENARIOS, Fault, Scenario
+from mock_upstream import MockDisconnect, MockUpstreamConfig, create_app
+
+
+def make_client(faults, elapsed=0.0):
+    """Mock app running a custom scenario whose clock reads `elapsed` seconds."""
+    app = create_app(MockUpstreamConfig(token_rate=0, ttft_ms=0, jitter=0, output_tokens=20, seed=7))
+    mock = app.state.mock
+    mock.scenario = Scenario("test", "test scenario", duration=60, faults=faults)
+    mock.start_scenario()
+    mock.scenario_start -= elapsed
+    return TestClient(app), mock
+
+
+class TestScenario:
+    def test_active_respects_window_and_target(self):
+        scenario = Scenario("s", "", 60, [Fault("anthropic", "overloaded", 10, 20)])
+        assert scenario.active("anthropic", 9.9) is None
+        assert scenario.active("anthropic", 10).kind == "overloaded"
+        assert scenario.active("bedrock", 15) is None
+        assert scenario.active("anthropic", 20) is None
+
+    def test_rejects_unknown_kind(self):
+        with pytest.raises(ValueError):
+            Fault("anthropic", "meteor", 0, 1)
+
+    def test_builtin_scenarios_fit_their_duration(self):
+        for scenario in SCENARIOS.values():
+            assert all(0 <= f.start < f.end <= scenario.duration for f in scenario.faults), scenario.name
+
+
+class TestMockFaults:
+    def test_error_fault_inside_window(self):
+        client, mock = make_client([Fault("anthropic", "overloaded", 10, 20, retry_after=5)], elapsed=12)
+        resp = client.post("/v1/messages", json={"stream": True, "messages": []})
+
+        assert resp.status_code == 529
+        assert resp.headers["retry-after"] == "5"
+        assert mock.timeline[0]["outcome"] == "overloaded"
+
+    def test_no_fault_outside_window(self):
+        client, mock = make_client([Fault("anthropic", "overloaded", 10, 20)], elapsed=25)
+        resp = client.post("/v1/messages", json={"stream": True, "messages": []})
+
+        assert resp.status_code == 200
+        assert mock.timeline[0]["outcome"] == "ok"
+
+    def test_bedrock_credential_expiry_shape(self):
+        client, _ = make_client([Fault("bedrock", "credential_expiry", 0, 10)], elapsed=1)
+        resp = client.post("/model/us.anthropic.claude-sonnet-4-6/invoke", json={"messages": []})
+
+        assert resp.status_code == 403
+        assert resp.headers["x-amzn-errortype"].startswith("ExpiredTokenException")
+        assert "security token" in resp.json()["message"]
+
+    def test_disconnect_drops_stream_mid_response(self):
+        _, mock = make_client([Fault("anthropic", "disconnect", 0, 10, after_tokens=3)], elapsed=1)
+        t, fault = mock.begin("anthropic")
+        received = []
+
+        async def consume():
+            async for chunk in mock.stream("claude-sonnet-4-6", t, fault):
+                received.append(chunk)
+
+        with pytest.raises(MockDisconnect):
+            asyncio.run(consume())
+        assert sum('"content_block_delta"' in chunk for chunk in received) == 3
+        assert mock.timeline[0]["outcome"] == "disconnect"
+
+    def test_scenario_endpoint_returns_timeline(self):
+        client, _ = make_client([], elapsed=0)
+        client.post("/v1/messages", json={"messages": []})
+
+        data = client.get("/mock/scenario").json()
+        assert data["scenario"]["name"] == "test"
+        assert [e["target"] for e in data["timeline"]] == ["anthropic"]
+
+
+class TestChaosReport:
+    def test_scores_fault_window(self):
+        scenario = Scenario("s", "d", 30, [Fault("anthropic", "overloaded", 10, 20)]).to_dict()
+        results = (
+            [{"ok": True, "error": None, "sent_s": t, "total_ms": 100.0} for t in (1, 2, 3)]
+            + [{"ok": True, "error": None, "sent_s": t, "total_ms": 300.0} for t in (11, 12)]
+            + [{"ok": False, "error": "api_error", "sent_s": 13, "total_ms": 50.0}]
+        )
+        timeline = (
+            [{"t": t, "target": "anthropic", "outcome": "ok"} for t in (1, 2, 3)]
+            + [{"t": t, "target": "anthropic", "outcome": "overloaded"} for t in (11, 12, 13)]
+            + [{"t": t, "target": "bedrock", "outcome": "ok"} for t in (11, 12)]
+            + [{"t": 22.5, "target": "anthropic", "outcome": "ok"}]
+        )
+
+        report = _chaos_report(scenario, results, timeline, {"duration_s": 30})
+
+        assert report["lost"] == 1
+        assert report["lost_by_error"] == {"api_error": 1}
+        assert report["retry_amplification"] == round(9 / 6, 2)
+        assert report["baseline_latency_ms"]["p50"] == 100.0
+        window = report["faults"][0]
+        assert window["requests"] == 3
+        assert window["upstream_attempts"] == 5
+        assert window["latency_ms"]["p50"] == 300.0
+        assert window["time_to_recover_s"] == 2.5
@@ -1,5 +1,6 @@
 """Tests for error_tracker module."""
 
+import multiprocessing
 import pytest
 import time
 import sqlite3
@@ -7,7 +8,10 @@ import tempfile
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from error_tracker import extract_signature, normalize_message, compute_fingerprint, ErrorTracker, ErrorTrackingHandler
+from error_tracker import (
+    extract_signature, normalize_message, compute_fingerprint, fingerprint_error,
+    ErrorTracker, ErrorTrackingHandler,
+)
 
 
 # =============================================================================
@@ -329,6 +333,20 @@ def test_compute_fingerprint_performance():
     assert avg_time_us < 100, f"Average fingerprint time: {avg_time_us:.1f}µs (target: <100µs)"
 
 
+
+def test_fingerprint_error_matches_uncached_path():
+    """Test that the memoized helper agrees with extract_signature + compute_fingerprint."""
+    message = "An error occurred (ThrottlingException) when calling the InvokeModel operation: Too many tokens"
+    sig, fp = fingerprint_error(message, provider='bedrock')
+
+    expected = extract_signature(message, provider='bedrock')
+    assert sig == expected
+    assert fp == compute_fingerprint(expected)
+
+    # Cached result must not be shared — callers may mutate the signature
+    sig['message'] = 'mutated'
+    assert fingerprint_error(message, provider='bedrock')[0] == expected
+
 # =============================================================================
 # Integration Tests
 # =============================================================================
@@ -604,6 +622,7 @@ def test_storage_growth_linearity(temp_db):
         }
         for j in range(10):
             tracker.record_error(sig, {'request_id': f'req_{i}_{j}'})
+    tracker.flush()
 
     # Check error_types: should have 10 rows
     conn = sqlite3.connect(temp_db)
@@ -620,6 +639,158 @@ def test_storage_growth_linearity(temp_db):
     conn.close()
 
 
+
+def _count_rows(db_path, table):
+    conn = sqlite3.connect(db_path)
+    count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    conn.close()
+    return count
+
+
+def test_record_error_buffers_repeats_in_memory(temp_db):
+    """Test that repeats of a known fingerprint skip SQLite until flushed."""
+    tracker = ErrorTracker(temp_db, flush_interval=3600)
+    sig = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ThrottlingException', 'message': 'Rate exceeded'}
+
+    fp, is_new = tracker.record_error(sig, {'request_id': 'req1'})
+    assert is_new is True
+    assert _count_rows(temp_db, 'error_occurrences') == 1  # new fingerprints are written immediately
+
+    for i in range(5):
+        assert tracker.record_error(sig, {'request_id': f'req{i + 2}'}) == (fp, False)
+    assert _count_rows(temp_db, 'error_occurrences') == 1
+
+    assert tracker.flush() == 5
+    assert _count_rows(temp_db, 'error_occurrences') == 6
+    assert tracker.get_error_by_fingerprint(fp)['count'] == 6
+
+
+def test_record_error_flushes_at_threshold(temp_db):
+    """Test that pending occurrences are flushed once the threshold is reached."""
+    tracker = ErrorTracker(temp_db, flush_interval=3600, flush_threshold=10)
+    sig = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ThrottlingException', 'message': 'Rate exceeded'}
+
+    for _ in range(11):
+        tracker.record_error(sig)
+
+    assert _count_rows(temp_db, 'error_occurrences') == 11
+
+
+def test_record_error_counts_are_additive_across_trackers(temp_db):
+    """Test that two trackers on one database (worker processes) don't lose counts."""
+    sig = {'provider': 'anthropic', 'operation': 'unknown', 'error_type': 'RateLimitError', 'message': 'rate limit'}
+    first = ErrorTracker(temp_db, flush_interval=3600)
+    fp, _ = first.record_error(sig)
+
+    # Second tracker loads the fingerprint as known at startup
+    second = ErrorTracker(temp_db, flush_interval=3600)
+    assert second.record_error(sig) == (fp, False)
+
+    first.record_error(sig)
+    first.flush()
+    second.flush()
+
+    assert first.get_error_by_fingerprint(fp)['count'] == 3
+
+
+def test_rollups_track_hourly_and_daily_counts(temp_db):
+    """Test that rollups include both immediate inserts and buffered repeats."""
+    tracker = ErrorTracker(temp_db, flush_interval=3600)
+    throttle = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ThrottlingException', 'message': 'Rate exceeded'}
+    rate_limit = {'provider': 'anthropic', 'operation': 'unknown', 'error_type': 'RateLimitError', 'message': 'rate limit'}
+
+    fp, _ = tracker.record_error(throttle, {'timestamp': '2026-03-01T10:15:00'})
+    tracker.record_error(throttle, {'timestamp': '2026-03-01T10:45:00'})
+    tracker.record_error(throttle, {'timestamp': '2026-03-01T11:05:00'})
+    tracker.record_error(rate_limit, {'timestamp': '2026-03-01T11:30:00'})
+
+    hourly = tracker.get_error_timeseries('hour', fingerprint=fp, since='2026-03-01')
+    assert [(r['bucket'], r['count']) for r in hourly] == [
+        ('2026-03-01T10:00:00', 2),
+        ('2026-03-01T11:00:00', 1),
+    ]
+
+    daily = tracker.get_error_timeseries('day', group_by='provider', since='2026-03-01')
+    assert {r['provider']: r['count'] for r in daily} == {'bedrock': 3, 'anthropic': 1}
+
+
+def test_rollups_backfilled_for_existing_database(temp_db):
+    """Test that databases created before rollups existed get backfilled on open."""
+    tracker = ErrorTracker(temp_db)
+    sig = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ValidationException', 'message': 'Extra inputs'}
+    for ts in ('2026-03-01T10:00:00', '2026-03-01T10:30:00'):
+        tracker.record_error(sig, {'timestamp': ts})
+    tracker.close()
+
+    conn = sqlite3.connect(temp_db)
+    conn.execute("DROP TABLE error_rollups_hourly")
+    conn.execute("DROP TABLE error_rollups_daily")
+    conn.commit()
+    conn.close()
+
+    reopened = ErrorTracker(temp_db)
+    hourly = reopened.get_error_timeseries('hour', since='2026-03-01')
+    assert [(r['bucket'], r['count']) for r in hourly] == [('2026-03-01T10:00:00', 2)]
+
+
+def _open_tracker(db_path, barrier, results):
+    barrier.wait()
+    try:
+        ErrorTracker(db_path).close()
+        results.put("ok")
+    except Exception as e:
+        results.put(repr(e))
+
+
+def test_rollup_backfill_is_safe_with_concurrent_workers(temp_db):
+    """Test that workers opening a pre-rollup database at once backfill it exactly once."""
+    tracker = ErrorTracker(temp_db)
+    sig = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ValidationException', 'message': 'Extra inputs'}
+    for ts in ('2026-03-01T10:00:00', '2026-03-01T10:30:00', '2026-03-01T11:00:00'):
+        tracker.record_error(sig, {'timestamp': ts})
+    tracker.close()
+    conn = sqlite3.connect(temp_db)
+    conn.execute("DROP TABLE error_rollups_hourly")
+    conn.execute("DROP TABLE error_rollups_daily")
+    conn.commit()
+    conn.close()
+
+    ctx = multiprocessing.get_context("fork")
+    barrier, results = ctx.Barrier(8), ctx.Queue()
+    workers = [ctx.Process(target=_open_tracker, args=(temp_db, barrier, results)) for _ in range(8)]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+    assert outcomes == ["ok"] * 8
+
+    daily = ErrorTracker(temp_db).get_error_timeseries('day', since='2026-03-01')
+    assert [(r['bucket'], r['count']) for r in daily] == [('2026-03-01', 3)]
+
+
+def test_apply_retention_prunes_rollups(temp_db):
+    """Test that retention removes old occurrences and rollup buckets."""
+    tracker = ErrorTracker(temp_db)
+    sig = {'provider': 'bedrock', 'operation': 'InvokeModel', 'error_type': 'ValidationException', 'message': 'Old error'}
+    old = (datetime.now() - timedelta(days=45)).isoformat()
+    recent = datetime.now().isoformat()
+    tracker.record_error(sig, {'timestamp': old})
+    tracker.record_error(sig, {'timestamp': recent})
+
+    deleted = tracker.apply_retention(occurrence_days=40, hourly_days=30, daily_days=400)
+
+    assert deleted == {'error_occurrences': 1, 'error_rollups_hourly': 1, 'error_rollups_daily': 0}
+    assert len(tracker.get_error_timeseries('hour', since=old)) == 1
+    assert len(tracker.get_error_timeseries('day', since=old)) == 2
+
+
+def test_get_error_timeseries_rejects_unknown_resolution(temp_db):
+    """Test input validation for time-series queries."""
+    tracker = ErrorTracker(temp_db)
+    with pytest.raises(ValueError):
+        tracker.get_error_timeseries('minute')
+
 # =============================================================================
 # Story 3: Logging Integration Tests
 # =============================================================================
@@ -764,5 +935,85 @@ def test_error_tracking_handler_new_error_detection(temp_db):
     assert errors[0]['count'] == 2  # But count increased
 
 
+
+def test_error_tracking_handler_background_mode(temp_db):
+    """Test that background mode persists errors on the writer thread."""
+    tracker = ErrorTracker(temp_db)
+    handler = ErrorTrackingHandler(tracker, background=True)
+
+    test_logger = logging.getLogger('test_background')
+    test_logger.setLevel(logging.ERROR)
+    test_logger.addHandler(handler)
+
+    try:
+        test_logger.error("[12345678] ✗ bedrock: validation error (model=claude-haiku-4-5) - Extra inputs not permitted")
+        test_logger.error("[87654321] ✗ bedrock: validation error (model=claude-haiku-4-5) - Extra inputs not permitted")
+        handler.flush()
+
+        errors = tracker.search_errors()
+        assert len(errors) == 1
+        assert errors[0]['count'] == 2
+
+        conn = sqlite3.connect(temp_db)
+        cursor = conn.cursor()
+        cursor.execute("SELECT request_id, model FROM error_occurrences ORDER BY id")
+        rows = cursor.fetchall()
+        conn.close()
+        assert rows == [('12345678', 'claude-haiku-4-5'), ('87654321', 'claude-haiku-4-5')]
+    finally:
+        test_logger.removeHandler(handler)
+        handler.close()
+        tracker.close()
+
+
+def test_error_tracking_handler_background_batches_writes(temp_db):
+    """Test that queued records are written in batched transactions, not one per error."""
+    tracker = ErrorTracker(temp_db)
+    handler = ErrorTrackingHandler(tracker, background=True, batch_size=25)
+
+    calls = []
+    original = tracker.record_errors
+
+    def recording(errors):
+        calls.append(len(errors))
+        return original(errors)
+
+    tracker.record_errors = recording
+
+    # Hold the writer inside its first transaction so the rest queue up behind it
+    tracker._writer_lock.acquire()
+    try:
+        for i in range(100):
+            record = logging.LogRecord('test_batch', logging.ERROR, __file__, 0,
+                                       f"[{i:08x}] ✗ bedrock: ThrottlingException - Rate exceeded", None, None)
+            handler.emit(record)
+    finally:
+        tracker._writer_lock.release()
+
+    handler.flush()
+    try:
+        assert sum(calls) == 100
+        assert max(calls) <= 25
+        assert len(calls) < 100
+        assert tracker.search_errors()[0]['count'] == 100
+    finally:
+        handler.close()
+        tracker.close()
+
+
+def test_error_tracking_handler_close_drains_queue(temp_db):
+    """Test that close() writes everything still queued before stopping."""
+    tracker = ErrorTracker(temp_db)
+    handler = ErrorTrackingHandler(tracker, background=True)
+
+    record = logging.LogRecord('test_close', logging.ERROR, __file__, 0,
+                               "[abc12345] ✗ bedrock (model=claude): Could not connect to endpoint", None, None)
+    handler.emit(record)
+    handler.close()
+
+    assert not handler._writer.is_alive()
+    assert tracker.search_errors()[0]['count'] == 1
+    tracker.close()
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])
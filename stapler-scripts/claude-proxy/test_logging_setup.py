@@ -0,0 +1,135 @@
+"""Tests for logging_setup module."""
+
+import json
+import logging
+import threading
+
+import pytest
+
+from logging_setup import (
+    NEVER_SAMPLE, JsonFormatter, LoggingStats, SamplingFilter, configure_logging,
+)
+
+
+def make_record(msg, level=logging.INFO, name="test", lineno=10, created=1000.0):
+    record = logging.LogRecord(name, level, "/src/module.py", lineno, msg, None, None)
+    record.created = created
+    return record
+
+
+class TestSamplingFilter:
+    def test_allows_burst_then_drops(self):
+        stats = LoggingStats()
+        f = SamplingFilter(burst=3, window=1.0, stats=stats)
+
+        results = [f.filter(make_record(f"line {i}", created=1000.0 + i * 0.01)) for i in range(5)]
+
+        assert results == [True, True, True, False, False]
+        assert stats.sampled_out == 2
+
+    def test_next_window_reports_suppressed(self):
+        f = SamplingFilter(burst=1, window=1.0)
+        f.filter(make_record("a", created=1000.0))
+        f.filter(make_record("b", created=1000.5))
+        f.filter(make_record("c", created=1000.6))
+
+        record = make_record("d", created=1001.5)
+        assert f.filter(record) is True
+        assert record.sampled_out == 2
+        assert "+2 similar suppressed" in record.getMessage()
+
+    def test_call_sites_are_independent(self):
+        f = SamplingFilter(burst=1, window=1.0)
+        assert f.filter(make_record("a", lineno=1)) is True
+        assert f.filter(make_record("b", lineno=2)) is True
+        assert f.filter(make_record("c", lineno=1)) is False
+
+    def test_warnings_never_sampled(self):
+        f = SamplingFilter(burst=1, window=60.0)
+        assert all(f.filter(make_record("w", level=logging.WARNING)) for _ in range(10))
+
+    def test_request_summaries_never_sampled(self):
+        f = SamplingFilter(burst=1, window=60.0)
+
+        def summary():
+            record = make_record("[abcd1234] ✓ anthropic (120ms)")
+            record.__dict__.update(NEVER_SAMPLE)
+            return record
+
+        assert all(f.filter(summary()) for _ in range(10))
+
+    def test_burst_is_exact_across_threads(self):
+        stats = LoggingStats()
+        f = SamplingFilter(burst=50, window=60.0, stats=stats)
+        passed = []
+
+        def log_many():
+            passed.append(sum(f.filter(make_record("x")) for _ in range(2000)))
+
+        threads = [threading.Thread(target=log_many) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sum(passed) == 50 and stats.sampled_out == 8 * 2000 - 50
+
+
+class TestJsonFormatter:
+    def test_formats_request_scoped_line(self):
+        record = make_record("[abcd1234] ✓ anthropic (120ms)", name="fallback")
+        entry = json.loads(JsonFormatter().format(record))
+
+        assert entry["level"] == "INFO"
+        assert entry["logger"] == "fallback"
+        assert entry["request_id"] == "abcd1234"
+        assert entry["msg"] == "[abcd1234] ✓ anthropic (120ms)"
+
+    def test_omits_request_id_when_absent(self):
+        entry = json.loads(JsonFormatter().format(make_record("startup complete")))
+        assert "request_id" not in entry
+
+
+class TestConfigureLogging:
+    @pytest.fixture
+    def pipeline(self, tmp_path):
+        root = logging.getLogger()
+        saved_handlers, saved_level = root.handlers[:], root.level
+        http_logger = logging.getLogger("httpx")
+        saved_http = (http_logger.handlers[:], http_logger.propagate)
+        collected = []
+
+        class Collect(logging.Handler):
+            def emit(self, record):
+                collected.append(record.getMessage())
+
+        pipeline = configure_logging(
+            app_log_path=str(tmp_path / "app.log"),
+            http_log_path=str(tmp_path / "http.log"),
+            extra_handlers=[Collect()],
+            log_format="json",
+        )
+        yield pipeline, tmp_path, collected
+        pipeline.stop()
+        for handler in pipeline.listener.handlers:
+            handler.close()
+        root.handlers[:] = saved_handlers
+        root.setLevel(saved_level)
+        http_logger.handlers[:], http_logger.propagate = saved_http
+
+    def test_routes_records_via_listener(self, pipeline):
+        pipeline, tmp_path, collected = pipeline
+
+        logging.getLogger("fallback").info("[abcd1234] ⟳ anthropic (model=claude)")
+        logging.getLogger("httpx").info("HTTP Request: POST https://api.anthropic.com")
+        pipeline.stop()
+
+        app_lines = (tmp_path / "app.log").read_text().splitlines()
+        assert [json.loads(line)["logger"] for line in app_lines] == ["fallback"]
+        assert "HTTP Request" in (tmp_path / "http.log").read_text()
+        # Extra handlers only see application records
+        assert collected == ["[abcd1234] ⟳ anthropic (model=claude)"]
+
+        snapshot = pipeline.snapshot()
+        assert snapshot["records_enqueued"] == 2
+        assert snapshot["records_written"] == 2
+        assert snapshot["queue_depth"] == 0
@@ -0,0 +1,56 @@
+"""Tests for the recent-requests feed (RequestFeed) behind /requests and /metrics."""
+
+import json
+
+from metrics import MetricsCollector, RequestDetail, RequestFeed
+
+
+def _detail(request_id):
+    return RequestDetail(request_id=request_id, timestamp="t", model="m", tokens_before=0,
+                         tokens_after=0, compressed=False, stream=True)
+
+
+def test_feed_is_newest_first_and_wraps():
+    feed = RequestFeed(capacity=3)
+    for i in range(5):
+        feed.append(_detail(f"r{i}"))
+
+    assert [d["request_id"] for d in feed.dicts()] == ["r4", "r3", "r2"]
+    assert len(feed) == 3 and [d.request_id for d in feed] == ["r4", "r3", "r2"]
+    assert feed.get("r1") is None and not feed.update("r1", provider="bedrock")  # evicted
+
+
+def test_update_invalidates_only_that_records_views():
+    feed = RequestFeed(capacity=4)
+    feed.append(_detail("a"))
+    feed.append(_detail("b"))
+    first = feed.dicts()
+    assert feed.update("a", provider="bedrock", duration_ms=12.5)
+
+    again = feed.dicts()
+    assert again[0] is first[0]  # "b" unchanged: cached view reused
+    assert again[1]["provider"] == "bedrock" and again[1]["duration_ms"] == 12.5
+    assert json.loads(feed.json()) == again
+
+
+def test_collector_updates_through_the_index(tmp_path):
+    metrics = MetricsCollector(cache_dir=str(tmp_path))
+    metrics.record_request_detail("req1", "m", 10, 8, True, msg_types='{"text":1}')
+    metrics.record_request_detail("req2", "m", 0, 0, False)
+    metrics.update_request_timing("req1", "anthropic", 1234.56, first_byte_ms=200.04)
+    metrics.update_request_timing("missing", "anthropic", 1.0)
+
+    feed = json.loads(metrics.get_recent_requests_json())
+    assert [r["request_id"] for r in feed] == ["req2", "req1"]
+    assert feed[1]["provider"] == "anthropic" and feed[1]["duration_ms"] == 1234.6
+    assert feed[1]["first_byte_ms"] == 200.0 and feed[1]["msg_types"] == '{"text":1}'
+    assert feed == metrics.get_recent_requests()
+
+
+def test_lease_goes_to_one_caller_until_it_expires(tmp_path):
+    worker_a = MetricsCollector(cache_dir=str(tmp_path))
+    worker_b = MetricsCollector(cache_dir=str(tmp_path))
+    assert worker_a.acquire_lease("error_retention", ttl=60)
+    assert not worker_b.acquire_lease("error_retention", ttl=60)
+    assert worker_b.acquire_lease("other", ttl=60)
+    assert worker_b.acquire_lease("expired", ttl=-1) and worker_a.acquire_lease("expired", ttl=60)
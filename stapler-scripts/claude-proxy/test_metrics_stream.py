@@ -0,0 +1,99 @@
+"""Tests for metrics_stream — one shared producer, snapshot then deltas, coalescing slow viewers."""
+
+import asyncio
+import json
+
+from metrics_stream import MetricsBroadcaster
+
+
+def _events(chunks):
+    """[(event, data)] from SSE text chunks, skipping retry / ping lines."""
+    out = []
+    for chunk in chunks:
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines() if not line.startswith(":"))
+        if "event" in fields:
+            out.append((fields["event"], json.loads(fields["data"])))
+    return out
+
+
+def test_viewers_share_one_producer_and_get_only_changes():
+    calls = []
+
+    async def produce():
+        calls.append(1)
+        return {"summary": {"total": len(calls) // 3}, "static": [1, 2, 3]}
+
+    async def read(broadcaster, n):
+        chunks, stream = [], broadcaster.subscribe()
+        while len(_events(chunks)) < n:
+            chunks.append(await stream.__anext__())
+        await stream.aclose()
+        return _events(chunks)
+
+    async def main():
+        broadcaster = MetricsBroadcaster(produce, interval=0.01, max_age=5)
+        first, second = await asyncio.gather(read(broadcaster, 3), read(broadcaster, 3))
+        ticks = broadcaster.ticks
+        await asyncio.sleep(0.05)  # both gone: the producer stops
+        assert broadcaster.subscribers == 0 and broadcaster.ticks == ticks
+        return first, second, ticks
+
+    first, second, ticks = asyncio.run(main())
+    assert first[0][0] == "snapshot" and first[0][1]["static"] == [1, 2, 3]
+    assert [name for name, _ in first[1:]] == ["delta", "delta"]
+    assert all(set(data) == {"summary"} for _, data in first[1:])  # unchanged keys aren't resent
+    assert second[0][0] == "snapshot"
+    assert ticks < 12  # one producer for both viewers, not one each
+
+
+def test_slow_viewer_receives_merged_delta():
+    values = iter(range(1000))
+
+    async def produce():
+        return {"a": next(values), "b": "same"}
+
+    async def main():
+        broadcaster = MetricsBroadcaster(produce, interval=0.01, max_age=5)
+        stream = broadcaster.subscribe()
+        await stream.__anext__()  # retry:
+        snapshot = await stream.__anext__()
+        await asyncio.sleep(0.1)  # several ticks go by unread
+        delta = await stream.__anext__()
+        await stream.aclose()
+        return _events([snapshot, delta]), broadcaster
+
+    (snap, delta), broadcaster = asyncio.run(main())
+    assert delta[0] == "delta" and delta[1]["a"] >= snap[1]["a"] + 5 and "b" not in delta[1]
+    assert broadcaster.subscribers == 0
+
+
+def test_stream_ends_after_max_age():
+    async def produce():
+        return {"a": 1}
+
+    async def main():
+        broadcaster = MetricsBroadcaster(produce, interval=0.01, keepalive=0.02, max_age=0.1)
+        return [chunk async for chunk in broadcaster.subscribe()]
+
+    chunks = asyncio.run(main())
+    assert chunks[0].startswith("retry: ")
+    assert [name for name, _ in _events(chunks)] == ["snapshot"]
+    assert ": ping\n\n" in chunks
+
+
+def test_stream_pings_and_ends_at_max_age_without_a_snapshot():
+    async def produce():
+        raise RuntimeError("metrics unavailable")
+
+    async def collect(stream):
+        return [chunk async for chunk in stream]
+
+    async def main():
+        broadcaster = MetricsBroadcaster(produce, interval=0.01, keepalive=0.05, max_age=0.2)
+        chunks = await asyncio.wait_for(collect(broadcaster.subscribe()), timeout=1.0)
+        await asyncio.sleep(0.05)
+        return chunks, broadcaster.subscribers
+
+    chunks, subscribers = asyncio.run(main())
+    assert chunks[0].startswith("retry: ") and _events(chunks) == []
+    assert ": ping\n\n" in chunks and subscribers == 0
@@ -0,0 +1,179 @@
+"""Tests for mock_upstream — the synthetic Anthropic / Bedrock APIs used by bench.py load."""
+
+import asyncio
+import base64
+import json
+import threading
+import time
+
+import pytest
+import uvicorn
+from botocore.eventstream import EventStreamBuffer
+from fastapi.testclient import TestClient
+
+from mock_upstream import MockUpstreamConfig, MOCK_MODELS, create_app, estimate_tokens
+
+
+def make_client(**overrides) -> TestClient:
+    cfg = MockUpstreamConfig(token_rate=0, ttft_ms=0, jitter=0, output_tokens=5, seed=7)
+    for key, value in overrides.items():
+        setattr(cfg, key, value)
+    return TestClient(create_app(cfg))
+
+
+def _events(text: str) -> list[dict]:
+    return [json.loads(line[6:]) for line in text.splitlines() if line.startswith("data: ")]
+
+
+def _bedrock_events(raw: bytes) -> list:
+    """Decode an InvokeModelWithResponseStream body with botocore's own parser."""
+    buffer = EventStreamBuffer()
+    buffer.add_data(raw)
+    return list(buffer)
+
+
+class TestMockUpstream:
+    def test_stream_is_well_formed(self):
+        client = make_client()
+        resp = client.post("/v1/messages", json={"model": "claude-sonnet-4-6", "stream": True, "messages": []})
+
+        assert resp.status_code == 200
+        events = _events(resp.text)
+        types = [e["type"] for e in events]
+        assert types[0] == "message_start"
+        assert types[-1] == "message_stop"
+        assert types.count("content_block_delta") == 5
+        assert events[0]["message"]["model"] == "claude-sonnet-4-6"
+
+        stats = client.get("/mock/stats").json()
+        assert stats["streams_completed"] == 1
+
+    def test_non_stream_response(self):
+        client = make_client()
+        resp = client.post("/v1/messages", json={"model": "claude-opus-4-6", "messages": []})
+
+        body = resp.json()
+        assert body["type"] == "message"
+        assert body["content"][0]["text"].split() == [f"tok{i}" for i in range(5)]
+
+    def test_usage_reflects_received_messages(self):
+        client = make_client()
+        messages = [{"role": "user", "content": "x" * 400}]
+        body = client.post("/v1/messages", json={"messages": messages}).json()
+        events = _events(client.post("/v1/messages", json={"stream": True, "messages": messages}).text)
+
+        assert body["usage"]["input_tokens"] == estimate_tokens(messages) > 100
+        assert events[0]["message"]["usage"]["input_tokens"] == estimate_tokens(messages)
+
+    def test_injects_429_with_retry_after(self):
+        client = make_client(error_429_rate=1.0, retry_after=3)
+        resp = client.post("/v1/messages", json={"stream": True, "messages": []})
+
+        assert resp.status_code == 429
+        assert resp.headers["retry-after"] == "3"
+        assert client.get("/mock/stats").json()["rate_limited"] == 1
+
+    def test_injects_server_error(self):
+        client = make_client(error_5xx_rate=1.0, server_error_status=500)
+        resp = client.post("/v1/messages", json={"messages": []})
+
+        assert resp.status_code == 500
+        assert resp.json()["error"]["type"] == "api_error"
+
+    def test_models_list_includes_bench_model(self):
+        data = make_client().get("/v1/models").json()["data"]
+        assert {m["id"] for m in data} == set(MOCK_MODELS)
+        assert "claude-sonnet-4-6" in MOCK_MODELS
+
+    def test_anthropic_unavailable_rejects_everything(self):
+        client = make_client(anthropic_available=False)
+        resp = client.post("/v1/messages", json={"stream": True, "messages": []})
+
+        assert resp.status_code == 429
+        assert client.get("/mock/stats").json()["anthropic_rejected"] == 1
+
+
+class TestMockBedrock:
+    MODEL_ID = "us.anthropic.claude-sonnet-4-6"
+
+    def test_stream_uses_event_stream_framing(self):
+        client = make_client()
+        resp = client.post(f"/model/{self.MODEL_ID}/invoke-with-response-stream", json={"messages": []})
+
+        assert resp.status_code == 200
+        assert resp.headers["content-type"] == "application/vnd.amazon.eventstream"
+        messages = _bedrock_events(resp.content)
+        assert all(m.headers[":event-type"] == "chunk" for m in messages)
+        chunks = [json.loads(base64.b64decode(json.loads(m.payload)["bytes"])) for m in messages]
+        assert chunks[0]["type"] == "message_start"
+        assert chunks[0]["message"]["model"] == "claude-sonnet-4-6"
+        assert [c["type"] for c in chunks].count("content_block_delta") == 5
+        metrics = chunks[-1]["amazon-bedrock-invocationMetrics"]
+        assert metrics["outputTokenCount"] == 5
+        assert metrics["invocationLatency"] >= metrics["firstByteLatency"] >= 0
+
+    def test_invoke_returns_message_and_token_headers(self):
+        client = make_client()
+        resp = client.post(f"/model/{self.MODEL_ID}/invoke", json={"messages": []})
+
+        assert resp.json()["type"] == "message"
+        assert resp.headers["x-amzn-bedrock-output-token-count"] == "5"
+        assert client.get("/mock/stats").json()["bedrock_requests"] == 1
+
+    def test_injected_throttle_uses_aws_error_shape(self):
+        client = make_client(error_429_rate=1.0)
+        resp = client.post(f"/model/{self.MODEL_ID}/invoke", json={"messages": []})
+
+        assert resp.status_code == 429
+        assert resp.headers["x-amzn-errortype"].startswith("ThrottlingException")
+
+
+@pytest.fixture
+def mock_server():
+    """Run the mock on a real socket so boto3 can talk to it."""
+    server = uvicorn.Server(uvicorn.Config(
+        create_app(MockUpstreamConfig(token_rate=0, ttft_ms=0, jitter=0, output_tokens=5, seed=7)),
+        host="127.0.0.1", port=0, log_level="warning",
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 10
+    while not server.started and time.time() < deadline:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(timeout=5)
+
+
+class TestBedrockProviderAgainstMock:
+    @pytest.fixture
+    def provider(self, mock_server, monkeypatch):
+        import config
+        monkeypatch.setattr(config, "BEDROCK_ENDPOINT_URL", mock_server)
+        monkeypatch.delenv("AWS_PROFILE", raising=False)
+        monkeypatch.delenv("AWS_SESSION_TOKEN", raising=False)
+        monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+        monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+        from providers.bedrock import BedrockProvider
+        provider = BedrockProvider()
+        yield provider
+        provider.executor.shutdown(wait=False)
+
+    def test_stream_message_round_trip(self, provider):
+        body = {"model": "claude-sonnet-4-6", "max_tokens": 16, "stream": True, "messages": [{"role": "user", "content": "hi"}]}
+
+        async def collect():
+            return [chunk async for chunk in provider.stream_message(body, "", "oauth")]
+
+        chunks = [json.loads(c[6:]) for c in asyncio.run(collect())]
+        assert chunks[0]["type"] == "message_start"
+        assert chunks[-1]["type"] == "message_stop"
+        assert "amazon-bedrock-invocationMetrics" in chunks[-1]
+
+    def test_send_message_round_trip(self, provider):
+        body = {"model": "claude-sonnet-4-6", "max_tokens": 16, "messages": [{"role": "user", "content": "hi"}]}
+
+        result = asyncio.run(provider.send_message(body, "", "oauth"))
+        assert result["model"] == "claude-sonnet-4-6"
+        assert result["content"][0]["text"].startswith("tok0")
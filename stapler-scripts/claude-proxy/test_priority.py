@@ -0,0 +1,87 @@
+"""Tests for priority — request classification and the weighted-fair queue."""
+
+import asyncio
+
+import pytest
+
+from priority import (BACKGROUND, DEFAULT_RULES, INTERACTIVE, WeightedFairQueue, classify, parse_rules,
+                      parse_weights)
+
+WEIGHTS = parse_weights("interactive=4,background=1")
+
+
+def _body(model="claude-sonnet-4-6", stream=True, max_tokens=32000):
+    return {"model": model, "stream": stream, "max_tokens": max_tokens, "messages": []}
+
+
+def test_classify_defaults_header_override_and_custom_rules():
+    assert WEIGHTS == {INTERACTIVE: 4.0, BACKGROUND: 1.0}
+    assert classify(_body(), {}, DEFAULT_RULES, WEIGHTS) == INTERACTIVE
+    assert classify(_body(model="claude-haiku-4-5"), {}, DEFAULT_RULES, WEIGHTS) == BACKGROUND
+    assert classify(_body(stream=False), {}, DEFAULT_RULES, WEIGHTS) == BACKGROUND
+    assert classify(_body(max_tokens=512), {}, DEFAULT_RULES, WEIGHTS) == BACKGROUND
+    assert classify(_body(model="claude-haiku-4-5"), {"x-proxy-priority": "interactive"}, DEFAULT_RULES, WEIGHTS) == INTERACTIVE
+    assert classify(_body(), {"x-proxy-priority": "bogus"}, DEFAULT_RULES, WEIGHTS) == INTERACTIVE
+
+    rules = parse_rules('[{"class": "background", "header": "user-agent", "value": "^batch/"},'
+                        ' {"class": "interactive", "model": "opus"}, {"class": "background", "stream": true}]')
+    assert classify(_body(model="claude-opus-4-6"), {"user-agent": "batch/1.0"}, rules, WEIGHTS) == BACKGROUND
+    assert classify(_body(model="claude-opus-4-6"), {"user-agent": "cli/2.0"}, rules, WEIGHTS) == INTERACTIVE
+    assert classify(_body(), {}, rules, WEIGHTS) == BACKGROUND
+    with pytest.raises(ValueError):
+        parse_rules('[{"model": "haiku"}]')
+
+
+def test_uncontended_requests_pass_and_capacity_zero_never_queues():
+    async def run():
+        queue = WeightedFairQueue(0, WEIGHTS)
+        for _ in range(10):
+            assert await queue.acquire(BACKGROUND) == 0.0
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert stats["in_flight"] == 10 and stats["classes"][BACKGROUND]["waited"] == 0
+
+
+def test_contended_slots_go_to_interactive_four_to_one_without_starving_background():
+    async def run():
+        queue = WeightedFairQueue(1, WEIGHTS)
+        order = []
+
+        async def request(priority):
+            async with queue.slot(priority):
+                order.append(priority)
+                await asyncio.sleep(0)
+
+        await queue.acquire(INTERACTIVE)  # holds the only slot while everything else queues
+        tasks = [asyncio.create_task(request(p)) for p in [BACKGROUND] * 4 + [INTERACTIVE] * 8]
+        await asyncio.sleep(0)
+        assert queue.stats()["classes"][BACKGROUND]["queued"] == 4
+        queue.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return order, queue.stats()
+
+    order, stats = asyncio.run(run())
+    assert order[:5].count(INTERACTIVE) == 4 and BACKGROUND in order[:5]
+    assert order[-2:] == [BACKGROUND, BACKGROUND]
+    assert stats["in_flight"] == 0 and stats["classes"][BACKGROUND]["waited"] == 4
+    assert stats["classes"][BACKGROUND]["queue_wait_ms"]["max"] > 0
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def run():
+        queue = WeightedFairQueue(1, WEIGHTS)
+        await queue.acquire(INTERACTIVE)
+        abandoned = asyncio.create_task(queue.acquire(INTERACTIVE))
+        waiting = asyncio.create_task(queue.acquire(BACKGROUND))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.sleep(0)
+        queue.release(INTERACTIVE)
+        await waiting
+        return queue.stats()
+
+    stats = asyncio.run(run())
+    assert stats["in_flight"] == 1
+    assert stats["classes"][BACKGROUND]["in_flight"] == 1 and stats["classes"][INTERACTIVE]["in_flight"] == 0
+    assert stats["classes"][INTERACTIVE]["queued"] == 0
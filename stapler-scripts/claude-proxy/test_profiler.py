@@ -0,0 +1,161 @@
+"""Tests for profiler — in-flight request tracking and the /debug sampling profiler."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from profiler import InflightMiddleware, InflightRegistry, ProfilerBusy, SamplingProfiler, collapse
+
+
+def _spin(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestInflightRegistry:
+    def test_tracks_child_tasks_and_await_points(self):
+        registry = InflightRegistry()
+        release = asyncio.Event()
+
+        async def ticks():
+            await release.wait()
+            yield 1
+
+        async def stream_body():
+            async for _ in ticks():
+                pass
+
+        async def handler(scope, receive, send):
+            await asyncio.create_task(stream_body())
+
+        async def main():
+            registry.install(asyncio.get_running_loop())
+            app = InflightMiddleware(handler, registry)
+            request = asyncio.create_task(app({"type": "http", "method": "POST", "path": "/v1/messages"}, None, None))
+            await asyncio.sleep(0.05)
+            snapshot = registry.snapshot()
+            release.set()
+            await request
+            return snapshot, registry.snapshot()
+
+        during, after = asyncio.run(main())
+
+        [entry] = during["inflight"]
+        assert entry["path"] == "/v1/messages" and entry["age_s"] >= 0.04
+        assert len(entry["tasks"]) == 2
+        # Walked through `async for` into the generator
+        assert "test_profiler.py:TestInflightRegistry.test_tracks_child_tasks_and_await_points.<locals>.ticks" in entry["app_frame"]
+        assert entry["await_point"].endswith("awaiting <Future>")
+        assert after["inflight"] == [] and registry._task_owner == {}
+
+
+class TestSamplingProfiler:
+    def test_threads_mode_labels_threads_and_request_tasks(self):
+        registry = InflightRegistry()
+        profiler = SamplingProfiler(registry)
+        stop = threading.Event()
+        worker = threading.Thread(target=lambda: [_spin(0.01) for _ in iter(stop.is_set, True)],
+                                  name="busy-worker_3", daemon=True)
+
+        async def busy_request():
+            token = registry.begin("GET", "/busy")
+            try:
+                # Bursts well past the 5ms GIL switch interval, so samples land inside them
+                for _ in range(10):
+                    _spin(0.03)
+                    await asyncio.sleep(0)
+            finally:
+                registry.end(token)
+
+        async def main():
+            task = asyncio.create_task(busy_request())
+            counts = await profiler.profile(0.3, hz=200, mode="threads")
+            await task
+            return counts
+
+        worker.start()
+        try:
+            counts = asyncio.run(main())
+        finally:
+            stop.set()
+        stacks = list(counts)
+        assert any(s.startswith("thread:busy-worker;") and s.endswith("_spin") for s in stacks)
+        assert any(";task:GET /busy;" in s and s.endswith("_spin") for s in stacks)
+        assert not any("debug-profiler" in s for s in stacks)
+
+    def test_tasks_mode_records_suspended_requests(self):
+        registry = InflightRegistry()
+        profiler = SamplingProfiler(registry)
+
+        async def waiting_request():
+            token = registry.begin("POST", "/v1/messages")
+            try:
+                await asyncio.sleep(0.5)
+            finally:
+                registry.end(token)
+
+        async def main():
+            task = asyncio.create_task(waiting_request())
+            await asyncio.sleep(0)
+            counts = await profiler.profile(0.2, hz=50, mode="tasks")
+            task.cancel()
+            return counts
+
+        counts = asyncio.run(main())
+        [stack] = [s for s in counts if s.startswith("request:POST /v1/messages;")]
+        assert "waiting_request" in stack and stack.endswith("<Future>")
+        assert counts[stack] >= 5
+
+    def test_one_profile_at_a_time(self):
+        profiler = SamplingProfiler(InflightRegistry())
+
+        async def main():
+            first = asyncio.create_task(profiler.profile(0.2, mode="tasks"))
+            await asyncio.sleep(0.01)
+            with pytest.raises(ProfilerBusy):
+                await profiler.profile(0.1)
+            await first
+
+        asyncio.run(main())
+
+    def test_collapse_heaviest_first(self):
+        from collections import Counter
+        assert collapse(Counter({"a;b": 1, "a;c": 3})) == "a;c 3\na;b 1\n"
+
+
+class TestDebugEndpoints:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        import config
+        from main import app
+        monkeypatch.setattr(config, "DEBUG_TOKEN", "s3cret")
+        return TestClient(app)
+
+    def test_disabled_without_token(self, client, monkeypatch):
+        import config
+        monkeypatch.setattr(config, "DEBUG_TOKEN", None)
+        assert client.get("/debug/tasks", headers={"Authorization": "Bearer s3cret"}).status_code == 404
+
+    def test_rejects_wrong_token(self, client):
+        assert client.get("/debug/tasks", headers={"Authorization": "Bearer nope"}).status_code == 401
+        assert client.get("/debug/profile?seconds=0.1").status_code == 401
+
+    def test_tasks_lists_the_request_itself(self, client):
+        data = client.get("/debug/tasks", headers={"Authorization": "Bearer s3cret"}).json()
+        assert [r["path"] for r in data["inflight"]] == ["/debug/tasks"]
+
+    def test_profile_returns_collapsed_stacks(self, client):
+        resp = client.get("/debug/profile?seconds=0.2&hz=50", headers={"x-api-key": "s3cret"})
+        assert resp.status_code == 200
+        assert resp.headers["x-profile-mode"] == "threads"
+        assert int(resp.headers["x-profile-samples"]) > 0
+        assert all(line.rsplit(" ", 1)[1].isdigit() for line in resp.text.splitlines())
+
+    def test_profile_validates_params(self, client):
+        headers = {"Authorization": "Bearer s3cret"}
+        assert client.get("/debug/profile?mode=heap", headers=headers).status_code == 400
+        assert client.get("/debug/profile?seconds=0", headers=headers).status_code == 400
@@ -21,10 +21,12 @@ def disable_compression(monkeypatch):
 def make_bedrock_provider():
     """Create a BedrockProvider with all external dependencies mocked."""
     with patch("providers.bedrock.boto3.Session") as mock_session, \
-         patch("providers.bedrock.ThreadPoolExecutor"), \
+         patch("providers.bedrock.InstrumentedThreadPoolExecutor"), \
          patch("providers.bedrock.Cache"), \
-         patch("providers.bedrock.config"):
+         patch("providers.bedrock.config") as mock_config:
         mock_session.return_value.client.return_value = MagicMock()
+        mock_config.BEDROCK_THREAD_POOL_SIZE = 4
+        mock_config.BEDROCK_POOL_AUTOSCALE = False
         from providers.bedrock import BedrockProvider
         provider = BedrockProvider()
         # Give the mock client some exception classes for _handle_bedrock_error
@@ -220,6 +222,96 @@ class TestPrepareBedrockBody:
         assert json.dumps(body, sort_keys=True) == original
 
 
+# ===========================================================================
+# BedrockProvider credential manager — refresh off the request path
+# ===========================================================================
+
+class TestCredentialManager:
+    def setup_method(self):
+        from datetime import datetime, timedelta
+        self.provider = make_bedrock_provider()
+        self.provider._is_sso_login_in_progress = lambda: (False, 0)
+        self.expiring_in = lambda minutes: MagicMock(_expiry_time=datetime.now() + timedelta(minutes=minutes))
+
+    def test_fresh_credentials_are_left_alone(self):
+        self.provider.session.get_credentials.return_value = self.expiring_in(60)
+        self.provider._build_client = MagicMock()
+
+        delay = self.provider._refresh_credentials()
+        assert delay == 60  # BEDROCK_CREDENTIAL_CHECK_INTERVAL caps the gap
+        self.provider._build_client.assert_not_called()
+        assert 3500 < self.provider.credential_status()["expires_in_s"] <= 3600
+
+    def test_refreshes_ahead_of_expiry_and_publishes_the_new_client(self):
+        old_client, new_session, new_client = self.provider.client, MagicMock(), MagicMock()
+        self.provider.session.get_credentials.return_value = self.expiring_in(5)
+        new_session.get_credentials.return_value = self.expiring_in(60)
+        self.provider._build_client = MagicMock(return_value=(new_session, new_client))
+        self.provider.cache.add.return_value = True
+
+        self.provider._refresh_credentials()
+        assert self.provider.client is new_client is not old_client
+        assert self.provider.session is new_session
+        assert self.provider.cache.add.call_args.args[0].startswith("creds_refresh:")
+        self.provider.cache.delete.assert_called_once()  # lease released for the next worker
+
+    def test_waits_while_another_worker_holds_the_refresh_lease(self):
+        self.provider.session.get_credentials.return_value = self.expiring_in(5)
+        self.provider._build_client = MagicMock()
+        self.provider.cache.add.return_value = False
+
+        assert self.provider._refresh_credentials() == 5
+        self.provider._build_client.assert_not_called()
+
+    def test_expired_credentials_fail_requests_without_touching_boto3(self):
+        from providers import AuthenticationError
+        self.provider.session.get_credentials.return_value = self.expiring_in(-10)
+        self.provider._trigger_sso_login = lambda: False
+        self.provider._refresh_credentials()
+
+        self.provider.session.get_credentials.reset_mock()
+        with pytest.raises(AuthenticationError, match="SSO login failed"):
+            asyncio.run(self.provider.send_message({"model": "claude-sonnet-4-6", "messages": []}, "", "oauth"))
+        self.provider.session.get_credentials.assert_not_called()
+        self.provider.executor.submit.assert_not_called()
+
+    def test_sso_login_backs_off_until_credentials_are_valid(self):
+        self.provider.session.get_credentials.return_value = self.expiring_in(-10)
+        self.provider._build_client = MagicMock(return_value=(self.provider.session, self.provider.client))
+        self.provider._trigger_sso_login = MagicMock(return_value=True)
+
+        # The login "succeeds" but the profile's credentials stay expired
+        assert self.provider._refresh_credentials() == 5
+        assert "login completed" in self.provider.credential_status()["error"]
+        assert self.provider._refresh_credentials() == 5
+        assert "retrying login in" in self.provider.credential_status()["error"]
+        self.provider._trigger_sso_login.assert_called_once()  # no browser reopened per pass
+
+        self.provider._sso_login_at -= 120
+        self.provider._trigger_sso_login.return_value = False
+        self.provider._refresh_credentials()
+        assert "login failed" in self.provider.credential_status()["error"]
+        assert self.provider._trigger_sso_login.call_count == 2
+
+        self.provider.session.get_credentials.return_value = self.expiring_in(60)
+        self.provider._refresh_credentials()
+        assert self.provider.credential_status()["error"] is None
+
+    def test_expired_token_error_wakes_the_manager(self):
+        async def main():
+            self.provider._refresh_credentials = MagicMock(return_value=3600)
+            task = asyncio.create_task(self.provider.run_credential_refresh_loop())
+            await asyncio.sleep(0.05)
+            with pytest.raises(Exception):
+                self.provider._handle_bedrock_error(Exception("The security token expired"))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            return self.provider._refresh_credentials.call_count
+
+        assert asyncio.run(main()) == 2
+        assert self.provider._force_refresh
+
+
 # ===========================================================================
 # BedrockProvider._stream_bedrock_sync — event routing
 # ===========================================================================
@@ -311,6 +403,21 @@ class TestStreamBedrockSync:
         close_calls = [c for c in mock_run.call_args_list if c.args[0] == send_stream.aclose]
         assert len(close_calls) == 1
 
+    def test_stream_message_surfaces_worker_error_unwrapped(self):
+        """A throttle in the worker thread must reach FallbackHandler as RateLimitError, not an ExceptionGroup."""
+        from providers import RateLimitError
+        self.provider.executor = None  # default loop executor
+        self.provider.client.invoke_model_with_response_stream.side_effect = (
+            self.provider.client.exceptions.ThrottlingException("slow down")
+        )
+
+        async def consume():
+            body = {"model": "claude-sonnet-4-6", "messages": [{"role": "user", "content": "hi"}]}
+            return [chunk async for chunk in self.provider.stream_message(body, "", "oauth")]
+
+        with pytest.raises(RateLimitError):
+            asyncio.run(consume())
+
 
 # ===========================================================================
 # Provider._clean_message_content  (base class, shared by both providers)
@@ -746,6 +853,167 @@ class TestFallbackHandler:
             assert self.bedrock.send_message.call_count == 2
 
 
+# ===========================================================================
+# FallbackHandler.stream_message — mid-stream resumption
+# ===========================================================================
+
+def _sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def _text_stream(*texts, stop=True):
+    """SSE events for a single text block streaming the given deltas."""
+    events = [
+        _sse({"type": "message_start", "message": {"id": "msg_1", "role": "assistant", "content": []}}),
+        _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}),
+    ]
+    events += [_sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": t}}) for t in texts]
+    if stop:
+        events += [
+            _sse({"type": "content_block_stop", "index": 0}),
+            _sse({"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 5}}),
+            _sse({"type": "message_stop"}),
+        ]
+    return events
+
+
+def _failing_stream(chunks, error):
+    async def gen(*args, **kwargs):
+        for chunk in chunks:
+            yield chunk
+        raise error
+    return gen
+
+
+def _recording_stream(chunks, calls):
+    async def gen(body, *args, **kwargs):
+        calls.append(body)
+        for chunk in chunks:
+            yield chunk
+    return gen
+
+
+class TestStreamResume:
+    def setup_method(self):
+        self.anthropic = MagicMock()
+        self.anthropic.name = "anthropic"
+        self.bedrock = MagicMock()
+        self.bedrock.name = "bedrock"
+
+        with patch("fallback.diskcache.Cache") as mock_cache_cls:
+            mock_cache = MagicMock()
+            mock_cache.get.return_value = None
+            mock_cache.__iter__.return_value = iter([])
+            mock_cache_cls.return_value = mock_cache
+
+            from fallback import FallbackHandler
+            self.handler = FallbackHandler([self.anthropic, self.bedrock])
+            self.cooldowns = mock_cache
+
+        self.body = {"model": "claude-sonnet-4-5", "messages": [{"role": "user", "content": "count"}]}
+
+    async def _collect(self, enabled=True):
+        with patch("fallback.config") as mock_config:
+            mock_config.STREAM_RESUME_ENABLED = enabled
+            mock_config.BEDROCK_MAX_RETRIES = 1
+            return [c async for c in self.handler.stream_message(self.body, "token", "oauth", request_id="req1")]
+
+    @pytest.mark.asyncio
+    async def test_resumes_on_next_provider_with_prefill(self):
+        from providers import ServerError
+
+        calls = []
+        self.anthropic.stream_message = _failing_stream(_text_stream("one two ", stop=False), ServerError("reset", 502))
+        self.bedrock.stream_message = _recording_stream(_text_stream(" three"), calls)
+
+        chunks = await self._collect()
+        events = [json.loads(c[6:]) for c in chunks]
+
+        # Continuation request carries the partial assistant turn, minus trailing whitespace
+        assert calls[0]["messages"][-1] == {"role": "assistant", "content": [{"type": "text", "text": "one two"}]}
+        assert calls[0]["messages"][:-1] == self.body["messages"]
+        # Single message_start and content_block_start — continuation merged into block 0
+        assert [e["type"] for e in events].count("message_start") == 1
+        assert [e["type"] for e in events].count("content_block_start") == 1
+        text = "".join(e["delta"]["text"] for e in events if e["type"] == "content_block_delta")
+        assert text == "one two three"
+        assert all(e["index"] == 0 for e in events if "index" in e)
+        assert events[-1]["type"] == "message_stop"
+
+    @pytest.mark.asyncio
+    async def test_interrupted_provider_goes_into_cooldown(self):
+        from providers import ServerError
+
+        self.anthropic.stream_message = _failing_stream(_text_stream("one", stop=False), ServerError("reset", 502))
+        self.bedrock.stream_message = _recording_stream(_text_stream(" two"), [])
+        await self._collect()
+
+        name, entry = self.cooldowns.set.call_args.args
+        assert name == "anthropic" and entry["reason"] == "stream_interrupted"
+
+    @pytest.mark.asyncio
+    async def test_other_interruptions_start_no_cooldown(self):
+        self.anthropic.stream_message = _failing_stream(_text_stream("one", stop=False), ValueError("bad chunk"))
+        self.bedrock.stream_message = _recording_stream(_text_stream(" two"), [])
+        await self._collect()
+
+        self.cooldowns.set.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_resume_after_closed_block_shifts_indices(self):
+        from providers import ServerError
+
+        first = _text_stream("intro")[:-2]  # block 0 closed, no message_delta/stop
+        self.anthropic.stream_message = _failing_stream(first, ServerError("reset", 502))
+        self.bedrock.stream_message = _recording_stream(_text_stream("more"), [])
+
+        events = [json.loads(c[6:]) for c in await self._collect()]
+
+        starts = [e for e in events if e["type"] == "content_block_start"]
+        assert [s["index"] for s in starts] == [0, 1]
+
+    @pytest.mark.asyncio
+    async def test_in_band_error_event_triggers_resume(self):
+        partial = _text_stream("hello", stop=False)
+        error = _sse({"type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}})
+        self.anthropic.stream_message = _recording_stream(partial + [error], [])
+        self.bedrock.stream_message = _recording_stream(_text_stream(" world"), [])
+
+        chunks = await self._collect()
+
+        assert error not in chunks
+        assert json.loads(chunks[-1][6:])["type"] == "message_stop"
+
+    @pytest.mark.asyncio
+    async def test_tool_use_in_progress_is_not_resumed(self):
+        from providers import ServerError
+
+        chunks = [
+            _sse({"type": "message_start", "message": {"id": "msg_1"}}),
+            _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "tool_use", "id": "toolu_1", "name": "Bash"}}),
+        ]
+        self.anthropic.stream_message = _failing_stream(chunks, ServerError("reset", 502))
+        calls = []
+        self.bedrock.stream_message = _recording_stream(_text_stream("x"), calls)
+
+        with pytest.raises(ServerError):
+            await self._collect()
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_disabled_raises_instead_of_replaying(self):
+        from providers import ServerError
+
+        self.anthropic.stream_message = _failing_stream(_text_stream("partial", stop=False), ServerError("reset", 502))
+        calls = []
+        self.bedrock.stream_message = _recording_stream(_text_stream("x"), calls)
+
+        with pytest.raises(ServerError):
+            await self._collect(enabled=False)
+        # A fresh stream on top of already-sent bytes would duplicate message_start
+        assert calls == []
+
+
 # ===========================================================================
 # BedrockProvider._handle_bedrock_error — error classification
 # ===========================================================================
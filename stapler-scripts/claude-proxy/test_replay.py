@@ -0,0 +1,186 @@
+"""Tests for replay — transcript reconstruction, anonymization and the replay schedule."""
+
+import asyncio
+import json
+import os
+
+from replay import Anonymizer, ReplayRequest, Session, clean_content, discover_sessions, load_session, schedule
+
+
+def _user(content, ts, **extra):
+    return {"type": "user", "timestamp": ts, "message": {"role": "user", "content": content}, **extra}
+
+
+def _assistant(msg_id, block, ts, model="claude-sonnet-4-6", **extra):
+    return {"type": "assistant", "timestamp": ts,
+            "message": {"id": msg_id, "role": "assistant", "model": model, "content": [block]}, **extra}
+
+
+def _write(path, entries):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("\n".join(json.dumps(e) for e in entries) + "\n")
+    return path
+
+
+TRANSCRIPT = [
+    {"type": "queue-operation", "operation": "enqueue"},
+    _user("List the files", "2026-01-01T10:00:00Z"),
+    _assistant("msg_1", {"type": "thinking", "thinking": "hmm", "signature": "sig"}, "2026-01-01T10:00:02Z"),
+    _assistant("msg_1", {"type": "tool_use", "id": "toolu_a", "name": "Bash", "input": {"command": "ls"}},
+               "2026-01-01T10:00:02Z"),
+    # Tool result logged before the second block of the same response
+    _user([{"type": "tool_result", "tool_use_id": "toolu_a", "content": "main.py"}], "2026-01-01T10:00:03Z"),
+    _assistant("msg_1", {"type": "tool_use", "id": "toolu_b", "name": "Bash", "input": {"command": "pwd"}},
+               "2026-01-01T10:00:03Z"),
+    _user([{"type": "tool_result", "tool_use_id": "toolu_b", "content": "/src"}], "2026-01-01T10:00:04Z"),
+    {"type": "attachment", "attachment": {"type": "environment"}},
+    _assistant("msg_2", {"type": "text", "text": "Done"}, "2026-01-01T10:00:06Z"),
+    _assistant("msg_side", {"type": "text", "text": "subagent"}, "2026-01-01T10:00:07Z", isSidechain=True),
+    _user("Thanks", "2026-01-01T10:05:00Z"),
+    _assistant("msg_err", {"type": "text", "text": "API Error"}, "2026-01-01T10:05:01Z", model="<synthetic>"),
+    _user("Again?", "2026-01-01T10:05:10Z"),
+    _assistant("msg_3", {"type": "text", "text": "Sure"}, "2026-01-01T10:05:12Z"),
+    {"type": "system", "subtype": "compact_boundary"},
+    _user("Summary of the conversation", "2026-01-01T11:00:00Z", isCompactSummary=True),
+    _assistant("msg_4", {"type": "text", "text": "Continuing"}, "2026-01-01T11:00:05Z"),
+]
+
+
+class TestLoadSession:
+    def test_rebuilds_one_request_per_response(self, tmp_path):
+        path = _write(tmp_path / "-home-me-proj" / "sess-1.jsonl", TRANSCRIPT)
+        session = load_session(str(path))
+
+        assert session.session_id == "sess-1"
+        assert session.project == "-home-me-proj"
+        assert [r.index for r in session.requests] == [0, 1, 2, 3]
+        first, second, third, fourth = session.requests
+        assert first.messages == [{"role": "user", "content": "List the files"}]
+        assert first.timestamp == 1767261600.0
+
+        # Split response merged, thinking dropped, both tool results folded into one user turn
+        assert second.messages[1] == {"role": "assistant", "content": [
+            {"type": "tool_use", "id": "toolu_a", "name": "Bash", "input": {"command": "ls"}},
+            {"type": "tool_use", "id": "toolu_b", "name": "Bash", "input": {"command": "pwd"}},
+        ]}
+        assert [b["tool_use_id"] for b in second.messages[2]["content"]] == ["toolu_a", "toolu_b"]
+
+        # Sidechain and synthetic entries skipped; the two user turns merge
+        assert [m["role"] for m in third.messages] == ["user", "assistant", "user", "assistant", "user"]
+        assert third.messages[-1]["content"] == [{"type": "text", "text": "Thanks"}, {"type": "text", "text": "Again?"}]
+        assert third.timestamp - first.timestamp == 310
+
+        # Compact boundary starts over from the summary
+        assert fourth.messages == [{"role": "user", "content": "Summary of the conversation"}]
+
+    def test_earlier_snapshots_are_not_mutated(self, tmp_path):
+        path = _write(tmp_path / "p" / "s.jsonl", TRANSCRIPT)
+        first = load_session(str(path)).requests[0]
+        assert len(first.messages) == 1
+
+    def test_max_requests(self, tmp_path):
+        path = _write(tmp_path / "p" / "s.jsonl", TRANSCRIPT)
+        assert len(load_session(str(path), max_requests=2).requests) == 2
+
+    def test_skips_malformed_lines(self, tmp_path):
+        path = tmp_path / "p" / "s.jsonl"
+        _write(path, TRANSCRIPT[:3])
+        with open(path, "a") as f:
+            f.write("{not json\n")
+        assert len(load_session(str(path)).requests) == 1
+
+
+class TestAnonymizer:
+    def test_preserves_length_case_and_punctuation(self):
+        anon = Anonymizer("salt")
+        original = "Traceback: FooError at line 42 in Widget.render()"
+        out = anon.text(original)
+
+        assert len(out) == len(original)
+        assert out != original
+        for a, b in zip(original, out):
+            assert a.isalpha() == b.isalpha() and a.isdigit() == b.isdigit()
+            assert a.isupper() == b.isupper()
+            if not a.isalnum():
+                assert a == b
+        assert " at line " in out and " in " in out  # KEEP_WORDS untouched
+
+    def test_deterministic_per_salt(self):
+        assert Anonymizer("a").text("Widget widget") == Anonymizer("a").text("Widget widget")
+        assert Anonymizer("a").text("widget") != Anonymizer("b").text("widget")
+        first, second = Anonymizer("a").text("Widget widget").split()
+        assert first.lower() == second
+
+    def test_content_keeps_structure(self):
+        anon = Anonymizer("s")
+        content = [
+            {"type": "tool_use", "id": "toolu_x", "name": "Read", "input": {"file_path": "/secret/plan.md"}},
+            {"type": "tool_result", "tool_use_id": "toolu_x", "is_error": False,
+             "content": [{"type": "text", "text": "secret"}, {"type": "image", "source": {"data": "AAAA"}}]},
+        ]
+        tool_use, tool_result = clean_content(content, anon)
+
+        assert tool_use["id"] == "toolu_x" and tool_use["name"] == "Read"
+        assert list(tool_use["input"]) == ["file_path"]
+        assert "secret" not in tool_use["input"]["file_path"]
+        assert tool_result["tool_use_id"] == "toolu_x" and tool_result["is_error"] is False
+        assert tool_result["content"][0]["text"] != "secret"
+        assert tool_result["content"][1] == {"type": "text", "text": "[image]"}
+
+
+def _request(session_id, ts, index=0):
+    return ReplayRequest(session_id=session_id, index=index, timestamp=ts, model="m", messages=[])
+
+
+class TestSchedule:
+    def test_interleaves_sessions_and_caps_gaps(self):
+        a = Session("a", "p", "a.jsonl", [_request("a", 100.0), _request("a", 110.0, 1), _request("a", 1000.0, 2)])
+        b = Session("b", "p", "b.jsonl", [_request("b", 104.0)])
+
+        plan = schedule([a, b], speed=2.0, max_gap=30.0)
+
+        assert [(r.session_id, r.index) for _, r in plan] == [("a", 0), ("b", 0), ("a", 1), ("a", 2)]
+        assert [offset for offset, _ in plan] == [0.0, 2.0, 5.0, 20.0]
+
+    def test_speed_zero_is_back_to_back(self):
+        s = Session("a", "p", "a.jsonl", [_request("a", 100.0), _request("a", 500.0, 1)])
+        assert [offset for offset, _ in schedule([s], speed=0)] == [0.0, 0.0]
+
+    def test_uncapped_real_time(self):
+        s = Session("a", "p", "a.jsonl", [_request("a", 100.0), _request("a", 500.0, 1)])
+        assert schedule([s], speed=1.0, max_gap=None)[1][0] == 400.0
+
+
+def test_discover_sessions_newest_first(tmp_path):
+    old = _write(tmp_path / "-work-api" / "old.jsonl", TRANSCRIPT)
+    new = _write(tmp_path / "-work-api" / "new.jsonl", TRANSCRIPT)
+    other = _write(tmp_path / "-home-notes" / "x.jsonl", TRANSCRIPT)
+    os.utime(old, (1000, 1000))
+    os.utime(other, (2000, 2000))
+
+    assert discover_sessions(str(tmp_path), limit=2) == [new, other]
+    assert discover_sessions(str(tmp_path), project="api") == [new, old]
+
+
+def test_replay_plan_and_report():
+    import bench
+
+    a = Session("sess-a", "p", "a.jsonl", [_request("sess-a", 0.0), _request("sess-a", 1.0, 1)])
+    plan = schedule([a], speed=20.0)
+
+    async def send(request, start):
+        before = 100 * (request.index + 1)
+        return {"ok": True, "error": None, "tokens_before": before, "tokens_after": before // 2,
+                "latency_ms": 5.0 * (request.index + 1), "ttft_ms": None}
+
+    results = asyncio.run(bench._replay_plan(plan, send, 20.0))
+    assert [(r["session"], r["index"], r["sent_s"]) for r in results] == [("sess-a", 0, 0.0), ("sess-a", 1, 0.05)]
+
+    report = bench._replay_report([a], plan, results, wall=0.1, params={"target": "test", "timing": "20x"})
+    assert report["original_span_s"] == 1.0
+    session = report["sessions"][0]
+    assert session["requests"] == 2 and session["ok"] == 2
+    assert session["tokens_before"] == 300 and session["tokens_after"] == 150
+    assert session["reduction_pct"] == 50.0
+    assert session["latency_ms"]["max"] == 10.0
+    assert report["total"]["requests"] == 2 and "ttft_ms" not in report["total"]
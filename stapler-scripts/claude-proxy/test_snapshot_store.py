@@ -0,0 +1,67 @@
+"""Tests for snapshot_store — byte budget, spill ring and lazy decompression."""
+
+import json
+import threading
+
+from snapshot_store import MAX_PENDING, SnapshotStore
+
+
+def _body(i, size=2000):
+    # Incompressible-ish payload so the byte budget is exercised
+    return {"model": "m", "messages": [{"role": "user", "content": f"{i}:" + "".join(
+        format(hash((i, j)) & 0xFFFF, "04x") for j in range(size // 4))}]}
+
+
+def test_round_trips_body_and_raw_bytes():
+    store = SnapshotStore(max_bytes=1 << 20)
+    store.put("r1", "original", raw=b'{"model":"m","messages":[]}')
+    store.put("r1", "compressed", body={"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+    store.flush()
+
+    assert store.get("r1") == b'{"model":"m","messages":[]}'
+    assert json.loads(store.get("r1", "compressed"))["messages"][0]["content"] == "hi"
+    assert store.get("missing") is None
+    stats = store.stats()
+    assert stats["entries"] == 2 and stats["bytes"] > 0
+    store.close()
+
+
+def test_evicts_oldest_by_compressed_bytes():
+    store = SnapshotStore(max_bytes=5000)
+    for i in range(10):
+        store.put(f"r{i}", "original", body=_body(i))
+        store.flush()
+
+    stats = store.stats()
+    assert stats["bytes"] <= 5000 and stats["evicted"] > 0
+    assert store.get("r0") is None
+    assert json.loads(store.get("r9"))["messages"][0]["content"].startswith("9:")
+    store.close()
+
+
+def test_evicted_snapshots_spill_to_the_ring_until_overwritten(tmp_path):
+    store = SnapshotStore(max_bytes=3000, spill_dir=str(tmp_path / "spill"), spill_bytes=6000)
+    assert list((tmp_path / "spill").iterdir()) == []  # unlinked once mapped: nothing left if the worker dies
+    for i in range(12):
+        store.put(f"r{i}", "original", body=_body(i))
+        store.flush()
+
+    stats = store.stats()
+    assert stats["spilled_entries"] >= 2
+    assert store.get("r0") is None  # wrapped over
+    spilled = [i for i in range(11) if store.get(f"r{i}") is not None]
+    assert spilled and all(json.loads(store.get(f"r{i}"))["messages"][0]["content"].startswith(f"{i}:")
+                           for i in spilled)
+    store.close()
+
+
+def test_drops_snapshots_when_the_encoder_falls_behind():
+    store = SnapshotStore(max_bytes=1 << 20)
+    release = threading.Event()
+    store._executor.submit(release.wait)
+    accepted = [store.put(f"r{i}", "original", raw=b"{}") for i in range(MAX_PENDING + 3)]
+    assert accepted.count(False) == 3 and store.stats()["dropped"] == 3
+    release.set()
+    store.flush()
+    assert store.stats()["entries"] == MAX_PENDING
+    store.close()
@@ -0,0 +1,57 @@
+"""Tests for startup — import-time profile parsing, startup marks, memory, worker reports."""
+
+import sys
+
+import startup
+from metrics import MetricsCollector
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      4000 |      60000 |     fastapi.routing
+import time:     30000 |      90000 |   fastapi
+import time:      2000 |       2000 |     botocore.session
+import time:      1000 |       3000 |   boto3
+import time:     40000 |     140000 | main
+some other stderr line
+"""
+
+
+def test_parse_and_format_import_profile():
+    entries = startup.parse_importtime(IMPORTTIME)
+    assert entries[0] == ("_io", 120, 120, 1)
+    assert ("main", 40000, 140000, 0) in entries and len(entries) == 6
+
+    report = startup.format_import_profile(entries, "main", top=2)
+    assert report.startswith("import main: 140.0ms (6 modules)")
+    by_package = report.split("by top-level package")[1].split("slowest modules")[0]
+    assert "main" in by_package and "fastapi" in by_package and "boto" not in by_package  # top 2 only
+    assert "34.0ms" in by_package  # fastapi + fastapi.routing self time
+
+
+def test_marks_restart_with_the_worker_and_memory_is_reported():
+    startup.mark("imports")
+    assert "imports" in startup.stats()["startup_ms"]
+    startup.worker_started()
+    stats = startup.stats()
+    assert stats["startup_ms"] == {} and stats["uptime_s"] < 1
+    assert stats["memory"]["peak_rss_mb"] > 0
+    if sys.platform.startswith("linux"):
+        assert stats["memory"]["pss_mb"] > 0 and stats["memory"]["rss_mb"] >= stats["memory"]["private_mb"]
+
+
+def test_preload_skips_missing_modules():
+    timings = startup.preload(["json", "no_such_module_for_preload"])
+    assert list(timings) == ["json"]
+
+
+def test_worker_reports_expire_with_the_worker(tmp_path):
+    metrics = MetricsCollector(cache_dir=str(tmp_path))
+    metrics.record_worker(101, {"memory": {"rss_mb": 60.0, "pss_mb": 30.0}}, ttl=60)
+    metrics.record_worker(102, {"memory": {"peak_rss_mb": 50.0}}, ttl=60)
+    metrics.record_worker(103, {"memory": {"rss_mb": 70.0}}, ttl=-1)  # already gone
+    workers = metrics.get_worker_stats()
+    assert workers["count"] == 2 and set(workers["workers"]) == {"101", "102"}
+    assert workers["total_rss_mb"] == 110.0 and workers["total_pss_mb"] == 30.0
+    metrics.remove_worker(101)
+    assert list(metrics.get_worker_stats()["workers"]) == ["102"]
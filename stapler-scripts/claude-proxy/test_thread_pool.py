@@ -0,0 +1,131 @@
+"""Tests for thread_pool — queue / run accounting, anyio thread tracking and pool autoscaling."""
+
+import threading
+import time
+
+import anyio
+
+from thread_pool import InstrumentedThreadPoolExecutor, PoolAutoscaler, PoolStats, run_in_thread
+
+
+def test_executor_reports_backlog_and_waits():
+    pool = InstrumentedThreadPoolExecutor(max_workers=1, name="test")
+    release = threading.Event()
+    first = pool.submit(release.wait)
+    second = pool.submit(lambda: "done")
+    time.sleep(0.05)
+
+    busy = pool.stats.snapshot()
+    assert (busy["active"], busy["queued"], busy["saturated"]) == (1, 1, True)
+
+    release.set()
+    assert second.result(timeout=1) == "done" and first.result()
+    stats = pool.stats.snapshot()
+    assert (stats["active"], stats["queued"], stats["completed"]) == (0, 0, 2)
+    assert stats["queue_wait_ms"]["max"] >= 40  # the second call waited for the first
+    assert stats["run_ms"]["max"] >= 40
+    pool.shutdown()
+
+
+def test_resize_starts_more_threads():
+    pool = InstrumentedThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    pool.submit(release.wait)
+    pool.resize(2)
+    assert pool.submit(lambda: "ran").result(timeout=1) == "ran"  # didn't wait behind the blocked thread
+    assert pool.threads == 2 and pool.stats.size == 2
+    release.set()
+    pool.shutdown()
+
+
+def test_resize_under_a_full_queue_starts_threads_for_the_backlog():
+    pool = InstrumentedThreadPoolExecutor(max_workers=1)
+    release = threading.Event()
+    started = [threading.Event() for _ in range(3)]
+    pool.submit(release.wait)
+    for event in started:
+        pool.submit(lambda event=event: event.set() or release.wait())
+    time.sleep(0.05)
+    try:
+        assert pool.stats.snapshot()["queued"] == 3 and pool.threads == 1
+        pool.resize(4)  # no further submits: the queued work must not wait for one
+        assert all(event.wait(timeout=1) for event in started)
+        assert pool.threads == 4
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_run_in_thread_accounts_for_cancelled_waiters():
+    stats = PoolStats("stream", 1)
+
+    async def main():
+        limiter = anyio.CapacityLimiter(1)
+        release = threading.Event()
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(lambda: run_in_thread(stats, release.wait, limiter=limiter))
+            await anyio.sleep(0.02)
+            with anyio.move_on_after(0.02):
+                await run_in_thread(stats, lambda: None, limiter=limiter)  # never gets the token
+            assert stats.queued == 0 and stats.active == 1
+            release.set()
+
+    anyio.run(main)
+    assert stats.snapshot()["completed"] == 1
+
+
+class TestPoolAutoscaler:
+    def _stats(self, size, waits, active=0, queued=0):
+        stats = PoolStats("p", size)
+        stats._waits.extend(waits)
+        stats.started = len(waits)
+        stats.active, stats.queued = active, queued
+        return stats
+
+    def test_grows_on_slow_p95_within_bounds(self):
+        sizes = []
+        stats = self._stats(8, [200.0] * 30)
+        scaler = PoolAutoscaler(stats, sizes.append, max_size=9, target_wait_ms=50, cooldown=10)
+
+        assert scaler.maybe_grow(now=100) == 9
+        assert sizes == [9] and stats.resizes == 1
+        stats.started += 30
+        assert scaler.maybe_grow(now=200) is None  # at the ceiling
+
+    def test_respects_target_cooldown_and_sample_floor(self):
+        stats = self._stats(8, [10.0] * 30)
+        scaler = PoolAutoscaler(stats, lambda n: None, max_size=32, target_wait_ms=50, cooldown=10)
+        assert scaler.maybe_grow(now=100) is None  # fast enough
+
+        stats._waits.extend([500.0] * 30)
+        stats.started += 5
+        assert scaler.maybe_grow(now=120) is None  # too few calls since the last check
+        stats.started += 30
+        assert scaler.maybe_grow(now=105) is None  # cooldown
+        assert scaler.maybe_grow(now=130) == 10
+
+    def test_grows_when_saturated_without_fresh_samples(self):
+        stats = self._stats(4, [], active=4, queued=3)
+        scaler = PoolAutoscaler(stats, lambda n: None, max_size=8)
+        assert scaler.maybe_grow(now=100) == 5
+
+
+def test_limiter_resize_lets_waiters_through():
+    async def main():
+        provider_limiter = anyio.CapacityLimiter(1)
+        stats = PoolStats("stream", 1)
+        release = threading.Event()
+        started = []
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(2):
+                tg.start_soon(lambda: run_in_thread(stats, lambda: (started.append(1), release.wait(1)),
+                                                    limiter=provider_limiter))
+            await anyio.sleep(0.05)
+            assert len(started) == 1
+            PoolAutoscaler(stats, lambda n: setattr(provider_limiter, "total_tokens", n), max_size=2).maybe_grow()
+            await anyio.sleep(0.05)
+            assert len(started) == 2
+            release.set()
+
+    anyio.run(main)
@@ -0,0 +1,138 @@
+"""Tests for per-phase request timing: PhaseTimer, context propagation, histograms and Server-Timing."""
+
+import asyncio
+import json
+from unittest.mock import MagicMock, patch
+
+import anyio
+import pytest
+from fastapi.testclient import TestClient
+
+import timing
+from metrics import MetricsCollector
+
+
+class TestPhaseTimer:
+    def test_repeated_phases_add_up_and_keep_request_order(self):
+        timer = timing.PhaseTimer()
+        timer.record("ttft", 800.04)
+        timer.record("clean", 1.0)
+        timer.record("auth", 0.2)
+        timer.record("clean", 0.5)  # cleaned again for the fallback provider
+
+        assert timer.rounded() == {"auth": 0.2, "clean": 1.5, "ttft": 800.0}
+        assert timer.server_timing() == "auth;dur=0.2, clean;dur=1.5, ttft;dur=800.0"
+        assert timer.server_timing(["auth"]) == "auth;dur=0.2"
+
+    def test_measure_is_a_no_op_outside_a_timed_request(self):
+        with timing.measure("clean"):
+            pass
+        timing.record("connect", 5.0)
+        assert timing.current() is None
+
+    def test_timer_follows_child_tasks_and_anyio_threads(self):
+        async def main():
+            timer = timing.PhaseTimer()
+            timing.activate(timer)
+
+            async def child():
+                timing.record("clean", 1.0)
+
+            def worker():
+                with timing.measure("connect"):
+                    pass
+
+            await asyncio.create_task(child())
+            await anyio.to_thread.run_sync(worker)
+            return timer
+
+        timer = asyncio.run(main())
+        assert set(timer.phases) == {"clean", "connect"}
+
+
+def test_record_phases_updates_detail_and_histograms(tmp_path):
+    metrics = MetricsCollector(cache_dir=str(tmp_path))
+    metrics.record_request_detail("req1", "m", 0, 0, False)
+    metrics.record_phases("req1", {"parse": 0.4, "ttft": 1200.0})
+    metrics.record_phases("req2", {"parse": 30.0})
+
+    assert metrics.get_recent_requests()[0]["phases"] == {"parse": 0.4, "ttft": 1200.0}
+    stats = metrics.get_phase_stats()
+    assert stats["parse"]["count"] == 2
+    assert stats["parse"]["avg_ms"] == 15.2 and stats["parse"]["max_ms"] == 30.0
+    assert stats["parse"]["buckets"]["< 1ms"] == 1 and stats["parse"]["buckets"]["< 100ms"] == 1
+    assert stats["ttft"]["buckets"]["< 2500ms"] == 1
+    assert sum(stats["ttft"]["buckets"].values()) == 1
+
+
+@pytest.mark.asyncio
+async def test_fallback_records_ttft_and_stream():
+    provider = MagicMock()
+    provider.name = "anthropic"
+
+    async def stream(*args, **kwargs):
+        await asyncio.sleep(0.02)
+        yield "data: {}\n\n"
+        await asyncio.sleep(0.02)
+        yield "data: {}\n\n"
+
+    provider.stream_message = stream
+    with patch("fallback.diskcache.Cache") as mock_cache_cls:
+        mock_cache_cls.return_value.get.return_value = None
+        from fallback import FallbackHandler
+        handler = FallbackHandler([provider])
+
+    timer = timing.PhaseTimer()
+    timing.activate(timer)
+    with patch("fallback.config") as mock_config:
+        mock_config.STREAM_RESUME_ENABLED = False
+        mock_config.BEDROCK_MAX_RETRIES = 1
+        _ = [c async for c in handler.stream_message({"model": "m"}, "token", "oauth", request_id="r")]
+
+    assert timer.phases["ttft"] >= 15
+    assert timer.phases["stream"] >= 15
+
+
+class TestMessagesEndpoint:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        import config
+        import main
+        monkeypatch.setattr(config, "COMPRESS_ENABLED", False)
+        monkeypatch.setattr(main, "get_auth_from_request", lambda request: ("token", "api_key"))
+        return TestClient(main.app), main
+
+    def test_non_streaming_server_timing(self, client, monkeypatch):
+        client, main = client
+
+        async def send_message(body, token, auth_type, headers, request_id):
+            timing.record("upstream", 12.5)
+            return {"id": "msg_1", "type": "message", "content": []}
+
+        monkeypatch.setattr(main.fallback, "send_message", send_message)
+        resp = client.post("/v1/messages", json={"model": "m", "messages": [{"role": "user", "content": "hi"}]})
+
+        assert resp.status_code == 200
+        entries = [e.strip().split(";")[0] for e in resp.headers["server-timing"].split(",")]
+        assert entries[:4] == ["auth", "parse", "summary", "snapshot"]
+        assert "upstream" in entries and entries[-1] == "total"
+        detail = main.metrics.get_recent_requests()[0]
+        assert detail["request_id"] == resp.headers["x-request-id"]
+        assert detail["phases"]["upstream"] == 12.5
+
+    def test_streaming_phases_recorded_after_the_stream(self, client, monkeypatch):
+        client, main = client
+
+        async def stream_message(body, token, auth_type, headers, request_id):
+            timing.record("ttft", 100.0)
+            yield f"data: {json.dumps({'type': 'message_stop'})}\n\n"
+            timing.record("stream", 50.0)
+
+        monkeypatch.setattr(main.fallback, "stream_message", stream_message)
+        resp = client.post("/v1/messages", json={"model": "m", "stream": True, "messages": []})
+
+        assert resp.status_code == 200
+        assert "ttft" not in resp.headers["server-timing"]  # sent before the upstream answered
+        detail = main.metrics.get_recent_requests()[0]
+        assert detail["request_id"] == resp.headers["x-request-id"]
+        assert detail["phases"]["ttft"] == 100.0 and detail["phases"]["stream"] == 50.0
@@ -0,0 +1,114 @@
+"""Tests for token_estimator and the local count_tokens path."""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from token_estimator import TokenEstimator
+
+
+def _body(turns, model="claude-sonnet-4-6"):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"question {i} " + "lorem ipsum dolor sit amet " * (10 + i)})
+        messages.append({"role": "assistant", "content": [
+            {"type": "tool_use", "id": f"t{i}", "name": "Read", "input": {"file_path": f"/src/mod{i}.py"}},
+        ]})
+    return {"model": model, "system": "You are a helpful assistant.", "messages": messages}
+
+
+def _exact(body):
+    """Stand-in for upstream: exact counts run at 0.9x the estimator's raw heuristic."""
+    return round(TokenEstimator().estimate(body).raw * 0.9)
+
+
+def _calibrate(estimator, bodies):
+    for body in bodies:
+        estimator.observe(estimator.estimate(body), _exact(body))
+
+
+def test_uncalibrated_estimates_are_not_confident():
+    estimate = TokenEstimator(min_samples=5).estimate(_body(3))
+    assert estimate.source == "estimate" and not estimate.confident and estimate.tokens > 0
+
+
+def test_calibrates_per_model_then_answers_within_tolerance():
+    estimator = TokenEstimator(tolerance=0.02, min_samples=5)
+    _calibrate(estimator, [_body(n) for n in range(1, 8)])
+
+    body = {**_body(20), "system": "A system prompt not seen before."}
+    estimate = estimator.estimate(body)
+    assert estimate.confident and estimate.source == "estimate"
+    assert abs(estimate.tokens - _exact(body)) / _exact(body) <= 0.02
+    stats = estimator.stats()["models"]["claude-sonnet-4-6"]
+    assert stats["calibrated"] and stats["scale"] == pytest.approx(0.9, abs=0.01)
+
+    assert not estimator.estimate(_body(20, model="claude-opus-4-6")).confident  # other model: not calibrated
+
+
+def test_exact_and_anchored_counts_reuse_previous_answers():
+    estimator = TokenEstimator(min_samples=1000)  # never confident from calibration alone
+    conversation = _body(5)
+    estimator.observe(estimator.estimate(conversation), 4321)
+
+    again = estimator.estimate(conversation)
+    assert (again.source, again.tokens, again.confident) == ("exact", 4321, True)
+
+    grown = {**conversation, "messages": conversation["messages"] + [{"role": "user", "content": "next?"}]}
+    anchored = estimator.estimate(grown)
+    assert anchored.source == "anchored" and anchored.tokens > 4321
+
+    changed_system = {**conversation, "system": "Different prompt"}
+    assert estimator.estimate(changed_system).source == "estimate"
+
+
+def test_new_images_block_a_local_answer():
+    estimator = TokenEstimator(min_samples=2)
+    _calibrate(estimator, [_body(n) for n in range(1, 5)])
+    body = _body(5)
+    body["messages"].append({"role": "user", "content": [{"type": "image", "source": {"type": "base64", "data": "x"}}]})
+    assert not estimator.estimate(body).confident
+
+
+class TestCountTokensEndpoint:
+    @pytest.fixture
+    def client(self, monkeypatch):
+        import config
+        import main
+        from fastapi.testclient import TestClient
+        monkeypatch.setattr(config, "COUNT_TOKENS_LOCAL", True)
+        monkeypatch.setattr(config, "COUNT_TOKENS_VERIFY_EVERY", 0)
+        monkeypatch.setattr(main, "get_auth_from_request", lambda request: ("token", "api_key"))
+        monkeypatch.setattr(main, "token_estimator", TokenEstimator(min_samples=1000))
+        return TestClient(main.app), main
+
+    def _upstream(self, main, monkeypatch, status, payload=None):
+        response = MagicMock(status_code=status, text="err")
+        response.json.return_value = payload or {}
+        post = AsyncMock(return_value=response)
+        monkeypatch.setattr(main.anthropic.client, "post", post)
+        return post
+
+    def test_repeat_body_answered_from_cache(self, client, monkeypatch):
+        client, main = client
+        post = self._upstream(main, monkeypatch, 200, {"input_tokens": 1234})
+        body = _body(2)
+
+        first = client.post("/v1/messages/count_tokens", json=body)
+        second = client.post("/v1/messages/count_tokens", json=body)
+        assert first.json() == second.json() == {"input_tokens": 1234}
+        assert first.headers["x-token-count-source"] == "upstream"
+        assert second.headers["x-token-count-source"] == "exact"
+        assert post.await_count == 1
+
+    def test_auth_failure_falls_back_to_estimate(self, client, monkeypatch):
+        client, main = client
+        self._upstream(main, monkeypatch, 401)
+        resp = client.post("/v1/messages/count_tokens", json=_body(2))
+        assert resp.status_code == 200 and resp.json()["input_tokens"] > 0
+        assert resp.headers["x-token-count-source"] == "fallback"
+
+    def test_bad_request_is_passed_through(self, client, monkeypatch):
+        client, main = client
+        self._upstream(main, monkeypatch, 400)
+        assert client.post("/v1/messages/count_tokens", json=_body(2)).status_code == 400
@@ -0,0 +1,132 @@
+"""Tests for optional OpenTelemetry tracing: span nesting, executor propagation and the OTLP/JSON file exporter."""
+
+import asyncio
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+import tracing
+
+pytest.importorskip("opentelemetry.sdk")
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    assert tracing.setup_tracing("file", str(path))
+    yield path
+    tracing.shutdown_tracing()
+
+
+def _spans(path):
+    """{name: span} from every export batch in the file."""
+    spans = {}
+    for line in path.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                for s in scope["spans"]:
+                    spans[s["name"]] = s
+    return spans
+
+
+def _attr(span, key):
+    for a in span["attributes"]:
+        if a["key"] == key:
+            return next(iter(a["value"].values()))
+    return None
+
+
+def test_disabled_helpers_are_no_ops():
+    assert not tracing.enabled()
+    with tracing.span("x", a=1) as s:
+        assert s is None
+    assert tracing.start_span("x") is None
+    tracing.set_attributes(a=1)
+    tracing.add_event("e")
+    assert tracing.in_context(lambda x: x + 1, "worker")(1) == 2
+
+
+def test_unknown_mode_or_missing_exporter_stays_off():
+    assert tracing.setup_tracing(None) is False
+    assert tracing.setup_tracing("jaeger") is False
+    assert not tracing.enabled()
+
+
+def test_executor_work_nests_under_the_submitting_span(trace_file):
+    def _engine():
+        with tracing.span("compactor.engine"):
+            pass
+
+    async def main():
+        pool = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        root = tracing.start_span("proxy.messages", **{"proxy.request_id": "abc12345"})
+        with tracing.use_span(root):
+            with tracing.span("fallback.attempt", **{"provider.name": "bedrock"}):
+                tracing.add_event("retry.backoff", backoff_s=1)
+                await loop.run_in_executor(pool, tracing.in_context(lambda: "ok", "bedrock.invoke"))
+            await asyncio.to_thread(_engine)
+        pool.shutdown()
+
+    asyncio.run(main())
+    tracing.shutdown_tracing()
+    spans = _spans(trace_file)
+
+    root, attempt, invoke = spans["proxy.messages"], spans["fallback.attempt"], spans["bedrock.invoke"]
+    assert "parentSpanId" not in root
+    assert attempt["parentSpanId"] == root["spanId"]
+    assert invoke["parentSpanId"] == attempt["spanId"]
+    assert invoke["traceId"] == root["traceId"]
+    assert spans["compactor.engine"]["parentSpanId"] == root["spanId"]  # asyncio.to_thread copies the context
+    assert _attr(root, "proxy.request_id") == "abc12345"
+    assert float(_attr(invoke, "executor.queue_wait_ms")) >= 0
+    assert attempt["events"][0]["name"] == "retry.backoff"
+    assert attempt["kind"] == 1 and int(attempt["startTimeUnixNano"]) <= int(attempt["endTimeUnixNano"])
+
+
+@pytest.mark.asyncio
+async def test_fallback_attempts_record_errors(trace_file):
+    from providers import ModelUnsupportedError
+
+    anthropic, bedrock = MagicMock(), MagicMock()
+    anthropic.name, bedrock.name = "anthropic", "bedrock"
+
+    async def unsupported(*args, **kwargs):
+        raise ModelUnsupportedError("nope")
+
+    async def ok(*args, **kwargs):
+        return {"id": "msg_1"}
+
+    anthropic.send_message, bedrock.send_message = unsupported, ok
+    with patch("fallback.diskcache.Cache") as mock_cache_cls:
+        mock_cache_cls.return_value.get.return_value = None
+        from fallback import FallbackHandler
+        handler = FallbackHandler([anthropic, bedrock])
+
+    with patch("fallback.config") as mock_config:
+        mock_config.BEDROCK_MAX_RETRIES = 1
+        assert (await handler.send_message({"model": "m"}, "t", "oauth", request_id="r"))["id"] == "msg_1"
+
+    tracing.shutdown_tracing()
+    attempts = []
+    for line in trace_file.read_text().splitlines():
+        for resource in json.loads(line)["resourceSpans"]:
+            for scope in resource["scopeSpans"]:
+                attempts += [s for s in scope["spans"] if s["name"] == "fallback.attempt"]
+    by_provider = {_attr(s, "provider.name"): s for s in attempts}
+    assert by_provider["anthropic"]["status"]["code"] == 2
+    assert by_provider["anthropic"]["events"][0]["name"] == "exception"
+    assert by_provider["bedrock"]["status"]["code"] == 0
+
+
+def test_json_logs_carry_the_current_trace_id(trace_file):
+    from logging_setup import JsonFormatter
+
+    with tracing.span("proxy.messages") as s:
+        record = logging.getLogger("test").makeRecord("test", logging.INFO, __file__, 1, "[abc12345] hi", (), None)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["trace_id"] == format(s.get_span_context().trace_id, "032x")
+    assert entry["request_id"] == "abc12345"
@@ -0,0 +1,194 @@
+"""Instrumented thread pools for blocking boto3 work.
+
+BedrockProvider runs boto3 calls on two pools: its ThreadPoolExecutor
+(invoke_model, body reads) and anyio worker threads behind
+a CapacityLimiter (invoke_model_with_response_stream, which needs
+anyio.from_thread). When either saturates, calls queue without a trace
+except a longer request duration. PoolStats records, per pool:
+
+  queued       submitted, waiting for a thread / limiter token
+  active       running on a thread
+  queue_wait   submit → start (ms; avg / p50 / p95 / max over the last WINDOW calls)
+  run          start → finish (ms; same)
+
+PoolAutoscaler optionally grows a pool (never shrinks it — idle executor
+threads cannot be retired) when recent p95 queue wait exceeds a target or
+every thread is busy with calls still queued, in steps, up to a ceiling, at
+most once per cooldown. It is evaluated on the
+event loop before each submit, where both ThreadPoolExecutor's worker cap and
+CapacityLimiter.total_tokens can be raised safely.
+"""
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import anyio
+
+logger = logging.getLogger(__name__)
+
+WINDOW = 256  # recent calls kept for the wait / run percentiles
+
+
+def latency_summary(samples: List[float]) -> Dict[str, float]:
+    """avg / p50 / p95 / max of `samples` (ms), rounded; zeros when there are none."""
+    if not samples:
+        return {"avg": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    ordered = sorted(samples)
+    return {
+        "avg": round(statistics.fmean(ordered), 2),
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+        "max": round(ordered[-1], 2),
+    }
+
+
+class PoolStats:
+    """Thread-safe queue / run accounting for one pool."""
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+        self.queued = 0
+        self.active = 0
+        self.peak_active = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.resizes = 0
+        self._waits: Deque[float] = deque(maxlen=WINDOW)
+        self._runs: Deque[float] = deque(maxlen=WINDOW)
+        self._lock = threading.Lock()
+
+    def track(self, fn: Callable) -> Callable:
+        """Wrap `fn` at submit time; the wrapper accounts for its wait and run on the worker thread."""
+        submitted = time.perf_counter()
+        with self._lock:
+            self.queued += 1
+            self.submitted += 1
+
+        def run(*args, **kwargs):
+            started = time.perf_counter()
+            with self._lock:
+                run.started = True
+                self.queued -= 1
+                self.started += 1
+                self.active += 1
+                self.peak_active = max(self.peak_active, self.active)
+                self._waits.append((started - submitted) * 1000)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.completed += 1
+                    self._runs.append((time.perf_counter() - started) * 1000)
+
+        run.started = False
+        return run
+
+    def abandon(self, run: Callable) -> None:
+        """Un-count a tracked call that was cancelled before a thread picked it up (no-op once started)."""
+        with self._lock:
+            if not run.started:
+                run.started = True
+                self.queued -= 1
+
+    def recent_wait_p95(self) -> float:
+        with self._lock:
+            waits = list(self._waits)
+        return latency_summary(waits)["p95"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits, runs = list(self._waits), list(self._runs)
+            counts = {
+                "size": self.size, "queued": self.queued, "active": self.active,
+                "peak_active": self.peak_active, "submitted": self.submitted,
+                "started": self.started, "completed": self.completed, "resizes": self.resizes,
+            }
+        counts["saturated"] = counts["active"] >= counts["size"] and counts["queued"] > 0
+        return {**counts, "queue_wait_ms": latency_summary(waits), "run_ms": latency_summary(runs)}
+
+
+class InstrumentedThreadPoolExecutor(ThreadPoolExecutor):
+    """ThreadPoolExecutor that records queue wait / run time per task and can grow."""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str = "", name: Optional[str] = None):
+        super().__init__(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self.stats = PoolStats(name or thread_name_prefix or "executor", max_workers)
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(self.stats.track(fn), *args, **kwargs)
+
+    def resize(self, max_workers: int) -> None:
+        """Raise the worker cap and start threads for work already queued."""
+        if max_workers <= self._max_workers:
+            return
+        # ThreadPoolExecutor has no public resize; this depends on CPython internals. Threads
+        # are started lazily by _adjust_thread_count() (one per call, from submit(), and only
+        # while no idle thread is waiting), which reads _max_workers each time. So raising the
+        # cap takes effect at the next submit, and the backlog already queued gets its threads here.
+        with self._shutdown_lock:
+            self._max_workers = max_workers
+            if not self._shutdown:
+                for _ in range(min(self._work_queue.qsize(), max_workers - len(self._threads))):
+                    self._adjust_thread_count()
+        self.stats.size = max_workers
+
+    @property
+    def threads(self) -> int:
+        """Worker threads started so far."""
+        return len(self._threads)
+
+
+async def run_in_thread(stats: PoolStats, fn: Callable, *args: Any, limiter: Any = None) -> Any:
+    """anyio.to_thread.run_sync with `fn` accounted for in `stats`."""
+    run = stats.track(fn)
+    try:
+        return await anyio.to_thread.run_sync(run, *args, limiter=limiter)
+    finally:
+        stats.abandon(run)  # cancelled while waiting for a limiter token
+
+
+class PoolAutoscaler:
+    """Grow a pool while its recent p95 queue wait is above target (bounded, rate-limited)."""
+
+    def __init__(self, stats: PoolStats, resize: Callable[[int], None], max_size: int,
+                 target_wait_ms: float = 50.0, cooldown: float = 10.0, min_samples: int = 20):
+        self.stats = stats
+        self.resize = resize
+        self.max_size = max_size
+        self.target_wait_ms = target_wait_ms
+        self.cooldown = cooldown
+        self.min_samples = min_samples
+        self._last_check = 0.0
+        self._last_started = 0
+
+    def maybe_grow(self, now: Optional[float] = None) -> Optional[int]:
+        """Grow the pool if it is warranted; returns the new size, or None."""
+        now = time.monotonic() if now is None else now
+        stats = self.stats
+        if now - self._last_check < self.cooldown or stats.size >= self.max_size:
+            return None
+        # Long streams can hold every thread for minutes: then nothing starts, so
+        # there are no fresh wait samples — a full pool with a backlog is reason enough
+        saturated = stats.queued > 0 and stats.active >= stats.size
+        fresh = stats.started - self._last_started >= self.min_samples
+        if not (saturated or fresh):
+            return None
+        self._last_check = now
+        self._last_started = stats.started
+        p95 = stats.recent_wait_p95()
+        if not saturated and p95 <= self.target_wait_ms:
+            return None
+        new_size = min(self.max_size, stats.size + max(1, stats.size // 4))
+        reason = "saturated with a backlog" if saturated else f"p95 queue wait {p95:.0f}ms > {self.target_wait_ms:.0f}ms"
+        logger.warning(f"{stats.name}: {reason} — growing pool {stats.size} → {new_size} (max {self.max_size})")
+        self.resize(new_size)
+        stats.size = new_size
+        stats.resizes += 1
+        return new_size
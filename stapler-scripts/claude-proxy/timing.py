@@ -0,0 +1,91 @@
+"""Per-phase request timing for /v1/messages (Server-Timing + RequestDetail.phases).
+
+messages_endpoint creates a PhaseTimer and makes it current; code further down
+(providers, fallback) records into it through `measure()` / `record()` without
+threading it through every signature. Durations of a phase that runs more than
+once (cleaning / connecting again on a retry or fallback) add up.
+
+Phases, in request order:
+
+  auth       credential extraction from the incoming headers
+  parse      request.json()
+  summary    _msg_type_summary over the original messages
+  snapshot   request body snapshots for /requests/{id} (original + compressed)
+  compress   compress_messages (ADR-001)
+  queue      waiting for an upstream slot in the priority queue (priority.py)
+  clean      provider body cleaning (_clean_request_body / _prepare_bedrock_body)
+  connect    upstream request sent → response headers received (streaming)
+  ttft       provider call → first SSE chunk (streaming)
+  stream     first SSE chunk → last chunk (streaming)
+  upstream   whole provider round trip (non-streaming)
+
+A streaming response's headers go out before the upstream is even contacted,
+so its Server-Timing header only carries the proxy-side phases; the full set
+lands in RequestDetail.phases and the /metrics phase histograms.
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+
+PHASES = ("auth", "parse", "summary", "snapshot", "compress", "queue", "clean", "connect", "ttft", "stream", "upstream")
+
+_current: contextvars.ContextVar[Optional["PhaseTimer"]] = contextvars.ContextVar("phase_timer", default=None)
+
+
+class PhaseTimer:
+    """Named phase durations (ms) for one request."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, name: str, ms: float) -> None:
+        self.phases[name] = self.phases.get(name, 0.0) + ms
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - start) * 1000)
+
+    def rounded(self) -> Dict[str, float]:
+        """Phases in PHASES order, rounded to 0.1ms (for RequestDetail / logs)."""
+        order = {name: i for i, name in enumerate(PHASES)}
+        return {name: round(ms, 1) for name, ms in sorted(self.phases.items(), key=lambda kv: order.get(kv[0], len(order)))}
+
+    def server_timing(self, names: Optional[Iterable[str]] = None) -> str:
+        """Server-Timing header value, e.g. `auth;dur=0.1, parse;dur=2.3`."""
+        items = self.rounded()
+        if names is not None:
+            wanted = set(names)
+            items = {k: v for k, v in items.items() if k in wanted}
+        return ", ".join(f"{name};dur={ms}" for name, ms in items.items())
+
+
+def activate(timer: PhaseTimer) -> contextvars.Token:
+    """Make `timer` the current request's timer (in this task and tasks it spawns)."""
+    return _current.set(timer)
+
+
+def current() -> Optional[PhaseTimer]:
+    return _current.get()
+
+
+def record(name: str, ms: float) -> None:
+    """Add to a phase of the current request, if one is being timed."""
+    timer = _current.get()
+    if timer is not None:
+        timer.record(name, ms)
+
+
+@contextmanager
+def measure(name: str) -> Iterator[None]:
+    """Time a block into the current request's timer (no-op outside a timed request)."""
+    timer = _current.get()
+    if timer is None:
+        yield
+        return
+    with timer.measure(name):
+        yield
@@ -0,0 +1,214 @@
+"""Local answers for /v1/messages/count_tokens.
+
+Claude Code calls count_tokens before requests (it drives auto-compaction),
+and every call used to be a round trip to Anthropic — one that fails with
+401 in the known missing-auth case. TokenEstimator answers locally when it
+can be confident, and the endpoint asks upstream otherwise:
+
+  exact     a body seen before (content hash) → the count upstream returned
+  anchored  a body whose messages extend one seen before (Claude Code's
+            common case: the conversation grew) → that exact count plus an
+            estimate for the new messages only
+  estimate  the whole body estimated
+
+Estimates come from a character-class approximation of the tokenizer (prose
+and JSON/code tokenize at different rates), scaled per model by a factor
+calibrated against the exact counts upstream returns. Each exact count also
+updates a running relative error; an estimate is used only once a model has
+`min_samples` observations and the error it predicts for the estimated part
+is within `tolerance` of the total. Bodies with images or documents are never
+estimated locally (their cost depends on content the heuristic can't see).
+
+State is per worker and in memory: calibration is re-learned after restart
+from the first upstream answers.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+# Heuristic tokenizer rates: characters per token
+PROSE_CHARS_PER_TOKEN = 3.8
+STRUCTURED_CHARS_PER_TOKEN = 3.0  # tool inputs / schemas / code-heavy results
+MESSAGE_OVERHEAD_TOKENS = 4
+TOOL_OVERHEAD_TOKENS = 8
+MEDIA_TYPES = ("image", "document")
+
+
+@dataclass
+class Estimate:
+    tokens: int
+    source: str             # exact / anchored / estimate
+    confident: bool
+    model: str
+    raw: float              # uncalibrated heuristic for the whole body
+    has_media: bool
+    hashes: List[str] = field(repr=False, default_factory=list)  # prefix digests: [header, +msg1, ...]
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+
+
+def _content_raw(content: Any) -> tuple:
+    """(heuristic tokens, has_media) for a message / tool_result content value."""
+    if isinstance(content, str):
+        return len(content) / PROSE_CHARS_PER_TOKEN, False
+    if not isinstance(content, list):
+        return len(_dumps(content)) / STRUCTURED_CHARS_PER_TOKEN, False
+    raw, media = 0.0, False
+    for block in content:
+        if not isinstance(block, dict):
+            raw += len(str(block)) / PROSE_CHARS_PER_TOKEN
+            continue
+        kind = block.get("type")
+        if kind in MEDIA_TYPES:
+            media = True
+        elif kind == "text":
+            raw += len(block.get("text", "")) / PROSE_CHARS_PER_TOKEN
+        elif kind == "thinking":
+            raw += len(block.get("thinking", "")) / PROSE_CHARS_PER_TOKEN
+        elif kind == "tool_use":
+            raw += (len(block.get("name", "")) + len(_dumps(block.get("input", {})))) / STRUCTURED_CHARS_PER_TOKEN
+        elif kind == "tool_result":
+            inner, inner_media = _content_raw(block.get("content", ""))
+            # Tool output is mostly code / logs / JSON: count it at the structured rate
+            raw += inner * PROSE_CHARS_PER_TOKEN / STRUCTURED_CHARS_PER_TOKEN
+            media = media or inner_media
+        else:
+            raw += len(_dumps(block)) / STRUCTURED_CHARS_PER_TOKEN
+    return raw, media
+
+
+class _Calibration:
+    __slots__ = ("scale", "error", "samples")
+
+    def __init__(self):
+        self.scale = 1.0
+        self.error = 1.0  # running mean relative error of scale * raw vs exact
+        self.samples = 0
+
+
+class TokenEstimator:
+    """Exact-count cache plus a per-model calibrated estimate."""
+
+    def __init__(self, tolerance: float = 0.02, min_samples: int = 20, cache_size: int = 4096,
+                 alpha: float = 0.1):
+        self.tolerance = tolerance
+        self.min_samples = min_samples
+        self.cache_size = cache_size
+        self.alpha = alpha
+        self._exact: "OrderedDict[str, int]" = OrderedDict()  # prefix digest → exact tokens (LRU)
+        self._calibration: Dict[str, _Calibration] = {}
+        # Local answers later checked against upstream (the endpoint samples some)
+        self.verified = 0
+        self.verified_within_tolerance = 0
+        self._verified_error_sum = 0.0
+        self.verified_max_error = 0.0
+        self._lock = threading.Lock()  # estimate() / observe() run on worker threads
+
+    def estimate(self, body: Dict[str, Any]) -> Estimate:
+        """Best local answer for `body` (CPU-bound on large bodies: call off the event loop)."""
+        model = str(body.get("model", "unknown"))
+        header = {k: body.get(k) for k in ("model", "system", "tools", "tool_choice", "thinking")}
+        digest = hashlib.blake2b(_dumps(header).encode(), digest_size=16)
+        hashes = [digest.hexdigest()]
+
+        header_raw, media = _content_raw(body.get("system") or "")
+        tools = body.get("tools") or []
+        header_raw += sum(len(_dumps(t)) / STRUCTURED_CHARS_PER_TOKEN + TOOL_OVERHEAD_TOKENS for t in tools)
+        message_raw: List[float] = []
+        message_media: List[bool] = []
+        for message in body.get("messages") or []:
+            digest.update(_dumps(message).encode())
+            hashes.append(digest.hexdigest())
+            raw, has_media = _content_raw(message.get("content", "") if isinstance(message, dict) else message)
+            message_raw.append(raw + MESSAGE_OVERHEAD_TOKENS)
+            message_media.append(has_media)
+        media = media or any(message_media)
+        total_raw = header_raw + sum(message_raw)
+
+        with self._lock:
+            cal = self._calibration.get(model) or _Calibration()
+            anchor_at, anchor_tokens = None, 0
+            for k in range(len(hashes) - 1, -1, -1):
+                exact = self._exact.get(hashes[k])
+                if exact is not None:
+                    self._exact.move_to_end(hashes[k])
+                    anchor_at, anchor_tokens = k, exact
+                    break
+            calibrated = cal.samples >= self.min_samples
+
+        if anchor_at == len(hashes) - 1:
+            return Estimate(anchor_tokens, "exact", True, model, total_raw, media, hashes)
+        if anchor_at is not None:
+            # hashes[k] covers messages[:k]: only the messages after it are estimated
+            delta_raw, delta_media = sum(message_raw[anchor_at:]), any(message_media[anchor_at:])
+            tokens = anchor_tokens + cal.scale * delta_raw
+            source = "anchored"
+        else:
+            delta_raw, delta_media = total_raw, media
+            tokens = cal.scale * total_raw
+            source = "estimate"
+        expected_error = cal.error * cal.scale * delta_raw
+        confident = calibrated and not delta_media and expected_error <= self.tolerance * max(tokens, 1)
+        return Estimate(round(tokens), source, confident, model, total_raw, media, hashes)
+
+    def observe(self, estimate: Estimate, exact: int, answered_locally: bool = False) -> None:
+        """Record upstream's exact count for the body `estimate` was made for.
+
+        answered_locally: `estimate` was already returned to the client, so
+        this also scores the answer it got.
+        """
+        with self._lock:
+            if answered_locally and exact > 0:
+                error = abs(estimate.tokens - exact) / exact
+                self.verified += 1
+                self.verified_within_tolerance += error <= self.tolerance
+                self._verified_error_sum += error
+                self.verified_max_error = max(self.verified_max_error, error)
+            key = estimate.hashes[-1] if estimate.hashes else None
+            if key is not None:
+                self._exact[key] = exact
+                self._exact.move_to_end(key)
+                while len(self._exact) > self.cache_size:
+                    self._exact.popitem(last=False)
+            if estimate.has_media or estimate.raw <= 0 or exact <= 0:
+                return
+            cal = self._calibration.setdefault(estimate.model, _Calibration())
+            # Error of the whole-body estimate before this sample moves the scale
+            error = abs(exact - cal.scale * estimate.raw) / exact
+            ratio = exact / estimate.raw
+            if cal.samples == 0:
+                cal.scale = ratio  # nothing to score yet: the first prediction used the default scale
+            elif cal.samples == 1:
+                cal.scale += self.alpha * (ratio - cal.scale)
+                cal.error = error
+            else:
+                cal.scale += self.alpha * (ratio - cal.scale)
+                cal.error += self.alpha * (error - cal.error)
+            cal.samples += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "cached_counts": len(self._exact),
+                "tolerance": self.tolerance,
+                "verified": {
+                    "count": self.verified,
+                    "within_tolerance": self.verified_within_tolerance,
+                    "mean_rel_error": round(self._verified_error_sum / self.verified, 4) if self.verified else 0.0,
+                    "max_rel_error": round(self.verified_max_error, 4),
+                },
+                "models": {
+                    model: {
+                        "samples": cal.samples,
+                        "scale": round(cal.scale, 4),
+                        "mean_rel_error": round(cal.error, 4),
+                        "calibrated": cal.samples >= self.min_samples,
+                    }
+                    for model, cal in self._calibration.items()
+                },
+            }
@@ -0,0 +1,289 @@
+"""Optional OpenTelemetry tracing for the request path.
+
+Off by default. PROXY_TRACING selects the exporter:
+
+  file   OTLP/JSON lines appended to PROXY_TRACE_FILE (default
+         $LOG_DIR/claude-proxy.traces.jsonl) — one ExportTraceServiceRequest
+         per line, the same shape the collector's file exporter writes, so
+         traces can be loaded offline without running a collector
+  otlp   OTLP/HTTP to OTEL_EXPORTER_OTLP_ENDPOINT (needs
+         opentelemetry-exporter-otlp-proto-http)
+
+Either mode needs opentelemetry-sdk; without it (or with tracing off) every
+helper here is a no-op that costs one flag check.
+
+Spans, per /v1/messages request:
+
+  proxy.messages                 root; request_id, model, stream, phase timings
+    compactor.compress           incl. compactor.engine on the to_thread worker
+    fallback.attempt             one per provider try (provider, attempt, outcome)
+      anthropic.request
+      bedrock.invoke / bedrock.invoke_stream   on the executor / anyio thread
+    ...
+
+Work handed to a thread pool keeps its parent: asyncio.to_thread and anyio
+copy the caller's context themselves; loop.run_in_executor does not, so the
+Bedrock executor calls go through `in_context()`, which also records how long
+the call sat in the pool's queue (executor.queue_wait_ms).
+
+With tracing on, JSON log lines (LOG_FORMAT=json) carry trace_id / span_id
+of the span that was current when the line was logged.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, Optional, Sequence
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover - fastapi pulls in opentelemetry-api
+    trace = None
+
+logger = logging.getLogger(__name__)
+
+MODES = ("file", "otlp")
+
+_enabled = False
+_tracer = None
+_provider = None
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def setup_tracing(mode: Optional[str], path: Optional[str] = None, service_name: str = "claude-proxy") -> bool:
+    """Install a TracerProvider for this process. Returns True if tracing is on."""
+    global _enabled, _tracer, _provider
+    if not mode:
+        return False
+    if mode not in MODES:
+        logger.warning(f"Unknown PROXY_TRACING={mode!r} (expected one of {', '.join(MODES)}) — tracing off")
+        return False
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning("PROXY_TRACING is set but opentelemetry-sdk is not installed — tracing off")
+        return False
+
+    if mode == "otlp":
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("PROXY_TRACING=otlp needs opentelemetry-exporter-otlp-proto-http — tracing off")
+            return False
+        exporter = OTLPSpanExporter()
+    else:
+        exporter = OTLPJsonFileExporter(path)
+
+    _provider = TracerProvider(resource=Resource.create({"service.name": service_name, "process.pid": os.getpid()}))
+    # Export on the processor's own thread, never on the event loop
+    _provider.add_span_processor(BatchSpanProcessor(exporter))
+    _tracer = _provider.get_tracer("claude-proxy")
+    _enabled = True
+    _install_log_correlation()
+    logger.info(f"Tracing enabled ({mode}{': ' + exporter.path if mode == 'file' else ''})")
+    return True
+
+
+def shutdown_tracing() -> None:
+    """Flush pending spans and stop exporting (idempotent)."""
+    global _enabled, _tracer, _provider
+    if _provider is not None:
+        _provider.shutdown()
+    _enabled, _tracer, _provider = False, None, None
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Child span of the current one, current for the duration of the block (None when off)."""
+    if not _enabled:
+        yield None
+        return
+    with _tracer.start_as_current_span(name, attributes=_clean(attributes)) as s:
+        yield s
+
+
+def start_span(name: str, **attributes: Any) -> Any:
+    """Span that outlives the current block (e.g. a streaming response); pair with use_span()."""
+    if not _enabled:
+        return None
+    return _tracer.start_span(name, attributes=_clean(attributes))
+
+
+@contextmanager
+def use_span(s: Any, end_on_exit: bool = True) -> Iterator[Any]:
+    """Make a span from start_span() current (in this task) and end it on exit."""
+    if s is None:
+        yield None
+        return
+    with trace.use_span(s, end_on_exit=end_on_exit, record_exception=True, set_status_on_exception=True):
+        yield s
+
+
+def set_attributes(**attributes: Any) -> None:
+    """Set attributes on the current span."""
+    if _enabled:
+        trace.get_current_span().set_attributes(_clean(attributes))
+
+
+def add_event(name: str, **attributes: Any) -> None:
+    """Add an event (retry, fallback, cooldown, ...) to the current span."""
+    if _enabled:
+        trace.get_current_span().add_event(name, attributes=_clean(attributes))
+
+
+def in_context(fn: Callable, span_name: Optional[str] = None) -> Callable:
+    """Wrap `fn` for loop.run_in_executor so it runs in the caller's context.
+
+    Call it at submit time: the returned callable carries a copy of the
+    caller's contextvars (current span, timing.PhaseTimer) and the submit
+    time, and — when `span_name` is given and tracing is on — runs `fn` inside
+    a span recording how long it waited for a pool thread.
+    """
+    ctx = contextvars.copy_context()
+    submitted = time.perf_counter()
+
+    def run(*args, **kwargs):
+        if span_name is None or not _enabled:
+            return ctx.run(fn, *args, **kwargs)
+
+        def traced():
+            queue_wait_ms = (time.perf_counter() - submitted) * 1000
+            with span(span_name, **{"executor.queue_wait_ms": round(queue_wait_ms, 2),
+                                    "thread.name": threading.current_thread().name}):
+                return fn(*args, **kwargs)
+
+        return ctx.run(traced)
+
+    return run
+
+
+def _clean(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """Drop None values (not valid OTel attribute values)."""
+    return {k: v for k, v in attributes.items() if v is not None}
+
+
+# ---------------------------------------------------------------------------
+# Log correlation
+# ---------------------------------------------------------------------------
+
+def _install_log_correlation() -> None:
+    """Stamp trace_id / span_id on log records as they are created (on the logging thread)."""
+    previous = logging.getLogRecordFactory()
+    if getattr(previous, "_trace_correlation", False):
+        return
+
+    def factory(*args, **kwargs):
+        record = previous(*args, **kwargs)
+        if _enabled:
+            ctx = trace.get_current_span().get_span_context()
+            if ctx.is_valid:
+                record.trace_id = format(ctx.trace_id, "032x")
+                record.span_id = format(ctx.span_id, "016x")
+        return record
+
+    factory._trace_correlation = True
+    logging.setLogRecordFactory(factory)
+
+
+# ---------------------------------------------------------------------------
+# OTLP/JSON file exporter
+# ---------------------------------------------------------------------------
+
+def _any_value(value: Any) -> Dict[str, Any]:
+    # OTLP/JSON: 64-bit ints are strings, everything else is the natural JSON type
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_any_value(v) for v in value]}}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes: Any) -> list:
+    return [{"key": k, "value": _any_value(v)} for k, v in (attributes or {}).items()]
+
+
+def _span_json(s: Any) -> Dict[str, Any]:
+    ctx = s.get_span_context()
+    out: Dict[str, Any] = {
+        "traceId": format(ctx.trace_id, "032x"),
+        "spanId": format(ctx.span_id, "016x"),
+        "name": s.name,
+        "kind": s.kind.value + 1,  # SDK SpanKind.INTERNAL is 0, OTLP SPAN_KIND_INTERNAL is 1
+        "startTimeUnixNano": str(s.start_time),
+        "endTimeUnixNano": str(s.end_time),
+        "attributes": _attributes(s.attributes),
+        "status": {"code": s.status.status_code.value},
+    }
+    if s.parent is not None:
+        out["parentSpanId"] = format(s.parent.span_id, "016x")
+    if s.status.description:
+        out["status"]["message"] = s.status.description
+    if s.events:
+        out["events"] = [
+            {"timeUnixNano": str(e.timestamp), "name": e.name, "attributes": _attributes(e.attributes)}
+            for e in s.events
+        ]
+    return out
+
+
+def encode_spans(spans: Sequence[Any]) -> Dict[str, Any]:
+    """ExportTraceServiceRequest (OTLP/JSON) for a batch of finished SDK spans."""
+    by_resource: Dict[int, Dict[str, Any]] = {}
+    for s in spans:
+        resource = by_resource.setdefault(id(s.resource), {"resource": s.resource, "scopes": {}})
+        scope = s.instrumentation_scope
+        key = (scope.name, scope.version) if scope is not None else ("", None)
+        resource["scopes"].setdefault(key, []).append(_span_json(s))
+    return {"resourceSpans": [
+        {
+            "resource": {"attributes": _attributes(r["resource"].attributes)},
+            "scopeSpans": [
+                {"scope": {"name": name, **({"version": version} if version else {})}, "spans": items}
+                for (name, version), items in r["scopes"].items()
+            ],
+        }
+        for r in by_resource.values()
+    ]}
+
+
+class OTLPJsonFileExporter:
+    """SpanExporter appending one OTLP/JSON export request per batch to a local file."""
+
+    def __init__(self, path: Optional[str] = None):
+        import config
+        self.path = path or os.path.join(config.LOG_DIR, "claude-proxy.traces.jsonl")
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        from opentelemetry.sdk.trace.export import SpanExportResult
+        line = json.dumps(encode_spans(spans), separators=(",", ":")) + "\n"
+        try:
+            with self._lock:
+                # O_APPEND: whole-line writes from several workers don't interleave
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line.encode())
+                finally:
+                    os.close(fd)
+        except OSError as e:
+            logger.warning(f"Trace export to {self.path} failed: {e}")
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True